@@ -1,2 +1,7 @@
-# import pymysql
-# pymysql.install_as_MySQLdb()
\ No newline at end of file
+import os
+
+if os.environ.get('OLYMPO_DB') == 'mysql':
+    # PyMySQL hace de MySQLdb; Django pide una version minima de mysqlclient
+    import pymysql
+    pymysql.version_info = (2, 2, 1, 'final', 0)
+    pymysql.install_as_MySQLdb()
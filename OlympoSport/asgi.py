@@ -3,6 +3,11 @@ ASGI config for OlympoSport project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live match channel (``eventos/<pk>/directo/``) only streams when the
+project is served through this module with an ASGI server, e.g.::
+
+    uvicorn OlympoSport.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
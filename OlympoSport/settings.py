@@ -43,7 +43,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'SportApp.middleware.CompresionMiddleware',#gzip o brotli (si esta instalado); va primero para comprimir lo ultimo
     'django.middleware.security.SecurityMiddleware',
+    'SportApp.middleware.InstrumentacionMiddleware',#solo con OLYMPO_INSTRUMENTACION=1
+    'SportApp.middleware.PresupuestoConsultasMiddleware',
+    'SportApp.replicas.ReplicasMiddleware',#solo con OLYMPO_DB_REPLICAS; antes que la sesion, que se guarda al final
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -74,24 +78,106 @@ WSGI_APPLICATION = 'OlympoSport.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Se elige con variables de entorno: OLYMPO_DB=mysql usa el MySQL del docker-compose
+# (OLYMPO_DB_NAME, OLYMPO_DB_USER, OLYMPO_DB_PASSWORD, OLYMPO_DB_HOST, OLYMPO_DB_PORT);
+# sin nada, SQLite en db.sqlite3
+OLYMPO_DB = os.environ.get('OLYMPO_DB', 'sqlite')
+
+if OLYMPO_DB == 'mysql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.mysql',
+            'NAME': os.environ.get('OLYMPO_DB_NAME', 'olymposport_db'),
+            'USER': os.environ.get('OLYMPO_DB_USER', 'olympo_user'),
+            'PASSWORD': os.environ.get('OLYMPO_DB_PASSWORD', 'olympo_password'),
+            'HOST': os.environ.get('OLYMPO_DB_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('OLYMPO_DB_PORT', '3307'),  # puerto del docker-compose
+            # Conexiones persistentes: se reutilizan entre peticiones y se comprueban antes de usarlas
+            'CONN_MAX_AGE': int(os.environ.get('OLYMPO_DB_CONN_MAX_AGE', 300)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'charset': 'utf8mb4',
+                'isolation_level': 'read committed',
+                'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('OLYMPO_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('OLYMPO_DB_CONN_MAX_AGE', 60)),
+            'OPTIONS': {
+                # WAL: las lecturas no bloquean al que escribe ni al reves. IMMEDIATE pide el cerrojo de
+                # escritura al abrir la transaccion, asi dos escrituras a la vez hacen cola (hasta `timeout`
+                # segundos) en lugar de fallar a mitad con "database is locked"
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA mmap_size=134217728'
+                ),
+            },
+        }
     }
+
+# Replicas de solo lectura (SportApp.replicas): las peticiones de lectura leen de ellas. OLYMPO_DB_REPLICAS es una
+# lista separada por comas de servidores (host o host:puerto, mismo usuario y base que la principal) con MySQL o de
+# ficheros con SQLite, que copia `manage.py sincronizar_replica`. Las pruebas usan la principal (MIRROR)
+for _numero, _replica in enumerate([r.strip() for r in os.environ.get('OLYMPO_DB_REPLICAS', '').split(',') if r.strip()], 1):
+    _datos = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if OLYMPO_DB == 'mysql':
+        _host, _, _puerto = _replica.partition(':')
+        _datos.update(HOST=_host, PORT=_puerto or _datos['PORT'])
+    else:
+        # Sin transaction_mode: un BEGIN IMMEDIATE en la replica bloquearia la copia
+        _datos.update(NAME=_replica, OPTIONS={
+            'timeout': 20,
+            'init_command': 'PRAGMA query_only=ON;PRAGMA temp_store=MEMORY;PRAGMA cache_size=-20000',
+        })
+    DATABASES[f'replica_{_numero}'] = _datos
+DATABASE_ROUTERS = ['SportApp.replicas.RouterReplicas']
+# Segundos que lee de la principal el navegador que acaba de escribir, para que vea su cambio aunque la replica vaya atrasada
+OLYMPO_REPLICA_PEGAJOSA = int(os.environ.get('OLYMPO_REPLICA_PEGAJOSA', 10))
+
+# Presupuesto de consultas por peticion (SportApp.middleware). Las vistas pueden fijar el suyo con
+# @presupuesto_consultas(n); este es el de las que no lo hacen (None = sin limite, solo se mide).
+# En modo estricto pasarse lanza una excepcion, para que lo detecten las pruebas
+OLYMPO_PRESUPUESTO_CONSULTAS = int(os.environ['OLYMPO_PRESUPUESTO_CONSULTAS']) if os.environ.get('OLYMPO_PRESUPUESTO_CONSULTAS') else None
+OLYMPO_PRESUPUESTO_ESTRICTO = os.environ.get('OLYMPO_PRESUPUESTO_ESTRICTO') == '1'
+OLYMPO_CABECERAS_CONSULTAS = DEBUG
+
+# Instrumentacion por vista (SportApp.middleware.InstrumentacionMiddleware): tiempos, consultas y plantillas
+# de una muestra de las peticiones en /metrics (formato Prometheus) y las peticiones lentas en el log.
+# /metrics lo ve el staff o quien mande "Authorization: Bearer <OLYMPO_METRICAS_TOKEN>"
+OLYMPO_INSTRUMENTACION = os.environ.get('OLYMPO_INSTRUMENTACION') == '1'
+OLYMPO_INSTRUMENTACION_MUESTREO = float(os.environ.get('OLYMPO_INSTRUMENTACION_MUESTREO', 1.0))
+OLYMPO_PETICION_LENTA_MS = int(os.environ.get('OLYMPO_PETICION_LENTA_MS', 500))
+OLYMPO_METRICAS_TOKEN = os.environ.get('OLYMPO_METRICAS_TOKEN', '')
+
+# Tareas en segundo plano (SportApp.tareas): las ejecuta `manage.py trabajador`. Con OLYMPO_TAREAS_EN_LINEA=1
+# se hacen en el mismo proceso al terminar la peticion, para desarrollar sin arrancar el trabajador
+OLYMPO_TAREAS_EN_LINEA = os.environ.get('OLYMPO_TAREAS_EN_LINEA') == '1'
+
+# Django REST Framework
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'SportApp.pagination.CursorPaginacion',
+    'PAGE_SIZE': 50,
 }
 
-"""DATABASES = {
+# Cache
+# Las versiones del calendario viven en la cache: con varios procesos en produccion
+# hay que usar un backend compartido (Redis, Memcached...) para que todos las vean
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'NAME': 'olymposport_db',
-        'USER': 'olympo_user',      # Usuario del docker-compose
-        'PASSWORD': 'olympo_password', # Contraseña del docker-compose
-        'HOST': '127.0.0.1',
-        'PORT': '3307',             # <--- ¡IMPORTANTE! Puerto 3307
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'olymposport',
     }
 }
-"""
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,82 @@
+"""
+Acta completa de un partido: todas las líneas de estadísticas de una vez.
+
+En lugar de un formulario (y un full_clean con sus consultas) por jugador, se
+comprueba con una sola consulta que todos los jugadores son de los equipos del
+partido y se escribe con un único upsert sobre la clave (partido, jugador)
+dentro de una transacción. Los acumulados de SportApp.estadisticas se ajustan
+en el mismo lote.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .estadisticas import CAMPOS_LINEA, aplicar_deltas
+from .models import EstadisticaPartido, Jugador
+
+
+CAMPOS_ACTA = ('juega', 'puntos', 'minutos_jugados', 'observaciones')
+
+
+def validar_jugadores(partido, jugador_ids):
+    """Devuelve un diccionario {jugador_id: mensaje} con los jugadores que no pueden estar en el acta."""
+    errores = {}
+    vistos = set()
+    for jugador_id in jugador_ids:
+        if jugador_id in vistos:
+            errores[jugador_id] = "El jugador aparece más de una vez en el acta."
+        vistos.add(jugador_id)
+
+    validos = set(Jugador.objects
+        .filter(pk__in=vistos, equipo_id__in=[partido.equipo_local_id, partido.equipo_visitante_id])
+        .values_list('pk', flat=True))
+    for jugador_id in vistos - validos:
+        errores.setdefault(jugador_id, "El jugador no pertenece a los equipos que juegan este partido.")
+    return errores
+
+
+def guardar_acta(partido, lineas):
+    """
+    Guarda las líneas (diccionarios con 'jugador' y CAMPOS_ACTA) del partido.
+    Lanza ValidationError sin escribir nada si algún jugador no es válido.
+    Devuelve el número de líneas guardadas.
+    """
+    if not lineas:
+        return 0
+    jugador_ids = [linea['jugador'] for linea in lineas]
+    errores = validar_jugadores(partido, jugador_ids)
+    if errores:
+        raise ValidationError({str(jugador_id): mensaje for jugador_id, mensaje in errores.items()})
+
+    torneo_id, temporada = partido.torneo_id, partido.torneo.temporada
+    with transaction.atomic():
+        anteriores = {
+            fila['jugador_id']: fila
+            for fila in EstadisticaPartido.objects.select_for_update()
+                .filter(partido=partido, jugador_id__in=jugador_ids).values(*CAMPOS_LINEA)
+        }
+
+        nuevas = []
+        cambios = []
+        for linea in lineas:
+            valores = {campo: linea.get(campo) for campo in CAMPOS_ACTA}
+            valores['puntos'] = valores['puntos'] or 0
+            valores['juega'] = bool(valores['juega'])
+            nuevas.append(EstadisticaPartido(partido=partido, jugador_id=linea['jugador'], **valores))
+            cambios.append((anteriores.get(linea['jugador']), {
+                'jugador_id': linea['jugador'],
+                'partido_id': partido.pk,
+                'partido__torneo_id': torneo_id,
+                'partido__torneo__temporada': temporada,
+                'juega': valores['juega'],
+                'puntos': valores['puntos'],
+                'minutos_jugados': valores['minutos_jugados'],
+            }))
+
+        EstadisticaPartido.objects.bulk_create(
+            nuevas,
+            update_conflicts=True,
+            unique_fields=['partido', 'jugador'],
+            update_fields=[*CAMPOS_ACTA, 'actualizado'],
+        )
+        aplicar_deltas(cambios)
+    return len(nuevas)
@@ -7,4 +7,6 @@ admin.site.register(Jugador)
 admin.site.register(Torneo)
 admin.site.register(Partido)
 admin.site.register(EstadisticaPartido)
-admin.site.register(Inscripcion)
\ No newline at end of file
+admin.site.register(Inscripcion)
+admin.site.register(Tarea)
+admin.site.register(Enfrentamiento)
\ No newline at end of file
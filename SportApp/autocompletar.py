@@ -0,0 +1,159 @@
+"""
+Búsqueda para los desplegables grandes (equipos, jugadores, torneos, partidos).
+
+En lugar de pintar un <option> por fila, el formulario solo lleva la opción
+elegida y el JS (static/SportApp/autocompletar.js) pide al servidor las que
+coinciden con lo que se va escribiendo. Se busca por nombre: primero los que
+empiezan por el texto, un rango sobre el índice Lower(nombre) (un LIKE o un
+istartswith no lo usaría), ordenados por ese mismo índice y cortados en
+LIMITE. Solo si no llegan a LIMITE se buscan los que lo llevan en medio, que no
+puede usar ningún índice: se mira como mucho entre las ESCANEO_CONTIENEN
+primeras filas. Cada usuario ve lo mismo que en sus listados: el staff todo, el
+resto sus equipos y sus jugadores.
+"""
+import json
+
+from django import forms
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Lower
+from django.db.models.lookups import GreaterThanOrEqual, LessThan, LessThanOrEqual
+from django.urls import reverse
+
+from .models import Equipo, Jugador, Partido, Torneo
+from .referencias import TABLAS, opciones_elegidas
+
+
+LIMITE = 20
+ESCANEO_CONTIENEN = 5000
+MINIMO_CONTIENEN = 2#con una letra casi todo la lleva en medio
+ULTIMO = '\U0010ffff'#mayor que cualquier caracter: los que empiezan por t son los de t <= x < t + ULTIMO
+
+
+def _entero(valor):
+    return int(valor) if valor and str(valor).isdigit() else None
+
+
+def _equipos(usuario, parametros):
+    queryset = Equipo.objects.all() if usuario.is_staff else Equipo.objects.filter(usuario=usuario)
+    if _entero(parametros.get('deporte')):
+        queryset = queryset.filter(deporte_id=_entero(parametros.get('deporte')))
+    if _entero(parametros.get('torneo')):#los del deporte del torneo (Partido.clean)
+        queryset = queryset.filter(deporte__torneo=_entero(parametros.get('torneo')))
+    return queryset
+
+
+def _jugadores(usuario, parametros):
+    queryset = Jugador.objects.all() if usuario.is_staff else Jugador.objects.filter(equipo__usuario=usuario)
+    if _entero(parametros.get('equipo')):
+        queryset = queryset.filter(equipo_id=_entero(parametros.get('equipo')))
+    if _entero(parametros.get('partido')):#los de los dos equipos del partido (EstadisticaPartido.clean)
+        partido = Partido.objects.filter(pk=_entero(parametros.get('partido'))).values('equipo_local_id', 'equipo_visitante_id').first()
+        queryset = queryset.filter(equipo_id__in=partido.values() if partido else [])
+    return queryset
+
+
+def _torneos(usuario, parametros):
+    queryset = Torneo.objects.all()
+    if _entero(parametros.get('deporte')):
+        queryset = queryset.filter(deporte_id=_entero(parametros.get('deporte')))
+    return queryset
+
+
+def _partidos(usuario, parametros):
+    queryset = Partido.objects.all()
+    if _entero(parametros.get('torneo')):
+        queryset = queryset.filter(torneo_id=_entero(parametros.get('torneo')))
+    return queryset
+
+
+# tabla: (queryset del usuario, campos en los que se busca, clave del orden, descendente)
+BUSQUEDAS = {
+    'equipos': (_equipos, ('nombre',), Lower('nombre'), False),
+    'jugadores': (_jugadores, ('nombre',), Lower('nombre'), False),
+    'torneos': (_torneos, ('nombre',), Lower('nombre'), False),
+    'partidos': (_partidos, ('equipo_local__nombre', 'equipo_visitante__nombre'), F('fecha_hora'), True),
+}
+
+
+def _filas(tabla, queryset, limite):
+    columnas, etiqueta = TABLAS[tabla][1], TABLAS[tabla][2]
+    return [(pk, etiqueta(*valores)) for pk, *valores in queryset.values_list('pk', *columnas)[:limite]]
+
+
+def _empiezan(modelo, campo, texto):
+    """Q de las filas cuyo `campo` empieza por `texto` sin distinguir mayúsculas, por el índice Lower(nombre)."""
+    relacion, _, columna = campo.rpartition('__')
+    minusculas, desde = Lower(columna), Lower(Value(texto))
+    condicion = Q(GreaterThanOrEqual(minusculas, desde), LessThan(minusculas, Concat(desde, Value(ULTIMO))))
+    if not relacion:
+        return condicion
+    # En otra tabla (los equipos de un partido): los ids de las filas que empiezan, por su indice
+    relacionado = modelo._meta.get_field(relacion).related_model
+    return Q(**{f'{relacion}__in': relacionado.objects.filter(condicion).values('pk')})
+
+
+def _primeras(queryset, clave, descendente):
+    """Q que deja solo las ESCANEO_CONTIENEN primeras filas de `queryset` en su orden (todas si no hay tantas)."""
+    corte = list(queryset.values_list(clave, flat=True)[ESCANEO_CONTIENEN:ESCANEO_CONTIENEN + 1])
+    if not corte:
+        return Q()
+    return Q((GreaterThanOrEqual if descendente else LessThanOrEqual)(clave, corte[0]))
+
+
+def buscar(tabla, usuario, texto='', parametros=None, limite=LIMITE):
+    """([(id, etiqueta)], hay_mas) de lo que encaja con `texto` en `tabla`, para `usuario`."""
+    base, campos, clave, descendente = BUSQUEDAS[tabla]
+    orden = (clave.desc(), '-pk') if descendente else (clave.asc(), 'pk')
+    queryset = base(usuario, parametros or {}).order_by(*orden)
+    texto = (texto or '').strip()
+    if not texto:
+        filas = _filas(tabla, queryset, limite + 1)
+        return filas[:limite], len(filas) > limite
+
+    empiezan = Q()
+    for campo in campos:
+        empiezan |= _empiezan(queryset.model, campo, texto)
+    filas = _filas(tabla, queryset.filter(empiezan), limite + 1)
+    if len(filas) > limite or len(texto) < MINIMO_CONTIENEN:
+        return filas[:limite], len(filas) > limite
+
+    # Faltan: los que lo llevan en medio, recorriendo como mucho ESCANEO_CONTIENEN filas
+    contienen = Q()
+    for campo in campos:
+        contienen |= Q(**{f'{campo}__icontains': texto})
+    acotado = queryset.filter(_primeras(queryset, clave, descendente))
+    filas += _filas(tabla, acotado.filter(contienen).exclude(empiezan), limite + 1 - len(filas))
+    return filas[:limite], len(filas) > limite
+
+
+class AutocompletarSelect(forms.Select):
+    """Select que solo pinta la opción elegida; el resto las trae autocompletar.js de /autocompletar/<tabla>/.
+    `dependencias` son {parámetro: campo del formulario} cuyo valor se manda con la búsqueda."""
+
+    def __init__(self, tabla, dependencias=None, attrs=None):
+        super().__init__(attrs)
+        self.tabla = tabla
+        self.dependencias = dependencias or {}
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-autocompletar'] = reverse('autocompletar', args=[self.tabla])
+        if self.dependencias:
+            context['widget']['attrs']['data-dependencias'] = json.dumps(self.dependencias)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        elegidos = {str(v) for v in value if str(v).isdigit()}
+        opciones = []
+        if not self.allow_multiple_selected and getattr(self.choices, 'field', None) is not None \
+                and self.choices.field.empty_label is not None:
+            opciones.append(('', self.choices.field.empty_label))
+        opciones += opciones_elegidas(self.choices.queryset, elegidos)
+        return [
+            (None, [self.create_option(name, pk, etiqueta, str(pk) in elegidos, indice)], indice)
+            for indice, (pk, etiqueta) in enumerate(opciones)
+        ]
+
+
+class AutocompletarSelectMultiple(AutocompletarSelect, forms.SelectMultiple):
+    pass
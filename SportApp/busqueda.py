@@ -0,0 +1,211 @@
+"""
+Buscador global de equipos, jugadores, torneos y sedes de los partidos.
+
+Cada objeto tiene una fila en DocumentoBusqueda con lo que se pinta en los
+resultados (título y detalle, ya con los nombres de sus relaciones) y el
+texto en el que se busca, en minúsculas y sin tildes. Sobre ese texto hay un
+índice de texto completo que se crea en la migración: en SQLite una tabla
+FTS5 de contenido externo que mantienen al día unos triggers, en MySQL un
+índice FULLTEXT. Una búsqueda es una sola consulta a ese índice ordenada por
+prioridad del tipo (los partidos, de los que solo se busca la sede, van
+detrás) y relevancia (bm25 / MATCH ... AGAINST) y cortada en una página, sin
+recorrer las tablas con LIKE. Con otros motores se busca en DocumentoBusqueda con
+LIKE, que funciona pero no escala.
+
+Las señales rehacen el documento de lo que se guarda y, si cambia un nombre
+que sale en otros documentos (el de un equipo en sus jugadores y partidos,
+el de un torneo en sus partidos, el de un deporte en sus equipos y torneos),
+también esos. Las cargas sin señales (calendarios, importación, datos
+sintéticos) llaman a indexar_nuevos(). Para rehacerlo todo, `manage.py
+reindexar_busqueda`.
+"""
+import re
+import unicodedata
+
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from .models import DocumentoBusqueda, Equipo, Jugador, Partido, Torneo
+
+
+TABLA_FTS = 'SportApp_busqueda_fts'#la crea la migracion 0013 en SQLite
+POR_PAGINA = 20
+MAX_PAGINA = 50#mas alla nadie mira y el OFFSET cuesta
+MAX_TERMINOS = 8
+MINIMO_MYSQL = 3#innodb_ft_min_token_size: las palabras mas cortas no estan en el indice FULLTEXT
+LOTE = 2000
+
+Tipo = DocumentoBusqueda.Tipo
+
+
+def normalizar(*textos):
+    """Une los textos en minúsculas y sin tildes ni diéresis (la ñ queda en n): lo que se indexa y lo que se busca."""
+    texto = unicodedata.normalize('NFKD', ' '.join(t for t in textos if t))
+    return ''.join(c for c in texto if not unicodedata.combining(c)).casefold()
+
+
+def _equipo(id, nombre, ciudad, entrenador, deporte):
+    return id, nombre, f"{ciudad} · {deporte}", normalizar(nombre, ciudad, entrenador)
+
+
+def _jugador(id, nombre, dorsal, equipo):
+    detalle = equipo or "Sin equipo"
+    return id, nombre, f"{detalle} · #{dorsal}" if dorsal else detalle, normalizar(nombre)
+
+
+def _torneo(id, nombre, temporada, deporte):
+    return id, f"{nombre} ({temporada})", deporte, normalizar(nombre, temporada)
+
+
+def _partido(id, local, visitante, lugar, fecha_hora, torneo):
+    fecha = timezone.localtime(fecha_hora).strftime('%d/%m/%Y %H:%M')
+    return id, f"{local} vs {visitante}", f"{lugar} · {fecha} · {torneo}", normalizar(lugar)
+
+
+# tipo: (modelo, campos que se leen, funcion(*fila) -> (id, titulo, detalle, texto), prioridad)
+FUENTES = {
+    Tipo.EQUIPO: (Equipo, ('id', 'nombre', 'ciudad', 'entrenador', 'deporte__nombre'), _equipo, 1),
+    Tipo.JUGADOR: (Jugador, ('id', 'nombre', 'dorsal', 'equipo__nombre'), _jugador, 1),
+    Tipo.TORNEO: (Torneo, ('id', 'nombre', 'temporada', 'deporte__nombre'), _torneo, 1),
+    # De un partido solo se busca la sede: hay muchos en cada una y no deben tapar al equipo de esa ciudad,
+    # que con un texto mas largo sale con menos relevancia
+    Tipo.PARTIDO: (Partido, ('id', 'equipo_local__nombre', 'equipo_visitante__nombre', 'lugar', 'fecha_hora',
+                             'torneo__nombre'), _partido, 0),
+}
+TIPO_DE_MODELO = {fuente[0]: tipo for tipo, fuente in FUENTES.items()}
+
+
+def _documentos(queryset):
+    tipo = TIPO_DE_MODELO[queryset.model]
+    _, campos, documento, prioridad = FUENTES[tipo]
+    for fila in queryset.order_by().values_list(*campos).iterator(chunk_size=LOTE):
+        objeto_id, titulo, detalle, texto = documento(*fila)
+        yield DocumentoBusqueda(tipo=tipo, objeto_id=objeto_id, titulo=titulo[:255], detalle=detalle[:255],
+                                texto=texto, prioridad=prioridad)
+
+
+def _guardar(documentos):
+    if documentos:
+        DocumentoBusqueda.objects.bulk_create(
+            documentos,
+            update_conflicts=True,
+            unique_fields=['tipo', 'objeto_id'],
+            update_fields=['titulo', 'detalle', 'texto', 'prioridad', 'actualizado'],
+            batch_size=500,
+        )
+
+
+def indexar(queryset):
+    """Crea o rehace los documentos de los objetos de `queryset` (de un modelo de FUENTES). Devuelve cuántos."""
+    total, lote = 0, []
+    for documento in _documentos(queryset):
+        lote.append(documento)
+        if len(lote) == LOTE:
+            _guardar(lote)
+            total, lote = total + len(lote), []
+    _guardar(lote)
+    return total + len(lote)
+
+
+def indexar_nuevos(queryset):
+    """Indexa los objetos de `queryset` que todavía no tienen documento (los que se han insertado sin señales)."""
+    tipo = TIPO_DE_MODELO[queryset.model]
+    return indexar(queryset.exclude(pk__in=DocumentoBusqueda.objects.filter(tipo=tipo).values('objeto_id')))
+
+
+def desindexar(modelo, ids):
+    return DocumentoBusqueda.objects.filter(tipo=TIPO_DE_MODELO[modelo], objeto_id__in=ids).delete()[0]
+
+
+def citan_a(objeto):
+    """Los querysets de los objetos cuyo documento lleva el nombre de `objeto`."""
+    if isinstance(objeto, Equipo):
+        return [Jugador.objects.filter(equipo=objeto),
+                Partido.objects.filter(models.Q(equipo_local=objeto) | models.Q(equipo_visitante=objeto))]
+    if isinstance(objeto, Torneo):
+        return [Partido.objects.filter(torneo=objeto)]
+    return []
+
+
+def actualizar(objeto, creado=False):
+    """
+    Rehace el documento de un objeto que se acaba de guardar y, si ha cambiado
+    su título, los de los objetos que lo citan. Es lo que hacen las señales.
+    """
+    tipo = TIPO_DE_MODELO[type(objeto)]
+    dependientes = [] if creado else citan_a(objeto)
+    anterior = None
+    if dependientes:
+        anterior = DocumentoBusqueda.objects.filter(tipo=tipo, objeto_id=objeto.pk).values_list('titulo', flat=True).first()
+    documentos = list(_documentos(type(objeto).objects.filter(pk=objeto.pk)))
+    _guardar(documentos)
+    if anterior is not None and documentos and documentos[0].titulo != anterior:
+        for queryset in dependientes:
+            indexar(queryset)
+
+
+def reindexar():
+    """Borra y rehace todos los documentos. Devuelve {tipo: documentos}."""
+    with transaction.atomic():
+        DocumentoBusqueda.objects.all().delete()
+        resumen = {tipo: indexar(fuente[0].objects.all()) for tipo, fuente in FUENTES.items()}
+        if connection.vendor == 'sqlite':
+            # Por si el indice se ha desviado de la tabla (filas tocadas con SQL a mano sin los triggers)
+            fts = connection.ops.quote_name(TABLA_FTS)
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    return resumen
+
+
+def terminos(texto):
+    """Las palabras de la búsqueda, normalizadas como el texto indexado."""
+    return re.findall(r'\w+', normalizar(texto))[:MAX_TERMINOS]
+
+
+def _sql_sqlite(palabras, filtro):
+    # Todas las palabras, cada una como prefijo; bm25 es menor cuanto mas relevante
+    fts = connection.ops.quote_name(TABLA_FTS)
+    tabla = connection.ops.quote_name(DocumentoBusqueda._meta.db_table)
+    sql = (f"SELECT d.* FROM {fts} JOIN {tabla} d ON d.id = {fts}.rowid WHERE {fts} MATCH %s{filtro} "
+           f"ORDER BY d.prioridad DESC, bm25({fts}), d.id DESC LIMIT %s OFFSET %s")
+    return sql, [' '.join(f'"{palabra}"*' for palabra in palabras)]
+
+
+def _sql_mysql(palabras, filtro):
+    tabla = connection.ops.quote_name(DocumentoBusqueda._meta.db_table)
+    consulta = ' '.join(f'+{palabra}*' for palabra in palabras)
+    sql = (f"SELECT d.*, MATCH(d.texto) AGAINST (%s IN BOOLEAN MODE) AS relevancia FROM {tabla} d "
+           f"WHERE MATCH(d.texto) AGAINST (%s IN BOOLEAN MODE){filtro} "
+           f"ORDER BY d.prioridad DESC, relevancia DESC, d.id DESC LIMIT %s OFFSET %s")
+    return sql, [consulta, consulta]
+
+
+def buscar(texto, tipos=None, pagina=1, por_pagina=POR_PAGINA):
+    """
+    Los documentos que tienen todas las palabras de `texto` (como prefijo:
+    "barc" encuentra "Barcelona"), de los `tipos` pedidos o de todos, del más
+    relevante al menos y solo los de la página `pagina`. Devuelve
+    (documentos, hay_mas); no cuenta el total, que obligaría a recorrer todas
+    las coincidencias.
+    """
+    palabras = terminos(texto)
+    if connection.vendor == 'mysql':
+        palabras = [palabra for palabra in palabras if len(palabra) >= MINIMO_MYSQL]
+    if not palabras:
+        return [], False
+    pagina = min(max(pagina, 1), MAX_PAGINA)
+    desde = (pagina - 1) * por_pagina
+
+    if connection.vendor in ('sqlite', 'mysql'):
+        tipos = list(tipos or [])
+        filtro = f" AND d.tipo IN ({', '.join(['%s'] * len(tipos))})" if tipos else ''
+        sql, parametros = (_sql_sqlite if connection.vendor == 'sqlite' else _sql_mysql)(palabras, filtro)
+        documentos = list(DocumentoBusqueda.objects.raw(sql, [*parametros, *tipos, por_pagina + 1, desde]))
+    else:
+        queryset = DocumentoBusqueda.objects.all()
+        for palabra in palabras:
+            queryset = queryset.filter(texto__contains=palabra)
+        if tipos:
+            queryset = queryset.filter(tipo__in=tipos)
+        documentos = list(queryset.order_by('-prioridad', '-id')[desde:desde + por_pagina + 1])
+    return documentos[:por_pagina], len(documentos) > por_pagina
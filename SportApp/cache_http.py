@@ -0,0 +1,152 @@
+"""
+Caché HTTP de las páginas públicas y de la API.
+
+Cada vista declara su política con @politica_cache: cuántos segundos puede
+guardarla el navegador de un anónimo y, opcionalmente, una función `marca`
+que resume con una consulta corta lo que pinta la página (el último
+`actualizado` y el número de filas de las tablas que lee). De la marca, la
+URL y quién mira (el menú y los botones cambian con el usuario) sale el ETag:
+si el navegador ya lo tiene se responde 304 sin renderizar nada. Con
+`ultima_modificacion` la página lleva también Last-Modified y atiende
+If-Modified-Since (para los clientes que no mandan el ETag). Para los
+anónimos la respuesta entera se guarda además en la caché del servidor con el
+ETag en la clave, así que al cambiar los datos se deja de usar sola.
+
+Las páginas con mensajes pendientes o que ponen cookies (token CSRF) no se
+cachean. En la API, CacheApiMixin hace lo mismo con las filas de la página
+que se devuelve.
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def marca_de(queryset, *relaciones):
+    """
+    Resumen en una consulta de lo que pinta una página: el último `actualizado` del
+    queryset y de sus relaciones (rutas del ORM) y cuántas filas salen al unirlas,
+    para que también cuenten los borrados.
+    """
+    rutas = ['actualizado', *(f'{relacion}__actualizado' for relacion in relaciones)]
+    datos = queryset.order_by().aggregate(filas=Count('pk'), **{f'ultimo_{i}': Max(ruta) for i, ruta in enumerate(rutas)})
+    return "|".join(str(valor.timestamp() if valor is not None and hasattr(valor, 'timestamp') else valor)
+                    for valor in datos.values())
+
+
+def _etag(request, marca):
+    usuario = request.user
+    clave = f"{marca}|{request.get_full_path()}|{request.headers.get('Accept', '')}|{usuario.pk}|{usuario.is_staff}"
+    return quote_etag(hashlib.md5(clave.encode()).hexdigest())
+
+
+def _cacheable(request):
+    return request.method in ('GET', 'HEAD') and not len(get_messages(request))
+
+
+def _poner_cabeceras(request, response, etag, segundos, modificada=None):
+    if etag and not response.has_header('ETag'):
+        response['ETag'] = etag
+    if modificada is not None and not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(modificada)
+    if request.user.is_authenticated:
+        # Lo personal no va a cachés compartidas y se revalida siempre (con el ETag sale barato)
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=segundos)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def politica_cache(marca=None, segundos=60, segundos_servidor=None, ultima_modificacion=None):
+    """
+    Decorador de vistas (en las CBV con method_decorator sobre dispatch).
+    `marca(request, *args, **kwargs)` devuelve un str que cambia cuando cambia lo
+    que se pinta; `ultima_modificacion(request, *args, **kwargs)`, con la misma
+    firma, el datetime del último cambio (o None); `segundos_servidor` guarda la
+    página de los anónimos en la caché.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if not _cacheable(request):
+                return vista(request, *args, **kwargs)
+
+            etag = _etag(request, marca(request, *args, **kwargs)) if marca else None
+            fecha = ultima_modificacion(request, *args, **kwargs) if ultima_modificacion else None
+            modificada = int(fecha.timestamp()) if fecha is not None else None
+            if etag or modificada is not None:
+                no_modificada = get_conditional_response(request, etag=etag, last_modified=modificada)
+                if no_modificada is not None:
+                    return _poner_cabeceras(request, no_modificada, etag, segundos, modificada)
+
+            clave = None
+            if segundos_servidor and not request.user.is_authenticated:
+                clave = f"vista:{hashlib.md5(request.get_full_path().encode()).hexdigest()}:{etag}"
+                guardada = cache.get(clave)
+                if guardada is not None:
+                    return guardada
+
+            response = vista(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            _poner_cabeceras(request, response, etag, segundos, modificada)
+            if clave and not response.cookies and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                if hasattr(response, 'render'):
+                    response.render()
+                cache.set(clave, response, segundos_servidor)
+            return response
+        return envoltura
+    return decorador
+
+
+class CacheApiMixin:
+    """
+    ETag y Cache-Control en los GET de un ModelViewSet. La marca sale de las filas
+    que se devuelven (y de las relaciones expandidas con ?expand=), así que no
+    hace ninguna consulta más y un 304 se ahorra toda la serialización.
+    """
+    segundos_cache = 30
+
+    def _relaciones_expandidas(self):
+        serializer = self.get_serializer_class()
+        return serializer.expandir_pedido(self.request) if hasattr(serializer, 'expandir_pedido') else set()
+
+    def _marca_objetos(self, objetos, relaciones=None):
+        relaciones = sorted(self._relaciones_expandidas() if relaciones is None else relaciones)
+        partes = []
+        for objeto in objetos:
+            relacionados = (getattr(objeto, relacion) for relacion in relaciones)
+            partes.append(":".join(str(o.actualizado.timestamp()) if o is not None else '-'
+                                   for o in (objeto, *relacionados)) + f"@{objeto.pk}")
+        return ",".join(partes)
+
+    def _responder(self, objetos, serializar, relaciones=None):
+        # `relaciones` sustituye a las de ?expand= en las acciones que no devuelven el serializer del viewset
+        if not _cacheable(self.request):
+            return serializar()
+        etag = _etag(self.request, self._marca_objetos(objetos, relaciones))
+        response = get_conditional_response(self.request, etag=etag) or serializar()
+        if response.status_code in (200, 304):
+            _poner_cabeceras(self.request, response, etag, self.segundos_cache)
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        pagina = self.paginate_queryset(queryset)
+        objetos = pagina if pagina is not None else list(queryset)
+
+        def serializar():
+            datos = self.get_serializer(objetos, many=True).data
+            return self.get_paginated_response(datos) if pagina is not None else Response(datos)
+        return self._responder(objetos, serializar)
+
+    def retrieve(self, request, *args, **kwargs):
+        objeto = self.get_object()
+        return self._responder([objeto], lambda: Response(self.get_serializer(objeto).data))
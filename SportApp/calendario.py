@@ -0,0 +1,128 @@
+"""
+Calendario de eventos por ventanas de fechas.
+
+ver_eventos ya no carga todos los partidos de la historia: muestra una ventana
+[desde, hasta] y, dentro de cada deporte, páginas de tamaño fijo con cursor
+(fecha_hora, id). Lo renderizado se guarda en caché por deporte y ventana; cada
+deporte tiene una versión en la caché que las señales cambian al guardar o
+borrar uno de sus partidos, y la versión global sirve también de
+Last-Modified/ETag de la página.
+"""
+import base64
+import time
+from datetime import datetime, time as hora, timedelta
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import Partido
+
+
+PARTIDOS_POR_SECCION = 20
+DIAS_POR_DEFECTO = 30
+DIAS_MAXIMOS = 366
+SEGUNDOS_CACHE_CALENDARIO = 15 * 60
+
+CLAVE_VERSION_GLOBAL = 'calendario:version'
+
+
+def _clave_version(deporte_id):
+    return f'calendario:version:{deporte_id}'
+
+
+def version_global():
+    version = cache.get(CLAVE_VERSION_GLOBAL)
+    if version is None:
+        version = time.time()
+        cache.add(CLAVE_VERSION_GLOBAL, version, None)
+    return version
+
+
+def versiones_deportes(deporte_ids):
+    claves = {_clave_version(d): d for d in deporte_ids}
+    versiones = cache.get_many(list(claves))
+    faltan = {clave: time.time() for clave in claves if clave not in versiones}
+    if faltan:
+        cache.set_many(faltan, None)
+        versiones.update(faltan)
+    return {claves[clave]: version for clave, version in versiones.items()}
+
+
+def invalidar_calendario(*deporte_ids):
+    """Cambia la versión de esos deportes (y la global) cuando se confirme la transacción."""
+    def invalidar():
+        ahora = time.time()
+        valores = {_clave_version(d): ahora for d in deporte_ids if d is not None}
+        valores[CLAVE_VERSION_GLOBAL] = ahora
+        cache.set_many(valores, None)
+    transaction.on_commit(invalidar)
+
+
+def codificar_cursor(partido):
+    crudo = f"{partido.fecha_hora.isoformat()}|{partido.pk}"
+    return base64.urlsafe_b64encode(crudo.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """Devuelve (fecha_hora, id) o None si el cursor no es válido."""
+    try:
+        fecha, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(fecha), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def ventana_desde_parametros(desde_raw, hasta_raw):
+    """Interpreta las fechas YYYY-MM-DD de la URL; lo que no sea válido toma el valor por defecto."""
+    def leer(valor):
+        try:
+            return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
+        except ValueError:
+            return None
+
+    desde = leer(desde_raw) or timezone.localdate()
+    hasta = leer(hasta_raw)
+    if hasta is None or hasta < desde:
+        hasta = desde + timedelta(days=DIAS_POR_DEFECTO)
+    hasta = min(hasta, desde + timedelta(days=DIAS_MAXIMOS))
+    return desde, hasta
+
+
+class SeccionCalendario:
+    """Una página de partidos de un deporte. La consulta solo se lanza si la
+    plantilla llega a pedir los partidos, es decir, si el fragmento no está en caché."""
+
+    def __init__(self, deporte, desde, hasta, cursor=None, version=None):
+        self.deporte = deporte
+        self.desde = desde
+        self.hasta = hasta
+        self.cursor = cursor or ''
+        self.version = version
+
+    @cached_property
+    def _pagina(self):
+        inicio = timezone.make_aware(datetime.combine(self.desde, hora.min))
+        fin = timezone.make_aware(datetime.combine(self.hasta + timedelta(days=1), hora.min))#hasta incluido
+        partidos = (Partido.objects
+            .filter(torneo__deporte=self.deporte, fecha_hora__gte=inicio, fecha_hora__lt=fin)
+            .select_related('equipo_local__deporte', 'equipo_visitante__deporte')
+            .order_by('fecha_hora', 'id'))
+
+        posicion = decodificar_cursor(self.cursor) if self.cursor else None
+        if posicion is not None:
+            fecha, pk = posicion
+            partidos = partidos.filter(models.Q(fecha_hora__gt=fecha) | models.Q(fecha_hora=fecha, id__gt=pk))
+
+        pagina = list(partidos[:PARTIDOS_POR_SECCION + 1])
+        return pagina[:PARTIDOS_POR_SECCION], len(pagina) > PARTIDOS_POR_SECCION
+
+    @property
+    def partidos(self):
+        return self._pagina[0]
+
+    @property
+    def siguiente_cursor(self):
+        partidos, hay_mas = self._pagina
+        return codificar_cursor(partidos[-1]) if hay_mas else None
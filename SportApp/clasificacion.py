@@ -0,0 +1,156 @@
+"""
+Motor de clasificación de los torneos.
+
+Cada Inscripcion es la fila de la tabla de su equipo en el torneo. En lugar de
+agregar todos los partidos en cada visita a TorneoDetail, la fila se ajusta con
+un UPDATE por equipo cada vez que un partido entra o sale del estado JUGADO o
+cambia su marcador. recalcular_clasificacion() reconstruye todo desde cero para
+comprobar que los contadores incrementales no se han desviado.
+"""
+from collections import defaultdict
+
+from django.db import models
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .models import Deporte, Inscripcion, Partido, Torneo
+
+
+CAMPOS_CLASIFICACION = (
+    'partidos_jugados', 'ganados', 'empatados', 'perdidos',
+    'tantos_favor', 'tantos_contra', 'puntos_acumulados',
+)
+
+# Campos del partido que afectan a la clasificación
+CAMPOS_PARTIDO = (
+    'torneo_id', 'equipo_local_id', 'equipo_visitante_id',
+    'marcador_local', 'marcador_visitante', 'estado',
+)
+
+# (victoria, empate, derrota) para cada sistema de puntuación
+PUNTOS_POR_RESULTADO = {
+    Deporte.SistemaPuntuacion.GOLES: (3, 1, 0),
+    Deporte.SistemaPuntuacion.CANASTAS: (2, 1, 1),  # en baloncesto la derrota también puntúa
+    Deporte.SistemaPuntuacion.PUNTOS: (2, 1, 0),
+}
+
+
+def puntos_resultado(sistema, propios, rivales):
+    """Puntos de clasificación que obtiene un equipo con ese marcador."""
+    if sistema == Deporte.SistemaPuntuacion.SETS:
+        # Como en voleibol: ganar con 2 o más sets de diferencia da 3 puntos,
+        # ganar ajustado 2 y perder ajustado 1
+        diferencia = propios - rivales
+        if diferencia >= 2:
+            return 3
+        if diferencia == 1:
+            return 2
+        if diferencia == -1:
+            return 1
+        return 0
+
+    victoria, empate, derrota = PUNTOS_POR_RESULTADO.get(sistema, PUNTOS_POR_RESULTADO[Deporte.SistemaPuntuacion.PUNTOS])
+    if propios > rivales:
+        return victoria
+    if propios == rivales:
+        return empate
+    return derrota
+
+
+def fila_resultado(sistema, propios, rivales):
+    """Aportación de un partido jugado a la fila de clasificación de un equipo."""
+    return {
+        'partidos_jugados': 1,
+        'ganados': int(propios > rivales),
+        'empatados': int(propios == rivales),
+        'perdidos': int(propios < rivales),
+        'tantos_favor': propios,
+        'tantos_contra': rivales,
+        'puntos_acumulados': puntos_resultado(sistema, propios, rivales),
+    }
+
+
+def datos_partido(partido):
+    """Foto de los campos de un partido que cuentan para la clasificación."""
+    return {campo: getattr(partido, campo) for campo in CAMPOS_PARTIDO}
+
+
+def _acumular(deltas, datos, sistema, signo):
+    if not datos or datos['estado'] != Partido.EstadoPartido.JUGADO:
+        return
+    lados = (
+        (datos['equipo_local_id'], datos['marcador_local'], datos['marcador_visitante']),
+        (datos['equipo_visitante_id'], datos['marcador_visitante'], datos['marcador_local']),
+    )
+    for equipo_id, propios, rivales in lados:
+        fila = deltas[(datos['torneo_id'], equipo_id)]
+        for campo, valor in fila_resultado(sistema, propios, rivales).items():
+            fila[campo] += signo * valor
+
+
+def _sistema_de(torneo_id):
+    return Torneo.objects.filter(pk=torneo_id).values_list('deporte__sistema_puntuacion', flat=True).first()
+
+
+def actualizar_clasificacion(anterior, actual, sistema=None):
+    """
+    Aplica a la clasificación el paso de un partido del estado `anterior` al
+    estado `actual` (cualquiera de los dos puede ser None en altas y bajas).
+
+    Quita la aportación antigua, suma la nueva y lanza como mucho un UPDATE por
+    equipo afectado, así que el coste no depende del número de partidos.
+    """
+    if anterior == actual:
+        return
+    jugado = Partido.EstadoPartido.JUGADO
+    if (anterior or {}).get('estado') != jugado and (actual or {}).get('estado') != jugado:
+        return
+
+    deltas = defaultdict(lambda: dict.fromkeys(CAMPOS_CLASIFICACION, 0))
+    sistemas = {}
+    for datos, signo in ((anterior, -1), (actual, 1)):
+        if datos and datos['estado'] == jugado:
+            torneo_id = datos['torneo_id']
+            if torneo_id not in sistemas:
+                sistemas[torneo_id] = sistema or _sistema_de(torneo_id)
+            _acumular(deltas, datos, sistemas[torneo_id], signo)
+
+    for (torneo_id, equipo_id), fila in deltas.items():
+        cambios = {campo: models.F(campo) + valor for campo, valor in fila.items() if valor}
+        if cambios:
+            Inscripcion.objects.filter(torneo_id=torneo_id, equipo_id=equipo_id).update(**cambios, actualizado=Now())
+
+
+def recalcular_clasificacion(torneos=None, guardar=True):
+    """
+    Reconstruye las filas de clasificación recorriendo una sola vez los
+    partidos jugados. Devuelve la lista de (inscripcion, valores_calculados)
+    que no coincidían con lo guardado; si guardar=True las corrige.
+    """
+    partidos = Partido.objects.filter(estado=Partido.EstadoPartido.JUGADO)
+    inscripciones = Inscripcion.objects.select_related('torneo', 'equipo')
+    if torneos is not None:
+        partidos = partidos.filter(torneo__in=torneos)
+        inscripciones = inscripciones.filter(torneo__in=torneos)
+
+    deltas = defaultdict(lambda: dict.fromkeys(CAMPOS_CLASIFICACION, 0))
+    filas = partidos.values_list(*CAMPOS_PARTIDO, 'torneo__deporte__sistema_puntuacion')
+    for *valores, sistema in filas.iterator(chunk_size=2000):
+        _acumular(deltas, dict(zip(CAMPOS_PARTIDO, valores)), sistema, 1)
+
+    vacia = dict.fromkeys(CAMPOS_CLASIFICACION, 0)
+    diferencias = []
+    for inscripcion in inscripciones.iterator(chunk_size=2000):
+        calculada = deltas.get((inscripcion.torneo_id, inscripcion.equipo_id), vacia)
+        if any(getattr(inscripcion, campo) != valor for campo, valor in calculada.items()):
+            diferencias.append((inscripcion, calculada))
+
+    if guardar and diferencias:
+        ahora = timezone.now()
+        for inscripcion, calculada in diferencias:
+            for campo, valor in calculada.items():
+                setattr(inscripcion, campo, valor)
+            inscripcion.actualizado = ahora
+        Inscripcion.objects.bulk_update([i for i, _ in diferencias], [*CAMPOS_CLASIFICACION, 'actualizado'], batch_size=500)
+
+    return diferencias
@@ -0,0 +1,176 @@
+"""
+Datos sintéticos para pruebas de rendimiento.
+
+sembrar() crea de una vez deportes, equipos, jugadores, torneos con todos sus
+equipos inscritos, ligas a doble vuelta y las líneas de estadísticas de los
+partidos ya jugados, con inserciones masivas (SportApp.insercion). Con la misma
+semilla y los mismos tamaños sale siempre lo mismo, salvo las fechas: la última
+temporada se coloca para que vaya por la mitad hoy. Al final se recalculan las
+clasificaciones, los acumulados, los cara a cara y el Elo y se indexa todo para
+el buscador, así que la base queda como si se hubiera rellenado a mano.
+"""
+import random
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import busqueda
+from .calendario import invalidar_calendario
+from .clasificacion import recalcular_clasificacion
+from .elo import ELO_INICIAL, recalcular_elo
+from .enfrentamientos import recalcular_enfrentamientos
+from .estadisticas import recalcular_estadisticas
+from .insercion import insertar_filas
+from .jornadas import CAMPOS_INSERTADOS, rondas_liga
+from .referencias import invalidar_referencias
+from .models import Deporte, Equipo, EstadisticaPartido, Inscripcion, Jugador, Partido, Torneo
+
+
+Sistema = Deporte.SistemaPuntuacion
+Estado = Partido.EstadoPartido
+
+PREFIJO = 'Sintético'
+HORAS = (time(12), time(16), time(18), time(20))
+CIUDADES = ('Sevilla', 'Madrid', 'Bilbao', 'Valencia', 'Málaga', 'Zaragoza', 'Vigo', 'Granada',
+            'Murcia', 'Oviedo', 'Cádiz', 'Girona', 'Burgos', 'Almería', 'Huesca', 'Lugo')
+
+EN_CAMPO = {Sistema.GOLES: 11, Sistema.CANASTAS: 5, Sistema.SETS: 2, Sistema.PUNTOS: 7}
+
+
+def _marcador(sistema, azar):
+    if sistema == Sistema.GOLES:
+        return azar.randint(0, 5), azar.randint(0, 4)
+    if sistema == Sistema.CANASTAS:
+        return azar.randint(60, 110), azar.randint(60, 110)
+    if sistema == Sistema.SETS:
+        perdedor = azar.randint(0, 2)
+        return (3, perdedor) if azar.random() < 0.5 else (perdedor, 3)
+    return azar.randint(0, 30), azar.randint(0, 30)
+
+
+def _puntos_jugador(sistema, azar):
+    if sistema == Sistema.CANASTAS:
+        return azar.randint(0, 30)
+    if sistema == Sistema.PUNTOS:
+        return azar.randint(0, 8)
+    return int(azar.random() < 0.15) + int(azar.random() < 0.03)
+
+
+def _ids(queryset):
+    return list(queryset.order_by('id').values_list('id', flat=True))
+
+
+def sembrar(deportes=4, equipos=40, jugadores=15, torneos=2, semilla=0, usuario=None):
+    """
+    Crea `deportes` deportes con `equipos` equipos de `jugadores` jugadores y
+    `torneos` temporadas cada uno. La última temporada queda a medio jugar
+    (partidos pendientes en el futuro); las anteriores, terminadas.
+    Devuelve un diccionario con cuántas filas se han creado de cada modelo.
+    """
+    azar = random.Random(semilla)
+    prefijo = f'{PREFIJO} {semilla}'
+    if Deporte.objects.filter(nombre__startswith=prefijo).exists():
+        raise ValueError(f"Ya hay datos sintéticos con la semilla {semilla}.")
+
+    if usuario is None:
+        usuario, _ = User.objects.get_or_create(username='sintetico', defaults={'first_name': 'Datos sintéticos'})
+    sistemas = list(EN_CAMPO)
+    # La temporada en curso va por la mitad el dia de hoy
+    dias_temporada = (2 * equipos - 2) * 7
+    hoy = timezone.localdate()
+    primera = hoy - timedelta(days=365 * (torneos - 1) + dias_temporada // 2)
+    creados = {}
+
+    with transaction.atomic():
+        creados['deportes'] = insertar_filas(Deporte, ('nombre', 'tipo', 'sistema_puntuacion', 'jugadores_por_equipo'), [
+            (f'{prefijo}-{d}', Deporte.TipoDeporte.EQUIPO, sistemas[d % len(sistemas)], EN_CAMPO[sistemas[d % len(sistemas)]])
+            for d in range(deportes)
+        ])
+        deporte_ids = _ids(Deporte.objects.filter(nombre__startswith=prefijo))
+        sistema_de = dict(Deporte.objects.filter(pk__in=deporte_ids).values_list('id', 'sistema_puntuacion'))
+
+        filas = []
+        for deporte_id in deporte_ids:
+            for e in range(equipos):
+                filas.append((usuario.pk, f'Equipo {e + 1} ({deporte_id})', f'Entrenador {e + 1}',
+                              azar.choice(CIUDADES), deporte_id, '', {}, ELO_INICIAL, 0))
+        creados['equipos'] = insertar_filas(
+            Equipo, ('usuario', 'nombre', 'entrenador', 'ciudad', 'deporte', 'escudo', 'escudo_derivados', 'elo', 'elo_partidos'),
+            filas)
+        equipos_de = {deporte_id: [] for deporte_id in deporte_ids}
+        ciudad_de = {}
+        for equipo_id, deporte_id, ciudad in (Equipo.objects.filter(deporte_id__in=deporte_ids)
+                                              .order_by('id').values_list('id', 'deporte_id', 'ciudad')):
+            equipos_de[deporte_id].append(equipo_id)
+            ciudad_de[equipo_id] = ciudad
+
+        filas = [
+            (f'Jugador {j + 1}-{equipo_id}', j + 1, '', {}, equipo_id)
+            for deporte_id in deporte_ids for equipo_id in equipos_de[deporte_id] for j in range(min(jugadores, 99))
+        ]
+        creados['jugadores'] = insertar_filas(Jugador, ('nombre', 'dorsal', 'foto', 'foto_derivados', 'equipo'), filas)
+        plantilla = {}
+        for jugador_id, equipo_id in (Jugador.objects.filter(equipo__deporte_id__in=deporte_ids)
+                                      .order_by('id').values_list('id', 'equipo_id')):
+            plantilla.setdefault(equipo_id, []).append(jugador_id)
+
+        filas = []
+        for deporte_id in deporte_ids:
+            for t in range(torneos):
+                inicio = primera + timedelta(days=365 * t)
+                estado = Torneo.EstadoTorneo.FINALIZADO if t < torneos - 1 else Torneo.EstadoTorneo.EN_CURSO
+                filas.append((f'Liga {deporte_id}', f'{inicio.year}/{inicio.year + 1}', deporte_id, estado))
+        creados['torneos'] = insertar_filas(Torneo, ('nombre', 'temporada', 'deporte', 'estado'), filas)
+        torneos_de = {deporte_id: [] for deporte_id in deporte_ids}
+        for torneo_id, deporte_id in (Torneo.objects.filter(deporte_id__in=deporte_ids)
+                                      .order_by('id').values_list('id', 'deporte_id')):
+            torneos_de[deporte_id].append(torneo_id)
+
+        filas = [
+            (torneo_id, equipo_id, primera, azar.random() < 0.8, 0, 0, 0, 0, 0, 0, 0)
+            for deporte_id in deporte_ids for torneo_id in torneos_de[deporte_id] for equipo_id in equipos_de[deporte_id]
+        ]
+        creados['inscripciones'] = insertar_filas(Inscripcion, (
+            'torneo', 'equipo', 'fecha_inscripcion', 'ha_pagado', 'puntos_acumulados', 'partidos_jugados',
+            'ganados', 'empatados', 'perdidos', 'tantos_favor', 'tantos_contra'), filas)
+
+        filas = []
+        for deporte_id in deporte_ids:
+            sistema = sistema_de[deporte_id]
+            for t, torneo_id in enumerate(torneos_de[deporte_id]):
+                inicio = primera + timedelta(days=365 * t)
+                for numero, ronda in enumerate(rondas_liga(equipos_de[deporte_id], ida_y_vuelta=True)):
+                    dia = inicio + timedelta(days=7 * numero)
+                    for local, visitante in ronda:
+                        fecha_hora = timezone.make_aware(datetime.combine(dia, azar.choice(HORAS)))
+                        jugado = dia < hoy
+                        marcador = _marcador(sistema, azar) if jugado else (0, 0)
+                        filas.append((usuario.pk, torneo_id, fecha_hora, ciudad_de[local], f'Jornada {numero + 1}',
+                                      Estado.JUGADO if jugado else Estado.PENDIENTE, Partido.FasePartido.REGULAR,
+                                      local, visitante, *marcador))
+        creados['partidos'] = insertar_filas(Partido, CAMPOS_INSERTADOS, filas)
+
+        filas = []
+        for partido_id, local, visitante, sistema in (Partido.objects
+                .filter(torneo__deporte_id__in=deporte_ids, estado=Estado.JUGADO).order_by('id')
+                .values_list('id', 'equipo_local_id', 'equipo_visitante_id', 'torneo__deporte__sistema_puntuacion')
+                .iterator(chunk_size=5000)):
+            for equipo_id in (local, visitante):
+                for jugador_id in plantilla.get(equipo_id, [])[:EN_CAMPO[sistema]]:
+                    filas.append((partido_id, jugador_id, _puntos_jugador(sistema, azar), None, azar.randint(10, 90), True))
+        creados['lineas'] = insertar_filas(
+            EstadisticaPartido, ('partido', 'jugador', 'puntos', 'observaciones', 'minutos_jugados', 'juega'), filas)
+
+        recalcular_clasificacion([t for ids in torneos_de.values() for t in ids])
+        recalcular_estadisticas()
+        recalcular_enfrentamientos()
+        recalcular_elo(deporte_ids)
+        busqueda.indexar(Equipo.objects.filter(deporte_id__in=deporte_ids))
+        busqueda.indexar(Jugador.objects.filter(equipo__deporte_id__in=deporte_ids))
+        busqueda.indexar(Torneo.objects.filter(deporte_id__in=deporte_ids))
+        busqueda.indexar(Partido.objects.filter(torneo__deporte_id__in=deporte_ids))
+        invalidar_calendario(*deporte_ids)
+        invalidar_referencias('deportes', 'torneos')
+    return creados
@@ -0,0 +1,128 @@
+"""
+Canal en directo de los partidos (Server-Sent Events sobre ASGI).
+
+Cuando se confirma un cambio de marcador o de estado se publica una foto del
+partido en el broker y este la reparte en memoria a todas las conexiones
+abiertas de ese partido, así una sola escritura en la BD sirve a todos los
+espectadores sin que ninguno vuelva a consultar.
+
+El broker es configurable con OLYMPO_DIRECTO_BROKER. BrokerMemoria reparte
+dentro del proceso y sirve para desarrollo o un único worker; con varios
+workers hace falta un broker que reenvíe los mensajes entre procesos y que
+llame a repartir() en cada uno.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class Suscripcion:
+    """Conexión de un espectador. Solo guarda el último mensaje: si el cliente
+    va lento se salta fotos intermedias en vez de acumularlas."""
+
+    def __init__(self, broker, partido_id):
+        self.broker = broker
+        self.partido_id = partido_id
+        self._bucle = asyncio.get_running_loop()
+        self._pendiente = None
+        self._esperando = None
+
+    def _despertar(self):
+        if self._esperando is not None and not self._esperando.done():
+            self._esperando.set_result(None)
+
+    def _entregar(self, mensaje):
+        self._pendiente = mensaje
+        self._despertar()
+
+    async def recibir(self, timeout=None):
+        """Espera el siguiente mensaje; devuelve None si pasa el timeout."""
+        # Un future y un call_later por espera: con miles de conexiones wait_for() crearia una tarea por cada una
+        if self._pendiente is None:
+            self._esperando = self._bucle.create_future()
+            temporizador = self._bucle.call_later(timeout, self._despertar) if timeout is not None else None
+            try:
+                await self._esperando
+            finally:
+                self._esperando = None
+                if temporizador is not None:
+                    temporizador.cancel()
+        mensaje, self._pendiente = self._pendiente, None
+        return mensaje
+
+    def cerrar(self):
+        self.broker.desuscribir(self)
+
+
+def _entregar_a_todas(suscripciones, mensaje):
+    for suscripcion in suscripciones:
+        suscripcion._entregar(mensaje)
+
+
+class BrokerMemoria:
+    """Reparto en memoria dentro del proceso."""
+
+    def __init__(self):
+        self._suscripciones = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def suscribir(self, partido_id):
+        suscripcion = Suscripcion(self, partido_id)
+        with self._lock:
+            self._suscripciones[partido_id].add(suscripcion)
+        return suscripcion
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            suscripciones = self._suscripciones.get(suscripcion.partido_id)
+            if suscripciones is not None:
+                suscripciones.discard(suscripcion)
+                if not suscripciones:
+                    del self._suscripciones[suscripcion.partido_id]
+
+    def conexiones(self, partido_id=None):
+        with self._lock:
+            if partido_id is not None:
+                return len(self._suscripciones.get(partido_id, ()))
+            return sum(len(s) for s in self._suscripciones.values())
+
+    def repartir(self, partido_id, mensaje):
+        # Las colas pertenecen al bucle de cada suscriptor y se puede publicar desde cualquier hilo.
+        # Agrupamos por bucle para despertarlo una sola vez por mensaje y no una por conexion.
+        por_bucle = defaultdict(list)
+        with self._lock:
+            for suscripcion in self._suscripciones.get(partido_id, ()):
+                por_bucle[suscripcion._bucle].append(suscripcion)
+        for bucle, suscripciones in por_bucle.items():
+            bucle.call_soon_threadsafe(_entregar_a_todas, suscripciones, mensaje)
+        return sum(len(s) for s in por_bucle.values())
+
+    def publicar(self, partido_id, mensaje):
+        # Un broker entre procesos enviaría aquí el mensaje al resto de workers
+        return self.repartir(partido_id, mensaje)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'OLYMPO_DIRECTO_BROKER', 'SportApp.directo.BrokerMemoria'))()
+
+
+def mensaje_partido(datos):
+    """Foto del partido que se envía a los espectadores."""
+    return {
+        'id': datos['id'],
+        'estado': datos['estado'],
+        'marcador_local': datos['marcador_local'],
+        'marcador_visitante': datos['marcador_visitante'],
+    }
+
+
+def publicar_al_confirmar(datos):
+    """Publica la foto del partido cuando se confirme la transacción en curso."""
+    mensaje = mensaje_partido(datos)
+    transaction.on_commit(lambda: get_broker().publicar(mensaje['id'], mensaje))
@@ -0,0 +1,170 @@
+"""
+Elo de los equipos en su deporte.
+
+Cada partido jugado mueve el Elo de sus dos equipos en la misma cantidad y
+en sentidos contrarios: K por la diferencia entre el resultado y lo que se
+esperaba según sus Elo (con ventaja para el local), multiplicada por un
+factor que crece con la diferencia del marcador medida en la escala de su
+sistema de puntuación (un gol no vale lo mismo que una canasta). Lo que ganó
+el local se guarda en Partido.elo_cambio, así que al corregir el marcador o
+el estado de un partido se deshace y se vuelve a aplicar sin tocar los demás:
+coste constante por partido.
+
+Como el Elo depende del orden, un partido corregido se reaplica con el Elo
+actual. recalcular_elo() repite toda la historia de cada deporte por orden
+de fecha con NumPy, por rondas de partidos sin equipos en común, y deja los
+Elo como si todos los resultados se hubieran metido a su tiempo.
+"""
+import math
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .models import Deporte, Equipo, Partido
+
+
+ELO_INICIAL = Equipo._meta.get_field('elo').default
+K = 20
+VENTAJA_LOCAL = 50
+
+# Diferencia de marcador que cuenta como "una unidad" en cada sistema de puntuacion
+ESCALA_MARGEN = {
+    Deporte.SistemaPuntuacion.GOLES: 1,
+    Deporte.SistemaPuntuacion.CANASTAS: 10,
+    Deporte.SistemaPuntuacion.SETS: 1,
+    Deporte.SistemaPuntuacion.PUNTOS: 1,
+}
+
+
+def factor_margen(sistema, diferencia):
+    """1 para un empate o la mínima, y creciendo con el logaritmo de la diferencia."""
+    escala = ESCALA_MARGEN.get(sistema, 1)
+    return 1 + math.log1p(max(abs(diferencia) - escala, 0) / escala)
+
+
+def cambio_elo(sistema, elo_local, elo_visitante, marcador_local, marcador_visitante):
+    """Elo que gana el local (negativo si pierde) con este resultado."""
+    esperado = 1 / (1 + 10 ** ((elo_visitante - elo_local - VENTAJA_LOCAL) / 400))
+    resultado = 1.0 if marcador_local > marcador_visitante else 0.5 if marcador_local == marcador_visitante else 0.0
+    return K * factor_margen(sistema, marcador_local - marcador_visitante) * (resultado - esperado)
+
+
+def _mover(local_id, visitante_id, cambio, partidos):
+    # Un UPDATE para los dos equipos
+    Equipo.objects.filter(pk__in=(local_id, visitante_id)).update(
+        elo=models.Case(models.When(pk=local_id, then=models.F('elo') + cambio), default=models.F('elo') - cambio),
+        elo_partidos=models.F('elo_partidos') + partidos,
+        actualizado=Now(),
+    )
+
+
+def actualizar_elo(partido_id, anterior, actual, cambio_anterior=None, sistema=None):
+    """
+    Pasa al Elo el cambio de un partido del estado `anterior` al `actual`
+    (diccionarios con clasificacion.CAMPOS_PARTIDO, None en altas y bajas):
+    deshace `cambio_anterior`, lo que se aplicó con el resultado anterior, y
+    aplica el nuevo. Devuelve el nuevo Partido.elo_cambio.
+    """
+    jugado = Partido.EstadoPartido.JUGADO
+    if anterior == actual:
+        return cambio_anterior
+    if anterior and anterior['estado'] == jugado and cambio_anterior is not None:
+        _mover(anterior['equipo_local_id'], anterior['equipo_visitante_id'], -cambio_anterior, -1)
+
+    cambio = None
+    if actual and actual['estado'] == jugado:
+        local_id, visitante_id = actual['equipo_local_id'], actual['equipo_visitante_id']
+        elos = dict(Equipo.objects.select_for_update(of=('self',))
+                    .filter(pk__in=(local_id, visitante_id)).values_list('pk', 'elo'))
+        if sistema is None:
+            sistema = Equipo.objects.filter(pk=local_id).values_list('deporte__sistema_puntuacion', flat=True).first()
+        cambio = cambio_elo(sistema, elos[local_id], elos[visitante_id], actual['marcador_local'], actual['marcador_visitante'])
+        _mover(local_id, visitante_id, cambio, 1)
+    if actual is not None:
+        Partido.objects.filter(pk=partido_id).update(elo_cambio=cambio)
+    return cambio
+
+
+def _rondas(locales, visitantes, equipos):
+    """
+    Ronda de cada partido (en orden de fecha): la primera en la que ninguno de
+    sus dos equipos tiene ya partido. Los de una misma ronda no comparten
+    equipos y se pueden calcular a la vez sin cambiar el resultado.
+    """
+    ultima = [-1] * equipos
+    rondas = [0] * len(locales)
+    for i, (local, visitante) in enumerate(zip(locales.tolist(), visitantes.tolist())):
+        ronda = ultima[local] if ultima[local] > ultima[visitante] else ultima[visitante]
+        ultima[local] = ultima[visitante] = rondas[i] = ronda + 1
+    return rondas
+
+
+def _repetir(np, sistema, equipos, partidos):
+    """Elo final, partidos jugados de cada equipo y cambio de cada partido, repitiendo los resultados por rondas."""
+    indice = {equipo_id: i for i, equipo_id in enumerate(equipos)}
+    elo = np.full(len(equipos), ELO_INICIAL, dtype=float)
+    jugados = np.zeros(len(equipos), dtype=int)
+    if not partidos:
+        return elo, jugados, np.zeros(0)
+
+    _, locales, visitantes, marcador_local, marcador_visitante = (np.array(columna) for columna in zip(*partidos))
+    locales = np.array([indice[e] for e in locales.tolist()])
+    visitantes = np.array([indice[e] for e in visitantes.tolist()])
+    escala = ESCALA_MARGEN.get(sistema, 1)
+    diferencia = marcador_local - marcador_visitante
+    margen = 1 + np.log1p(np.maximum(np.abs(diferencia) - escala, 0) / escala)
+    resultado = np.where(diferencia > 0, 1.0, np.where(diferencia == 0, 0.5, 0.0))
+    np.add.at(jugados, locales, 1)
+    np.add.at(jugados, visitantes, 1)
+
+    cambios = np.zeros(len(partidos))
+    rondas = np.array(_rondas(locales, visitantes, len(equipos)))
+    orden = np.argsort(rondas, kind='stable')
+    cortes = np.flatnonzero(np.diff(rondas[orden])) + 1
+    for ronda in np.split(orden, cortes):
+        local, visitante = locales[ronda], visitantes[ronda]
+        esperado = 1 / (1 + 10 ** ((elo[visitante] - elo[local] - VENTAJA_LOCAL) / 400))
+        cambio = K * margen[ronda] * (resultado[ronda] - esperado)
+        elo[local] += cambio#dentro de una ronda no se repite ningun equipo
+        elo[visitante] -= cambio
+        cambios[ronda] = cambio
+    return elo, jugados, cambios
+
+
+def recalcular_elo(deportes=None):
+    """
+    Rehace el Elo de todos los equipos (o los de `deportes`) y el elo_cambio
+    de sus partidos repitiendo los resultados desde el principio. Devuelve
+    {deporte: equipos}.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImproperlyConfigured("Para recalcular el Elo hace falta numpy (pip install numpy).")
+
+    todos = Deporte.objects.all() if deportes is None else Deporte.objects.filter(pk__in=deportes)
+    resumen = {}
+    for deporte in todos:
+        equipos = list(Equipo.objects.filter(deporte=deporte).order_by('pk').values_list('pk', flat=True))
+        partidos = list(Partido.objects
+            .filter(torneo__deporte=deporte, estado=Partido.EstadoPartido.JUGADO)
+            .order_by('fecha_hora', 'pk')
+            .values_list('pk', 'equipo_local_id', 'equipo_visitante_id', 'marcador_local', 'marcador_visitante'))
+        elo, jugados, cambios = _repetir(np, deporte.sistema_puntuacion, equipos, partidos)
+
+        ahora = timezone.now()
+        Equipo.objects.bulk_update(
+            [Equipo(pk=equipo_id, elo=float(elo[i]), elo_partidos=int(jugados[i]), actualizado=ahora)
+             for i, equipo_id in enumerate(equipos)],
+            ['elo', 'elo_partidos', 'actualizado'], batch_size=500)
+        Partido.objects.bulk_update(
+            [Partido(pk=fila[0], elo_cambio=float(cambio)) for fila, cambio in zip(partidos, cambios)],
+            ['elo_cambio'], batch_size=500)
+        # Los que ya no cuentan (suspendidos, pendientes) no tienen cambio
+        Partido.objects.filter(torneo__deporte=deporte, elo_cambio__isnull=False).exclude(
+            estado=Partido.EstadoPartido.JUGADO).update(elo_cambio=None)
+        resumen[deporte] = len(equipos)
+    return resumen
+
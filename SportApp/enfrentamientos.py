@@ -0,0 +1,143 @@
+"""
+Cara a cara entre equipos.
+
+Cada pareja de equipos que se ha enfrentado tiene una fila de Enfrentamiento
+con sus totales (partidos, victorias de cada uno, empates, tantos) y los
+últimos ULTIMOS_PARTIDOS resultados, así que el historial de un cruce es una
+lectura por la clave única (equipo_a, equipo_b) en lugar de buscar en Partido
+por local y por visitante.
+
+Cuando un partido entra o sale del estado JUGADO o cambia su marcador se
+rehace la fila de su pareja a partir de sus partidos jugados, que son pocos.
+Si se cambia la fecha de un partido jugado o se cargan partidos con SQL a
+mano hay que pasar `manage.py recalcular_enfrentamientos`.
+"""
+from collections import defaultdict
+
+from django.db import models, transaction
+
+from .models import Enfrentamiento, Partido
+
+
+ULTIMOS_PARTIDOS = 5
+
+CAMPOS_TOTALES = ('partidos', 'victorias_a', 'victorias_b', 'empates', 'tantos_a', 'tantos_b')
+
+# Lo que se lee de cada partido jugado, del mas reciente al mas antiguo
+CAMPOS_LECTURA = ('id', 'fecha_hora', 'torneo_id', 'equipo_local_id', 'equipo_visitante_id',
+                  'marcador_local', 'marcador_visitante')
+
+
+def pareja(equipo_id, rival_id):
+    """Clave de la fila de dos equipos, en cualquier orden."""
+    return (equipo_id, rival_id) if equipo_id < rival_id else (rival_id, equipo_id)
+
+
+def _nueva_fila():
+    return dict(dict.fromkeys(CAMPOS_TOTALES, 0), ultimos=[])
+
+
+def _sumar(filas, id, fecha_hora, torneo_id, local_id, visitante_id, marcador_local, marcador_visitante):
+    # Los partidos llegan del mas reciente al mas antiguo: los primeros son los ultimos
+    equipo_a, equipo_b = pareja(local_id, visitante_id)
+    tantos_a, tantos_b = ((marcador_local, marcador_visitante) if local_id == equipo_a
+                          else (marcador_visitante, marcador_local))
+    fila = filas[(equipo_a, equipo_b)]
+    fila['partidos'] += 1
+    fila['victorias_a'] += int(tantos_a > tantos_b)
+    fila['victorias_b'] += int(tantos_b > tantos_a)
+    fila['empates'] += int(tantos_a == tantos_b)
+    fila['tantos_a'] += tantos_a
+    fila['tantos_b'] += tantos_b
+    if len(fila['ultimos']) < ULTIMOS_PARTIDOS:
+        fila['ultimos'].append({
+            'partido': id,
+            'fecha': fecha_hora.isoformat(),
+            'torneo': torneo_id,
+            'local': local_id,
+            'marcador_local': marcador_local,
+            'marcador_visitante': marcador_visitante,
+        })
+
+
+def _jugados():
+    return (Partido.objects.filter(estado=Partido.EstadoPartido.JUGADO)
+            .order_by('-fecha_hora', '-id').values_list(*CAMPOS_LECTURA))
+
+
+def _guardar(filas):
+    if filas:
+        Enfrentamiento.objects.bulk_create(
+            [Enfrentamiento(equipo_a_id=a, equipo_b_id=b, **fila) for (a, b), fila in filas.items()],
+            update_conflicts=True,
+            unique_fields=['equipo_a', 'equipo_b'],
+            update_fields=[*CAMPOS_TOTALES, 'ultimos', 'actualizado'],
+            batch_size=1000,
+        )
+
+
+def recalcular_parejas(parejas):
+    """Rehace las filas de esas parejas (pares de ids de equipo) con una lectura y una escritura."""
+    parejas = {pareja(*p) for p in parejas}
+    if not parejas:
+        return
+    filtro = models.Q()
+    for a, b in parejas:
+        filtro |= models.Q(equipo_local_id=a, equipo_visitante_id=b) | models.Q(equipo_local_id=b, equipo_visitante_id=a)
+
+    filas = defaultdict(_nueva_fila)
+    for valores in _jugados().filter(filtro):
+        _sumar(filas, *valores)
+
+    with transaction.atomic():
+        # Las parejas que ya no tienen ningun partido jugado se quedan sin fila
+        sin_partidos = parejas - set(filas)
+        if sin_partidos:
+            vacias = models.Q()
+            for a, b in sin_partidos:
+                vacias |= models.Q(equipo_a_id=a, equipo_b_id=b)
+            Enfrentamiento.objects.filter(vacias).delete()
+        _guardar(filas)
+
+
+def actualizar_enfrentamientos(anterior, actual):
+    """
+    Pasa a los cara a cara el cambio de un partido del estado `anterior` al
+    `actual` (diccionarios con los campos de clasificacion.CAMPOS_PARTIDO,
+    None en altas y bajas). Solo hace algo si alguno de los dos es JUGADO.
+    """
+    if anterior == actual:
+        return
+    parejas = {
+        pareja(datos['equipo_local_id'], datos['equipo_visitante_id'])
+        for datos in (anterior, actual)
+        if datos and datos['estado'] == Partido.EstadoPartido.JUGADO
+    }
+    recalcular_parejas(parejas)
+
+
+def recalcular_enfrentamientos():
+    """Rehace la tabla entera con una sola pasada por los partidos jugados. Devuelve las filas."""
+    filas = defaultdict(_nueva_fila)
+    for valores in _jugados().iterator(chunk_size=2000):
+        _sumar(filas, *valores)
+    with transaction.atomic():
+        Enfrentamiento.objects.all().delete()
+        _guardar(filas)
+    return len(filas)
+
+
+def enfrentamiento_de(equipo_id, rival_id):
+    """La fila de dos equipos (None si no se han enfrentado) con una lectura por la clave única."""
+    a, b = pareja(equipo_id, rival_id)
+    return Enfrentamiento.objects.filter(equipo_a_id=a, equipo_b_id=b).first()
+
+
+def enfrentamientos_de(parejas):
+    """{pareja: fila} de muchas parejas a la vez (p. ej. todos los partidos de una jornada) en una consulta."""
+    filtro = models.Q()
+    for a, b in {pareja(*p) for p in parejas}:
+        filtro |= models.Q(equipo_a_id=a, equipo_b_id=b)
+    if not filtro:
+        return {}
+    return {(fila.equipo_a_id, fila.equipo_b_id): fila for fila in Enfrentamiento.objects.filter(filtro)}
@@ -0,0 +1,243 @@
+"""
+Estadísticas acumuladas de los jugadores.
+
+Cada línea de EstadisticaPartido suma en seis filas de EstadisticaAcumulada:
+las del jugador en su torneo, su temporada y su carrera, y las de los totales
+de todos los jugadores en esos mismos tres ámbitos. Los rankings y los totales
+de la página de estadísticas son lecturas por índice de esas filas, sin
+agregar nada, así que no crecen con el número de líneas.
+
+La fila de carrera de cada jugador guarda además su forma: los últimos
+FORMA_PARTIDOS partidos que ha jugado, con la fecha, el rival y lo que hizo.
+Con ella y las demás filas del jugador, perfil_jugador() monta su ficha con
+una sola consulta, tenga los partidos que tenga.
+
+Las filas se ajustan con deltas al guardar o borrar líneas. Si se cambia la
+temporada de un torneo, se mueve un partido a otro torneo o de fecha o se
+renombra un equipo hay que pasar `manage.py recalcular_estadisticas`.
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import EstadisticaAcumulada, EstadisticaPartido, Partido
+
+
+Ambito = EstadisticaAcumulada.Ambito
+
+CAMPOS_ACUMULADOS = ('partidos_jugados', 'puntos', 'minutos_jugados')
+
+FORMA_PARTIDOS = 5
+
+# Campos de la linea que cuentan para los totales y la forma, con el torneo y la temporada de su partido
+CAMPOS_LINEA = ('jugador_id', 'partido_id', 'partido__torneo_id', 'partido__torneo__temporada', 'juega', 'puntos',
+                'minutos_jugados')
+
+
+def datos_linea(linea, torneo_id, temporada):
+    return {
+        'jugador_id': linea.jugador_id,
+        'partido_id': linea.partido_id,
+        'partido__torneo_id': torneo_id,
+        'partido__torneo__temporada': temporada,
+        'juega': linea.juega,
+        'puntos': linea.puntos,
+        'minutos_jugados': linea.minutos_jugados,
+    }
+
+
+def torneo_de_partido(partido_id):
+    """(torneo_id, temporada) del partido, o (None, None) si ya no existe."""
+    fila = Partido.objects.filter(pk=partido_id).values_list('torneo_id', 'torneo__temporada').first()
+    return fila or (None, None)
+
+
+def _acumular(deltas, datos, signo):
+    """Suma la aportación de una línea a las filas que le tocan."""
+    if not datos:
+        return
+    valores = (int(bool(datos['juega'])), datos['puntos'] or 0, datos['minutos_jugados'] or 0)
+    torneo_id = datos['partido__torneo_id']
+    claves = [(Ambito.CARRERA, '', None)]
+    if torneo_id is not None:
+        claves += [
+            (Ambito.TEMPORADA, datos['partido__torneo__temporada'], None),
+            (Ambito.TORNEO, str(torneo_id), torneo_id),
+        ]
+    for jugador_id in (datos['jugador_id'], None):
+        for ambito, clave, torneo in claves:
+            fila = deltas[(jugador_id, ambito, clave)]
+            fila['torneo_id'] = torneo
+            for campo, valor in zip(CAMPOS_ACUMULADOS, valores):
+                fila[campo] += signo * valor
+
+
+def _nuevos_deltas():
+    return defaultdict(lambda: dict.fromkeys(CAMPOS_ACUMULADOS, 0))
+
+
+def _guardar_deltas(deltas):
+    jugadores = {jugador_id for jugador_id, _, _ in deltas if jugador_id is not None}
+    ambitos = models.Q()
+    for ambito, clave in {(ambito, clave) for _, ambito, clave in deltas}:
+        ambitos |= models.Q(ambito=ambito, clave=clave)
+
+    filas = (EstadisticaAcumulada.objects.select_for_update()
+        .filter(ambitos)
+        .filter(models.Q(jugador_id__in=jugadores) | models.Q(jugador__isnull=True)))
+    existentes = {(f.jugador_id, f.ambito, f.clave): f for f in filas}
+
+    cambiadas, nuevas = [], []
+    for clave, delta in deltas.items():
+        fila = existentes.get(clave)
+        if fila is not None:
+            for campo in CAMPOS_ACUMULADOS:
+                setattr(fila, campo, max(getattr(fila, campo) + delta[campo], 0))
+            cambiadas.append(fila)
+        elif all(delta[campo] >= 0 for campo in CAMPOS_ACUMULADOS):
+            # Solo se crean filas al sumar; restar de una fila que no existe (p. ej. porque se esta
+            # borrando su torneo en cascada) no deja nada que guardar
+            jugador_id, ambito, clave_ambito = clave
+            nuevas.append(EstadisticaAcumulada(
+                jugador_id=jugador_id, ambito=ambito, clave=clave_ambito, torneo_id=delta['torneo_id'],
+                **{campo: delta[campo] for campo in CAMPOS_ACUMULADOS},
+            ))
+
+    if cambiadas:
+        ahora = timezone.now()
+        for fila in cambiadas:
+            fila.actualizado = ahora#bulk_update no pasa por el auto_now
+        EstadisticaAcumulada.objects.bulk_update(cambiadas, [*CAMPOS_ACUMULADOS, 'actualizado'])
+    if nuevas:
+        EstadisticaAcumulada.objects.bulk_create(nuevas)
+
+
+def _formas(jugador_ids=None):
+    """
+    {jugador_id: forma} con los últimos FORMA_PARTIDOS partidos jugados de cada
+    jugador (de todos con None), en una consulta que corta por jugador en la BD.
+    """
+    lineas = EstadisticaPartido.objects.filter(juega=True)
+    if jugador_ids is not None:
+        lineas = lineas.filter(jugador_id__in=jugador_ids)
+    lineas = (lineas
+        .annotate(orden=models.Window(RowNumber(), partition_by=models.F('jugador_id'),
+                                      order_by=(models.F('partido__fecha_hora').desc(), models.F('partido_id').desc())))
+        .filter(orden__lte=FORMA_PARTIDOS)
+        .order_by('jugador_id', 'orden')
+        .values_list('jugador_id', 'jugador__equipo_id', 'partido_id', 'partido__fecha_hora', 'partido__equipo_local_id',
+                     'partido__equipo_local__nombre', 'partido__equipo_visitante__nombre', 'puntos', 'minutos_jugados'))
+
+    formas = defaultdict(list)
+    for jugador_id, equipo_id, partido_id, fecha_hora, local_id, local, visitante, puntos, minutos in lineas:
+        en_casa = equipo_id == local_id
+        formas[jugador_id].append({
+            'partido': partido_id,
+            'fecha': fecha_hora.isoformat(),
+            'rival': visitante if en_casa else local,
+            'en_casa': en_casa,
+            'puntos': puntos,
+            'minutos': minutos,
+        })
+    return formas
+
+
+def _actualizar_formas(jugador_ids):
+    # La forma cambia con cualquier linea del jugador, aunque no mueva ningun total (otro partido, misma cifra)
+    formas = _formas(jugador_ids)
+    filas = list(EstadisticaAcumulada.objects.filter(jugador_id__in=jugador_ids, ambito=Ambito.CARRERA, clave=''))
+    ahora = timezone.now()
+    for fila in filas:
+        fila.forma = formas.get(fila.jugador_id, [])
+        fila.actualizado = ahora
+    EstadisticaAcumulada.objects.bulk_update(filas, ['forma', 'actualizado'])
+
+
+def aplicar_deltas(cambios):
+    """
+    Aplica una lista de pares (anterior, actual) de líneas (diccionarios con
+    CAMPOS_LINEA, None en altas y bajas) con una lectura y como mucho dos
+    escrituras en lote, sea una línea o el acta entera de un partido, más la
+    lectura y escritura de la forma de los jugadores que cambian.
+    """
+    deltas = _nuevos_deltas()
+    jugadores = set()
+    for anterior, actual in cambios:
+        if anterior == actual:
+            continue
+        _acumular(deltas, anterior, -1)
+        _acumular(deltas, actual, 1)
+        jugadores.update(datos['jugador_id'] for datos in (anterior, actual) if datos)
+    deltas = {clave: d for clave, d in deltas.items() if any(d[campo] for campo in CAMPOS_ACUMULADOS)}
+    if not jugadores:
+        return
+
+    for intento in range(2):
+        try:
+            with transaction.atomic():
+                if deltas:
+                    _guardar_deltas(deltas)
+                _actualizar_formas(jugadores)
+            return
+        except IntegrityError:
+            # Otra peticion ha creado a la vez alguna de las filas nuevas: al repetir ya las encontramos
+            if intento:
+                raise
+
+
+def recalcular_estadisticas():
+    """Rehace la tabla de acumulados desde cero con una sola pasada por las líneas (y otra para las formas)."""
+    deltas = _nuevos_deltas()
+    for valores in EstadisticaPartido.objects.values_list(*CAMPOS_LINEA).iterator(chunk_size=2000):
+        _acumular(deltas, dict(zip(CAMPOS_LINEA, valores)), 1)
+    formas = _formas()
+
+    with transaction.atomic():
+        EstadisticaAcumulada.objects.all().delete()
+        EstadisticaAcumulada.objects.bulk_create(
+            (EstadisticaAcumulada(
+                jugador_id=jugador_id, ambito=ambito, clave=clave, torneo_id=d['torneo_id'],
+                forma=formas.get(jugador_id, []) if jugador_id is not None and ambito == Ambito.CARRERA else [],
+                **{campo: d[campo] for campo in CAMPOS_ACUMULADOS},
+            ) for (jugador_id, ambito, clave), d in deltas.items()),
+            batch_size=1000,
+        )
+    return len(deltas)
+
+
+def perfil_jugador(jugador):
+    """
+    Ficha del jugador leída de sus filas acumuladas en una consulta: la carrera
+    (con la forma), las temporadas de la más reciente a la más antigua y los
+    torneos de cada temporada.
+    """
+    carrera, temporadas, torneos = None, [], []
+    for fila in EstadisticaAcumulada.objects.filter(jugador=jugador).select_related('torneo').order_by('-clave'):
+        if fila.ambito == Ambito.CARRERA:
+            carrera = fila
+        elif fila.ambito == Ambito.TEMPORADA:
+            temporadas.append(fila)
+        elif fila.torneo is not None:
+            torneos.append(fila)
+    torneos.sort(key=lambda fila: (fila.torneo.temporada, fila.torneo_id), reverse=True)
+    return {
+        'carrera': carrera,
+        'temporadas': temporadas,
+        'torneos': torneos,
+        'forma': [dict(partido, fecha=datetime.fromisoformat(partido['fecha'])) for partido in (carrera.forma if carrera else [])],
+    }
+
+
+def ranking(campo, ambito=Ambito.CARRERA, clave='', limite=5):
+    """Top de jugadores por `campo` en un ámbito, leído directamente del índice."""
+    return (EstadisticaAcumulada.objects
+        .filter(ambito=ambito, clave=clave, jugador__isnull=False, **{f'{campo}__gt': 0})
+        .select_related('jugador__equipo')
+        .order_by(f'-{campo}')[:limite])
+
+
+def totales(ambito=Ambito.CARRERA, clave=''):
+    return EstadisticaAcumulada.objects.filter(ambito=ambito, clave=clave, jugador__isnull=True).first()
@@ -0,0 +1,155 @@
+"""
+Exportación de resultados en CSV y JSON lines.
+
+Cada exportación es una lista de columnas (cabecera y ruta de values_list) sobre
+un modelo. Las filas se leen por bloques con un cursor por clave (pk > último),
+así cada consulta es corta y la memoria no depende del número de filas en
+ningún backend (con MySQL/SQLite .iterator() sigue trayendo el resultado entero
+al cliente), y se van escribiendo en la respuesta según llegan.
+"""
+import csv
+import json
+
+from django.db.models import F
+from django.utils.text import compress_sequence
+
+from .models import EstadisticaPartido, Inscripcion, Partido
+
+
+TAMANO_BLOQUE = 2000
+TAMANO_TROZO = 64 * 1024#bytes que se mandan de una vez al servidor
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class Exportacion:
+    def __init__(self, modelo, prefijo_torneo, columnas):
+        self.modelo = modelo
+        self.prefijo_torneo = prefijo_torneo#ruta hasta el torneo, para los filtros
+        self.columnas = columnas
+
+    @property
+    def cabeceras(self):
+        return [cabecera for cabecera, _ in self.columnas]
+
+    def queryset(self, torneo=None, deporte=None, temporada=None):
+        filtros = {}
+        if torneo is not None:
+            filtros[f'{self.prefijo_torneo}_id'] = torneo
+        if deporte is not None:
+            filtros[f'{self.prefijo_torneo}__deporte_id'] = deporte
+        if temporada:
+            filtros[f'{self.prefijo_torneo}__temporada'] = temporada
+        return self.modelo.objects.filter(**filtros)
+
+    def filas(self, tamano_bloque=TAMANO_BLOQUE, **filtros):
+        queryset = self.queryset(**filtros).values_list('pk', *(ruta for _, ruta in self.columnas)).order_by('pk')
+        ultimo = None
+        while True:
+            bloque = queryset if ultimo is None else queryset.filter(pk__gt=ultimo)
+            bloque = list(bloque[:tamano_bloque])
+            for fila in bloque:
+                yield fila[1:]
+            if len(bloque) < tamano_bloque:
+                return
+            ultimo = bloque[-1][0]
+
+
+class ExportacionClasificacion(Exportacion):
+    # La clasificacion va torneo a torneo y ordenada como en TorneoDetail; un torneo son pocas filas
+    def filas(self, tamano_bloque=TAMANO_BLOQUE, **filtros):
+        queryset = self.queryset(**filtros)
+        torneo_ids = queryset.order_by('torneo_id').values_list('torneo_id', flat=True).distinct()
+        for torneo_id in torneo_ids.iterator(chunk_size=tamano_bloque):
+            yield from (queryset.filter(torneo_id=torneo_id)
+                        .annotate(diferencia=F('tantos_favor') - F('tantos_contra'))
+                        .order_by('-puntos_acumulados', '-diferencia', '-tantos_favor', 'equipo__nombre')
+                        .values_list(*(ruta for _, ruta in self.columnas)))
+
+
+EXPORTACIONES = {
+    'partidos': Exportacion(Partido, 'torneo', [
+        ('id', 'id'),
+        ('torneo', 'torneo__nombre'),
+        ('temporada', 'torneo__temporada'),
+        ('deporte', 'torneo__deporte__nombre'),
+        ('fecha_hora', 'fecha_hora'),
+        ('jornada', 'jornada'),
+        ('fase', 'fase'),
+        ('estado', 'estado'),
+        ('lugar', 'lugar'),
+        ('equipo_local', 'equipo_local__nombre'),
+        ('equipo_visitante', 'equipo_visitante__nombre'),
+        ('marcador_local', 'marcador_local'),
+        ('marcador_visitante', 'marcador_visitante'),
+    ]),
+    'clasificacion': ExportacionClasificacion(Inscripcion, 'torneo', [
+        ('torneo_id', 'torneo_id'),
+        ('torneo', 'torneo__nombre'),
+        ('temporada', 'torneo__temporada'),
+        ('deporte', 'torneo__deporte__nombre'),
+        ('equipo', 'equipo__nombre'),
+        ('partidos_jugados', 'partidos_jugados'),
+        ('ganados', 'ganados'),
+        ('empatados', 'empatados'),
+        ('perdidos', 'perdidos'),
+        ('tantos_favor', 'tantos_favor'),
+        ('tantos_contra', 'tantos_contra'),
+        ('puntos', 'puntos_acumulados'),
+    ]),
+    'estadisticas': Exportacion(EstadisticaPartido, 'partido__torneo', [
+        ('partido_id', 'partido_id'),
+        ('fecha_hora', 'partido__fecha_hora'),
+        ('torneo', 'partido__torneo__nombre'),
+        ('temporada', 'partido__torneo__temporada'),
+        ('deporte', 'partido__torneo__deporte__nombre'),
+        ('jugador_id', 'jugador_id'),
+        ('jugador', 'jugador__nombre'),
+        ('equipo', 'jugador__equipo__nombre'),
+        ('juega', 'juega'),
+        ('minutos_jugados', 'minutos_jugados'),
+        ('puntos', 'puntos'),
+        ('observaciones', 'observaciones'),
+    ]),
+}
+
+
+class _Eco:
+    """Fichero falso para csv.writer: devuelve lo escrito en vez de guardarlo."""
+    def write(self, valor):
+        return valor
+
+
+def lineas_csv(cabeceras, filas):
+    escritor = csv.writer(_Eco())
+    yield '\ufeff' + escritor.writerow(cabeceras)#BOM para que Excel lo abra en UTF-8
+    for fila in filas:
+        yield escritor.writerow(fila)
+
+
+def lineas_jsonl(cabeceras, filas):
+    for fila in filas:
+        yield json.dumps(dict(zip(cabeceras, fila)), ensure_ascii=False, default=str) + '\n'
+
+
+def _trozos(lineas):
+    # Juntamos las lineas para no hacer una escritura al socket por fila
+    trozo, tamano = [], 0
+    for linea in lineas:
+        trozo.append(linea)
+        tamano += len(linea)
+        if tamano >= TAMANO_TROZO:
+            yield ''.join(trozo).encode('utf-8')
+            trozo, tamano = [], 0
+    if trozo:
+        yield ''.join(trozo).encode('utf-8')
+
+
+def contenido(exportacion, formato, comprimir=False, **filtros):
+    """Generador de bytes de la exportación, opcionalmente en gzip."""
+    generar = lineas_csv if formato == 'csv' else lineas_jsonl
+    trozos = _trozos(generar(exportacion.cabeceras, exportacion.filas(**filtros)))
+    return compress_sequence(trozos) if comprimir else trozos
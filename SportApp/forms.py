@@ -1,19 +1,23 @@
+from datetime import datetime
 
 from django import forms
 from django.core.exceptions import ValidationError
 from .models import *
+from .referencias import ReferenciaChoiceField, ReferenciaMultipleChoiceField
+from .autocompletar import AutocompletarSelect, AutocompletarSelectMultiple
 
 
 class JugadorForm(forms.ModelForm):
     class Meta:
         model = Jugador
         fields = '__all__'
+        field_classes = {'equipo': ReferenciaChoiceField}#opciones desde la cache (SportApp.referencias)
         
         #para que se vea bonito en bootstrap
         widgets = {
             'nombre': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Nombre del jugador'}),
             'dorsal': forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'max': 99}),
-            'equipo': forms.Select(attrs={'class': 'form-select'}),
+            'equipo': AutocompletarSelect('equipos', attrs={'class': 'form-select'}),#se busca escribiendo (SportApp.autocompletar)
             'foto': forms.FileInput(attrs={'class': 'form-control'}),
         }
 
@@ -41,6 +45,7 @@ class EquipoForm(forms.ModelForm):
         exclude=['usuario'] # Excluir el campo 'usuario' del formulario
 
         fields = '__all__'
+        field_classes = {'deporte': ReferenciaChoiceField}
         widgets = {
             'nombre': forms.TextInput(attrs={'class': 'form-control'}),
             'entrenador': forms.TextInput(attrs={'class': 'form-control'}),
@@ -57,11 +62,13 @@ class TorneoForm(forms.ModelForm):
     class Meta:
         model =Torneo
         fields = '__all__'
+        field_classes = {'deporte': ReferenciaChoiceField, 'equipos': ReferenciaMultipleChoiceField}
         widgets={
             'deporte':forms.Select(attrs={'class':'form-select'}),
             'nombre':forms.TextInput(attrs={'class':'form-control'}),
             'temporada':forms.TextInput(attrs={'class':'form-control'}),
             'estado':forms.Select(attrs={'class':'form-select'}),
+            'equipos':AutocompletarSelectMultiple('equipos',{'deporte':'deporte'},attrs={'class':'form-select'}),
         }
 # ---------------------------------------------------------
 class PartidoForm(forms.ModelForm):
@@ -69,14 +76,15 @@ class PartidoForm(forms.ModelForm):
         model=Partido
         exclude=['usuario'] # Excluir el campo 'usuario' del formulario
         fields=('torneo','fecha_hora','lugar','jornada','estado','equipo_local','equipo_visitante','marcador_local','marcador_visitante')
+        field_classes={'torneo':ReferenciaChoiceField,'equipo_local':ReferenciaChoiceField,'equipo_visitante':ReferenciaChoiceField}
         widgets={
-            'torneo':forms.Select(attrs={'class':'form-select'}),
+            'torneo':AutocompletarSelect('torneos',attrs={'class':'form-select'}),
             'fecha_hora':forms.DateTimeInput(attrs={'class':'form-control','type':'datetime-local'}),
             'lugar':forms.TextInput(attrs={'class':'form-control'}),
             'jornada':forms.TextInput(attrs={'class':'form-control'}),
             'estado':forms.Select(attrs={'class':'form-select'}),
-            'equipo_local':forms.Select(attrs={'class':'form-select'}),
-            'equipo_visitante':forms.Select(attrs={'class':'form-select'}),
+            'equipo_local':AutocompletarSelect('equipos',{'torneo':'torneo'},attrs={'class':'form-select'}),#solo los del deporte del torneo elegido
+            'equipo_visitante':AutocompletarSelect('equipos',{'torneo':'torneo'},attrs={'class':'form-select'}),
             'marcador_local':forms.NumberInput(attrs={'class':'form-control'}),
             'marcador_visitante':forms.NumberInput(attrs={'class':'form-control'}),
         }
@@ -85,12 +93,11 @@ class PartidoForm(forms.ModelForm):
 class InscripcionForm(forms.ModelForm):
     class Meta:
         model=Inscripcion
-        fields='__all__'
+        fields=('equipo','torneo','ha_pagado')# los puntos salen de los partidos jugados (SportApp.clasificacion)
+        field_classes={'equipo':ReferenciaChoiceField,'torneo':ReferenciaChoiceField}
         widgets={
-            'equipo':forms.Select(attrs={'class':'form-select'}),
-            'torneo':forms.Select(attrs={'class':'form-select'}),
-            'puntos_acumulados':forms.NumberInput(attrs={'class':'form-control'}),
-            'fecha_inscripcion':forms.DateTimeInput(attrs={'class':'form-control','type':'datetime-local'}),
+            'equipo':AutocompletarSelect('equipos',attrs={'class':'form-select'}),
+            'torneo':AutocompletarSelect('torneos',attrs={'class':'form-select'}),
             'ha_pagado':forms.CheckboxInput(attrs={ 'class':'form-check-input'}),
         }
 
@@ -99,11 +106,80 @@ class EstadisticaPartidoForm(forms.ModelForm):
     class Meta:
         model = EstadisticaPartido
         fields = ('partido', 'jugador', 'juega', 'puntos', 'minutos_jugados', 'observaciones')
+        field_classes = {'partido': ReferenciaChoiceField, 'jugador': ReferenciaChoiceField}
         widgets = {
-            'partido': forms.Select(attrs={'class': 'form-select'}),
-            'jugador': forms.Select(attrs={'class': 'form-select'}),
+            'partido': AutocompletarSelect('partidos', attrs={'class': 'form-select'}),
+            'jugador': AutocompletarSelect('jugadores', {'partido': 'partido'}, attrs={'class': 'form-select'}),#los de los dos equipos del partido
             'juega': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'puntos': forms.NumberInput(attrs={'class': 'form-control', 'min': 0}),
             'minutos_jugados': forms.NumberInput(attrs={'class': 'form-control', 'min': 0}),
             'observaciones': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
-        }
\ No newline at end of file
+        }
+
+# ---------------------------------------------------------
+class LineaActaForm(forms.Form):
+    # Una fila del acta completa; el jugador va oculto y se valida en bloque en SportApp.actas
+    jugador = forms.IntegerField(widget=forms.HiddenInput)
+    juega = forms.BooleanField(required=False, widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
+    puntos = forms.IntegerField(min_value=0, required=False, widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'min': 0}))
+    minutos_jugados = forms.IntegerField(min_value=0, required=False, widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'min': 0}))
+    observaciones = forms.CharField(required=False, widget=forms.TextInput(attrs={'class': 'form-control form-control-sm'}))
+
+    def tiene_datos(self):
+        datos = self.cleaned_data
+        return datos.get('juega') or datos.get('puntos') or datos.get('minutos_jugados') or datos.get('observaciones')
+
+
+ActaFormSet = forms.formset_factory(LineaActaForm, extra=0)
+
+
+class GenerarCalendarioForm(forms.Form):
+    TIPOS = (
+        ('liga', 'Liga (todos contra todos)'),
+        ('eliminatoria', 'Eliminatoria: primera ronda'),
+        ('siguiente-ronda', 'Eliminatoria: siguiente ronda con los ganadores'),
+    )
+    tipo = forms.ChoiceField(choices=TIPOS, widget=forms.Select(attrs={'class': 'form-select'}))
+    inicio = forms.DateTimeField(widget=forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}))
+    dias_entre_jornadas = forms.IntegerField(initial=7, min_value=1, widget=forms.NumberInput(attrs={'class': 'form-control'}))
+    horarios = forms.CharField(required=False, help_text="Horas de juego separadas por comas, p. ej. 18:00, 20:00",
+                               widget=forms.TextInput(attrs={'class': 'form-control'}))
+    sedes = forms.CharField(required=False, help_text="Una sede por línea. Si se deja vacío se juega en la ciudad del local.",
+                            widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3}))
+    ida_y_vuelta = forms.BooleanField(required=False, widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
+    clasificados = forms.IntegerField(required=False, min_value=2, help_text="Solo eliminatoria. Por defecto la mayor potencia de dos posible.",
+                                      widget=forms.NumberInput(attrs={'class': 'form-control'}))
+    reemplazar = forms.BooleanField(required=False, label="Borrar antes los partidos pendientes",
+                                    widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
+
+    def clean_horarios(self):
+        horarios = []
+        for valor in self.cleaned_data['horarios'].split(','):
+            if valor.strip():
+                try:
+                    horarios.append(datetime.strptime(valor.strip(), '%H:%M').time())
+                except ValueError:
+                    raise ValidationError(f"'{valor.strip()}' no es una hora válida (HH:MM).")
+        return horarios
+
+    def clean_sedes(self):
+        return [sede.strip() for sede in self.cleaned_data['sedes'].splitlines() if sede.strip()]
+
+
+class ImportarForm(forms.Form):
+    TIPOS = (
+        ('equipos', 'Equipos'),
+        ('jugadores', 'Jugadores'),
+        ('partidos', 'Partidos'),
+    )
+    tipo = forms.ChoiceField(choices=TIPOS, widget=forms.Select(attrs={'class': 'form-select'}))
+    fichero = forms.FileField(help_text="CSV en UTF-8 (separado por ',' o ';') o XLSX, con los nombres de columna en la primera fila.",
+                              widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}))
+    comprobar = forms.BooleanField(required=False, label="Solo comprobar, sin guardar",
+                                   widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
+
+    def clean_fichero(self):
+        fichero = self.cleaned_data['fichero']
+        if not fichero.name.lower().endswith(('.csv', '.xlsx')):
+            raise ValidationError("El fichero tiene que ser .csv o .xlsx.")
+        return fichero
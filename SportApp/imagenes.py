@@ -0,0 +1,137 @@
+"""
+Derivados de las imágenes subidas (escudos de equipo y fotos de jugador).
+
+Al subir una imagen se generan, en la cola de tareas, varias copias reducidas
+en WebP y en un formato de respaldo (JPEG, o PNG si la imagen tiene
+transparencia). Los nombres llevan un hash del contenido original, así que un
+fichero derivado nunca cambia y se puede servir con caché inmutable; subir la
+misma imagen dos veces reutiliza los mismos ficheros.
+
+Lo generado se guarda en el JSONField `<campo>_derivados` del modelo:
+
+    {"origen": "escudos/x.jpg", "hash": "...", "tipo": "image/jpeg",
+     "tamanos": [{"ancho": 40, "alto": 40, "webp": "...", "respaldo": "..."}, ...]}
+
+La etiqueta {% imagen %} de templatetags/imagenes.py y los serializadores leen
+de ahí; si todavía no hay derivados se usa el original.
+"""
+import hashlib
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models
+from django.db.models.functions import Now
+
+from PIL import Image, ImageOps
+
+from .models import Tarea
+from .tareas import encolar
+
+
+logger = logging.getLogger(__name__)
+
+# Anchos (px) que se generan por campo: cubren los tamaños a los que se pintan en las plantillas, a 1x y 2x
+TAMANOS = {
+    'escudo': (40, 80, 160, 320),
+    'foto': (64, 160, 320, 640),
+}
+
+CARPETA_DERIVADOS = 'derivados'
+CALIDAD_WEBP = 80
+CALIDAD_JPEG = 82
+
+def _tiene_transparencia(imagen):
+    return imagen.mode in ('RGBA', 'LA') or (imagen.mode == 'P' and 'transparency' in imagen.info)
+
+
+def _guardar(nombre, imagen, formato, **opciones):
+    # El nombre depende del contenido: si ya existe es exactamente este fichero
+    if not default_storage.exists(nombre):
+        buffer = io.BytesIO()
+        imagen.save(buffer, formato, **opciones)
+        default_storage.save(nombre, ContentFile(buffer.getvalue()))
+    return nombre
+
+
+def generar_derivados(fichero, campo):
+    """Genera los derivados del FieldFile `fichero` y devuelve el diccionario a guardar en `<campo>_derivados`."""
+    with fichero.open('rb') as f:
+        contenido = f.read()
+    huella = hashlib.sha256(contenido).hexdigest()[:16]
+
+    with Image.open(io.BytesIO(contenido)) as original:
+        original.draft('RGB', (max(TAMANOS[campo]),) * 2)  # en JPEG decodifica ya reducido
+        original = ImageOps.exif_transpose(original)
+        transparente = _tiene_transparencia(original)
+        original = original.convert('RGBA' if transparente else 'RGB')
+
+    extension, formato, tipo = ('png', 'PNG', 'image/png') if transparente else ('jpg', 'JPEG', 'image/jpeg')
+    base = f"{CARPETA_DERIVADOS}/{campo}/{huella[:2]}/{huella}"
+    tamanos = []
+    for ancho in TAMANOS[campo]:
+        if tamanos and ancho > max(original.size):
+            break  # no se amplía: el último derivado ya es del tamaño del original
+        copia = original.copy()
+        copia.thumbnail((ancho, ancho), Image.Resampling.LANCZOS)
+        tamanos.append({
+            'ancho': copia.width,
+            'alto': copia.height,
+            'webp': _guardar(f"{base}-{ancho}.webp", copia, 'WEBP', quality=CALIDAD_WEBP, method=6),
+            'respaldo': _guardar(f"{base}-{ancho}.{extension}", copia, formato,
+                                 **({'optimize': True} if transparente else {'quality': CALIDAD_JPEG, 'optimize': True, 'progressive': True})),
+        })
+
+    return {'origen': fichero.name, 'hash': huella, 'tipo': tipo, 'tamanos': tamanos}
+
+
+def actualizar_derivados(modelo, pk, campo):
+    """Genera y guarda los derivados de la imagen actual de un objeto. Devuelve True si ha escrito algo."""
+    objeto = modelo.objects.filter(pk=pk).only('pk', campo).first()
+    if objeto is None:
+        return False
+    fichero = getattr(objeto, campo)
+    if not fichero:
+        derivados = {}
+    else:
+        try:
+            derivados = generar_derivados(fichero, campo)
+        except (OSError, Image.DecompressionBombError):
+            logger.exception("No se han podido generar los derivados de %s %s", modelo.__name__, pk)
+            return False
+
+    # Solo si la imagen no ha cambiado mientras tanto; update() no dispara otra vez las señales
+    misma_imagen = models.Q(**{campo: fichero.name}) if fichero else models.Q(**{campo: ''}) | models.Q(**{f'{campo}__isnull': True})
+    return bool(modelo.objects.filter(misma_imagen, pk=pk).update(**{f'{campo}_derivados': derivados}, actualizado=Now()))
+
+
+def programar_derivados(instance, campo):
+    """
+    Si la imagen de `campo` ha cambiado, deja su generación en la cola de tareas
+    (SportApp.tareas), salvo que ya haya una pendiente para ese objeto y campo:
+    la tarea lee la imagen al ejecutarse, así que también sirve para esta.
+    """
+    fichero = getattr(instance, campo)
+    derivados = getattr(instance, f'{campo}_derivados') or {}
+    if (fichero.name or '') == derivados.get('origen', ''):
+        return
+
+    argumentos = {'modelo': instance._meta.label, 'pk': instance.pk, 'campo': campo}
+    pendientes = Tarea.objects.filter(nombre='derivados', estado=Tarea.EstadoTarea.PENDIENTE,
+                                      **{f'argumentos__{clave}': valor for clave, valor in argumentos.items()})
+    if not pendientes.exists():#las que estan en curso pueden haber leido ya la imagen anterior
+        encolar('derivados', **argumentos)
+
+
+def derivados_para(derivados, ancho):
+    """El derivado más pequeño que cubre `ancho` px (o el mayor que haya)."""
+    tamanos = derivados.get('tamanos') or []
+    for tamano in tamanos:
+        if tamano['ancho'] >= ancho:
+            return tamano
+    return tamanos[-1] if tamanos else None
+
+
+def srcset(derivados, formato):
+    return ", ".join(f"{default_storage.url(t[formato])} {t['ancho']}w" for t in derivados.get('tamanos') or [])
@@ -0,0 +1,432 @@
+"""
+Importación masiva de equipos, jugadores y partidos desde CSV o XLSX.
+
+En vez de un formulario y un full_clean() por fila (con sus consultas para cada
+clave ajena), el fichero se lee en lotes de LOTE filas sin cargarlo entero: de
+cada lote se resuelven los deportes, equipos, torneos y usuarios a los que se
+refieren con unas pocas consultas en bloque, se aplican sobre esos diccionarios
+las mismas reglas que Inscripcion.clean y Partido.clean (equipo del deporte del
+torneo, no jugar contra sí mismo...) y, si no hay errores, se inserta con
+SportApp.insercion. Todo va en una sola transacción: si alguna fila tiene
+errores se siguen validando las demás (sin insertar), se devuelven todos con su
+número de línea y se deshace lo insertado. Al final se recalculan una vez las
+clasificaciones y el calendario afectados.
+
+Los equipos se buscan por nombre dentro de su deporte, así que al importar
+equipos no se admiten dos con el mismo nombre en un deporte.
+"""
+import csv
+import io
+from itertools import chain, islice
+from datetime import date, datetime
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .busqueda import indexar_nuevos
+from .calendario import invalidar_calendario
+from .clasificacion import recalcular_clasificacion
+from .elo import ELO_INICIAL
+from .enfrentamientos import recalcular_parejas
+from .insercion import insertar_filas
+from .jornadas import CAMPOS_INSERTADOS
+from .referencias import invalidar_referencias
+from .tareas import encolar
+from .models import Deporte, Equipo, Inscripcion, Jugador, Partido, Torneo
+
+
+LOTE = 2000#filas que se validan e insertan de una vez
+FORMATOS_FECHA = ('%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M:%S', '%d/%m/%Y %H:%M')
+
+COLUMNAS = {
+    'equipos': {
+        'obligatorias': ('nombre', 'deporte', 'ciudad', 'entrenador'),
+        'opcionales': ('usuario', 'torneo', 'temporada'),
+    },
+    'jugadores': {
+        'obligatorias': ('nombre', 'equipo'),
+        'opcionales': ('deporte', 'dorsal'),
+    },
+    'partidos': {
+        'obligatorias': ('torneo', 'temporada', 'fecha_hora', 'jornada', 'equipo_local', 'equipo_visitante'),
+        'opcionales': ('lugar', 'fase', 'estado', 'marcador_local', 'marcador_visitante'),
+    },
+}
+
+
+class ErrorImportacion(Exception):
+    """El fichero no se puede leer o le faltan columnas (no son errores de una fila concreta)."""
+
+
+def _cabecera(valor):
+    return str(valor or '').strip().lower().replace(' ', '_')
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():#las celdas numericas de Excel
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def leer_filas(fichero, nombre=''):
+    """Genera (número de línea, {columna: texto}) de un CSV (',' o ';') o de la primera hoja de un XLSX."""
+    fichero = getattr(fichero, 'file', fichero)#UploadedFile -> fichero binario de verdad
+    if nombre.lower().endswith('.xlsx'):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ErrorImportacion("Para importar XLSX hace falta openpyxl (pip install openpyxl).")
+        try:
+            libro = load_workbook(fichero, read_only=True, data_only=True)
+        except Exception as e:
+            raise ErrorImportacion(f"No se puede abrir el XLSX: {e}")
+        try:
+            filas = libro.active.iter_rows(values_only=True)
+            cabeceras = [_cabecera(valor) for valor in next(filas, ())]
+            for numero, valores in enumerate(filas, start=2):
+                # Las fechas las dejamos como datetime, el resto como texto
+                fila = {c: (v if isinstance(v, (datetime, date)) else _texto(v)) for c, v in zip(cabeceras, valores) if c}
+                if any(fila.values()):
+                    yield numero, fila
+        finally:
+            libro.close()
+        return
+
+    texto = io.TextIOWrapper(fichero, encoding='utf-8-sig', newline='')
+    try:
+        primera = texto.readline()
+        delimitador = ';' if primera.count(';') > primera.count(',') else ','
+        lector = csv.reader(texto, delimiter=delimitador)
+        cabeceras = [_cabecera(valor) for valor in next(csv.reader([primera], delimiter=delimitador), [])]
+        for numero, valores in enumerate(lector, start=2):
+            fila = {c: v.strip() for c, v in zip(cabeceras, valores) if c}
+            if any(fila.values()):
+                yield numero, fila
+    except UnicodeDecodeError:
+        raise ErrorImportacion("El CSV tiene que estar en UTF-8.")
+    finally:
+        texto.detach()#que no cierre el fichero, es de quien nos lo ha pasado
+
+
+def _lotes(filas):
+    filas = iter(filas)
+    while lote := list(islice(filas, LOTE)):
+        yield lote
+
+
+def _comprobar_columnas(tipo, filas):
+    presentes = set().union(*(fila.keys() for _, fila in filas))
+    faltan = [c for c in COLUMNAS[tipo]['obligatorias'] if c not in presentes]
+    if faltan:
+        raise ErrorImportacion(f"Faltan columnas: {', '.join(faltan)}.")
+
+
+def _largo(modelo, campo, valor, errores, numero):
+    maximo = modelo._meta.get_field(campo).max_length
+    if len(valor) > maximo:
+        errores.append((numero, f"'{campo}' no puede tener más de {maximo} caracteres."))
+        return False
+    return True
+
+
+def _entero(valor, campo, errores, numero, minimo=0, maximo=None):
+    try:
+        entero = int(valor)
+    except (TypeError, ValueError):
+        errores.append((numero, f"'{campo}' tiene que ser un número entero ('{valor}')."))
+        return None
+    if entero < minimo or (maximo is not None and entero > maximo):
+        rango = f"entre {minimo} y {maximo}" if maximo is not None else f"mayor o igual que {minimo}"
+        errores.append((numero, f"'{campo}' tiene que estar {rango}."))
+        return None
+    return entero
+
+
+def _fecha_hora(valor):
+    if isinstance(valor, datetime):
+        fecha = valor
+    elif not isinstance(valor, str):#una fecha de Excel sin hora
+        return None
+    else:
+        for formato in FORMATOS_FECHA:
+            try:
+                fecha = datetime.strptime(valor, formato)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    return timezone.make_aware(fecha) if timezone.is_naive(fecha) else fecha
+
+
+def _opcion(choices, valor, defecto):
+    """Acepta el valor o la etiqueta de un TextChoices, sin distinguir mayúsculas."""
+    if not valor:
+        return defecto
+    for opcion in choices:
+        if valor.upper() == opcion.value or valor.lower() == opcion.label.lower():
+            return opcion.value
+    return None
+
+
+# Busquedas en bloque: una consulta por tipo de referencia para todo el fichero
+
+def _deportes(filas):
+    nombres = {fila['deporte'] for _, fila in filas if fila.get('deporte')}
+    return dict(Deporte.objects.filter(nombre__in=nombres).values_list('nombre', 'id'))
+
+
+def _torneos(filas):
+    """{(nombre, temporada): (id, deporte_id)}"""
+    claves = {(fila['torneo'], fila.get('temporada', '')) for _, fila in filas if fila.get('torneo')}
+    torneos = Torneo.objects.filter(nombre__in={nombre for nombre, _ in claves}).values_list('id', 'nombre', 'temporada', 'deporte_id')
+    return {(nombre, temporada): (pk, deporte_id) for pk, nombre, temporada, deporte_id in torneos
+            if (nombre, temporada) in claves}
+
+
+def _equipos(nombres):
+    """{nombre: {deporte_id: [(id, ciudad), ...]}}"""
+    equipos = {}
+    for pk, nombre, deporte_id, ciudad in (Equipo.objects.filter(nombre__in=nombres)
+                                           .values_list('id', 'nombre', 'deporte_id', 'ciudad')):
+        equipos.setdefault(nombre, {}).setdefault(deporte_id, []).append((pk, ciudad))
+    return equipos
+
+
+def _importar_equipos(lotes, usuario):
+    errores, creados, vistos, deportes_creados = [], {'equipos': 0}, set(), set()
+    for filas in lotes:
+        equipos, inscripciones = _validar_equipos(filas, usuario, errores, vistos)
+        if errores:
+            continue#solo se valida el resto, para devolver todos los errores
+        creados['equipos'] += insertar_filas(
+            Equipo, ('usuario', 'nombre', 'entrenador', 'ciudad', 'deporte', 'escudo', 'escudo_derivados', 'elo', 'elo_partidos'),
+            equipos)
+        deportes_creados.update(fila[4] for fila in equipos)
+        if inscripciones:
+            # Los ids nuevos, con la misma busqueda en bloque
+            nuevos = _equipos({nombre for nombre, _, _ in inscripciones})
+            hoy = timezone.localdate()
+            creados['inscripciones'] = creados.get('inscripciones', 0) + insertar_filas(Inscripcion, (
+                'torneo', 'equipo', 'fecha_inscripcion', 'ha_pagado', 'puntos_acumulados', 'partidos_jugados',
+                'ganados', 'empatados', 'perdidos', 'tantos_favor', 'tantos_contra'), [
+                (torneo_id, nuevos[nombre][deporte_id][0][0], hoy, False, 0, 0, 0, 0, 0, 0, 0)
+                for nombre, deporte_id, torneo_id in inscripciones
+            ])
+
+    if errores:
+        return {}, errores
+    invalidar_referencias('equipos')#sin señales
+    indexar_nuevos(Equipo.objects.filter(deporte_id__in=deportes_creados))
+    return creados, []
+
+
+def _validar_equipos(filas, usuario, errores, vistos):
+    deportes = _deportes(filas)
+    torneos = _torneos(filas)
+    existentes = _equipos({fila['nombre'] for _, fila in filas})
+    usuarios = dict(User.objects.filter(username__in={f['usuario'] for _, f in filas if f.get('usuario')})
+                    .values_list('username', 'id'))
+
+    equipos, inscripciones = [], []
+    for numero, fila in filas:
+        antes = len(errores)
+        for campo in COLUMNAS['equipos']['obligatorias']:
+            if not fila.get(campo):
+                errores.append((numero, f"Falta '{campo}'."))
+        if len(errores) > antes:
+            continue
+        for campo in ('nombre', 'ciudad', 'entrenador'):
+            _largo(Equipo, campo, fila[campo], errores, numero)
+
+        deporte_id = deportes.get(fila['deporte'])
+        if deporte_id is None:
+            errores.append((numero, f"No existe el deporte '{fila['deporte']}'."))
+        elif deporte_id in existentes.get(fila['nombre'], {}) or (fila['nombre'], deporte_id) in vistos:
+            errores.append((numero, f"Ya hay un equipo '{fila['nombre']}' en {fila['deporte']}."))
+        vistos.add((fila['nombre'], deporte_id))
+
+        propietario = usuario.pk
+        if fila.get('usuario'):
+            propietario = usuarios.get(fila['usuario'])
+            if propietario is None:
+                errores.append((numero, f"No existe el usuario '{fila['usuario']}'."))
+
+        torneo = None
+        if fila.get('torneo'):
+            torneo = torneos.get((fila['torneo'], fila.get('temporada', '')))
+            if torneo is None:
+                errores.append((numero, f"No existe el torneo '{fila['torneo']}' ({fila.get('temporada', '')})."))
+            elif deporte_id is not None and torneo[1] != deporte_id:
+                # Inscripcion.clean: no mezclar deportes
+                errores.append((numero, f"El equipo '{fila['nombre']}' juega a {fila['deporte']} y no puede "
+                                        f"inscribirse en un torneo de otro deporte."))
+
+        if len(errores) == antes:
+            equipos.append((propietario, fila['nombre'], fila['entrenador'], fila['ciudad'], deporte_id, '', {}, ELO_INICIAL, 0))
+            if torneo is not None:
+                inscripciones.append((fila['nombre'], deporte_id, torneo[0]))
+    return equipos, inscripciones
+
+
+def _importar_jugadores(lotes, usuario):
+    errores, creados, equipos_creados = [], {'jugadores': 0}, set()
+    for filas in lotes:
+        jugadores = _validar_jugadores(filas, errores)
+        if errores:
+            continue
+        creados['jugadores'] += insertar_filas(Jugador, ('nombre', 'dorsal', 'foto', 'foto_derivados', 'equipo'), jugadores)
+        equipos_creados.update(fila[4] for fila in jugadores)
+
+    if errores:
+        return {}, errores
+    invalidar_referencias('jugadores')
+    indexar_nuevos(Jugador.objects.filter(equipo_id__in=equipos_creados))
+    return creados, []
+
+
+def _validar_jugadores(filas, errores):
+    deportes = _deportes(filas)
+    equipos = _equipos({fila['equipo'] for _, fila in filas if fila.get('equipo')})
+
+    jugadores = []
+    for numero, fila in filas:
+        antes = len(errores)
+        if not fila.get('nombre') or not fila.get('equipo'):
+            errores.append((numero, "Faltan 'nombre' o 'equipo'."))
+            continue
+        _largo(Jugador, 'nombre', fila['nombre'], errores, numero)
+
+        candidatos = equipos.get(fila['equipo'], {})
+        if fila.get('deporte'):
+            deporte_id = deportes.get(fila['deporte'])
+            if deporte_id is None:
+                errores.append((numero, f"No existe el deporte '{fila['deporte']}'."))
+            candidatos = {deporte_id: candidatos[deporte_id]} if deporte_id in candidatos else {}
+        opciones = [pk for lista in candidatos.values() for pk, _ in lista]
+        if not opciones:
+            errores.append((numero, f"No existe el equipo '{fila['equipo']}'."))
+        elif len(opciones) > 1:
+            errores.append((numero, f"Hay varios equipos '{fila['equipo']}'; indica la columna 'deporte'."))
+
+        dorsal = None
+        if fila.get('dorsal'):
+            dorsal = _entero(fila['dorsal'], 'dorsal', errores, numero, minimo=1, maximo=99)
+
+        if len(errores) == antes:
+            jugadores.append((fila['nombre'], dorsal, '', {}, opciones[0]))
+    return jugadores
+
+
+def _importar_partidos(lotes, usuario):
+    errores, creados = [], {'partidos': 0}
+    deportes, jugados, parejas = {}, set(), set()#deporte de cada torneo con partidos nuevos
+    for filas in lotes:
+        partidos, torneos = _validar_partidos(filas, usuario, errores)
+        if errores:
+            continue
+        creados['partidos'] += insertar_filas(Partido, CAMPOS_INSERTADOS, partidos)
+        for fila in partidos:
+            deportes[fila[1]] = torneos[fila[1]]
+            if fila[5] == Partido.EstadoPartido.JUGADO:
+                jugados.add(fila[1])
+                parejas.add((fila[7], fila[8]))
+
+    if errores:
+        return {}, errores
+    indexar_nuevos(Partido.objects.filter(torneo_id__in=deportes))
+    # Sin señales: los jugados cuentan para la clasificacion y los cara a cara, y todos cambian el calendario
+    if jugados:
+        recalcular_clasificacion(sorted(jugados))
+        recalcular_parejas(parejas)
+        # El Elo depende del orden de los partidos: se repite la historia de esos deportes en la cola
+        encolar('recalcular_elo', usuario, deportes=sorted({deportes[torneo_id] for torneo_id in jugados}))
+    invalidar_calendario(*set(deportes.values()))
+    return creados, []
+
+
+def _validar_partidos(filas, usuario, errores):
+    """Las filas de Partido (en el orden de CAMPOS_INSERTADOS) y {torneo_id: deporte_id} de las válidas."""
+    torneos = _torneos(filas)
+    equipos = _equipos({fila[c] for _, fila in filas for c in ('equipo_local', 'equipo_visitante') if fila.get(c)})
+
+    partidos = []
+    for numero, fila in filas:
+        antes = len(errores)
+        for campo in COLUMNAS['partidos']['obligatorias']:
+            if not fila.get(campo):
+                errores.append((numero, f"Falta '{campo}'."))
+        if len(errores) > antes:
+            continue
+        _largo(Partido, 'jornada', fila['jornada'], errores, numero)
+
+        torneo = torneos.get((fila['torneo'], fila['temporada']))
+        if torneo is None:
+            errores.append((numero, f"No existe el torneo '{fila['torneo']}' ({fila['temporada']})."))
+            continue
+        torneo_id, deporte_id = torneo
+
+        # Partido.clean: los dos equipos del deporte del torneo y distintos
+        lado = {}
+        for campo, nombre in (('equipo_local', 'local'), ('equipo_visitante', 'visitante')):
+            por_deporte = equipos.get(fila[campo], {})
+            if not por_deporte:
+                errores.append((numero, f"No existe el equipo {nombre} '{fila[campo]}'."))
+            elif deporte_id not in por_deporte:
+                errores.append((numero, f"El equipo {nombre} no es del mismo deporte que el torneo."))
+            elif len(por_deporte[deporte_id]) > 1:
+                errores.append((numero, f"Hay varios equipos '{fila[campo]}' en el deporte del torneo."))
+            else:
+                lado[nombre] = por_deporte[deporte_id][0]
+        if len(lado) == 2 and lado['local'][0] == lado['visitante'][0]:
+            errores.append((numero, "Un equipo no puede jugar contra sí mismo."))
+
+        fecha_hora = _fecha_hora(fila['fecha_hora'])
+        if fecha_hora is None:
+            errores.append((numero, f"'fecha_hora' no es una fecha válida ('{fila['fecha_hora']}'); usa AAAA-MM-DD HH:MM."))
+        estado = _opcion(Partido.EstadoPartido, fila.get('estado'), Partido.EstadoPartido.PENDIENTE)
+        if estado is None:
+            errores.append((numero, f"Estado desconocido '{fila['estado']}'."))
+        fase = _opcion(Partido.FasePartido, fila.get('fase'), Partido.FasePartido.REGULAR)
+        if fase is None:
+            errores.append((numero, f"Fase desconocida '{fila['fase']}'."))
+        marcador = [_entero(fila.get(campo) or 0, campo, errores, numero) for campo in ('marcador_local', 'marcador_visitante')]
+
+        lugar = fila.get('lugar') or (lado['local'][1] if 'local' in lado else '')#como en jornadas: en casa del local
+        _largo(Partido, 'lugar', lugar, errores, numero)
+
+        if len(errores) == antes:
+            partidos.append((usuario.pk, torneo_id, fecha_hora, lugar, fila['jornada'], estado, fase,
+                             lado['local'][0], lado['visitante'][0], *marcador))
+    return partidos, {torneo_id: deporte_id for torneo_id, deporte_id in torneos.values()}
+
+
+IMPORTADORES = {
+    'equipos': _importar_equipos,
+    'jugadores': _importar_jugadores,
+    'partidos': _importar_partidos,
+}
+
+
+def importar(tipo, fichero, usuario, nombre='', comprobar=False):
+    """
+    Importa el fichero (CSV o XLSX según `nombre`) de `tipo` ('equipos',
+    'jugadores' o 'partidos') en nombre de `usuario`. Devuelve (creados,
+    errores): un diccionario con las filas creadas por modelo y una lista de
+    (línea, mensaje). Si hay errores, o con `comprobar`, no se escribe nada.
+    Lanza ErrorImportacion si el fichero no se puede leer.
+    """
+    lotes = _lotes(leer_filas(fichero, nombre))
+    primero = next(lotes, None)
+    if primero is None:
+        raise ErrorImportacion("El fichero no tiene filas.")
+    _comprobar_columnas(tipo, primero)#todas las filas tienen las columnas de la cabecera
+
+    with transaction.atomic():
+        creados, errores = IMPORTADORES[tipo](chain([primero], lotes), usuario)
+        if errores or comprobar:
+            transaction.set_rollback(True)#los lotes anteriores al primer error ya estan insertados
+    return creados, errores
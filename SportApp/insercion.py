@@ -0,0 +1,53 @@
+"""
+Inserciones masivas sin pasar por instancias de modelo.
+
+bulk_create construye un objeto por fila y, en SQLite, el tope de parámetros
+por sentencia lo parte en lotes de unas decenas de filas que hay que compilar
+uno a uno. Para cargas grandes (generar un calendario, sembrar datos) es más
+rápido preparar una sola sentencia INSERT y ejecutarla con executemany.
+No se disparan señales ni se rellenan los valores por defecto: hay que pasar
+todos los campos que no admitan NULL, salvo las marcas de tiempo (auto_now y
+auto_now_add), que se ponen a la hora actual.
+"""
+from django.db import connections
+from django.utils import timezone
+
+
+def insertar_filas(modelo, campos, filas, using='default'):
+    """
+    Inserta `filas` (tuplas en el orden de `campos`, nombres de campo del modelo;
+    en las FK el id) en la tabla de `modelo`. Devuelve cuántas.
+    """
+    conexion = connections[using]
+    campos = [modelo._meta.get_field(nombre) for nombre in campos]
+    marcas = [campo for campo in modelo._meta.concrete_fields
+              if (getattr(campo, 'auto_now', False) or getattr(campo, 'auto_now_add', False)) and campo not in campos]
+    if marcas:
+        ahora = timezone.now()
+        campos += marcas
+        filas = (tuple(fila) + (ahora,) * len(marcas) for fila in filas)
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        conexion.ops.quote_name(modelo._meta.db_table),
+        ', '.join(conexion.ops.quote_name(campo.column) for campo in campos),
+        ', '.join(['%s'] * len(campos)),
+    )
+    # Solo hay que adaptar los valores de los campos que lo necesitan (fechas, decimales, JSON...)
+    preparar = [
+        (i, campo) for i, campo in enumerate(campos)
+        if campo.get_internal_type() not in ('AutoField', 'BigAutoField', 'CharField', 'TextField', 'IntegerField',
+                                             'PositiveIntegerField', 'BooleanField', 'ForeignKey')
+    ]
+
+    def adaptar(fila):
+        if not preparar:
+            return fila
+        fila = list(fila)
+        for i, campo in preparar:
+            fila[i] = campo.get_db_prep_save(fila[i], conexion)
+        return fila
+
+    filas = [adaptar(fila) for fila in filas]
+    if filas:
+        with conexion.cursor() as cursor:
+            cursor.executemany(sql, filas)
+    return len(filas)
@@ -0,0 +1,210 @@
+"""
+Generador de calendarios de competición.
+
+A partir de los equipos inscritos en un Torneo crea de una vez todos los
+partidos de una liga (todos contra todos, a una o dos vueltas, método del
+círculo) o las rondas de una eliminatoria, repartiendo fechas, horarios y
+sedes sin que dos partidos coincidan en la misma sede a la misma hora.
+
+Los partidos se insertan con un único INSERT preparado (SportApp.insercion)
+sin construir instancias de Partido. No se pasa por full_clean() partido a
+partido; que los equipos son del deporte del torneo ya lo garantiza
+Inscripcion.clean. Tampoco hay señales: los partidos nacen pendientes (no
+cuentan en la clasificación) y el calendario se invalida a mano.
+"""
+from datetime import datetime, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .busqueda import indexar_nuevos
+from .calendario import invalidar_calendario
+from .insercion import insertar_filas
+from .models import Inscripcion, Partido
+
+
+Fase = Partido.FasePartido
+
+RONDAS_ELIMINATORIA = {
+    2: 'Final',
+    4: 'Semifinales',
+    8: 'Cuartos de final',
+    16: 'Octavos de final',
+    32: 'Dieciseisavos de final',
+}
+
+# Columnas que se escriben al generar (todas las de Partido salvo el id)
+CAMPOS_INSERTADOS = ('usuario', 'torneo', 'fecha_hora', 'lugar', 'jornada', 'estado', 'fase',
+                     'equipo_local', 'equipo_visitante', 'marcador_local', 'marcador_visitante')
+
+
+def nombre_ronda(equipos):
+    return RONDAS_ELIMINATORIA.get(equipos, f'Ronda de {equipos}')
+
+
+def rondas_liga(equipos, ida_y_vuelta=False):
+    """
+    Jornadas de una liga todos contra todos con el método del círculo:
+    una lista de jornadas, cada una con sus parejas (local, visitante).
+    Con número impar de equipos uno descansa en cada jornada.
+    """
+    lista = list(equipos)
+    if len(lista) % 2:
+        lista.append(None)
+    n = len(lista)
+    rondas = []
+    for r in range(n - 1):
+        ronda = []
+        for i in range(n // 2):
+            a, b = lista[i], lista[n - 1 - i]
+            if a is None or b is None:
+                continue
+            # El equipo fijo alterna campo cada jornada; el resto juega en casa el de la mitad de arriba
+            if i == 0 and r % 2:
+                a, b = b, a
+            ronda.append((a, b))
+        rondas.append(ronda)
+        lista = [lista[0], lista[-1]] + lista[1:-1]
+
+    if ida_y_vuelta:
+        rondas += [[(b, a) for a, b in ronda] for ronda in rondas]
+    return rondas
+
+
+def orden_cuadro(tamano):
+    """Posiciones de los cabezas de serie en el cuadro para que 1 y 2 solo se crucen en la final."""
+    orden = [0]
+    while len(orden) < tamano:
+        orden = [x for posicion in orden for x in (posicion, 2 * len(orden) - 1 - posicion)]
+    return orden
+
+
+class Programador:
+    """Reparte los partidos de cada jornada en horarios y sedes libres."""
+
+    def __init__(self, inicio, dias_entre_jornadas=7, horarios=None, sedes=None):
+        self.inicio = inicio
+        self.dias_entre_jornadas = dias_entre_jornadas
+        self.horarios = sorted(horarios) if horarios else [inicio.time()]
+        self.sedes = list(sedes or [])
+
+    def programar(self, ronda, numero):
+        """Devuelve [(local, visitante, fecha_hora, lugar)] para la jornada `numero` (desde 0)."""
+        dia_base = self.inicio.date() + timedelta(days=numero * self.dias_entre_jornadas)
+        ocupados = {}  # huecos usados por sede en esta jornada
+        partidos = []
+        for orden, (local, visitante) in enumerate(ronda):
+            if self.sedes:
+                lugar = self.sedes[orden % len(self.sedes)]
+                hueco = orden // len(self.sedes)
+            else:
+                # Sin sedes fijas cada partido se juega en la ciudad del local
+                lugar = local.ciudad
+                hueco = ocupados.get(lugar, 0)
+                ocupados[lugar] = hueco + 1
+
+            dia, indice_hora = divmod(hueco, len(self.horarios))
+            if self.dias_entre_jornadas and dia >= self.dias_entre_jornadas:
+                raise ValidationError(
+                    f"Los partidos de la jornada {numero + 1} no caben en {self.dias_entre_jornadas} días "
+                    f"en '{lugar}'. Añade sedes u horarios o separa más las jornadas."
+                )
+            fecha_hora = datetime.combine(dia_base + timedelta(days=dia), self.horarios[indice_hora], self.inicio.tzinfo)
+            partidos.append((local, visitante, fecha_hora, lugar))
+        return partidos
+
+
+def _fila(torneo, usuario, local, visitante, fecha_hora, lugar, jornada, fase):
+    return (usuario.pk, torneo.pk, fecha_hora, lugar, jornada, Partido.EstadoPartido.PENDIENTE, fase,
+            local.pk, visitante.pk, 0, 0)
+
+
+def _guardar(torneo, filas, reemplazar):
+    with transaction.atomic():
+        if reemplazar:
+            # Solo los pendientes: los jugados tienen resultado y cuentan para la clasificacion
+            Partido.objects.filter(torneo=torneo, estado=Partido.EstadoPartido.PENDIENTE).delete()
+        if filas:
+            insertar_filas(Partido, CAMPOS_INSERTADOS, filas)
+            indexar_nuevos(Partido.objects.filter(torneo=torneo))#sin señales
+        invalidar_calendario(torneo.deporte_id)
+    return len(filas)
+
+
+def _equipos_inscritos(torneo, orden):
+    equipos = [i.equipo for i in Inscripcion.objects.filter(torneo=torneo).select_related('equipo').order_by(*orden)]
+    if len(equipos) < 2:
+        raise ValidationError("El torneo necesita al menos dos equipos inscritos.")
+    return equipos
+
+
+def generar_liga(torneo, usuario, inicio, ida_y_vuelta=False, dias_entre_jornadas=7,
+                 horarios=None, sedes=None, reemplazar=False):
+    """Crea todos los partidos de una liga entre los equipos inscritos. Devuelve cuántos."""
+    equipos = _equipos_inscritos(torneo, ('equipo__nombre', 'equipo_id'))
+    programador = Programador(inicio, dias_entre_jornadas, horarios, sedes)
+
+    filas = []
+    for numero, ronda in enumerate(rondas_liga(equipos, ida_y_vuelta)):
+        jornada = f'Jornada {numero + 1}'
+        for local, visitante, fecha_hora, lugar in programador.programar(ronda, numero):
+            filas.append(_fila(torneo, usuario, local, visitante, fecha_hora, lugar, jornada, Fase.REGULAR))
+    return _guardar(torneo, filas, reemplazar)
+
+
+def _partidos_ronda(torneo, usuario, equipos, programador, numero):
+    """Empareja los equipos de dos en dos, en el orden del cuadro."""
+    ronda = [(equipos[i], equipos[i + 1]) for i in range(0, len(equipos), 2)]
+    nombre = nombre_ronda(len(equipos))
+    fase = Fase.FINAL if len(equipos) == 2 else Fase.SEMIFINAL if len(equipos) == 4 else Fase.REGULAR
+    return [
+        _fila(torneo, usuario, local, visitante, fecha_hora, lugar, nombre, fase)
+        for local, visitante, fecha_hora, lugar in programador.programar(ronda, numero)
+    ]
+
+
+def generar_eliminatoria(torneo, usuario, inicio, clasificados=None, dias_entre_jornadas=7,
+                         horarios=None, sedes=None, reemplazar=False):
+    """
+    Crea la primera ronda de un cuadro con los `clasificados` mejores de la
+    clasificación (por defecto la mayor potencia de dos que quepa). El mejor
+    clasificado juega en casa. Las rondas siguientes salen de los resultados
+    con generar_siguiente_ronda().
+    """
+    equipos = _equipos_inscritos(torneo, ('-puntos_acumulados', 'equipo__nombre'))
+    if clasificados is None:
+        clasificados = 1 << (len(equipos).bit_length() - 1)
+    if clasificados < 2 or clasificados & (clasificados - 1) or clasificados > len(equipos):
+        raise ValidationError("Los clasificados deben ser una potencia de dos no mayor que los equipos inscritos.")
+
+    cabezas = equipos[:clasificados]
+    en_cuadro = [cabezas[posicion] for posicion in orden_cuadro(clasificados)]
+    programador = Programador(inicio, dias_entre_jornadas, horarios, sedes)
+    return _guardar(torneo, _partidos_ronda(torneo, usuario, en_cuadro, programador, 0), reemplazar)
+
+
+def generar_siguiente_ronda(torneo, usuario, inicio, dias_entre_jornadas=7, horarios=None, sedes=None):
+    """Empareja a los ganadores de la última ronda de la eliminatoria, en el orden del cuadro."""
+    # La ultima ronda es la mas pequeña que existe: se prueban las potencias de dos desde la final hasta el
+    # numero de inscritos, asi sirven tambien los cuadros de 64 o mas ("Ronda de 64")
+    jornadas = set(Partido.objects.filter(torneo=torneo).values_list('jornada', flat=True).distinct())
+    inscritos = Inscripcion.objects.filter(torneo=torneo).count()
+    equipos = 2
+    while equipos <= inscritos and nombre_ronda(equipos) not in jornadas:
+        equipos *= 2
+    if equipos > inscritos:
+        raise ValidationError("El torneo no tiene ninguna ronda de eliminatoria.")
+    ultima = list(Partido.objects.filter(torneo=torneo, jornada=nombre_ronda(equipos))
+                  .select_related('equipo_local', 'equipo_visitante').order_by('id'))
+    if len(ultima) == 1:
+        raise ValidationError("La final ya está generada.")
+
+    ganadores = []
+    for partido in ultima:
+        if partido.estado != Partido.EstadoPartido.JUGADO or partido.marcador_local == partido.marcador_visitante:
+            raise ValidationError(f"El partido {partido} no tiene todavía un ganador.")
+        ganadores.append(partido.equipo_local if partido.marcador_local > partido.marcador_visitante
+                         else partido.equipo_visitante)
+
+    programador = Programador(inicio, dias_entre_jornadas, horarios, sedes)
+    return _guardar(torneo, _partidos_ronda(torneo, usuario, ganadores, programador, 0), False)
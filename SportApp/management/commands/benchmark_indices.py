@@ -0,0 +1,124 @@
+import statistics
+import time
+from datetime import datetime, time as hora, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from SportApp.datos_sinteticos import sembrar
+from SportApp.models import EstadisticaPartido, Inscripcion, Jugador, Partido, Torneo
+
+
+MODELOS_CON_INDICES = (Partido, Inscripcion, Jugador, EstadisticaPartido)
+
+
+def consultas():
+    """Las formas de consulta de las vistas calientes, con parámetros sacados de los datos sembrados."""
+    torneo = Torneo.objects.order_by('-id').first()
+    equipo_id = Inscripcion.objects.filter(torneo=torneo).values_list('equipo_id', flat=True).first()
+    jugador_id = Jugador.objects.filter(equipo_id=equipo_id).values_list('id', flat=True).first()
+    hoy = timezone.localdate()
+    desde = timezone.make_aware(datetime.combine(hoy, hora.min))
+    hasta = desde + timedelta(days=31)
+
+    return {
+        # ver_eventos: una pagina de un deporte dentro de la ventana de fechas
+        'calendario': lambda: list(Partido.objects
+            .filter(torneo__deporte_id=torneo.deporte_id, fecha_hora__gte=desde, fecha_hora__lt=hasta)
+            .order_by('fecha_hora', 'id')[:21]),
+        # proximos partidos pendientes
+        'pendientes': lambda: list(Partido.objects
+            .filter(estado=Partido.EstadoPartido.PENDIENTE, fecha_hora__gte=desde).order_by('fecha_hora')[:20]),
+        # primera pagina de los partidos de un torneo
+        'partidos_torneo': lambda: list(Partido.objects.filter(torneo=torneo).order_by('fecha_hora')[:50]),
+        # TorneoDetail
+        'clasificacion': lambda: list(Inscripcion.objects.filter(torneo=torneo).select_related('equipo')
+            .order_by('-puntos_acumulados', 'equipo__nombre')),
+        # plantilla de un equipo (JugadorListView, ver_equipo)
+        'plantilla': lambda: list(Jugador.objects.filter(equipo_id=equipo_id).order_by('dorsal')),
+        # totales de un jugador
+        'lineas_jugador': lambda: EstadisticaPartido.objects.filter(jugador_id=jugador_id, juega=True)
+            .aggregate(puntos=models.Sum('puntos'), minutos=models.Sum('minutos_jugados')),
+    }
+
+
+def plan(funcion):
+    """EXPLAIN de la consulta que lanza `funcion` (la última que ejecuta)."""
+    with CaptureQueriesContext(connection) as capturadas:
+        funcion()
+    sql = capturadas[-1]['sql']
+    prefijo = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefijo + sql)
+        filas = cursor.fetchall()
+    if connection.vendor == 'sqlite':
+        return [fila[-1] for fila in filas]
+    return [" | ".join(str(c) for c in fila) for fila in filas]
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+class Command(BaseCommand):
+    help = ("Siembra datos sintéticos en una base de datos de pruebas y compara los planes (EXPLAIN) y los "
+            "tiempos de las consultas calientes sin y con los índices declarados en los modelos.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deportes', type=int, default=4)
+        parser.add_argument('--equipos', type=int, default=60)
+        parser.add_argument('--jugadores', type=int, default=20)
+        parser.add_argument('--torneos', type=int, default=3)
+        parser.add_argument('--repeticiones', type=int, default=30)
+        parser.add_argument('--sin-planes', action='store_true', help="Solo tiempos, sin los EXPLAIN")
+
+    def handle(self, *args, **options):
+        # Todo se hace en una base de datos de pruebas que se borra al final
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self._benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+    def _benchmark(self, options):
+        inicio = time.perf_counter()
+        creados = sembrar(options['deportes'], options['equipos'], options['jugadores'], options['torneos'])
+        self.stdout.write(f"Datos sembrados en {time.perf_counter() - inicio:.1f} s: "
+                          + ", ".join(f"{n} {modelo}" for modelo, n in creados.items()))
+
+        indices = [(modelo, indice) for modelo in MODELOS_CON_INDICES for indice in modelo._meta.indexes]
+        pruebas = consultas()
+        resultados = {}
+
+        for fase in ('sin índices', 'con índices'):
+            with connection.schema_editor() as editor:
+                for modelo, indice in indices:
+                    if fase == 'sin índices':
+                        editor.remove_index(modelo, indice)
+                    else:
+                        editor.add_index(modelo, indice)
+            if connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {fase} =="))
+            for nombre, funcion in pruebas.items():
+                funcion()  # calentamos la cache de paginas
+                resultados.setdefault(nombre, {})[fase] = medir(funcion, options['repeticiones'])
+                self.stdout.write(f"{nombre}: {resultados[nombre][fase]:.2f} ms")
+                if not options['sin_planes']:
+                    for linea in plan(funcion):
+                        self.stdout.write(f"    {linea}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("\n== Resumen (mediana, ms) =="))
+        for nombre, tiempos in resultados.items():
+            antes, despues = tiempos['sin índices'], tiempos['con índices']
+            self.stdout.write(f"{nombre:<16} {antes:>9.2f} {despues:>9.2f}   x{antes / despues if despues else 0:.1f}")
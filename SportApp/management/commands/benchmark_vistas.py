@@ -0,0 +1,266 @@
+import json
+import logging
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import URLResolver, reverse
+
+from SportApp import urls
+from SportApp.datos_sinteticos import sembrar
+from SportApp.models import Enfrentamiento, Equipo, EstadisticaPartido, Inscripcion, Jugador, Partido, Tarea, Torneo
+from SportApp.replicas import solo_primaria
+from SportApp.tareas import encolar
+
+
+# Rutas que no se miden con GET: cambian datos o dejan la conexion abierta
+EXCLUIDAS = {
+    'actualizar_marcador': "modifica el marcador",
+    'directo_evento': "canal SSE abierto",
+    'partido-acta': "solo POST",
+    'tarea-recalcular': "solo POST",
+    'tarea-reintentar': "solo POST",
+}
+
+# Modelo del que sacar el valor de cada parametro de URL cuando la vista no lo dice
+MODELO_PARAMETRO = {
+    'evento_pk': Partido,
+    'partido_id': Partido,
+    'partido_pk': Partido,
+    'equipo_id': Equipo,
+    'rival_id': 'rival',#el otro equipo del partido de ejemplo
+}
+# Parametros que no son un id
+VALOR_PARAMETRO = {
+    'tabla': 'jugadores',#la mas grande de las del autocompletado
+    'tipo': 'estadisticas',
+    'formato': 'csv',
+}
+# Parametros GET sin los que la vista no hace su trabajo
+CONSULTA_VISTA = {
+    'buscar': '?q=Equipo',
+    'buscar-list': '?q=Equipo',#sin q responde 400
+}
+MODELO_VISTA = {
+    'torneo_detalle': Torneo,
+    'torneo_generar_calendario': Torneo,
+}
+
+
+def _rutas(patrones):
+    for patron in patrones:
+        if isinstance(patron, URLResolver):
+            yield from _rutas(patron.url_patterns)
+        elif patron.name and 'format' not in patron.pattern.regex.groupindex:
+            yield patron
+
+
+def _modelo_de(patron):
+    vista = patron.callback
+    for clase in (getattr(vista, 'view_class', None), getattr(vista, 'cls', None)):
+        modelo = getattr(clase, 'model', None) or getattr(getattr(clase, 'queryset', None), 'model', None)
+        if modelo is not None:
+            return modelo
+    return MODELO_VISTA.get(patron.name)
+
+
+def _ejemplos():
+    """Un objeto representativo de cada modelo: un partido jugado y con estadísticas, y lo que cuelga de él."""
+    partido = (Partido.objects.filter(estado=Partido.EstadoPartido.JUGADO, estadisticas__isnull=False)
+               .order_by('-fecha_hora').first())
+    if partido is None:
+        raise CommandError("No hay partidos jugados con estadísticas que medir.")
+    linea = EstadisticaPartido.objects.filter(partido=partido).first()
+    return {
+        Partido: partido.pk,
+        Torneo: partido.torneo_id,
+        Equipo: partido.equipo_local_id,
+        'rival': partido.equipo_visitante_id,
+        Enfrentamiento: Enfrentamiento.objects.values_list('pk', flat=True).first(),
+        Jugador: linea.jugador_id,
+        EstadisticaPartido: linea.pk,
+        Inscripcion: Inscripcion.objects.filter(torneo_id=partido.torneo_id).values_list('pk', flat=True).first(),
+        Tarea: Tarea.objects.values_list('pk', flat=True).first(),
+    }
+
+
+def urls_a_medir():
+    """[(nombre, url)] de todas las rutas de SportApp.urls que se pueden pedir con GET."""
+    ejemplos = _ejemplos()
+    resultado, saltadas = [], []
+    for patron in _rutas(urls.urlpatterns):
+        if patron.name in EXCLUIDAS:
+            saltadas.append((patron.name, EXCLUIDAS[patron.name]))
+            continue
+        kwargs = {}
+        for parametro in patron.pattern.regex.groupindex:
+            if parametro in VALOR_PARAMETRO:
+                kwargs[parametro] = VALOR_PARAMETRO[parametro]
+                continue
+            modelo = MODELO_PARAMETRO.get(parametro) if parametro != 'pk' else _modelo_de(patron)
+            if modelo not in ejemplos:
+                saltadas.append((patron.name, f"no se sabe qué valor dar a '{parametro}'"))
+                break
+            if ejemplos[modelo] is None:
+                saltadas.append((patron.name, f"no hay filas de {modelo._meta.verbose_name_plural}"))
+                break
+            kwargs[parametro] = ejemplos[modelo]
+        else:
+            resultado.append((patron.name, reverse(patron.name, kwargs=kwargs) + CONSULTA_VISTA.get(patron.name, '')))
+    return resultado, saltadas
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+def medir_url(cliente, url, repeticiones):
+    respuesta = cliente.get(url)  # calentamos caches y plantillas
+    latencias, consultas = [], []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        respuesta = cliente.get(url)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        contador = getattr(respuesta.wsgi_request, 'consultas_bd', None)
+        consultas.append(contador.consultas if contador else None)
+
+    tracemalloc.start()
+    cliente.get(url)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'url': url,
+        'estado': respuesta.status_code,
+        'p50_ms': round(statistics.median(latencias), 2),
+        'p95_ms': round(_percentil(latencias, 95), 2),
+        'p99_ms': round(_percentil(latencias, 99), 2),
+        'consultas': max(c for c in consultas if c is not None) if any(c is not None for c in consultas) else None,
+        'presupuesto': getattr(respuesta.wsgi_request, 'presupuesto_consultas', None),
+        'memoria_pico_kib': round(pico / 1024, 1),
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Siembra datos sintéticos en una base de datos de pruebas y pide con el cliente de pruebas todas las "
+            "rutas de SportApp (HTML y API) como staff, midiendo latencia (p50/p95/p99), consultas y memoria "
+            "pico por vista. Puede guardar el resultado en JSON y compararlo con el de otro commit.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deportes', type=int, default=2)
+        parser.add_argument('--equipos', type=int, default=20)
+        parser.add_argument('--jugadores', type=int, default=15)
+        parser.add_argument('--torneos', type=int, default=2)
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--solo', action='append', default=[], help="Mide solo esta ruta (nombre; se puede repetir)")
+        parser.add_argument('--json', help="Fichero donde guardar los resultados")
+        parser.add_argument('--comparar', help="JSON de una ejecución anterior con el que comparar")
+        parser.add_argument('--umbral', type=float, default=20.0,
+                            help="% de empeoramiento del p50 a partir del cual se marca una regresión")
+
+    def handle(self, *args, **options):
+        base = None
+        if options['comparar']:
+            try:
+                with open(options['comparar'], encoding='utf-8') as f:
+                    base = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se puede leer {options['comparar']}: {e}")
+
+        nombre_original = connection.settings_dict['NAME']
+        # Los 404/403 ya salen en la tabla
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with solo_primaria():#las replicas siguen apuntando a la base de verdad, no a la de pruebas
+                resultado = self._benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            teardown_test_environment()
+
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as f:
+                json.dump(resultado, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json']}"))
+        if base is not None and self._comparar(base, resultado, options['umbral']):
+            raise CommandError("Hay regresiones respecto a la ejecución de referencia.")
+
+    def _benchmark(self, options):
+        tamanos = {campo: options[campo] for campo in ('deportes', 'equipos', 'jugadores', 'torneos')}
+        inicio = time.perf_counter()
+        sembrar(**tamanos)
+        self.stdout.write(f"Datos sembrados en {time.perf_counter() - inicio:.1f} s")
+
+        # El usuario de los datos sembrados, hecho staff: ve todo y es dueño de equipos e inscripciones
+        usuario = User.objects.get(username='sintetico')
+        usuario.is_staff = True
+        usuario.save(update_fields=['is_staff'])
+        cliente = Client()
+        cliente.force_login(usuario)
+        encolar('recalcular_elo', usuario)#para el detalle de /api/tareas/; sin trabajador se queda pendiente
+
+        rutas, saltadas = urls_a_medir()
+        for nombre, motivo in saltadas:
+            self.stdout.write(self.style.WARNING(f"Sin medir {nombre}: {motivo}"))
+
+        vistas = {}
+        self.stdout.write(f"{'vista':<28} {'estado':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'consultas':>10} {'KiB':>9}")
+        for nombre, url in rutas:
+            if options['solo'] and nombre not in options['solo']:
+                continue
+            datos = medir_url(cliente, url, options['repeticiones'])
+            vistas[nombre] = datos
+            consultas = '-' if datos['consultas'] is None else str(datos['consultas'])
+            if datos['presupuesto'] is not None:
+                consultas += f"/{datos['presupuesto']}"
+            linea = (f"{nombre:<28} {datos['estado']:>6} {datos['p50_ms']:>8.2f} {datos['p95_ms']:>8.2f} "
+                     f"{datos['p99_ms']:>8.2f} {consultas:>10} {datos['memoria_pico_kib']:>9.1f}")
+            excedido = datos['presupuesto'] is not None and (datos['consultas'] or 0) > datos['presupuesto']
+            self.stdout.write(self.style.ERROR(linea) if excedido or datos['estado'] >= 400 else linea)
+
+        return {
+            'commit': _commit(),
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'datos': tamanos,
+            'repeticiones': options['repeticiones'],
+            'vistas': vistas,
+        }
+
+    def _comparar(self, base, actual, umbral):
+        """Imprime las diferencias por vista y devuelve True si alguna ha empeorado."""
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\nComparación con {base.get('commit') or 'la referencia'} (p50 ms, consultas)"))
+        if base.get('datos') != actual['datos']:
+            self.stdout.write(self.style.WARNING("Los tamaños de los datos no coinciden; la comparación es orientativa."))
+
+        regresiones = False
+        for nombre, datos in actual['vistas'].items():
+            anterior = base.get('vistas', {}).get(nombre)
+            if anterior is None:
+                self.stdout.write(f"{nombre:<28} nueva")
+                continue
+            cambio = (datos['p50_ms'] - anterior['p50_ms']) / anterior['p50_ms'] * 100 if anterior['p50_ms'] else 0
+            mas_consultas = (datos['consultas'] or 0) > (anterior['consultas'] or 0)
+            peor = cambio > umbral or mas_consultas
+            regresiones |= peor
+            linea = (f"{nombre:<28} {anterior['p50_ms']:>8.2f} -> {datos['p50_ms']:>8.2f} ({cambio:+.0f}%)   "
+                     f"{anterior['consultas']} -> {datos['consultas']}")
+            self.stdout.write(self.style.ERROR(linea) if peor else linea)
+        return regresiones
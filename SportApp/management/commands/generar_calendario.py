@@ -0,0 +1,69 @@
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from SportApp import jornadas
+from SportApp.models import Torneo
+
+
+class Command(BaseCommand):
+    help = ("Genera de una vez los partidos de un torneo a partir de sus inscripciones: liga todos contra "
+            "todos, primera ronda de eliminatoria o la siguiente ronda con los ganadores. Informa del tiempo empleado.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('torneo', type=int, help="Id del torneo")
+        parser.add_argument('--tipo', choices=('liga', 'eliminatoria', 'siguiente-ronda'), default='liga')
+        parser.add_argument('--inicio', help="Fecha y hora del primer partido, AAAA-MM-DDTHH:MM. Por defecto mañana a esta hora.")
+        parser.add_argument('--dias', type=int, default=7, help="Días entre jornadas")
+        parser.add_argument('--horario', action='append', dest='horarios', default=[],
+                            help="Hora de juego HH:MM (se puede repetir)")
+        parser.add_argument('--sede', action='append', dest='sedes', default=[],
+                            help="Sede disponible (se puede repetir). Sin sedes se juega en la ciudad del local.")
+        parser.add_argument('--ida-y-vuelta', action='store_true')
+        parser.add_argument('--clasificados', type=int, help="Equipos que entran en el cuadro de la eliminatoria")
+        parser.add_argument('--usuario', help="Usuario que figura como creador. Por defecto el primer superusuario.")
+        parser.add_argument('--reemplazar', action='store_true', help="Borra antes los partidos pendientes del torneo")
+
+    def handle(self, *args, **options):
+        try:
+            torneo = Torneo.objects.get(pk=options['torneo'])
+        except Torneo.DoesNotExist:
+            raise CommandError(f"No existe el torneo {options['torneo']}")
+
+        usuarios = User.objects.filter(username=options['usuario']) if options['usuario'] \
+            else User.objects.filter(is_superuser=True).order_by('id')
+        usuario = usuarios.first()
+        if usuario is None:
+            raise CommandError("No hay ningún usuario con el que crear los partidos.")
+
+        try:
+            if options['inicio']:
+                inicio = datetime.fromisoformat(options['inicio'])
+            else:
+                inicio = timezone.localtime() + timedelta(days=1)
+            horarios = [datetime.strptime(h, '%H:%M').time() for h in options['horarios']]
+        except ValueError as e:
+            raise CommandError(f"Fecha u hora no válida: {e}")
+        if timezone.is_naive(inicio):
+            inicio = timezone.make_aware(inicio)
+
+        comunes = dict(dias_entre_jornadas=options['dias'], horarios=horarios, sedes=options['sedes'])
+        comienzo = time.perf_counter()
+        try:
+            if options['tipo'] == 'liga':
+                creados = jornadas.generar_liga(torneo, usuario, inicio, ida_y_vuelta=options['ida_y_vuelta'],
+                                                reemplazar=options['reemplazar'], **comunes)
+            elif options['tipo'] == 'eliminatoria':
+                creados = jornadas.generar_eliminatoria(torneo, usuario, inicio, clasificados=options['clasificados'],
+                                                        reemplazar=options['reemplazar'], **comunes)
+            else:
+                creados = jornadas.generar_siguiente_ronda(torneo, usuario, inicio, **comunes)
+        except ValidationError as e:
+            raise CommandError(" ".join(e.messages))
+        segundos = time.perf_counter() - comienzo
+
+        self.stdout.write(self.style.SUCCESS(f"{creados} partidos creados en {segundos:.2f} s."))
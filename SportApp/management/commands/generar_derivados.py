@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from SportApp.imagenes import actualizar_derivados
+from SportApp.models import Equipo, Jugador
+
+
+class Command(BaseCommand):
+    help = ("Genera las versiones reducidas (WebP y respaldo) de los escudos y fotos ya subidos. "
+            "Las imágenes nuevas se procesan solas al guardarlas.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true',
+                            help="Regenera también las que ya tienen derivados de su imagen actual.")
+
+    def handle(self, *args, **options):
+        for modelo, campo in ((Equipo, 'escudo'), (Jugador, 'foto')):
+            hechas = fallidas = 0
+            for pk, nombre, derivados in (modelo.objects.exclude(**{campo: ''}).exclude(**{f'{campo}__isnull': True})
+                                          .values_list('pk', campo, f'{campo}_derivados').iterator()):
+                if not options['todas'] and (derivados or {}).get('origen') == nombre:
+                    continue
+                if actualizar_derivados(modelo, pk, campo):
+                    hechas += 1
+                else:
+                    fallidas += 1
+            self.stdout.write(f"{modelo.__name__} ({campo}): {hechas} procesadas, {fallidas} con errores.")
+        self.stdout.write(self.style.SUCCESS("Derivados al día."))
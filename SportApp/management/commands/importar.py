@@ -0,0 +1,43 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from SportApp.importacion import COLUMNAS, ErrorImportacion, importar
+
+
+class Command(BaseCommand):
+    help = ("Importa equipos, jugadores o partidos desde un CSV o XLSX con inserciones masivas en una sola "
+            "transacción. Si alguna fila tiene errores los muestra todos y no guarda nada.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(COLUMNAS))
+        parser.add_argument('fichero', help="Ruta del CSV (UTF-8, separado por ',' o ';') o del XLSX")
+        parser.add_argument('--usuario', help="Usuario que figura como creador. Por defecto el primer superusuario.")
+        parser.add_argument('--comprobar', action='store_true', help="Solo valida, no guarda nada")
+
+    def handle(self, *args, **options):
+        usuarios = User.objects.filter(username=options['usuario']) if options['usuario'] \
+            else User.objects.filter(is_superuser=True).order_by('id')
+        usuario = usuarios.first()
+        if usuario is None:
+            raise CommandError("No hay ningún usuario con el que importar.")
+
+        inicio = time.perf_counter()
+        try:
+            with open(options['fichero'], 'rb') as fichero:
+                creados, errores = importar(options['tipo'], fichero, usuario, nombre=options['fichero'],
+                                            comprobar=options['comprobar'])
+        except (OSError, ErrorImportacion) as e:
+            raise CommandError(str(e))
+
+        if errores:
+            for linea, mensaje in errores:
+                self.stderr.write(f"Línea {linea}: {mensaje}")
+            raise CommandError(f"{len(errores)} errores; no se ha importado nada.")
+
+        resumen = ", ".join(f"{n} {modelo}" for modelo, n in creados.items())
+        if options['comprobar']:
+            self.stdout.write(self.style.SUCCESS(f"Fichero correcto, se crearían: {resumen}."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Importados {resumen} en {time.perf_counter() - inicio:.1f} s."))
@@ -0,0 +1,69 @@
+import asyncio
+import statistics
+import threading
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from SportApp.directo import BrokerMemoria
+
+
+class Command(BaseCommand):
+    help = ("Mide cuántas conexiones en directo aguanta un worker y cuánto tarda en llegarles cada "
+            "publicación. Abre N suscripciones a un partido en el broker en memoria y publica M fotos "
+            "desde otro hilo, como hace una vista síncrona al confirmar un cambio de marcador.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conexiones', type=int, default=5000)
+        parser.add_argument('--mensajes', type=int, default=20)
+        parser.add_argument('--intervalo', type=float, default=0.05, help="Segundos entre publicaciones")
+
+    def handle(self, *args, **options):
+        asyncio.run(self._medir(options['conexiones'], options['mensajes'], options['intervalo']))
+
+    async def _medir(self, conexiones, mensajes, intervalo):
+        broker = BrokerMemoria()
+        latencias = []
+
+        tracemalloc.start()
+        memoria_inicial = tracemalloc.get_traced_memory()[0]
+        suscripciones = [broker.suscribir(1) for _ in range(conexiones)]
+
+        async def espectador(suscripcion):
+            recibidos = 0
+            while recibidos < mensajes:
+                mensaje = await suscripcion.recibir(timeout=5)
+                if mensaje is None:
+                    return
+                latencias.append(time.perf_counter() - mensaje['enviado'])
+                recibidos += 1
+
+        tareas = [asyncio.create_task(espectador(s)) for s in suscripciones]
+        await asyncio.sleep(0)
+        memoria_conexiones = tracemalloc.get_traced_memory()[0] - memoria_inicial
+        tracemalloc.stop()  # con tracemalloc activo las latencias no serian reales
+
+        def publicar():
+            for i in range(mensajes):
+                broker.publicar(1, {'id': 1, 'marcador_local': i, 'enviado': time.perf_counter()})
+                time.sleep(intervalo)
+
+        publicador = threading.Thread(target=publicar)
+        publicador.start()
+        await asyncio.gather(*tareas)
+        publicador.join()
+
+        for suscripcion in suscripciones:
+            suscripcion.cerrar()
+
+        esperados = conexiones * mensajes
+        self.stdout.write(f"Conexiones abiertas: {conexiones} (~{memoria_conexiones / conexiones / 1024:.1f} KiB cada una)")
+        self.stdout.write(f"Mensajes entregados: {len(latencias)} de {esperados}")
+        if len(latencias) > 1:
+            cuantiles = statistics.quantiles(latencias, n=100)
+            self.stdout.write(
+                f"Latencia de entrega: p50 {cuantiles[49] * 1000:.2f} ms, "
+                f"p95 {cuantiles[94] * 1000:.2f} ms, p99 {cuantiles[98] * 1000:.2f} ms, "
+                f"max {max(latencias) * 1000:.2f} ms"
+            )
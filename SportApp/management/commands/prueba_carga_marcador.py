@@ -0,0 +1,49 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from SportApp.marcador import ajustar_marcador
+from SportApp.models import Partido
+
+
+class Command(BaseCommand):
+    help = ("Lanza muchas pulsaciones concurrentes de marcador contra un partido y comprueba que no se "
+            "pierde ninguna. Suma N goles al local y después los resta, así que el marcador queda como estaba.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('partido', type=int, help="Id del partido")
+        parser.add_argument('--peticiones', type=int, default=500)
+        parser.add_argument('--hilos', type=int, default=32)
+
+    def _rafaga(self, partido_id, accion, peticiones, hilos):
+        def pulsar(_):
+            try:
+                ajustar_marcador(partido_id, accion)
+            finally:
+                connection.close()  # cada hilo tiene su propia conexion
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            list(pool.map(pulsar, range(peticiones)))
+        return time.perf_counter() - inicio
+
+    def handle(self, *args, **options):
+        partido_id, peticiones, hilos = options['partido'], options['peticiones'], options['hilos']
+        try:
+            inicial = Partido.objects.values_list('marcador_local', flat=True).get(pk=partido_id)
+        except Partido.DoesNotExist:
+            raise CommandError(f"No existe el partido {partido_id}")
+
+        for accion, esperado in (('local_sumar', inicial + peticiones), ('local_restar', inicial)):
+            segundos = self._rafaga(partido_id, accion, peticiones, hilos)
+            final = Partido.objects.values_list('marcador_local', flat=True).get(pk=partido_id)
+            self.stdout.write(
+                f"{accion}: {peticiones} peticiones en {hilos} hilos, {segundos:.2f}s "
+                f"({peticiones / segundos:.0f} pet/s), marcador {final} (esperado {esperado})"
+            )
+            if final != esperado:
+                raise CommandError(f"Se han perdido {abs(esperado - final)} actualizaciones")
+
+        self.stdout.write(self.style.SUCCESS("Sin actualizaciones perdidas."))
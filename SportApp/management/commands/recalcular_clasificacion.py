@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from SportApp.clasificacion import CAMPOS_CLASIFICACION, recalcular_clasificacion
+
+
+class Command(BaseCommand):
+    help = "Reconstruye desde cero las clasificaciones de los torneos a partir de los partidos jugados."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--torneo', type=int, action='append', dest='torneos',
+                            help="Id del torneo a recalcular (se puede repetir). Por defecto todos.")
+        parser.add_argument('--comprobar', action='store_true',
+                            help="Solo informa de las filas que no cuadran, sin guardar nada.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            diferencias = recalcular_clasificacion(options['torneos'], guardar=not options['comprobar'])
+
+        for inscripcion, calculada in diferencias:
+            cambios = ", ".join(
+                f"{campo}: {getattr(inscripcion, campo) if options['comprobar'] else '-'} -> {calculada[campo]}"
+                for campo in CAMPOS_CLASIFICACION
+            )
+            self.stdout.write(f"{inscripcion.torneo} / {inscripcion.equipo.nombre}: {cambios}")
+
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS("La clasificación está al día."))
+        elif options['comprobar']:
+            self.stdout.write(self.style.WARNING(f"{len(diferencias)} filas no coinciden con los partidos jugados."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{len(diferencias)} filas corregidas."))
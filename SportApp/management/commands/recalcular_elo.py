@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from SportApp.elo import recalcular_elo
+
+
+class Command(BaseCommand):
+    help = ("Recalcula el Elo de los equipos repitiendo por orden de fecha todos los partidos jugados de su deporte. "
+            "Hace falta tras corregir resultados antiguos: al guardar un partido solo se ajusta con el Elo del momento.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deporte', type=int, action='append', dest='deportes',
+                            help="Id del deporte a recalcular (se puede repetir). Por defecto todos.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            resumen = recalcular_elo(options['deportes'])
+        for deporte, equipos in resumen.items():
+            self.stdout.write(f"{deporte.nombre}: {equipos} equipos")
+        self.stdout.write(self.style.SUCCESS(f"Elo recalculado en {len(resumen)} deportes."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from SportApp.enfrentamientos import recalcular_enfrentamientos
+
+
+class Command(BaseCommand):
+    help = "Reconstruye desde cero los cara a cara entre equipos a partir de los partidos jugados."
+
+    def handle(self, *args, **options):
+        filas = recalcular_enfrentamientos()
+        self.stdout.write(self.style.SUCCESS(f"{filas} enfrentamientos recalculados."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from SportApp.estadisticas import recalcular_estadisticas
+
+
+class Command(BaseCommand):
+    help = "Reconstruye desde cero las estadísticas acumuladas de los jugadores a partir de las líneas de cada partido."
+
+    def handle(self, *args, **options):
+        filas = recalcular_estadisticas()
+        self.stdout.write(self.style.SUCCESS(f"{filas} filas de estadísticas acumuladas recalculadas."))
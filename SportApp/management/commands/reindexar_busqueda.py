@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from SportApp.busqueda import reindexar
+
+
+class Command(BaseCommand):
+    help = ("Rehace desde cero los documentos del buscador global (equipos, jugadores, torneos y partidos). "
+            "Hace falta después de migrar con datos y si se cargan filas con SQL a mano.")
+
+    def handle(self, *args, **options):
+        resumen = reindexar()
+        for tipo, documentos in resumen.items():
+            self.stdout.write(f"  {tipo}: {documentos}")
+        self.stdout.write(self.style.SUCCESS(f"{sum(resumen.values())} documentos indexados."))
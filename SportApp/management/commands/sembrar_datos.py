@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SportApp.datos_sinteticos import sembrar
+
+
+class Command(BaseCommand):
+    help = ("Rellena la base de datos con datos sintéticos deterministas (deportes, equipos, jugadores, torneos, "
+            "partidos y estadísticas) usando inserciones masivas. Pensado para desarrollo y pruebas de rendimiento.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deportes', type=int, default=4)
+        parser.add_argument('--equipos', type=int, default=40, help="Equipos por deporte")
+        parser.add_argument('--jugadores', type=int, default=15, help="Jugadores por equipo")
+        parser.add_argument('--torneos', type=int, default=2, help="Temporadas por deporte")
+        parser.add_argument('--semilla', type=int, default=0)
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        try:
+            creados = sembrar(options['deportes'], options['equipos'], options['jugadores'],
+                              options['torneos'], semilla=options['semilla'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(", ".join(f"{n} {modelo}" for modelo, n in creados.items()))
+        self.stdout.write(self.style.SUCCESS(f"Datos sintéticos creados en {time.perf_counter() - inicio:.1f} s."))
@@ -0,0 +1,35 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from SportApp.replicas import REPLICAS, copiar_sqlite
+
+
+class Command(BaseCommand):
+    help = ("Copia la base de datos principal de SQLite en las réplicas de OLYMPO_DB_REPLICAS, para probar en local "
+            "la lectura en réplicas. Con --cada N lo repite cada N segundos, como una replicación con retraso.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cada', type=float, default=None, help="Segundos entre copias; sin él copia una vez y sale")
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError("Solo para SQLite: con MySQL las réplicas se mantienen con la replicación del servidor.")
+        if not REPLICAS:
+            raise CommandError("No hay réplicas: define OLYMPO_DB_REPLICAS con las rutas de los ficheros.")
+
+        parar = []
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(senal, lambda *_: parar.append(True))
+        while True:
+            inicio = time.perf_counter()
+            copiar_sqlite()
+            self.stdout.write(f"Copiada en {', '.join(REPLICAS)} en {(time.perf_counter() - inicio) * 1000:.0f} ms.")
+            if options['cada'] is None or parar:
+                break
+            time.sleep(options['cada'])
+            if parar:
+                break
+        self.stdout.write(self.style.SUCCESS("Réplicas al día."))
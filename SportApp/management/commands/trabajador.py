@@ -0,0 +1,24 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from SportApp.tareas import nombre_trabajador, trabajar
+
+
+class Command(BaseCommand):
+    help = ("Ejecuta las tareas en segundo plano (derivados de imágenes, recálculos...) que dejan en la cola "
+            "las vistas. Se pueden arrancar varios a la vez; con Ctrl+C o SIGTERM acaba la tarea en curso y sale.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--espera', type=float, default=1.0, help="Segundos entre consultas a la cola vacía")
+        parser.add_argument('--una-vez', action='store_true', help="Vacía la cola y termina, en vez de quedarse esperando")
+
+    def handle(self, *args, **options):
+        parar = []
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(senal, lambda *_: parar.append(True))
+
+        trabajador = nombre_trabajador()
+        self.stdout.write(f"Trabajador {trabajador} esperando tareas...")
+        ejecutadas = trabajar(trabajador, espera=options['espera'], una_vez=options['una_vez'], parar=lambda: bool(parar))
+        self.stdout.write(self.style.SUCCESS(f"{ejecutadas} tareas ejecutadas."))
@@ -0,0 +1,61 @@
+"""
+Marcador en directo.
+
+Cada pulsación del anotador es un único UPDATE condicional sobre la fila del
+partido (F-expressions, sin bajar de cero), así que varios anotadores a la vez
+no se pisan los goles y no se pasa por full_clean() para un simple +1. El
+resultado se publica en el canal en directo (SportApp.directo) al confirmar.
+Solo anotan el staff y el organizador del partido (el usuario que lo creó).
+"""
+from django.db import models, transaction
+from django.db.models.functions import Now
+
+from .clasificacion import CAMPOS_PARTIDO, actualizar_clasificacion
+from .directo import publicar_al_confirmar
+from .elo import actualizar_elo
+from .enfrentamientos import actualizar_enfrentamientos
+from .models import Partido
+
+
+ACCIONES = {
+    'local_sumar': ('marcador_local', 1),
+    'local_restar': ('marcador_local', -1),
+    'visitante_sumar': ('marcador_visitante', 1),
+    'visitante_restar': ('marcador_visitante', -1),
+}
+
+
+def puede_anotar(usuario, organizador_id):
+    return usuario.is_authenticated and (usuario.is_staff or usuario.pk == organizador_id)
+
+
+def ajustar_marcador(partido_id, accion):
+    """
+    Aplica la acción sobre el marcador y devuelve el estado actual del partido
+    como diccionario (None si el partido no existe). Una acción desconocida o
+    restar a un marcador en 0 no cambia nada.
+    """
+    partido = Partido.objects.filter(pk=partido_id)
+    with transaction.atomic():
+        actualizados = 0
+        if accion in ACCIONES:
+            campo, delta = ACCIONES[accion]
+            if delta > 0:
+                actualizados = partido.update(**{campo: models.F(campo) + delta}, actualizado=Now())
+            else:
+                actualizados = partido.filter(**{f'{campo}__gte': -delta}).update(**{campo: models.F(campo) + delta}, actualizado=Now())
+
+        # La fila sigue bloqueada por el UPDATE hasta el commit: lo que leemos es nuestro resultado
+        actual = partido.values(*CAMPOS_PARTIDO, 'elo_cambio', sistema=models.F('torneo__deporte__sistema_puntuacion')).first()
+        if actual is None:
+            return None
+        sistema = actual.pop('sistema')
+        elo_cambio = actual.pop('elo_cambio')
+        if actualizados:
+            anterior = dict(actual, **{campo: actual[campo] - delta})
+            actualizar_clasificacion(anterior, actual, sistema)
+            actualizar_enfrentamientos(anterior, actual)
+            actualizar_elo(partido_id, anterior, actual, elo_cambio, sistema)
+            publicar_al_confirmar(dict(actual, id=partido_id))
+
+    return actual
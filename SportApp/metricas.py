@@ -0,0 +1,88 @@
+"""
+Métricas por vista en memoria, en el formato de texto de Prometheus.
+
+InstrumentacionMiddleware (SportApp.middleware) apunta aquí lo que mide de
+cada petición muestreada: histogramas de tiempo total, tiempo de base de
+datos, número de consultas y tiempo de plantillas, y contadores de consultas
+duplicadas y de peticiones lentas, todos con la vista como etiqueta. Cada
+proceso lleva sus propias cifras desde que arrancó; /metrics devuelve las del
+proceso que atiende la petición.
+"""
+import bisect
+import threading
+from collections import defaultdict
+
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.cuentas = [0] * (len(buckets) + 1)#la ultima es +Inf
+        self.suma = 0.0
+
+    def observar(self, valor):
+        self.cuentas[bisect.bisect_left(self.buckets, valor)] += 1
+        self.suma += valor
+
+
+# nombre: (tipo, ayuda, buckets si es histograma)
+METRICAS = {
+    'olympo_peticion_segundos': ('histogram', "Tiempo de la vista hasta devolver la respuesta", BUCKETS_SEGUNDOS),
+    'olympo_bd_segundos': ('histogram', "Tiempo en la base de datos por petición", BUCKETS_SEGUNDOS),
+    'olympo_consultas': ('histogram', "Consultas SQL por petición", BUCKETS_CONSULTAS),
+    'olympo_plantillas_segundos': ('histogram', "Tiempo pintando plantillas (incluye las consultas que lanzan)", BUCKETS_SEGUNDOS),
+    'olympo_consultas_duplicadas_total': ('counter', "Consultas repetidas con los mismos parámetros en una petición", None),
+    'olympo_peticiones_lentas_total': ('counter', "Peticiones por encima de OLYMPO_PETICION_LENTA_MS", None),
+}
+
+_cerrojo = threading.Lock()
+_valores = defaultdict(dict)#nombre -> {etiquetas: Histograma o numero}
+
+
+def observar(nombre, etiquetas, valor):
+    etiquetas = tuple(sorted(etiquetas.items()))
+    with _cerrojo:
+        serie = _valores[nombre]
+        if METRICAS[nombre][0] == 'histogram':
+            if etiquetas not in serie:
+                serie[etiquetas] = Histograma(METRICAS[nombre][2])
+            serie[etiquetas].observar(valor)
+        else:
+            serie[etiquetas] = serie.get(etiquetas, 0) + valor
+
+
+def reiniciar():
+    with _cerrojo:
+        _valores.clear()
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(etiquetas, **extra):
+    pares = [*etiquetas, *extra.items()]
+    return '{' + ','.join(f'{clave}="{_escapar(valor)}"' for clave, valor in pares) + '}' if pares else ''
+
+
+def exportar():
+    """Todas las métricas en el formato de exposición de Prometheus (text/plain 0.0.4)."""
+    lineas = []
+    with _cerrojo:
+        for nombre, (tipo, ayuda, buckets) in METRICAS.items():
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for etiquetas, valor in sorted(_valores.get(nombre, {}).items()):
+                if tipo == 'counter':
+                    lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+                    continue
+                acumulado = 0
+                for limite, cuenta in zip((*buckets, '+Inf'), valor.cuentas):
+                    acumulado += cuenta
+                    lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, le=limite)} {acumulado}")
+                lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {valor.suma}")
+                lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {acumulado}")
+    return '\n'.join(lineas) + '\n'
@@ -0,0 +1,331 @@
+"""
+Medición de consultas por petición.
+
+PresupuestoConsultasMiddleware cuenta las consultas y el tiempo de base de
+datos de cada petición con connection.execute_wrapper y, con DEBUG (o
+OLYMPO_CABECERAS_CONSULTAS), lo devuelve en las cabeceras X-Consultas-BD y
+Server-Timing. Si la vista tiene presupuesto (@presupuesto_consultas(n), el
+atributo de clase `presupuesto_consultas` o OLYMPO_PRESUPUESTO_CONSULTAS) y se
+pasa, lo registra en el log y, en modo estricto, lanza
+PresupuestoConsultasExcedido para que falle la prueba que la ha llamado.
+Normalmente solo cuenta; el SQL de cada consulta lo guarda en modo estricto
+(para el mensaje) o con la instrumentación.
+
+InstrumentacionMiddleware (opcional, OLYMPO_INSTRUMENTACION) va por fuera del
+anterior y aprovecha su contador: apunta en SportApp.metricas el tiempo, las
+consultas, las repetidas y el tiempo de plantillas de una muestra de las
+peticiones, y deja en el log las lentas con su SQL.
+
+CompresionMiddleware es el GZipMiddleware de Django con Brotli cuando el
+paquete `brotli` está instalado y el cliente lo acepta, salvo en las páginas
+que llevan el token CSRF (ver _brotli_seguro). Lo que acepta el cliente se lee
+de Accept-Encoding con sus q (calidad_codificacion), que también usan las
+exportaciones.
+"""
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from . import metricas
+
+try:
+    import brotli
+except ImportError:  # opcional: pip install brotli
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class PresupuestoConsultasExcedido(Exception):
+    pass
+
+
+def presupuesto_consultas(maximo):
+    """Fija el máximo de consultas de una vista de función."""
+    def decorador(vista):
+        vista.presupuesto_consultas = maximo
+        return vista
+    return decorador
+
+
+class ContadorConsultas:
+    """
+    execute_wrapper que acumula el número de consultas y los segundos que tardan.
+    Con `detalle` guarda además el SQL, los parámetros y el tiempo de cada una
+    (para duplicadas, mas_lentas y el mensaje del modo estricto).
+    """
+
+    def __init__(self, detalle=False):
+        self.consultas = 0
+        self.segundos = 0.0
+        self.detalle = detalle
+        self.sql = []
+        self.parametros = []
+        self.tiempos = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            tiempo = time.perf_counter() - inicio
+            self.segundos += tiempo
+            self.consultas += 1
+            if self.detalle:
+                self.sql.append(sql)
+                self.parametros.append(object() if many else params)#un executemany nunca cuenta como repetido
+                self.tiempos.append(tiempo)
+
+    @property
+    def duplicadas(self):
+        """Consultas que ya se habían hecho antes en la petición con los mismos parámetros (un N+1 o un bucle)."""
+        vistas = set()
+        for sql, params in zip(self.sql, self.parametros):
+            vistas.add((sql, repr(params)))
+        return len(self.sql) - len(vistas)
+
+    def mas_lentas(self, n=10):
+        return sorted(zip(self.tiempos, self.sql), reverse=True)[:n]
+
+    @contextmanager
+    def contando(self):
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(self))
+            yield self
+
+
+def _con_detalle():
+    # El SQL de cada consulta solo hace falta para el modo estricto y la instrumentacion; si no, solo se cuenta
+    return getattr(settings, 'OLYMPO_PRESUPUESTO_ESTRICTO', False) or getattr(settings, 'OLYMPO_INSTRUMENTACION', False)
+
+
+def _presupuesto_de(vista):
+    for candidato in (vista, getattr(vista, 'view_class', None), getattr(vista, 'cls', None)):
+        maximo = getattr(candidato, 'presupuesto_consultas', None)
+        if maximo is not None:
+            return maximo
+    return getattr(settings, 'OLYMPO_PRESUPUESTO_CONSULTAS', None)
+
+
+class PresupuestoConsultasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        contador = ContadorConsultas(_con_detalle())
+        with contador.contando():
+            response = self.get_response(request)
+        return self._revisar(request, response, contador)
+
+    async def __acall__(self, request):
+        # Con ASGI las vistas sincronas corren en otro hilo pero con la misma conexion, asi que cuentan igual.
+        # De una respuesta en streaming solo se cuenta lo que pasa antes de empezar a enviarla
+        contador = ContadorConsultas(_con_detalle())
+        with contador.contando():
+            response = await self.get_response(request)
+        return self._revisar(request, response, contador)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.presupuesto_consultas = _presupuesto_de(view_func)
+
+    def _revisar(self, request, response, contador):
+        request.consultas_bd = contador
+        if getattr(settings, 'OLYMPO_CABECERAS_CONSULTAS', False):
+            response['X-Consultas-BD'] = str(contador.consultas)
+            response['Server-Timing'] = f'db;dur={contador.segundos * 1000:.1f};desc="{contador.consultas} consultas"'
+
+        maximo = getattr(request, 'presupuesto_consultas', None)
+        if maximo is not None and contador.consultas > maximo:
+            mensaje = f"{request.method} {request.path}: {contador.consultas} consultas (presupuesto {maximo})"
+            if getattr(settings, 'OLYMPO_PRESUPUESTO_ESTRICTO', False):
+                raise PresupuestoConsultasExcedido(mensaje + "\n" + "\n".join(contador.sql))
+            logger.warning(mensaje)
+        return response
+
+
+_tiempo_plantillas = ContextVar('tiempo_plantillas', default=None)
+
+
+def _instrumentar_plantillas():
+    # Envolvemos el render de las plantillas de Django (una vez por plantilla principal: los include van por dentro)
+    from django.template.backends.django import Template
+    if getattr(Template.render, 'instrumentado', False):
+        return
+    original = Template.render
+
+    @wraps(original)
+    def render(self, *args, **kwargs):
+        acumulado = _tiempo_plantillas.get()
+        if acumulado is None:
+            return original(self, *args, **kwargs)
+        inicio = time.perf_counter()
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            acumulado[0] += time.perf_counter() - inicio
+
+    render.instrumentado = True
+    Template.render = render
+
+
+class InstrumentacionMiddleware:
+    """
+    Con OLYMPO_INSTRUMENTACION mide cada petición de la muestra
+    (OLYMPO_INSTRUMENTACION_MUESTREO, de 0 a 1) y avisa en el log de las que
+    pasan de OLYMPO_PETICION_LENTA_MS con sus consultas más lentas. Sin el
+    ajuste Django lo quita de la cadena y no cuesta nada. Tiene que ir antes
+    que PresupuestoConsultasMiddleware en MIDDLEWARE.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'OLYMPO_INSTRUMENTACION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.muestreo = getattr(settings, 'OLYMPO_INSTRUMENTACION_MUESTREO', 1.0)
+        self.lenta = getattr(settings, 'OLYMPO_PETICION_LENTA_MS', 500) / 1000
+        _instrumentar_plantillas()
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        plantillas = [0.0] if random.random() < self.muestreo else None
+        marca = _tiempo_plantillas.set(plantillas)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _tiempo_plantillas.reset(marca)
+        self._apuntar(request, time.perf_counter() - inicio, plantillas)
+        return response
+
+    async def __acall__(self, request):
+        # sync_to_async copia el contexto, pero la lista es la misma: lo que sume la vista se ve aqui
+        plantillas = [0.0] if random.random() < self.muestreo else None
+        marca = _tiempo_plantillas.set(plantillas)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _tiempo_plantillas.reset(marca)
+        self._apuntar(request, time.perf_counter() - inicio, plantillas)
+        return response
+
+    def _apuntar(self, request, segundos, plantillas):
+        contador = getattr(request, 'consultas_bd', None)#lo deja PresupuestoConsultasMiddleware
+        vista = request.resolver_match.view_name if request.resolver_match else 'sin_ruta'
+        etiquetas = {'vista': vista}
+
+        if segundos >= self.lenta:
+            metricas.observar('olympo_peticiones_lentas_total', etiquetas, 1)
+            detalle = ""
+            if contador is not None:
+                detalle = f", {contador.consultas} consultas ({contador.duplicadas} repetidas) en {contador.segundos * 1000:.0f} ms de BD"
+                detalle += "".join(f"\n  {tiempo * 1000:8.1f} ms  {sql}" for tiempo, sql in contador.mas_lentas())
+            logger.warning("Petición lenta %s %s (%s): %.0f ms%s", request.method, request.path, vista, segundos * 1000, detalle)
+
+        if plantillas is None:
+            return
+        metricas.observar('olympo_peticion_segundos', {**etiquetas, 'metodo': request.method}, segundos)
+        metricas.observar('olympo_plantillas_segundos', etiquetas, plantillas[0])
+        if contador is not None:
+            metricas.observar('olympo_bd_segundos', etiquetas, contador.segundos)
+            metricas.observar('olympo_consultas', etiquetas, contador.consultas)
+            metricas.observar('olympo_consultas_duplicadas_total', etiquetas, contador.duplicadas)
+
+
+CALIDAD_BROTLI = 5#a partir de aqui comprime poco mas y tarda mucho mas en cada respuesta
+
+
+def calidad_codificacion(request, codificacion):
+    """
+    El q con el que el Accept-Encoding de la petición admite `codificacion`, de
+    0 (no la admite: no la nombra, o 'gzip;q=0') a 1. '*' vale para las que
+    no se nombran.
+    """
+    comodin = 0.0
+    for parte in request.headers.get('Accept-Encoding', '').split(','):
+        nombre, _, parametros = parte.partition(';')
+        nombre, q = nombre.strip().lower(), 1.0
+        for parametro in parametros.split(';'):
+            clave, _, valor = parametro.partition('=')
+            if clave.strip().lower() == 'q':
+                try:
+                    q = min(max(float(valor), 0.0), 1.0)
+                except ValueError:
+                    q = 0.0#un q que no se entiende no cuenta como aceptada
+        if nombre == codificacion:
+            return q
+        if nombre == '*':
+            comodin = q
+    return comodin
+
+
+def _brotli_seguro(request, response):
+    """
+    Brotli no tiene la mitigación de BREACH que GZipMiddleware mete en gzip (bytes
+    al azar en la cabecera para que el tamaño no delate el contenido): solo se usa
+    en lo que no es HTML (JSON, CSV, estáticos) o en el HTML que no lleva el token
+    CSRF. Esas páginas van con gzip.
+    """
+    if not response.get('Content-Type', '').startswith('text/html'):
+        return True
+    # get_token marca la peticion y CsrfViewMiddleware, que va por dentro, quita la marca al poner la cookie
+    return not request.META.get('CSRF_COOKIE_NEEDS_UPDATE') and settings.CSRF_COOKIE_NAME not in response.cookies
+
+
+class CompresionMiddleware(GZipMiddleware):
+    """
+    Comprime las respuestas de texto: Brotli si se puede, si no gzip. No toca las
+    que ya vienen comprimidas (las exportaciones) ni el canal en directo (SSE),
+    que tiene que llegar mensaje a mensaje.
+    """
+
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        q_brotli, q_gzip = calidad_codificacion(request, 'br'), calidad_codificacion(request, 'gzip')
+        if (brotli is None or response.streaming or response.has_header('Content-Encoding')
+                or len(response.content) < 200 or not _brotli_seguro(request, response)
+                or not q_brotli or q_brotli < q_gzip):
+            if not q_gzip:
+                # GZipMiddleware solo busca 'gzip' en la cabecera: comprimiria tambien con 'gzip;q=0'
+                patch_vary_headers(response, ('Accept-Encoding',))
+                return response
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        comprimido = brotli.compress(response.content, quality=CALIDAD_BROTLI)
+        if len(comprimido) >= len(response.content):
+            return response
+        response.content = comprimido
+        response['Content-Length'] = str(len(comprimido))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag#como hace GZipMiddleware: el cuerpo ya no es el mismo byte a byte
+        response['Content-Encoding'] = 'br'
+        return response
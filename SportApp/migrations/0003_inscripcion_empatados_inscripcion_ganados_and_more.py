@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SportApp', '0002_equipo_usuario_partido_usuario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inscripcion',
+            name='empatados',
+            field=models.PositiveIntegerField(default=0, verbose_name='E'),
+        ),
+        migrations.AddField(
+            model_name='inscripcion',
+            name='ganados',
+            field=models.PositiveIntegerField(default=0, verbose_name='G'),
+        ),
+        migrations.AddField(
+            model_name='inscripcion',
+            name='partidos_jugados',
+            field=models.PositiveIntegerField(default=0, verbose_name='PJ'),
+        ),
+        migrations.AddField(
+            model_name='inscripcion',
+            name='perdidos',
+            field=models.PositiveIntegerField(default=0, verbose_name='P'),
+        ),
+        migrations.AddField(
+            model_name='inscripcion',
+            name='tantos_contra',
+            field=models.PositiveIntegerField(default=0, verbose_name='En contra'),
+        ),
+        migrations.AddField(
+            model_name='inscripcion',
+            name='tantos_favor',
+            field=models.PositiveIntegerField(default=0, verbose_name='A favor'),
+        ),
+    ]
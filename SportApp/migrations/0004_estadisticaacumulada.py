@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SportApp', '0003_inscripcion_empatados_inscripcion_ganados_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaAcumulada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ambito', models.CharField(choices=[('CARRERA', 'Carrera'), ('TEMPORADA', 'Temporada'), ('TORNEO', 'Torneo')], max_length=20)),
+                ('clave', models.CharField(blank=True, help_text='Temporada o id del torneo; vacío en la carrera', max_length=50)),
+                ('partidos_jugados', models.PositiveIntegerField(default=0)),
+                ('puntos', models.PositiveIntegerField(default=0)),
+                ('minutos_jugados', models.PositiveIntegerField(default=0)),
+                ('jugador', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas_acumuladas', to='SportApp.jugador')),
+                ('torneo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas_acumuladas', to='SportApp.torneo')),
+            ],
+            options={
+                'verbose_name': 'Estadística Acumulada',
+                'verbose_name_plural': 'Estadísticas Acumuladas',
+                'indexes': [models.Index(fields=['ambito', 'clave', '-puntos'], name='acumulada_top_puntos'), models.Index(fields=['ambito', 'clave', '-minutos_jugados'], name='acumulada_top_minutos'), models.Index(fields=['ambito', 'clave', '-partidos_jugados'], name='acumulada_top_partidos')],
+                'constraints': [models.UniqueConstraint(fields=('jugador', 'ambito', 'clave'), name='estadistica_acumulada_unica'), models.UniqueConstraint(condition=models.Q(('jugador__isnull', True)), fields=('ambito', 'clave'), name='estadistica_acumulada_total_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SportApp', '0004_estadisticaacumulada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipo',
+            name='escudo_derivados',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='jugador',
+            name='foto_derivados',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
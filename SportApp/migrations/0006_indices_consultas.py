@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SportApp', '0005_equipo_escudo_derivados_jugador_foto_derivados'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='estadisticapartido',
+            index=models.Index(fields=['jugador', 'juega'], name='estadistica_jugador_juega'),
+        ),
+        migrations.AddIndex(
+            model_name='inscripcion',
+            index=models.Index(fields=['torneo', '-puntos_acumulados'], name='inscripcion_clasificacion'),
+        ),
+        migrations.AddIndex(
+            model_name='jugador',
+            index=models.Index(fields=['equipo', 'dorsal'], name='jugador_equipo_dorsal'),
+        ),
+        migrations.AddIndex(
+            model_name='partido',
+            index=models.Index(fields=['torneo', 'fecha_hora'], name='partido_torneo_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='partido',
+            index=models.Index(fields=['estado', 'fecha_hora'], name='partido_estado_fecha'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SportApp', '0006_indices_consultas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipo',
+            index=models.Index(fields=['nombre'], name='equipo_nombre'),
+        ),
+        migrations.AddIndex(
+            model_name='jugador',
+            index=models.Index(fields=['nombre'], name='jugador_nombre'),
+        ),
+        migrations.AddIndex(
+            model_name='torneo',
+            index=models.Index(fields=['nombre'], name='torneo_nombre'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SportApp', '0009_marcas_tiempo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estadisticaacumulada',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='estadisticaacumulada',
+            name='creado',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='estadisticaacumulada',
+            name='forma',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
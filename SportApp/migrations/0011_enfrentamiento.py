@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SportApp', '0010_perfil_jugador'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Enfrentamiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('partidos', models.PositiveIntegerField(default=0)),
+                ('victorias_a', models.PositiveIntegerField(default=0)),
+                ('victorias_b', models.PositiveIntegerField(default=0)),
+                ('empates', models.PositiveIntegerField(default=0)),
+                ('tantos_a', models.PositiveIntegerField(default=0)),
+                ('tantos_b', models.PositiveIntegerField(default=0)),
+                ('ultimos', models.JSONField(blank=True, default=list, editable=False)),
+                ('equipo_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enfrentamientos_como_a', to='SportApp.equipo')),
+                ('equipo_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enfrentamientos_como_b', to='SportApp.equipo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('equipo_a', 'equipo_b'), name='enfrentamiento_unico'), models.CheckConstraint(condition=models.Q(('equipo_a__lt', models.F('equipo_b'))), name='enfrentamiento_orden')],
+            },
+        ),
+    ]
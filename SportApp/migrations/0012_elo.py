@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SportApp', '0011_enfrentamiento'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipo',
+            name='elo',
+            field=models.FloatField(default=1500, editable=False),
+        ),
+        migrations.AddField(
+            model_name='equipo',
+            name='elo_partidos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='partido',
+            name='elo_cambio',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='equipo',
+            index=models.Index(fields=['deporte', '-elo'], name='equipo_deporte_elo'),
+        ),
+    ]
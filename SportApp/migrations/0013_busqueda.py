@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+TABLA = 'SportApp_documentobusqueda'
+FTS = 'SportApp_busqueda_fts'
+
+# SQLite: tabla FTS5 de contenido externo (guarda solo el indice; el texto esta en TABLA) que los triggers
+# mantienen al dia con cualquier INSERT, UPDATE o DELETE de TABLA, tambien los de bulk_create
+SQLITE = [
+    f"""CREATE VIRTUAL TABLE "{FTS}" USING fts5(texto, content='{TABLA}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    f"""CREATE TRIGGER busqueda_fts_insertar AFTER INSERT ON "{TABLA}" BEGIN
+        INSERT INTO "{FTS}"(rowid, texto) VALUES (new.id, new.texto);
+    END""",
+    f"""CREATE TRIGGER busqueda_fts_borrar AFTER DELETE ON "{TABLA}" BEGIN
+        INSERT INTO "{FTS}"("{FTS}", rowid, texto) VALUES ('delete', old.id, old.texto);
+    END""",
+    f"""CREATE TRIGGER busqueda_fts_cambiar AFTER UPDATE OF texto ON "{TABLA}" BEGIN
+        INSERT INTO "{FTS}"("{FTS}", rowid, texto) VALUES ('delete', old.id, old.texto);
+        INSERT INTO "{FTS}"(rowid, texto) VALUES (new.id, new.texto);
+    END""",
+]
+SQLITE_QUITAR = [
+    "DROP TRIGGER IF EXISTS busqueda_fts_insertar",
+    "DROP TRIGGER IF EXISTS busqueda_fts_borrar",
+    "DROP TRIGGER IF EXISTS busqueda_fts_cambiar",
+    f'DROP TABLE IF EXISTS "{FTS}"',
+]
+MYSQL = [f"ALTER TABLE `{TABLA}` ADD FULLTEXT INDEX documento_busqueda_texto (texto)"]
+MYSQL_QUITAR = [f"ALTER TABLE `{TABLA}` DROP INDEX documento_busqueda_texto"]
+
+
+def _ejecutar(sentencias):
+    # El indice de texto completo depende del motor; con los demas SportApp.busqueda busca con LIKE
+    def operacion(apps, schema_editor):
+        for sql in sentencias.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operacion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SportApp', '0012_elo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('tipo', models.CharField(choices=[('equipo', 'Equipo'), ('jugador', 'Jugador'), ('torneo', 'Torneo'), ('partido', 'Partido')], max_length=20)),
+                ('objeto_id', models.PositiveIntegerField()),
+                ('titulo', models.CharField(max_length=255)),
+                ('detalle', models.CharField(blank=True, max_length=255)),
+                ('texto', models.TextField(help_text='Los campos en los que se busca, en minúsculas y sin tildes')),
+                ('prioridad', models.PositiveSmallIntegerField(default=1)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'objeto_id'), name='documento_busqueda_unico')],
+            },
+        ),
+        migrations.RunPython(_ejecutar({'sqlite': SQLITE, 'mysql': MYSQL}),
+                             _ejecutar({'sqlite': SQLITE_QUITAR, 'mysql': MYSQL_QUITAR})),
+    ]
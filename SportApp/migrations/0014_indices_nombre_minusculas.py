@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:37
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SportApp', '0013_busqueda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipo',
+            index=models.Index(django.db.models.functions.text.Lower('nombre'), name='equipo_nombre_minusculas'),
+        ),
+        migrations.AddIndex(
+            model_name='jugador',
+            index=models.Index(django.db.models.functions.text.Lower('nombre'), name='jugador_nombre_minusculas'),
+        ),
+        migrations.AddIndex(
+            model_name='torneo',
+            index=models.Index(django.db.models.functions.text.Lower('nombre'), name='torneo_nombre_minusculas'),
+        ),
+    ]
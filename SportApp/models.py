@@ -1,12 +1,24 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.core.exceptions import ValidationError # Para clean()
 from django.core.validators import MinValueValidator, MaxValueValidator # Para validadores
+from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth.models import User
 # Create your models here.
 
 
-class Deporte(models.Model):
+class MarcasTiempo(models.Model):
+    # Cuando se creo y se cambio por ultima vez cada fila; de `actualizado` salen los ETag de SportApp.cache_http.
+    # Los UPDATE y las inserciones masivas que no pasan por save() tienen que poner actualizado=Now() a mano
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class Deporte(MarcasTiempo):
     
     class TipoDeporte(models.TextChoices):
         EQUIPO = 'EQUIPO', 'Por Equipo'
@@ -44,7 +56,34 @@ class Deporte(models.Model):
 
 
 
-class Equipo(models.Model):
+# Consultas que reutilizan las vistas: cada una trae de golpe lo que pinta su plantilla
+class EquipoQuerySet(models.QuerySet):
+    def con_deporte(self):
+        return self.select_related('deporte')#Equipo.__str__ muestra el deporte
+
+    def con_plantilla(self):
+        # ver_equipo: el equipo y sus jugadores por dorsal, en dos consultas
+        return self.select_related('deporte').prefetch_related(
+            models.Prefetch('jugadores', queryset=Jugador.objects.order_by('dorsal', 'id')))
+
+    def para_listado(self):
+        return self.select_related('deporte').annotate(num_jugadores=models.Count('jugadores'))
+
+
+class JugadorQuerySet(models.QuerySet):
+    def con_equipo(self):
+        return self.select_related('equipo__deporte')#Jugador.__str__ y el equipo que se pinta al lado
+
+
+class TorneoQuerySet(models.QuerySet):
+    def para_listado(self):
+        return self.select_related('deporte')
+
+
+CAMPOS_ELO = ('elo', 'elo_partidos')
+
+
+class Equipo(MarcasTiempo):
 
     usuario=models.ForeignKey(User,on_delete=models.CASCADE,related_name='equipos')
 
@@ -55,13 +94,35 @@ class Equipo(models.Model):
     
     # Pillow
     escudo = models.ImageField(upload_to='escudos/', null=True, blank=True)
+    escudo_derivados = models.JSONField(default=dict, blank=True, editable=False)#versiones reducidas (SportApp.imagenes)
     
     deporte = models.ForeignKey(Deporte, on_delete=models.CASCADE, related_name='equipos')
 
+    # Elo frente a los equipos de su deporte (SportApp.elo)
+    elo = models.FloatField(default=1500, editable=False)
+    elo_partidos = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = EquipoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['nombre'], name='equipo_nombre'),#listados por nombre
+            models.Index(Lower('nombre'), name='equipo_nombre_minusculas'),#busqueda por prefijo del autocompletado
+            models.Index(fields=['deporte', '-elo'], name='equipo_deporte_elo'),#ranking de cada deporte
+        ]
+
+    def save(self, *args, **kwargs):
+        # El Elo solo lo mueve SportApp.elo con UPDATE: un equipo leido antes de un partido (un formulario
+        # abierto, el admin) no tiene que devolverlo a su valor viejo al guardarse
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [campo.name for campo in self._meta.concrete_fields
+                                       if not campo.primary_key and campo.name not in CAMPOS_ELO]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.nombre} ({self.deporte.nombre})"
 
-class Jugador(models.Model):
+class Jugador(MarcasTiempo):
     
     nombre = models.CharField(max_length=100)
     dorsal = models.PositiveIntegerField(
@@ -69,15 +130,25 @@ class Jugador(models.Model):
         help_text="Número entre 1 y 99",blank=True,null=True
     )
     foto = models.ImageField(upload_to='jugadores/', null=True, blank=True)
+    foto_derivados = models.JSONField(default=dict, blank=True, editable=False)
     
     
     equipo = models.ForeignKey(Equipo,on_delete=models.SET_NULL,null=True,blank=True,related_name='jugadores'
     )
 
+    objects = JugadorQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['equipo', 'dorsal'], name='jugador_equipo_dorsal'),#plantillas ordenadas por dorsal
+            models.Index(fields=['nombre'], name='jugador_nombre'),
+            models.Index(Lower('nombre'), name='jugador_nombre_minusculas'),
+        ]
+
     def __str__(self):
         return f"{self.nombre} (#{self.dorsal}) del {self.equipo.nombre  if self.equipo else 'Sin Equipo'} para la disciplina de {self.equipo.deporte.nombre if self.equipo else 'N/A'}"
 
-class Torneo(models.Model):
+class Torneo(MarcasTiempo):
     class EstadoTorneo(models.TextChoices):
         INSCRIPCION = 'INSCRIPCION', 'Inscripción Abierta'
         EN_CURSO = 'EN_CURSO', 'En Curso'
@@ -103,11 +174,19 @@ class Torneo(models.Model):
         related_name='torneos_inscritos'
     )
 
+    objects = TorneoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['nombre'], name='torneo_nombre'),
+            models.Index(Lower('nombre'), name='torneo_nombre_minusculas'),
+        ]
+
     def __str__(self):
         return f"{self.nombre} ({self.temporada})"
 
 
-class Inscripcion(models.Model):
+class Inscripcion(MarcasTiempo):
     torneo = models.ForeignKey(Torneo, on_delete=models.CASCADE)
     equipo = models.ForeignKey(Equipo, on_delete=models.CASCADE)
     
@@ -116,9 +195,20 @@ class Inscripcion(models.Model):
     ha_pagado = models.BooleanField(default=False, verbose_name="¿Pagado?")
     puntos_acumulados = models.IntegerField(default=0, verbose_name="Puntos Clasificación")
 
+    # Fila de clasificación, la mantiene SportApp.clasificacion a partir de los partidos jugados
+    partidos_jugados = models.PositiveIntegerField(default=0, verbose_name="PJ")
+    ganados = models.PositiveIntegerField(default=0, verbose_name="G")
+    empatados = models.PositiveIntegerField(default=0, verbose_name="E")
+    perdidos = models.PositiveIntegerField(default=0, verbose_name="P")
+    tantos_favor = models.PositiveIntegerField(default=0, verbose_name="A favor")
+    tantos_contra = models.PositiveIntegerField(default=0, verbose_name="En contra")
+
     class Meta:
         unique_together = ('torneo', 'equipo')#evitamos duplicados
         verbose_name_plural = "Inscripciones"
+        indexes = [
+            models.Index(fields=['torneo', '-puntos_acumulados'], name='inscripcion_clasificacion'),
+        ]
 
     #Sobrescritura de clean() para validar a mi gusro
     def clean(self):
@@ -137,7 +227,7 @@ class Inscripcion(models.Model):
     def __str__(self):
         return f"Inscripción de {self.equipo.nombre} en {self.torneo.nombre}"
 
-class  Partido(models.Model):
+class  Partido(MarcasTiempo):
     
     class EstadoPartido(models.TextChoices):
         PENDIENTE = 'PENDIENTE', 'Pendiente'
@@ -172,6 +262,13 @@ class  Partido(models.Model):
 
     marcador_local = models.PositiveIntegerField(default=0)
     marcador_visitante = models.PositiveIntegerField(default=0)
+    elo_cambio = models.FloatField(null=True, blank=True, editable=False)#Elo que gano el local (y perdio el visitante) con este resultado
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['torneo', 'fecha_hora'], name='partido_torneo_fecha'),#ventanas del calendario y partidos de un torneo
+            models.Index(fields=['estado', 'fecha_hora'], name='partido_estado_fecha'),
+        ]
 
     def clean(self):
         super().clean()
@@ -187,13 +284,14 @@ class  Partido(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
-        super().save(*args, **kwargs)
+        with transaction.atomic():#la clasificacion se actualiza en las señales, dentro de la misma transaccion
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.equipo_local} vs {self.equipo_visitante} ({self.get_estado_display()})"
 
 
-class EstadisticaPartido(models.Model):
+class EstadisticaPartido(MarcasTiempo):
     partido = models.ForeignKey(Partido, on_delete=models.CASCADE, related_name='estadisticas')
     jugador = models.ForeignKey(Jugador, on_delete=models.CASCADE)
     
@@ -210,6 +308,9 @@ class EstadisticaPartido(models.Model):
     class Meta:
         unique_together = ('partido', 'jugador')
         verbose_name = "Estadística de Jugador"
+        indexes = [
+            models.Index(fields=['jugador', 'juega'], name='estadistica_jugador_juega'),
+        ]
         verbose_name_plural = "Estadísticas de Partido"
 
     def clean(self):
@@ -221,7 +322,155 @@ class EstadisticaPartido(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
-        super().save(*args, **kwargs)
+        with transaction.atomic():#los acumulados se actualizan en las señales, dentro de la misma transaccion
+            super().save(*args, **kwargs)
         
     def __str__(self):
-        return f"Estadísticas de {self.jugador.nombre} en el partido {self.partido}"
\ No newline at end of file
+        return f"Estadísticas de {self.jugador.nombre} en el partido {self.partido}"
+
+class EstadisticaAcumulada(MarcasTiempo):
+    # Totales ya sumados de EstadisticaPartido para no agregar en cada visita (los mantiene SportApp.estadisticas)
+    class Ambito(models.TextChoices):
+        CARRERA = 'CARRERA', 'Carrera'
+        TEMPORADA = 'TEMPORADA', 'Temporada'
+        TORNEO = 'TORNEO', 'Torneo'
+
+    # jugador vacio = totales de todos los jugadores en ese ambito
+    jugador = models.ForeignKey(Jugador, on_delete=models.CASCADE, null=True, blank=True, related_name='estadisticas_acumuladas')
+    ambito = models.CharField(max_length=20, choices=Ambito.choices)
+    clave = models.CharField(max_length=50, blank=True, help_text="Temporada o id del torneo; vacío en la carrera")
+    torneo = models.ForeignKey(Torneo, on_delete=models.CASCADE, null=True, blank=True, related_name='estadisticas_acumuladas')
+
+    partidos_jugados = models.PositiveIntegerField(default=0)
+    puntos = models.PositiveIntegerField(default=0)
+    minutos_jugados = models.PositiveIntegerField(default=0)
+    forma = models.JSONField(default=list, blank=True, editable=False)#ultimos partidos jugados, solo en la carrera de un jugador
+
+    class Meta:
+        verbose_name = "Estadística Acumulada"
+        verbose_name_plural = "Estadísticas Acumuladas"
+        constraints = [
+            models.UniqueConstraint(fields=['jugador', 'ambito', 'clave'], name='estadistica_acumulada_unica'),
+            models.UniqueConstraint(fields=['ambito', 'clave'], condition=models.Q(jugador__isnull=True),
+                                    name='estadistica_acumulada_total_unica'),
+        ]
+        indexes = [#los rankings son lecturas por indice: ambito+clave y ordenado por el total
+            models.Index(fields=['ambito', 'clave', '-puntos'], name='acumulada_top_puntos'),
+            models.Index(fields=['ambito', 'clave', '-minutos_jugados'], name='acumulada_top_minutos'),
+            models.Index(fields=['ambito', 'clave', '-partidos_jugados'], name='acumulada_top_partidos'),
+        ]
+
+    @property
+    def puntos_por_partido(self):
+        return self.puntos / self.partidos_jugados if self.partidos_jugados else 0
+
+    @property
+    def minutos_por_partido(self):
+        return self.minutos_jugados / self.partidos_jugados if self.partidos_jugados else 0
+
+    @property
+    def puntos_por_minuto(self):
+        return self.puntos / self.minutos_jugados if self.minutos_jugados else 0
+
+    def __str__(self):
+        quien = self.jugador.nombre if self.jugador_id else 'Todos'
+        return f"{quien} - {self.get_ambito_display()} {self.clave}".strip()
+
+
+class Enfrentamiento(MarcasTiempo):
+    # Cara a cara de dos equipos en sus partidos jugados (lo mantiene SportApp.enfrentamientos).
+    # El par no tiene orden: equipo_a es siempre el de id menor, asi cada pareja tiene una sola fila
+    equipo_a = models.ForeignKey(Equipo, on_delete=models.CASCADE, related_name='enfrentamientos_como_a')
+    equipo_b = models.ForeignKey(Equipo, on_delete=models.CASCADE, related_name='enfrentamientos_como_b')
+
+    partidos = models.PositiveIntegerField(default=0)
+    victorias_a = models.PositiveIntegerField(default=0)
+    victorias_b = models.PositiveIntegerField(default=0)
+    empates = models.PositiveIntegerField(default=0)
+    tantos_a = models.PositiveIntegerField(default=0)
+    tantos_b = models.PositiveIntegerField(default=0)
+    ultimos = models.JSONField(default=list, blank=True, editable=False)#ultimos partidos, del mas reciente al mas antiguo
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['equipo_a', 'equipo_b'], name='enfrentamiento_unico'),#la busqueda de una pareja
+            models.CheckConstraint(condition=models.Q(equipo_a__lt=models.F('equipo_b')), name='enfrentamiento_orden'),
+        ]
+
+    def para(self, equipo_id):
+        """El cara a cara visto desde uno de los dos equipos."""
+        es_a = equipo_id == self.equipo_a_id
+        return {
+            'partidos': self.partidos,
+            'ganados': self.victorias_a if es_a else self.victorias_b,
+            'empatados': self.empates,
+            'perdidos': self.victorias_b if es_a else self.victorias_a,
+            'tantos_favor': self.tantos_a if es_a else self.tantos_b,
+            'tantos_contra': self.tantos_b if es_a else self.tantos_a,
+        }
+
+    def __str__(self):
+        return f"{self.equipo_a.nombre} - {self.equipo_b.nombre} ({self.partidos} partidos)"
+
+
+class DocumentoBusqueda(MarcasTiempo):
+    # Lo que encuentra el buscador global de un equipo, jugador, torneo o partido (lo mantiene SportApp.busqueda).
+    # El indice de texto completo (FTS5 en SQLite, FULLTEXT en MySQL) es sobre `texto` y se crea en la migracion
+    class Tipo(models.TextChoices):
+        EQUIPO = 'equipo', 'Equipo'
+        JUGADOR = 'jugador', 'Jugador'
+        TORNEO = 'torneo', 'Torneo'
+        PARTIDO = 'partido', 'Partido'
+
+    tipo = models.CharField(max_length=20, choices=Tipo.choices)
+    objeto_id = models.PositiveIntegerField()
+    titulo = models.CharField(max_length=255)
+    detalle = models.CharField(max_length=255, blank=True)
+    texto = models.TextField(help_text="Los campos en los que se busca, en minúsculas y sin tildes")
+    prioridad = models.PositiveSmallIntegerField(default=1)#los de mas prioridad salen antes; dentro, por relevancia
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'objeto_id'], name='documento_busqueda_unico'),
+        ]
+
+    URLS = {'equipo': 'ver_equipo', 'jugador': 'jugador_detalle', 'torneo': 'torneo_detalle', 'partido': 'detalle_evento'}
+
+    def get_absolute_url(self):
+        return reverse(self.URLS[self.tipo], args=[self.objeto_id])
+
+    def __str__(self):
+        return f"{self.get_tipo_display()}: {self.titulo}"
+
+
+class Tarea(models.Model):
+    # Trabajo pesado que se hace fuera de la peticion: la cola es esta tabla y la vacia `manage.py trabajador` (SportApp.tareas)
+    class EstadoTarea(models.TextChoices):
+        PENDIENTE = 'PENDIENTE', 'Pendiente'
+        EN_CURSO = 'EN_CURSO', 'En curso'
+        HECHA = 'HECHA', 'Hecha'
+        FALLIDA = 'FALLIDA', 'Fallida'
+
+    nombre = models.CharField(max_length=50, help_text="Una de las de SportApp.tareas.TAREAS")
+    argumentos = models.JSONField(default=dict, blank=True)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='tareas')
+    estado = models.CharField(max_length=20, choices=EstadoTarea.choices, default=EstadoTarea.PENDIENTE)
+
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=3)
+    ejecutar_desde = models.DateTimeField(default=timezone.now)#los reintentos esperan cada vez mas
+    trabajador = models.CharField(max_length=100, blank=True)
+
+    creada = models.DateTimeField(auto_now_add=True)
+    iniciada = models.DateTimeField(null=True, blank=True)
+    terminada = models.DateTimeField(null=True, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'ejecutar_desde'], name='tarea_cola'),#la siguiente pendiente que ya toca
+        ]
+
+    def __str__(self):
+        return f"{self.nombre} #{self.pk} ({self.get_estado_display()})"
@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CursorPaginacion(CursorPagination):
+    # Cursor sobre el id: no hace COUNT(*) y cada pagina es una lectura por indice aunque la tabla sea enorme
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = 'id'
+
+
+class CursorPaginacionRecientes(CursorPaginacion):
+    ordering = '-id'
@@ -1,4 +1,6 @@
-from rest_framework import permissions, request, request
+from rest_framework import permissions
+
+from .marcador import puede_anotar
 
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
@@ -10,14 +12,24 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        # Solo permito escribir si soy el dueño del objeto
-        if hasattr(obj, 'usuario'):
-            return obj.usuario == request.user
-            
-        
-        if hasattr(obj, 'equipo') and hasattr(obj.equipo, 'usuario'):
-            return obj.equipo.usuario == request.user
-        
-        
+        # Solo permito escribir si soy el dueño del objeto.
+        # Comparamos ids (usuario_id) para no cargar el usuario ni el equipo en cada comprobacion
+        if hasattr(obj, 'usuario_id'):
+            return obj.usuario_id == request.user.id
+
+        # El equipo ya viene en el select_related de las vistas, asi que equipo.usuario_id no consulta
+        if getattr(obj, 'equipo_id', None) is not None:
+            return obj.equipo.usuario_id == request.user.id
+
         return False
-    
\ No newline at end of file
+
+
+class IsOrganizerOrStaff(permissions.IsAuthenticated):
+    """
+    Partidos: los ve cualquier usuario identificado y solo los cambia su
+    organizador o el staff, como el marcador de la web (marcador.puede_anotar).
+    """
+    def has_object_permission(self, request, view, obj):
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        return puede_anotar(request.user, obj.usuario_id)
@@ -0,0 +1,146 @@
+"""
+Opciones de los desplegables de los formularios (deportes, torneos, equipos, jugadores, partidos).
+
+Un ModelChoiceField normal lee la tabla entera y llama a __str__ en cada fila,
+y el __str__ de Equipo, Jugador y Partido va a buscar el deporte y el equipo de
+cada una: miles de consultas para pintar un formulario. Aquí las etiquetas se
+montan a partir de un solo values_list con sus joins (las mismas que __str__) y,
+para las tablas que casi no cambian, se guardan en la caché con una versión por
+tabla que las señales cambian al guardar o borrar (como SportApp.calendario).
+Los partidos cambian a menudo, así que se leen siempre pero en una consulta.
+
+ReferenciaChoiceField es un ModelChoiceField que pinta así sus opciones; si la
+vista le pone un queryset filtrado u ordenado se respeta con una consulta de
+solo ids. Validar el valor enviado sigue siendo un .get() al queryset. Los
+selects con autocompletar solo pintan lo elegido: opciones_elegidas() lee esas
+filas y nada más.
+"""
+import time
+
+from django import forms
+from django.core.cache import cache
+from django.db import transaction
+from django.forms.models import ModelChoiceIteratorValue
+
+from .models import Deporte, Equipo, Jugador, Partido, Torneo
+
+
+SEGUNDOS_CACHE_REFERENCIAS = 24 * 60 * 60
+
+_TIPOS_DEPORTE = dict(Deporte.TipoDeporte.choices)
+_ESTADOS_PARTIDO = dict(Partido.EstadoPartido.choices)
+
+
+def _equipo(nombre, deporte):
+    return f"{nombre} ({deporte})"
+
+
+# tabla: (modelo, columnas, etiqueta(*columnas), se cachea)
+TABLAS = {
+    'deportes': (Deporte, ('nombre', 'tipo', 'jugadores_por_equipo'),
+                 lambda nombre, tipo, jugadores: f"{nombre} ({_TIPOS_DEPORTE.get(tipo, tipo)},{jugadores} jugadores)", True),
+    'torneos': (Torneo, ('nombre', 'temporada'),
+                lambda nombre, temporada: f"{nombre} ({temporada})", True),
+    'equipos': (Equipo, ('nombre', 'deporte__nombre'), _equipo, True),
+    'jugadores': (Jugador, ('nombre', 'dorsal', 'equipo__nombre', 'equipo__deporte__nombre'),
+                  lambda nombre, dorsal, equipo, deporte:
+                      f"{nombre} (#{dorsal}) del {equipo or 'Sin Equipo'} para la disciplina de {deporte or 'N/A'}", True),
+    'partidos': (Partido, ('equipo_local__nombre', 'equipo_local__deporte__nombre', 'equipo_visitante__nombre',
+                           'equipo_visitante__deporte__nombre', 'estado'),
+                 lambda local, deporte_local, visitante, deporte_visitante, estado:
+                     f"{_equipo(local, deporte_local)} vs {_equipo(visitante, deporte_visitante)} "
+                     f"({_ESTADOS_PARTIDO.get(estado, estado)})", False),
+}
+TABLA_DE_MODELO = {modelo: tabla for tabla, (modelo, *_) in TABLAS.items()}
+
+# Que otras etiquetas cambian cuando cambia una fila de esta tabla
+DEPENDIENTES = {
+    'deportes': ('deportes', 'equipos', 'jugadores'),
+    'equipos': ('equipos', 'jugadores'),
+    'torneos': ('torneos',),
+    'jugadores': ('jugadores',),
+}
+
+
+def _clave_version(tabla):
+    return f'referencias:version:{tabla}'
+
+
+def version(tabla):
+    clave = _clave_version(tabla)
+    valor = cache.get(clave)
+    if valor is None:
+        valor = time.time()
+        cache.add(clave, valor, None)
+    return valor
+
+
+def invalidar_referencias(*tablas):
+    """Cambia la versión de esas tablas (y de las que dependen de ellas) cuando se confirme la transacción."""
+    def invalidar():
+        ahora = time.time()
+        cache.set_many({_clave_version(t): ahora for tabla in tablas for t in DEPENDIENTES.get(tabla, (tabla,))}, None)
+    transaction.on_commit(invalidar)
+
+
+def _leer(tabla):
+    modelo, columnas, etiqueta, _ = TABLAS[tabla]
+    return [(pk, etiqueta(*valores)) for pk, *valores in modelo.objects.order_by('pk').values_list('pk', *columnas)]
+
+
+def opciones(tabla, refrescar=False):
+    """[(id, etiqueta)] de toda la tabla, por id."""
+    if not TABLAS[tabla][3]:
+        return _leer(tabla)
+    clave = f'referencias:{tabla}:{version(tabla)}'
+    valor = None if refrescar else cache.get(clave)
+    if valor is None:
+        valor = _leer(tabla)
+        cache.set(clave, valor, SEGUNDOS_CACHE_REFERENCIAS)
+    return valor
+
+
+def _etiquetas(queryset):
+    # La misma consulta con las columnas de la etiqueta
+    _, columnas, etiqueta, _ = TABLAS[TABLA_DE_MODELO[queryset.model]]
+    return [(pk, etiqueta(*valores)) for pk, *valores in queryset.values_list('pk', *columnas)]
+
+
+def opciones_de(queryset):
+    """Las opciones de las filas de `queryset`, en su orden."""
+    tabla = TABLA_DE_MODELO[queryset.model]
+    if not TABLAS[tabla][3]:
+        return _etiquetas(queryset)
+    todas = opciones(tabla)
+    query = queryset.query
+    if not query.where and not query.order_by and not query.is_sliced:
+        return todas
+    ids = list(queryset.values_list('pk', flat=True))
+    etiquetas = dict(todas)
+    if any(pk not in etiquetas for pk in ids):
+        etiquetas = dict(opciones(tabla, refrescar=True))#filas creadas sin pasar por las señales
+    return [(pk, etiquetas[pk]) for pk in ids if pk in etiquetas]
+
+
+def opciones_elegidas(queryset, ids):
+    """Las opciones de las filas `ids` de `queryset`, en una consulta y sin la caché de toda la tabla."""
+    return _etiquetas(queryset.filter(pk__in=ids)) if ids else []
+
+
+class IteradorReferencias(forms.models.ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for pk, etiqueta in opciones_de(self.queryset):
+            yield (ModelChoiceIteratorValue(pk, None), etiqueta)
+
+    def __len__(self):
+        return len(opciones_de(self.queryset)) + (1 if self.field.empty_label is not None else 0)
+
+
+class ReferenciaChoiceField(forms.ModelChoiceField):
+    iterator = IteradorReferencias
+
+
+class ReferenciaMultipleChoiceField(forms.ModelMultipleChoiceField):
+    iterator = IteradorReferencias
@@ -0,0 +1,144 @@
+"""
+Lecturas en réplicas de la base de datos.
+
+Con OLYMPO_DB_REPLICAS (ver settings) hay, además de `default`, una o varias
+bases de datos de solo lectura con los mismos datos (replica_1,
+replica_2...). RouterReplicas manda las escrituras siempre a la principal y
+las lecturas de las peticiones GET/HEAD a una réplica al azar, salvo que:
+
+- la petición ya haya escrito algo: desde ese momento lo que lea va a la
+  principal, para que vea lo que acaba de escribir;
+- se lea dentro de una transacción de la principal;
+- el navegador haya escrito hace poco: ReplicasMiddleware le deja tras cada
+  escritura una cookie que dura OLYMPO_REPLICA_PEGAJOSA segundos y, mientras
+  la tenga, lee de la principal. Así quien acaba de cambiar un marcador lo
+  ve cambiado aunque la réplica vaya con retraso.
+
+Fuera de las peticiones (órdenes de manage.py, el trabajador de tareas, el
+cuerpo de las respuestas en streaming) todo va a la principal: son procesos
+que recalculan a partir de lo que leen y no pueden trabajar con datos viejos.
+
+Con MySQL las réplicas son servidores con la replicación nativa. Para
+probarlo en local con SQLite la réplica es otro fichero que `manage.py
+sincronizar_replica` copia de la principal (con --cada N, cada N segundos,
+que hace de retraso de la replicación).
+"""
+import random
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+COOKIE = 'olympo_primaria'
+METODOS_LECTURA = ('GET', 'HEAD', 'OPTIONS')
+
+REPLICAS = [alias for alias in settings.DATABASES if alias.startswith('replica')]
+ALIAS = {DEFAULT_DB_ALIAS, *REPLICAS}
+
+# Lo que ReplicasMiddleware prepara en cada peticion: {'primaria': bool, 'escrito': bool}. Es un dict y no dos
+# ContextVar porque con ASGI la vista corre en otro hilo con una copia del contexto: lo que cambie alli se ve aqui
+_peticion = ContextVar('replicas_peticion', default=None)
+_solo_primaria = ContextVar('replicas_solo_primaria', default=False)
+
+
+@contextmanager
+def solo_primaria():
+    """Dentro, todas las lecturas van a la principal aunque sean de una petición de lectura."""
+    marca = _solo_primaria.set(True)
+    try:
+        yield
+    finally:
+        _solo_primaria.reset(marca)
+
+
+class RouterReplicas:
+    def db_for_read(self, model, **hints):
+        peticion = _peticion.get()
+        if (not REPLICAS or peticion is None or peticion['primaria'] or _solo_primaria.get()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        peticion = _peticion.get()
+        if peticion is not None:
+            peticion['primaria'] = peticion['escrito'] = True#lo que se lea despues tiene que ver esta escritura
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Todas tienen los mismos datos: un objeto leido de una replica puede apuntar a uno de la principal
+        return obj1._state.db in ALIAS and obj2._state.db in ALIAS
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS#las replicas reciben el esquema con los datos
+
+
+class ReplicasMiddleware:
+    """
+    Prepara cada petición para RouterReplicas: las que no son de lectura y las
+    de quien trae la cookie leen de la principal, y a la que escribe se le deja
+    la cookie. Sin réplicas Django lo quita de la cadena. Tiene que ir antes que
+    SessionMiddleware, que guarda la sesión al final.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.pegajosa = getattr(settings, 'OLYMPO_REPLICA_PEGAJOSA', 10)
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        peticion = self._peticion(request)
+        marca = _peticion.set(peticion)
+        try:
+            response = self.get_response(request)
+        finally:
+            _peticion.reset(marca)
+        return self._terminar(request, response, peticion)
+
+    async def __acall__(self, request):
+        peticion = self._peticion(request)
+        marca = _peticion.set(peticion)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _peticion.reset(marca)
+        return self._terminar(request, response, peticion)
+
+    def _peticion(self, request):
+        primaria = request.method not in METODOS_LECTURA or COOKIE in request.COOKIES
+        return {'primaria': primaria, 'escrito': False}
+
+    def _terminar(self, request, response, peticion):
+        # Tambien tras cualquier POST: insercion.insertar_filas escribe con el cursor, sin pasar por el router
+        if peticion['escrito'] or request.method not in METODOS_LECTURA:
+            response.set_cookie(COOKIE, '1', max_age=self.pegajosa, httponly=True, samesite='Lax',
+                                secure=request.is_secure())
+        return response
+
+
+def copiar_sqlite():
+    """Copia la base de datos principal (SQLite) sobre cada réplica con la API de copia en caliente de SQLite."""
+    origen = sqlite3.connect(settings.DATABASES[DEFAULT_DB_ALIAS]['NAME'])
+    try:
+        for alias in REPLICAS:
+            destino = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+            try:
+                origen.backup(destino)
+            finally:
+                destino.close()
+    finally:
+        origen.close()
+    return REPLICAS
@@ -1,11 +1,93 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from .models import Equipo,Jugador,Partido
+from .models import Deporte,DocumentoBusqueda,Enfrentamiento,Equipo,EstadisticaAcumulada,Jugador,Partido,Tarea,Torneo
 
 
-class EquipoSerializer(serializers.ModelSerializer):
+class CamposDinamicosMixin:
+    """
+    Permite pedir solo algunos campos (?fields=id,nombre) y expandir relaciones
+    (?expand=equipo,torneo) con el serializer anidado en lugar del id.
+    Las relaciones expandibles se declaran en Meta.expandibles y los alias
+    (un nombre que expande varias relaciones) en Meta.alias_expandir.
+    """
+
+    @classmethod
+    def expandir_pedido(cls, request):
+        # Nombres de relaciones a expandir segun la peticion; la vista los usa para el select_related
+        if request is None:
+            return set()
+        expandibles = getattr(cls.Meta, 'expandibles', {})
+        alias = getattr(cls.Meta, 'alias_expandir', {})
+        pedidos = set()
+        for nombre in request.query_params.get('expand', '').split(','):
+            nombre = nombre.strip()
+            pedidos.update(alias.get(nombre, (nombre,)))
+        return {nombre for nombre in pedidos if nombre in expandibles}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        # Los serializers anidados se crean sin contexto, asi que solo el de primer nivel mira la peticion
+        if request is None:
+            return
+
+        for nombre in self.expandir_pedido(request):
+            self.fields[nombre] = self.Meta.expandibles[nombre](read_only=True)
+
+        campos = request.query_params.get('fields')
+        if campos:
+            pedidos = {c.strip() for c in campos.split(',')}
+            for nombre in set(self.fields) - pedidos:
+                self.fields.pop(nombre)
+
+
+class DerivadosImagenField(serializers.Field):
+    """
+    URLs de las versiones reducidas de una imagen (SportApp.imagenes), por ancho:
+    {"tipo": "image/jpeg", "tamanos": [{"ancho": 40, "alto": 40, "webp": url, "respaldo": url}, ...]}.
+    None mientras no estén generadas para la imagen actual.
+    """
+
+    def __init__(self, campo, **kwargs):
+        self.campo = campo
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, objeto):
+        fichero = getattr(objeto, self.campo)
+        derivados = getattr(objeto, f'{self.campo}_derivados') or {}
+        if not fichero or derivados.get('origen') != fichero.name:
+            return None
+        request = self.context.get('request')
+        url = lambda nombre: request.build_absolute_uri(default_storage.url(nombre)) if request else default_storage.url(nombre)
+        return {
+            'tipo': derivados['tipo'],
+            'tamanos': [
+                {'ancho': t['ancho'], 'alto': t['alto'], 'webp': url(t['webp']), 'respaldo': url(t['respaldo'])}
+                for t in derivados['tamanos']
+            ],
+        }
+
+
+class DeporteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Deporte
+        fields = '__all__'
+
+
+class TorneoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Torneo
+        fields = ('id', 'nombre', 'temporada', 'deporte', 'estado')
+
+
+class EquipoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    escudo_derivados = DerivadosImagenField('escudo')
+
     class Meta:
         model = Equipo
         fields = '__all__'
+        expandibles = {'deporte': DeporteSerializer}
 
     def validate_nombre(self,value):
         if len(value) < 3:
@@ -13,12 +95,16 @@ class EquipoSerializer(serializers.ModelSerializer):
 
         if value=="admin" or value=="Admin" or value=="ADMIN":
             raise serializers.ValidationError("El nommbre del equipo nunca puede  ser admin")
+        return value
+
 
+class JugadorSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    foto_derivados = DerivadosImagenField('foto')
 
-class JugadorSerializer(serializers.ModelSerializer):
     class Meta:
         model=Jugador
         fields='__all__'
+        expandibles = {'equipo': EquipoSerializer}
 
     def validate_nombre(self,value):
         if len(value) < 2:
@@ -33,12 +119,90 @@ class JugadorSerializer(serializers.ModelSerializer):
         return data
 
 
-class PartidoSerializer(serializers.ModelSerializer):
+class PartidoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model=Partido
         fields='__all__'
+        expandibles = {'torneo': TorneoSerializer, 'equipo_local': EquipoSerializer, 'equipo_visitante': EquipoSerializer}
+        alias_expandir = {'equipo': ('equipo_local', 'equipo_visitante')}
 
     def validate(self, data):
-        if data["equipo__local"]==data["equipo__visitante"]:
+        if data.get("equipo_local") is not None and data.get("equipo_local")==data.get("equipo_visitante"):
             raise serializers.ValidationError("No puede jugar un equipo contra si mismo")
-        return data
\ No newline at end of file
+        return data
+
+
+class EstadisticaAcumuladaSerializer(serializers.ModelSerializer):
+    # Una fila de totales de SportApp.estadisticas con las medias que salen de ella
+    torneo = TorneoSerializer(read_only=True)
+    puntos_por_partido = serializers.FloatField(read_only=True)
+    minutos_por_partido = serializers.FloatField(read_only=True)
+    puntos_por_minuto = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = EstadisticaAcumulada
+        fields = ('ambito', 'clave', 'torneo', 'partidos_jugados', 'puntos', 'minutos_jugados',
+                  'puntos_por_partido', 'minutos_por_partido', 'puntos_por_minuto')
+        read_only_fields = fields
+
+
+class FormaSerializer(serializers.Serializer):
+    partido = serializers.IntegerField()
+    fecha = serializers.DateTimeField()
+    rival = serializers.CharField()
+    en_casa = serializers.BooleanField()
+    puntos = serializers.IntegerField()
+    minutos = serializers.IntegerField(allow_null=True)
+
+
+class PerfilJugadorSerializer(serializers.Serializer):
+    # Lo que devuelve SportApp.estadisticas.perfil_jugador
+    carrera = EstadisticaAcumuladaSerializer(allow_null=True)
+    temporadas = EstadisticaAcumuladaSerializer(many=True)
+    torneos = EstadisticaAcumuladaSerializer(many=True)
+    forma = FormaSerializer(many=True)
+
+
+class EnfrentamientoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    # Cara a cara de dos equipos (SportApp.enfrentamientos); equipo_a es el de id menor
+    class Meta:
+        model = Enfrentamiento
+        fields = ('id', 'equipo_a', 'equipo_b', 'partidos', 'victorias_a', 'victorias_b', 'empates',
+                  'tantos_a', 'tantos_b', 'ultimos', 'actualizado')
+        read_only_fields = fields
+        expandibles = {'equipo_a': EquipoSerializer, 'equipo_b': EquipoSerializer}
+        alias_expandir = {'equipo': ('equipo_a', 'equipo_b')}
+
+
+class DocumentoBusquedaSerializer(serializers.ModelSerializer):
+    # Un resultado del buscador global (SportApp.busqueda): objeto_id es el id del equipo, jugador, torneo o partido
+    url = serializers.CharField(source='get_absolute_url', read_only=True)
+
+    class Meta:
+        model = DocumentoBusqueda
+        fields = ('tipo', 'objeto_id', 'titulo', 'detalle', 'url')
+        read_only_fields = fields
+
+
+class LineaActaSerializer(serializers.Serializer):
+    # Una linea del acta completa de un partido (ver SportApp.actas)
+    jugador = serializers.IntegerField()
+    juega = serializers.BooleanField(default=False)
+    puntos = serializers.IntegerField(min_value=0, default=0)
+    minutos_jugados = serializers.IntegerField(min_value=0, required=False, allow_null=True, default=None)
+    observaciones = serializers.CharField(required=False, allow_blank=True, allow_null=True, default=None)
+
+
+class TareaSerializer(serializers.ModelSerializer):
+    # Estado de una tarea de la cola (SportApp.tareas); solo lectura, se crean desde las vistas
+    class Meta:
+        model = Tarea
+        fields = ('id', 'nombre', 'argumentos', 'estado', 'intentos', 'max_intentos', 'creada', 'ejecutar_desde',
+                  'iniciada', 'terminada', 'resultado', 'error')
+        read_only_fields = fields
+
+
+class RecalcularSerializer(serializers.Serializer):
+    tipo = serializers.ChoiceField(choices=('clasificacion', 'estadisticas', 'enfrentamientos', 'elo'))
+    torneos = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                    help_text="Solo para la clasificación; por defecto todos")
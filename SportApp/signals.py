@@ -0,0 +1,150 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import busqueda
+from .clasificacion import CAMPOS_PARTIDO, actualizar_clasificacion, datos_partido
+from .calendario import invalidar_calendario
+from .directo import publicar_al_confirmar
+from .elo import actualizar_elo
+from .enfrentamientos import actualizar_enfrentamientos
+from .estadisticas import CAMPOS_LINEA, aplicar_deltas, datos_linea, torneo_de_partido
+from .imagenes import programar_derivados
+from .models import Deporte, Equipo, EstadisticaPartido, Jugador, Partido, Torneo
+from .referencias import TABLA_DE_MODELO, invalidar_referencias
+
+
+#========================= Partidos ==========================
+
+@receiver(pre_save, sender=Partido)
+def partido_guardar_estado_anterior(sender, instance, raw=False, **kwargs):
+    # Guardamos como estaba el partido en la BD para poder calcular el cambio despues de guardar
+    instance._anterior = instance._elo_anterior = None
+    if instance.pk and not raw:
+        fila = Partido.objects.filter(pk=instance.pk).values(*CAMPOS_PARTIDO, 'elo_cambio').first()
+        if fila is not None:
+            instance._elo_anterior = fila.pop('elo_cambio')#el de la BD: el de la instancia puede venir de un formulario viejo
+        instance._anterior = fila
+
+
+@receiver(post_save, sender=Partido)
+def partido_actualizar_clasificacion(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    anterior, actual = getattr(instance, '_anterior', None), datos_partido(instance)
+    actualizar_clasificacion(anterior, actual)
+    actualizar_enfrentamientos(anterior, actual)
+    instance.elo_cambio = actualizar_elo(instance.pk, anterior, actual, getattr(instance, '_elo_anterior', None))
+    if anterior is not None and anterior != actual:
+        publicar_al_confirmar(dict(actual, id=instance.pk))
+    _invalidar_calendario_de(instance, anterior)
+
+
+@receiver(post_delete, sender=Partido)
+def partido_quitar_de_clasificacion(sender, instance, **kwargs):
+    actualizar_clasificacion(datos_partido(instance), None)
+    actualizar_enfrentamientos(datos_partido(instance), None)
+    actualizar_elo(instance.pk, datos_partido(instance), None, instance.elo_cambio)
+    _invalidar_calendario_de(instance)
+
+
+def _invalidar_calendario_de(partido, anterior=None):
+    # Si el partido ha cambiado de torneo puede haber cambiado tambien de deporte
+    torneos = {partido.torneo_id, (anterior or {}).get('torneo_id', partido.torneo_id)}
+    invalidar_calendario(*Torneo.objects.filter(pk__in=torneos).values_list('deporte_id', flat=True))
+
+
+#========================= Datos que se ven en el calendario ==========================
+
+@receiver(post_save, sender=Deporte)
+@receiver(post_delete, sender=Deporte)
+def deporte_invalidar_calendario(sender, instance, **kwargs):
+    invalidar_calendario(instance.pk)
+
+
+@receiver(post_save, sender=Torneo)
+@receiver(post_save, sender=Equipo)
+def invalidar_calendario_del_deporte(sender, instance, **kwargs):
+    invalidar_calendario(instance.deporte_id)
+
+
+#========================= Opciones de los formularios ==========================
+
+@receiver(post_save, sender=Deporte)
+@receiver(post_delete, sender=Deporte)
+@receiver(post_save, sender=Torneo)
+@receiver(post_delete, sender=Torneo)
+@receiver(post_save, sender=Equipo)
+@receiver(post_delete, sender=Equipo)
+@receiver(post_save, sender=Jugador)
+@receiver(post_delete, sender=Jugador)
+def invalidar_opciones(sender, instance, **kwargs):
+    invalidar_referencias(TABLA_DE_MODELO[sender])
+
+
+#========================= Estadisticas de partido ==========================
+
+@receiver(pre_save, sender=EstadisticaPartido)
+def estadistica_guardar_estado_anterior(sender, instance, raw=False, **kwargs):
+    instance._anterior = None
+    if instance.pk and not raw:
+        instance._anterior = EstadisticaPartido.objects.filter(pk=instance.pk).values(*CAMPOS_LINEA).first()
+
+
+@receiver(post_save, sender=EstadisticaPartido)
+def estadistica_actualizar_acumulados(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    actual = datos_linea(instance, *torneo_de_partido(instance.partido_id))
+    aplicar_deltas([(getattr(instance, '_anterior', None), actual)])
+
+
+@receiver(post_delete, sender=EstadisticaPartido)
+def estadistica_quitar_de_acumulados(sender, instance, **kwargs):
+    aplicar_deltas([(datos_linea(instance, *torneo_de_partido(instance.partido_id)), None)])
+
+
+#========================= Escudos y fotos ==========================
+
+@receiver(post_save, sender=Equipo)
+def equipo_derivados_escudo(sender, instance, **kwargs):
+    programar_derivados(instance, 'escudo')
+
+
+@receiver(post_save, sender=Jugador)
+def jugador_derivados_foto(sender, instance, **kwargs):
+    programar_derivados(instance, 'foto')
+
+
+#========================= Buscador ==========================
+
+@receiver(post_save, sender=Equipo)
+@receiver(post_save, sender=Jugador)
+@receiver(post_save, sender=Torneo)
+@receiver(post_save, sender=Partido)
+def indexar_para_busqueda(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        busqueda.actualizar(instance, created)
+
+
+@receiver(post_save, sender=Deporte)
+def deporte_reindexar_busqueda(sender, instance, created=False, raw=False, **kwargs):
+    # El nombre del deporte sale en el detalle de sus equipos y torneos
+    if not created and not raw:
+        busqueda.indexar(Equipo.objects.filter(deporte=instance))
+        busqueda.indexar(Torneo.objects.filter(deporte=instance))
+
+
+@receiver(pre_delete, sender=Equipo)
+def equipo_recordar_jugadores(sender, instance, **kwargs):
+    # Sus jugadores se quedan sin equipo con un UPDATE sin señales: luego hay que rehacer sus documentos
+    instance._jugadores_busqueda = list(instance.jugadores.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Equipo)
+@receiver(post_delete, sender=Jugador)
+@receiver(post_delete, sender=Torneo)
+@receiver(post_delete, sender=Partido)
+def desindexar_para_busqueda(sender, instance, **kwargs):
+    busqueda.desindexar(sender, [instance.pk])
+    if getattr(instance, '_jugadores_busqueda', None):
+        busqueda.indexar(Jugador.objects.filter(pk__in=instance._jugadores_busqueda))
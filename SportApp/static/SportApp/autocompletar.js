@@ -0,0 +1,186 @@
+// Selects con data-autocompletar (SportApp.autocompletar.AutocompletarSelect): el HTML solo trae la
+// opcion elegida y las demas se piden al servidor segun se escribe, asi la pagina pesa lo mismo
+// haya diez equipos o diez mil. data-dependencias lleva los campos del formulario que filtran la busqueda.
+(function () {
+    var ESPERA = 200;
+
+    function iniciar(select) {
+        var multiple = select.multiple;
+        var dependencias = JSON.parse(select.dataset.dependencias || '{}');
+        var caja = document.createElement('div');
+        var entrada = document.createElement('input');
+        var menu = document.createElement('div');
+        var fichas = document.createElement('div');
+        var temporizador = null;
+        var peticion = null;
+        var activo = -1;
+
+        caja.className = 'position-relative';
+        entrada.type = 'search';
+        entrada.className = 'form-control';
+        entrada.autocomplete = 'off';
+        entrada.placeholder = 'Escribe para buscar...';
+        if (select.id) { entrada.id = select.id + '_buscar'; }
+        menu.className = 'dropdown-menu w-100 overflow-auto';
+        menu.style.maxHeight = '20rem';
+        fichas.className = 'd-flex flex-wrap gap-1 mb-1';
+
+        // El select oculto no puede ser required: el navegador no podria enseñar el aviso
+        entrada.required = select.required && !multiple;
+        select.required = false;
+        select.classList.add('d-none');
+        select.parentNode.insertBefore(caja, select);
+        if (multiple) { caja.appendChild(fichas); }
+        caja.appendChild(entrada);
+        caja.appendChild(menu);
+        caja.appendChild(select);
+
+        function elegida() {
+            var opcion = select.options[select.selectedIndex];
+            return opcion && opcion.value ? opcion : null;
+        }
+
+        function pintarFichas() {
+            fichas.innerHTML = '';
+            Array.prototype.forEach.call(select.selectedOptions, function (opcion) {
+                var ficha = document.createElement('span');
+                var quitar = document.createElement('button');
+                ficha.className = 'badge text-bg-secondary d-inline-flex align-items-center gap-1';
+                ficha.textContent = opcion.text;
+                quitar.type = 'button';
+                quitar.className = 'btn-close btn-close-white btn-sm';
+                quitar.setAttribute('aria-label', 'Quitar');
+                quitar.addEventListener('click', function () {
+                    opcion.selected = false;
+                    pintarFichas();
+                    select.dispatchEvent(new Event('change', {bubbles: true}));
+                });
+                ficha.appendChild(quitar);
+                fichas.appendChild(ficha);
+            });
+        }
+
+        function cerrar() {
+            menu.classList.remove('show');
+            activo = -1;
+        }
+
+        function elegir(id, texto) {
+            var opcion = Array.prototype.find.call(select.options, function (o) { return o.value === String(id); });
+            if (!opcion) {
+                opcion = new Option(texto, id);
+                select.add(opcion);
+            }
+            opcion.selected = true;
+            if (multiple) {
+                entrada.value = '';
+                pintarFichas();
+            } else {
+                entrada.value = texto;
+            }
+            cerrar();
+            select.dispatchEvent(new Event('change', {bubbles: true}));
+        }
+
+        function pintarResultados(datos) {
+            menu.innerHTML = '';
+            activo = -1;
+            datos.resultados.forEach(function (r) {
+                var boton = document.createElement('button');
+                boton.type = 'button';
+                boton.className = 'dropdown-item text-wrap';
+                boton.textContent = r.texto;
+                boton.addEventListener('click', function () { elegir(r.id, r.texto); });
+                menu.appendChild(boton);
+            });
+            if (!datos.resultados.length || datos.mas) {
+                var aviso = document.createElement('span');
+                aviso.className = 'dropdown-item-text text-muted small';
+                aviso.textContent = datos.resultados.length ? 'Hay más: sigue escribiendo para afinar.' : 'Sin resultados.';
+                menu.appendChild(aviso);
+            }
+            menu.classList.add('show');
+        }
+
+        function buscar() {
+            var parametros = new URLSearchParams({q: entrada.value.trim()});
+            Object.keys(dependencias).forEach(function (parametro) {
+                var campo = select.form && select.form.elements[dependencias[parametro]];
+                if (campo && campo.value) { parametros.set(parametro, campo.value); }
+            });
+            if (peticion) { peticion.abort(); }
+            peticion = new AbortController();
+            fetch(select.dataset.autocompletar + '?' + parametros, {
+                headers: {'Accept': 'application/json'},
+                signal: peticion.signal,
+            })
+                .then(function (r) { return r.ok ? r.json() : Promise.reject(r); })
+                .then(pintarResultados)
+                .catch(function () {});
+        }
+
+        function programar() {
+            clearTimeout(temporizador);
+            temporizador = setTimeout(buscar, ESPERA);
+        }
+
+        function marcar(paso) {
+            var botones = menu.querySelectorAll('button');
+            if (!botones.length) { return; }
+            activo = (activo + paso + botones.length) % botones.length;
+            botones.forEach(function (b, i) { b.classList.toggle('active', i === activo); });
+            botones[activo].scrollIntoView({block: 'nearest'});
+        }
+
+        entrada.addEventListener('input', function () {
+            if (!multiple && !entrada.value && elegida()) {
+                select.value = '';
+                select.dispatchEvent(new Event('change', {bubbles: true}));
+            }
+            programar();
+        });
+        entrada.addEventListener('focus', programar);
+        entrada.addEventListener('blur', function () {
+            clearTimeout(temporizador);
+            cerrar();
+            // Si se escribio sin elegir, volvemos a enseñar lo que de verdad se va a enviar
+            if (!multiple) { entrada.value = elegida() ? elegida().text : ''; }
+        });
+        entrada.addEventListener('keydown', function (e) {
+            if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+                e.preventDefault();
+                marcar(e.key === 'ArrowDown' ? 1 : -1);
+            } else if (e.key === 'Enter' && menu.classList.contains('show')) {
+                e.preventDefault();
+                var botones = menu.querySelectorAll('button');
+                if (botones.length) { botones[Math.max(activo, 0)].click(); }
+            } else if (e.key === 'Escape') {
+                cerrar();
+            }
+        });
+        // mousedown antes que el blur de la entrada, para que el click llegue al resultado
+        menu.addEventListener('mousedown', function (e) { e.preventDefault(); });
+
+        // Si cambia un campo del que dependemos, lo elegido puede dejar de valer
+        Object.keys(dependencias).forEach(function (parametro) {
+            var campo = select.form && select.form.elements[dependencias[parametro]];
+            if (!campo) { return; }
+            campo.addEventListener('change', function () {
+                if (multiple || !elegida()) { return; }
+                select.value = '';
+                entrada.value = '';
+                select.dispatchEvent(new Event('change', {bubbles: true}));
+            });
+        });
+
+        if (multiple) {
+            pintarFichas();
+        } else if (elegida()) {
+            entrada.value = elegida().text;
+        }
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select[data-autocompletar]').forEach(iniciar);
+    });
+})();
@@ -0,0 +1,167 @@
+"""
+Cola de tareas en segundo plano sobre la propia base de datos.
+
+Las vistas y señales llaman a encolar(), que solo inserta una fila en Tarea
+(dentro de la transacción de la petición: si esta se deshace la tarea
+tampoco existe), y la petición vuelve enseguida. `manage.py trabajador`
+reclama las pendientes una a una con un UPDATE condicional, así varios
+trabajadores pueden vaciar la misma cola sin hacer la misma tarea dos veces,
+y las ejecuta. Si una tarea falla se reintenta más tarde, esperando cada vez
+el doble, hasta max_intentos; las que se quedan EN_CURSO porque su trabajador
+murió vuelven a la cola pasado TIEMPO_MAXIMO.
+
+Con OLYMPO_TAREAS_EN_LINEA se ejecutan en el propio proceso al confirmar la
+transacción, sin trabajador (desarrollo y pruebas).
+"""
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Tarea
+
+
+logger = logging.getLogger(__name__)
+
+ESPERA_REINTENTO = 30#segundos antes del primer reintento; luego el doble cada vez
+TIEMPO_MAXIMO = timedelta(minutes=30)#mas que esto EN_CURSO es que el trabajador ha muerto
+DIAS_CONSERVAR = 7#las hechas se borran pasado este tiempo
+
+
+# Las funciones de las tareas importan aqui dentro porque esos modulos encolan tareas
+def _derivados(modelo, pk, campo):
+    from .imagenes import actualizar_derivados
+    return actualizar_derivados(apps.get_model(modelo), pk, campo)
+
+
+def _recalcular_clasificacion(torneos=None):
+    from .clasificacion import recalcular_clasificacion
+    with transaction.atomic():
+        return {'corregidas': len(recalcular_clasificacion(torneos))}
+
+
+def _recalcular_estadisticas():
+    from .estadisticas import recalcular_estadisticas
+    return {'filas': recalcular_estadisticas()}
+
+
+def _recalcular_enfrentamientos():
+    from .enfrentamientos import recalcular_enfrentamientos
+    return {'filas': recalcular_enfrentamientos()}
+
+
+def _recalcular_elo(deportes=None):
+    from .elo import recalcular_elo
+    with transaction.atomic():
+        return {deporte.nombre: equipos for deporte, equipos in recalcular_elo(deportes).items()}
+
+
+# nombre: (funcion(**argumentos) -> resultado que quepa en JSON, intentos)
+TAREAS = {
+    'derivados': (_derivados, 3),
+    'recalcular_clasificacion': (_recalcular_clasificacion, 2),
+    'recalcular_estadisticas': (_recalcular_estadisticas, 2),
+    'recalcular_enfrentamientos': (_recalcular_enfrentamientos, 2),
+    'recalcular_elo': (_recalcular_elo, 2),
+}
+
+
+def encolar(nombre, usuario=None, **argumentos):
+    """Deja la tarea `nombre` pendiente y la devuelve."""
+    if nombre not in TAREAS:
+        raise ValueError(f"No existe la tarea '{nombre}'")
+    tarea = Tarea.objects.create(nombre=nombre, argumentos=argumentos, usuario=usuario,
+                                 max_intentos=TAREAS[nombre][1])
+    if getattr(settings, 'OLYMPO_TAREAS_EN_LINEA', False):
+        transaction.on_commit(lambda: ejecutar_ahora(tarea.pk))
+    return tarea
+
+
+def nombre_trabajador():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _reclamar(pks, trabajador, ahora):
+    for pk in pks:
+        # Solo uno de los trabajadores que lo intenten a la vez ve la fila todavia PENDIENTE
+        if Tarea.objects.filter(pk=pk, estado=Tarea.EstadoTarea.PENDIENTE).update(
+                estado=Tarea.EstadoTarea.EN_CURSO, trabajador=trabajador, iniciada=ahora, intentos=F('intentos') + 1):
+            return Tarea.objects.get(pk=pk)
+    return None
+
+
+def reclamar(trabajador):
+    """La siguiente tarea pendiente que ya toca, marcada EN_CURSO para `trabajador`, o None."""
+    ahora = timezone.now()
+    pks = (Tarea.objects.filter(estado=Tarea.EstadoTarea.PENDIENTE, ejecutar_desde__lte=ahora)
+           .order_by('ejecutar_desde', 'pk').values_list('pk', flat=True)[:10])
+    return _reclamar(list(pks), trabajador, ahora)
+
+
+def ejecutar(tarea):
+    """Ejecuta una tarea ya reclamada y guarda cómo ha ido. Devuelve el estado final."""
+    try:
+        funcion = TAREAS[tarea.nombre][0]
+        resultado = funcion(**tarea.argumentos)
+    except Exception:
+        logger.exception("La tarea %s ha fallado (intento %s de %s)", tarea, tarea.intentos, tarea.max_intentos)
+        cambios = {'error': traceback.format_exc(), 'trabajador': ''}
+        if tarea.nombre in TAREAS and tarea.intentos < tarea.max_intentos:
+            cambios.update(estado=Tarea.EstadoTarea.PENDIENTE,
+                           ejecutar_desde=timezone.now() + timedelta(seconds=ESPERA_REINTENTO * 2 ** (tarea.intentos - 1)))
+        else:
+            cambios.update(estado=Tarea.EstadoTarea.FALLIDA, terminada=timezone.now())
+    else:
+        cambios = {'estado': Tarea.EstadoTarea.HECHA, 'resultado': resultado, 'error': '', 'terminada': timezone.now()}
+    Tarea.objects.filter(pk=tarea.pk).update(**cambios)
+    return cambios['estado']
+
+
+def ejecutar_ahora(pk):
+    tarea = _reclamar([pk], nombre_trabajador(), timezone.now())
+    return ejecutar(tarea) if tarea is not None else None
+
+
+def rescatar_colgadas():
+    """Devuelve a la cola (o da por fallidas) las tareas cuyo trabajador dejó de responder."""
+    colgadas = Tarea.objects.filter(estado=Tarea.EstadoTarea.EN_CURSO, iniciada__lt=timezone.now() - TIEMPO_MAXIMO)
+    error = "El trabajador dejó de responder."
+    return (colgadas.filter(intentos__lt=F('max_intentos')).update(estado=Tarea.EstadoTarea.PENDIENTE, trabajador='', error=error)
+            + colgadas.update(estado=Tarea.EstadoTarea.FALLIDA, terminada=timezone.now(), error=error))
+
+
+def limpiar():
+    return Tarea.objects.filter(estado=Tarea.EstadoTarea.HECHA,
+                                terminada__lt=timezone.now() - timedelta(days=DIAS_CONSERVAR)).delete()[0]
+
+
+def trabajar(trabajador, espera=1.0, una_vez=False, parar=lambda: False):
+    """
+    Bucle del trabajador: reclama y ejecuta hasta que `parar()` sea cierto. Con
+    una_vez termina en cuanto no queda nada pendiente. Devuelve las ejecutadas.
+    """
+    ejecutadas = 0
+    siguiente_limpieza = 0
+    while not parar():
+        close_old_connections()
+        if time.monotonic() >= siguiente_limpieza:
+            rescatar_colgadas()
+            limpiar()
+            siguiente_limpieza = time.monotonic() + 60
+        tarea = reclamar(trabajador)
+        if tarea is None:
+            if una_vez:
+                break
+            time.sleep(espera)
+            continue
+        ejecutar(tarea)
+        ejecutadas += 1
+    return ejecutadas
@@ -0,0 +1,55 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from SportApp.imagenes import derivados_para, srcset
+
+
+register = template.Library()
+
+
+def _derivados(objeto, campo):
+    # Solo valen si son de la imagen actual; mientras se generan se sirve el original
+    fichero = getattr(objeto, campo)
+    derivados = getattr(objeto, f'{campo}_derivados', None) or {}
+    if fichero and derivados.get('origen') == fichero.name and derivados.get('tamanos'):
+        return derivados
+    return None
+
+
+@register.simple_tag
+def imagen(objeto, campo, ancho, alt='', **atributos):
+    """
+    <picture> con los derivados WebP y de respaldo de objeto.<campo> para pintarla a `ancho` px.
+    Uso: {% imagen equipo 'escudo' 40 alt="Escudo" class="rounded-circle" %}
+    """
+    fichero = getattr(objeto, campo)
+    if not fichero:
+        return ''
+    extra = format_html_join('', ' {}="{}"', atributos.items())
+    derivados = _derivados(objeto, campo)
+    if derivados is None:
+        return format_html('<img src="{}" alt="{}" loading="lazy"{}>', fichero.url, alt, extra)
+
+    principal = derivados_para(derivados, ancho)
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}px">'
+        '<img src="{}" srcset="{}" sizes="{}px" width="{}" height="{}" alt="{}" loading="lazy" decoding="async"{}>'
+        '</picture>',
+        srcset(derivados, 'webp'), ancho,
+        default_storage.url(principal['respaldo']), srcset(derivados, 'respaldo'), ancho,
+        principal['ancho'], principal['alto'], alt, extra,
+    )
+
+
+@register.simple_tag
+def imagen_url(objeto, campo, ancho):
+    """URL del derivado de respaldo que cubre `ancho` px, o del original si aún no hay derivados."""
+    fichero = getattr(objeto, campo)
+    if not fichero:
+        return ''
+    derivados = _derivados(objeto, campo)
+    if derivados is None:
+        return fichero.url
+    return default_storage.url(derivados_para(derivados, ancho)['respaldo'])
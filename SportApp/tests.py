@@ -1,3 +1,1938 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import io
+import shutil
+import signal
+import tempfile
+import time
+from datetime import date, time as time_, timedelta
+from itertools import combinations
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import MiddlewareNotUsed, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, models, transaction
+from django.db.models import Sum
+from django.http import HttpResponse, JsonResponse
+from django.middleware.csrf import get_token
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import autocompletar, busqueda, metricas, tareas, urls
+from .actas import guardar_acta
+from .calendario import (CLAVE_VERSION_GLOBAL, DIAS_MAXIMOS, DIAS_POR_DEFECTO, SeccionCalendario, codificar_cursor,
+                         decodificar_cursor, ventana_desde_parametros, versiones_deportes)
+from .clasificacion import CAMPOS_CLASIFICACION, recalcular_clasificacion
+from .datos_sinteticos import sembrar
+from .directo import BrokerMemoria, publicar_al_confirmar
+from .elo import ELO_INICIAL, recalcular_elo
+from .enfrentamientos import (CAMPOS_TOTALES, ULTIMOS_PARTIDOS, enfrentamiento_de, recalcular_enfrentamientos,
+                              recalcular_parejas)
+from .estadisticas import CAMPOS_ACUMULADOS, Ambito, perfil_jugador, recalcular_estadisticas
+from .forms import JugadorForm, TorneoForm
+from .importacion import ErrorImportacion, importar
+from .marcador import ajustar_marcador
+from .insercion import insertar_filas
+from .management.commands.benchmark_vistas import EXCLUIDAS, _rutas, urls_a_medir
+from .jornadas import CAMPOS_INSERTADOS, generar_eliminatoria, generar_liga, generar_siguiente_ronda, rondas_liga
+from .middleware import (InstrumentacionMiddleware, PresupuestoConsultasExcedido, _brotli_seguro, brotli,
+                         calidad_codificacion)
+from .models import (Deporte, DocumentoBusqueda, Enfrentamiento, Equipo, EstadisticaAcumulada, EstadisticaPartido, Inscripcion,
+                     Jugador, Partido, Tarea, Torneo)
+from .referencias import DEPENDIENTES, TABLA_DE_MODELO, TABLAS, opciones, version
+from .replicas import COOKIE, ReplicasMiddleware, RouterReplicas, solo_primaria
+from .tareas import ejecutar_ahora
+from .views import JugadorListView
+
+
+def crear_liga(equipos=4, jugadores=3, nombre='Liga', usuario=None, deporte=None):
+    """
+    Un torneo de `equipos` equipos de `jugadores` jugadores cada uno, todos contra
+    todos: los partidos de la primera mitad jugados (con una línea de estadísticas
+    por jugador) y el resto pendientes. Pasa por save(), así que las señales
+    mantienen clasificación, acumulados, cara a cara, Elo y buscador.
+    """
+    usuario = usuario or User.objects.create_user(f'organizador-{nombre}', is_staff=True)
+    deporte = deporte or Deporte.objects.create(nombre=f'Fútbol {nombre}', sistema_puntuacion=Deporte.SistemaPuntuacion.GOLES,
+                                                jugadores_por_equipo=jugadores)
+    torneo = Torneo.objects.create(nombre=nombre, temporada='2025/2026', deporte=deporte)
+    lista = []
+    for e in range(equipos):
+        equipo = Equipo.objects.create(usuario=usuario, nombre=f'{nombre} Equipo {e + 1}', entrenador='Entrenador',
+                                       ciudad='Sevilla', deporte=deporte)
+        Inscripcion.objects.create(torneo=torneo, equipo=equipo)
+        for j in range(jugadores):
+            Jugador.objects.create(nombre=f'Jugador {e + 1}-{j + 1}', dorsal=j + 1, equipo=equipo)
+        lista.append(equipo)
+
+    inicio = timezone.now() - timedelta(days=30)
+    parejas = list(combinations(lista, 2))
+    partidos = []
+    for numero, (local, visitante) in enumerate(parejas):
+        jugado = numero < len(parejas) // 2
+        partido = Partido.objects.create(
+            usuario=usuario, torneo=torneo, fecha_hora=inicio + timedelta(days=numero), lugar=local.ciudad,
+            jornada=f'Jornada {numero + 1}', equipo_local=local, equipo_visitante=visitante,
+            estado=Partido.EstadoPartido.JUGADO if jugado else Partido.EstadoPartido.PENDIENTE,
+            marcador_local=numero % 3 if jugado else 0, marcador_visitante=1 if jugado else 0)
+        if jugado:
+            for jugador in Jugador.objects.filter(equipo__in=(local, visitante)):
+                EstadisticaPartido.objects.create(partido=partido, jugador=jugador, puntos=jugador.dorsal % 2,
+                                                  minutos_jugados=90, juega=True)
+        partidos.append(partido)
+    return {'usuario': usuario, 'deporte': deporte, 'torneo': torneo, 'equipos': lista, 'partidos': partidos}
+
+
+#====== Consultas por vista ======
+# Cuantas consultas hace cada vista con presupuesto (incluidas la sesion y el usuario) con varios equipos,
+# jugadores y partidos. Un N+1 las hace crecer con los datos y falla aqui antes de llegar al presupuesto
+
+@override_settings(OLYMPO_PRESUPUESTO_ESTRICTO=True)
+class ConsultasVistasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.liga = crear_liga(equipos=4, jugadores=3)
+        cls.partido = cls.liga['partidos'][0]
+        cls.local, cls.visitante = cls.partido.equipo_local, cls.partido.equipo_visitante
+        cls.jugador = cls.local.jugadores.first()
+
+    def setUp(self):
+        cache.clear()#politica_cache guarda paginas enteras
+        self.client.force_login(self.liga['usuario'])
+
+    def assertConsultas(self, numero, url):
+        with self.assertNumQueries(numero):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_detalle_evento(self):
+        self.assertConsultas(6, reverse('detalle_evento', args=[self.partido.pk]))
+
+    def test_enfrentamiento(self):
+        self.assertConsultas(4, reverse('enfrentamiento', args=[self.local.pk, self.visitante.pk]))
+
+    def test_jugador_lista(self):
+        response = self.assertConsultas(3, reverse('jugador_lista'))
+        self.assertContains(response, 'Jugador 4-3')
+
+    def test_jugador_detalle(self):
+        self.assertConsultas(5, reverse('jugador_detalle', args=[self.jugador.pk]))
+
+    def test_ver_equipo(self):
+        self.assertConsultas(5, reverse('ver_equipo', args=[self.local.pk]))
+
+    def test_equipo_lista(self):
+        response = self.assertConsultas(4, reverse('equipo_lista'))
+        self.assertContains(response, 'Liga Equipo 4')
+
+    def test_torneo_detalle(self):
+        self.assertConsultas(5, reverse('torneo_detalle', args=[self.liga['torneo'].pk]))
+
+    def test_torneo_lista(self):
+        Torneo.objects.create(nombre='Copa', temporada='2025/2026', deporte=self.liga['deporte'])
+        self.assertConsultas(4, reverse('torneo_lista'))
+
+    def test_autocompletar(self):
+        # Las dos pasadas: los que empiezan por el texto no llegan a LIMITE y se buscan los que lo contienen
+        response = self.assertConsultas(5, reverse('autocompletar', args=['jugadores']) + '?q=jug')
+        self.assertEqual(len(response.json()['resultados']), 12)
+
+    def test_autocompletar_jugadores_de_un_partido(self):
+        url = reverse('autocompletar', args=['jugadores']) + f'?q=-1&partido={self.partido.pk}'
+        response = self.assertConsultas(6, url)
+        self.assertEqual([r['texto'][:11] for r in response.json()['resultados']], ['Jugador 1-1', 'Jugador 2-1'])
+
+    def test_buscar(self):
+        response = self.assertConsultas(3, reverse('buscar') + '?q=equipo')
+        self.assertContains(response, 'Liga Equipo 3')
+
+    def test_estadisticas(self):
+        self.assertConsultas(7, reverse('estadisticas'))
+
+    def test_estadisticas_partido(self):
+        self.assertConsultas(4, reverse('estadisticas_partido', args=[self.partido.pk]))
+
+
+#====== Consultas de la API ======
+
+class ConsultasApiTests(TestCase):
+    # Los listados de la API con y sin ?expand= hacen las mismas consultas con 2 equipos que con 6
+    LISTADOS = [
+        ('equipo-list', ''),
+        ('equipo-list', 'deporte'),
+        ('jugador-list', ''),
+        ('jugador-list', 'equipo'),
+        ('partido-list', ''),
+        ('partido-list', 'torneo,equipo'),
+        ('enfrentamiento-list', ''),
+        ('enfrentamiento-list', 'equipo_a,equipo_b'),
+    ]
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('api', is_staff=True)
+        self.client.force_login(self.usuario)
+
+    def consultas(self, nombre, expandir):
+        cache.clear()#CacheApiMixin
+        url = reverse(nombre) + (f'?expand={expandir}' if expandir else '')
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(capturadas), response.json()['results']
+
+    def test_listados_no_crecen_con_los_datos(self):
+        crear_liga(equipos=3, jugadores=2, nombre='Pequeña', usuario=self.usuario)
+        antes = {listado: self.consultas(*listado)[0] for listado in self.LISTADOS}
+        crear_liga(equipos=6, jugadores=4, nombre='Grande', usuario=self.usuario)
+        for listado in self.LISTADOS:
+            with self.subTest(listado=listado):
+                numero, filas = self.consultas(*listado)
+                self.assertGreater(len(filas), 5)
+                self.assertEqual(numero, antes[listado])
+                self.assertLessEqual(numero, 3)#sesion, usuario y la pagina
+
+    def test_expand_incrusta_las_relaciones(self):
+        liga = crear_liga(equipos=3, jugadores=2, usuario=self.usuario)
+        _, equipos = self.consultas('equipo-list', 'deporte')
+        self.assertEqual(equipos[0]['deporte']['nombre'], liga['deporte'].nombre)
+        _, jugadores = self.consultas('jugador-list', 'equipo')
+        self.assertIn('nombre', jugadores[0]['equipo'])
+        _, partidos = self.consultas('partido-list', 'torneo,equipo')
+        self.assertEqual(partidos[0]['torneo']['nombre'], 'Liga')
+        self.assertIn('nombre', partidos[0]['equipo_local'])
+        self.assertIn('nombre', partidos[0]['equipo_visitante'])
+
+
+#====== Eliminatorias ======
+
+class EliminatoriaTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('organizador', is_staff=True)
+        deporte = Deporte.objects.create(nombre='Fútbol', sistema_puntuacion=Deporte.SistemaPuntuacion.GOLES)
+        self.torneo = Torneo.objects.create(nombre='Copa', temporada='2025/2026', deporte=deporte)
+        self.inicio = timezone.now() + timedelta(days=1)
+
+    def inscribir(self, numero):
+        for i in range(numero):
+            equipo = Equipo.objects.create(usuario=self.usuario, nombre=f'Equipo {i + 1:02}', entrenador='Entrenador',
+                                           ciudad=f'Ciudad {i + 1}', deporte=self.torneo.deporte)
+            Inscripcion.objects.create(torneo=self.torneo, equipo=equipo)
+
+    def jugar(self, ronda):
+        # Gana siempre el local: los cabezas de serie pasan
+        partidos = Partido.objects.filter(torneo=self.torneo, jornada=ronda)
+        partidos.update(estado=Partido.EstadoPartido.JUGADO, marcador_local=2, marcador_visitante=1)
+        return list(partidos.order_by('id').values_list('equipo_local_id', flat=True))
+
+    def test_cuadro_de_64_llega_a_la_final(self):
+        self.inscribir(64)
+        self.assertEqual(generar_eliminatoria(self.torneo, self.usuario, self.inicio), 32)
+        rondas = ['Ronda de 64', 'Dieciseisavos de final', 'Octavos de final', 'Cuartos de final', 'Semifinales', 'Final']
+        for ronda, siguiente in zip(rondas, rondas[1:]):
+            ganadores = self.jugar(ronda)
+            self.assertEqual(generar_siguiente_ronda(self.torneo, self.usuario, self.inicio), len(ganadores) // 2)
+            cruces = Partido.objects.filter(torneo=self.torneo, jornada=siguiente).order_by('id')
+            self.assertEqual([equipo for cruce in cruces.values_list('equipo_local_id', 'equipo_visitante_id')
+                              for equipo in cruce], ganadores)
+        final = Partido.objects.get(torneo=self.torneo, jornada='Final')
+        self.assertEqual(final.fase, Partido.FasePartido.FINAL)
+        self.assertEqual({final.equipo_local.nombre, final.equipo_visitante.nombre}, {'Equipo 01', 'Equipo 02'})
+        self.jugar('Final')
+        with self.assertRaisesMessage(ValidationError, "La final ya está generada."):
+            generar_siguiente_ronda(self.torneo, self.usuario, self.inicio)
+
+    def test_ronda_sin_ganador(self):
+        self.inscribir(4)
+        generar_eliminatoria(self.torneo, self.usuario, self.inicio)
+        with self.assertRaisesMessage(ValidationError, "no tiene todavía un ganador"):
+            generar_siguiente_ronda(self.torneo, self.usuario, self.inicio)
+
+    def test_sin_eliminatoria(self):
+        self.inscribir(4)
+        with self.assertRaisesMessage(ValidationError, "ninguna ronda de eliminatoria"):
+            generar_siguiente_ronda(self.torneo, self.usuario, self.inicio)
+
+
+#====== Caché HTTP ======
+
+class CacheCalendarioTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.liga = crear_liga(equipos=2, jugadores=1)
+        cache.set(CLAVE_VERSION_GLOBAL, time.time() - 100, None)#el ultimo cambio, hace un rato
+
+    def test_last_modified_e_if_modified_since(self):
+        url = reverse('ver_eventos')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        modificada = response['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=modificada).status_code, 304)
+
+        partido = self.liga['partidos'][0]
+        partido.lugar = 'Otra sede'
+        with self.captureOnCommitCallbacks(execute=True):
+            partido.save()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modificada)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['Last-Modified'], modificada)
+
+    def test_etag_manda_sobre_if_modified_since(self):
+        url = reverse('ver_eventos')
+        response = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"otro"', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+
+
+class CalendarioTests(TestCase):
+    def test_ventana_desde_parametros(self):
+        hoy = timezone.localdate()
+        por_defecto = (hoy, hoy + timedelta(days=DIAS_POR_DEFECTO))
+        self.assertEqual(ventana_desde_parametros('2025-01-10', '2025-01-20'), (date(2025, 1, 10), date(2025, 1, 20)))
+        self.assertEqual(ventana_desde_parametros(None, None), por_defecto)
+        self.assertEqual(ventana_desde_parametros('', ''), por_defecto)
+        self.assertEqual(ventana_desde_parametros('basura', '2025-13-40'), por_defecto)
+        self.assertEqual(ventana_desde_parametros('2025-01-10', '2025-01-01'),#hasta antes que desde
+                         (date(2025, 1, 10), date(2025, 1, 10) + timedelta(days=DIAS_POR_DEFECTO)))
+        self.assertEqual(ventana_desde_parametros('2025-01-10', '2030-01-01'),
+                         (date(2025, 1, 10), date(2025, 1, 10) + timedelta(days=DIAS_MAXIMOS)))
+
+    def test_cursor(self):
+        partido = Partido(pk=42, fecha_hora=timezone.now())
+        self.assertEqual(decodificar_cursor(codificar_cursor(partido)), (partido.fecha_hora, 42))
+        for malo in ('', 'no-es-base64!', 'YWJj', base64.urlsafe_b64encode(b'2025-01-01|x').decode(),
+                     base64.urlsafe_b64encode(b'\xff\xfe').decode(), codificar_cursor(partido)[:-4]):
+            self.assertIsNone(decodificar_cursor(malo), malo)
+
+    @patch('SportApp.calendario.PARTIDOS_POR_SECCION', 3)
+    def test_paginas_de_seccion(self):
+        liga = crear_liga(equipos=5, jugadores=1)
+        primero, segundo = liga['partidos'][:2]
+        Partido.objects.filter(pk=segundo.pk).update(fecha_hora=primero.fecha_hora)#empate: desempata el id
+        esperado = list(Partido.objects.order_by('fecha_hora', 'id').values_list('pk', flat=True))
+        desde = timezone.localdate() - timedelta(days=31)
+        hasta = desde + timedelta(days=DIAS_MAXIMOS)
+
+        with self.assertNumQueries(0):
+            SeccionCalendario(liga['deporte'], desde, hasta)#sin pedir los partidos no consulta
+        vistos, cursor, paginas = [], None, 0
+        while True:
+            seccion = SeccionCalendario(liga['deporte'], desde, hasta, cursor)
+            with self.assertNumQueries(1):
+                vistos += [p.pk for p in seccion.partidos]
+                cursor = seccion.siguiente_cursor
+            paginas += 1
+            if cursor is None:
+                break
+        self.assertEqual(vistos, esperado)
+        self.assertEqual(paginas, 4)#10 partidos de 3 en 3
+
+        #un cursor manipulado vuelve al principio y otro deporte no ve nada
+        self.assertEqual([p.pk for p in SeccionCalendario(liga['deporte'], desde, hasta, 'basura').partidos], esperado[:3])
+        otro = Deporte.objects.create(nombre='Vacío', sistema_puntuacion=Deporte.SistemaPuntuacion.GOLES)
+        self.assertEqual(SeccionCalendario(otro, desde, hasta).partidos, [])
+
+    def test_guardar_partido_solo_invalida_su_deporte(self):
+        cache.clear()
+        futbol, baloncesto = crear_liga(equipos=3, jugadores=1, nombre='A'), crear_liga(equipos=3, jugadores=1, nombre='B')
+        ids = [futbol['deporte'].pk, baloncesto['deporte'].pk]
+        desde = timezone.localdate() - timedelta(days=31)
+        hasta = desde + timedelta(days=DIAS_POR_DEFECTO + 10)
+        url = reverse('ver_eventos') + f'?desde={desde:%Y-%m-%d}&hasta={hasta:%Y-%m-%d}'
+        self.client.get(url)
+        antes = versiones_deportes(ids)
+
+        def fragmento(deporte_id, version_deporte):
+            return make_template_fragment_key('calendario_seccion', [None, deporte_id, desde, hasta, '', version_deporte])
+        self.assertIsNotNone(cache.get(fragmento(ids[1], antes[ids[1]])))
+
+        partido = futbol['partidos'][0]
+        partido.lugar = 'Otra sede'
+        with self.captureOnCommitCallbacks(execute=True):
+            partido.save()
+        despues = versiones_deportes(ids)
+        self.assertNotEqual(despues[ids[0]], antes[ids[0]])
+        self.assertEqual(despues[ids[1]], antes[ids[1]])
+
+        response = self.client.get(url)
+        self.assertContains(response, 'Otra sede')
+        self.assertIsNotNone(cache.get(fragmento(ids[1], antes[ids[1]])))#el otro deporte sigue sirviendo su fragmento
+        self.assertIsNotNone(cache.get(fragmento(ids[0], despues[ids[0]])))
+
+
+#====== Compresión ======
+
+class CompresionTests(TestCase):
+    def test_brotli_solo_sin_token_csrf_en_html(self):
+        peticion = RequestFactory().get('/')
+        self.assertTrue(_brotli_seguro(peticion, JsonResponse({'a': 1})))
+        self.assertTrue(_brotli_seguro(peticion, HttpResponse('<p>hola</p>')))
+        get_token(peticion)#lo que hace {% csrf_token %}
+        self.assertFalse(_brotli_seguro(peticion, HttpResponse('<p>hola</p>')))
+        self.assertTrue(_brotli_seguro(peticion, HttpResponse('a;b', content_type='text/csv')))
+
+    def test_pagina_con_formulario_va_con_gzip(self):
+        usuario = User.objects.create_user('organizador', is_staff=True)
+        self.client.force_login(usuario)
+        response = self.client.get(reverse('equipo_crear'), HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    @skipUnless(brotli, "sin el paquete brotli")
+    def test_pagina_sin_formulario_va_con_brotli(self):
+        response = self.client.get(reverse('torneo_lista'), HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'br')
+
+    def test_calidad_codificacion(self):
+        casos = {
+            '': (0, 0), 'gzip, br': (1, 1), 'gzip;q=0': (0, 0), 'br;q=0.5, gzip;q=0.8': (0.8, 0.5),
+            'GZIP ; Q=0.3': (0.3, 0), '*': (1, 1), 'br;q=0, *;q=0.2': (0.2, 0), 'gzip;q=raro, br': (0, 1),
+            'x-gzip, brotli': (0, 0),
+        }
+        for cabecera, esperado in casos.items():
+            peticion = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=cabecera)
+            self.assertEqual((calidad_codificacion(peticion, 'gzip'), calidad_codificacion(peticion, 'br')), esperado, cabecera)
+
+    def test_respeta_los_q(self):
+        casos = {'gzip;q=0': None, 'br;q=0, gzip': 'gzip', 'gzip, br;q=0.5': 'gzip', 'identity': None}
+        if brotli:
+            casos['gzip;q=0, br'] = 'br'
+        for cabecera, codificacion in casos.items():
+            response = self.client.get(reverse('torneo_lista'), HTTP_ACCEPT_ENCODING=cabecera)
+            self.assertEqual(response.get('Content-Encoding'), codificacion, cabecera)
+            self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_exportacion(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        url = reverse('exportar', args=['partidos', 'csv'])
+        for cabecera, codificacion in (('gzip', 'gzip'), ('gzip;q=0', None), ('br', None)):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=cabecera)
+            self.assertEqual(response.get('Content-Encoding'), codificacion, cabecera)
+            contenido = b''.join(response.streaming_content)
+            self.assertIn(b'id,torneo,temporada', gzip.decompress(contenido) if codificacion else contenido)
+
+
+#====== Presupuesto de consultas ======
+
+class PresupuestoConsultasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.liga = crear_liga(equipos=2, jugadores=2)
+
+    def setUp(self):
+        self.client.force_login(self.liga['usuario'])
+
+    @override_settings(OLYMPO_PRESUPUESTO_ESTRICTO=True)
+    def test_estricto_falla_al_pasarse(self):
+        # El listado hace 3 consultas: con un presupuesto de 2 es como si tuviera una de mas (un N+1)
+        with patch.object(JugadorListView, 'presupuesto_consultas', 2):
+            with self.assertRaisesMessage(PresupuestoConsultasExcedido, '3 consultas (presupuesto 2)') as error:
+                self.client.get(reverse('jugador_lista'))
+        self.assertIn('SportApp_jugador', str(error.exception))#con el SQL de las consultas
+
+    @override_settings(OLYMPO_PRESUPUESTO_ESTRICTO=False, OLYMPO_INSTRUMENTACION=False)
+    def test_sin_estricto_solo_avisa_y_no_guarda_el_sql(self):
+        with patch.object(JugadorListView, 'presupuesto_consultas', 2):
+            with self.assertLogs('SportApp.middleware', 'WARNING'):
+                response = self.client.get(reverse('jugador_lista'))
+        contador = response.wsgi_request.consultas_bd
+        self.assertEqual(contador.consultas, 3)
+        self.assertEqual(contador.sql, [])
+
+
+#====== Desplegables ======
+
+class AutocompletarSelectTests(TestCase):
+    def test_solo_lee_la_opcion_elegida(self):
+        liga = crear_liga(equipos=5, jugadores=1)
+        jugador = Jugador.objects.get(nombre='Jugador 3-1')
+        cache.clear()
+        form = JugadorForm(instance=jugador)
+        with self.assertNumQueries(1):
+            html = str(form['equipo'])
+        self.assertIn(f'<option value="{jugador.equipo_id}" selected>{jugador.equipo.nombre} ({liga["deporte"].nombre})</option>', html)
+        self.assertEqual(html.count('<option'), 2)#la vacia y la elegida
+        self.assertIsNone(cache.get(f'referencias:equipos:{version("equipos")}'))#sin las opciones de toda la tabla
+
+    def test_sin_valor_no_consulta(self):
+        with self.assertNumQueries(0):
+            html = str(JugadorForm()['equipo'])
+        self.assertEqual(html.count('<option'), 1)
+
+
+class ReferenciasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_guardar_y_borrar_cambian_la_version(self):
+        liga = crear_liga(equipos=1, jugadores=1)
+        filas = {Deporte: liga['deporte'], Torneo: liga['torneo'], Equipo: liga['equipos'][0], Jugador: Jugador.objects.get()}
+        for operacion in ('save', 'delete'):
+            for modelo in (Jugador, Torneo, Equipo, Deporte):#borrando de las hojas hacia arriba
+                tabla = TABLA_DE_MODELO[modelo]
+                antes = {t: version(t) for t in TABLAS}
+                time.sleep(0.001)
+                with self.captureOnCommitCallbacks(execute=True):
+                    getattr(filas[modelo], operacion)()
+                cambiadas = {t for t in TABLAS if version(t) != antes[t]}
+                self.assertEqual(cambiadas, set(DEPENDIENTES[tabla]), (operacion, tabla))
+        #los partidos no se cachean: se leen siempre y su version no hace falta
+        self.assertEqual(set(TABLA_DE_MODELO), {Deporte, Torneo, Equipo, Jugador, Partido})
+        self.assertFalse(TABLAS['partidos'][3])
+        with self.assertNumQueries(1):
+            opciones('partidos')
+        with self.assertNumQueries(1):
+            opciones('partidos')
+
+    def test_desplegable_desde_la_cache(self):
+        liga = crear_liga(equipos=2, jugadores=1)
+        otro = Deporte.objects.create(nombre='Pádel', sistema_puntuacion=Deporte.SistemaPuntuacion.GOLES)
+        with self.assertNumQueries(1):
+            primero = str(TorneoForm()['deporte'])
+        with self.assertNumQueries(0):
+            segundo = str(TorneoForm()['deporte'])
+        self.assertEqual(primero, segundo)
+        self.assertIn(f'<option value="{otro.pk}">Pádel (', segundo)
+        self.assertEqual(segundo.count('<option'), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Deporte.objects.filter(pk=otro.pk).get().delete()
+        with self.assertNumQueries(1):
+            html = str(TorneoForm()['deporte'])
+        self.assertNotIn('Pádel', html)
+
+        #con un queryset filtrado solo se leen los ids
+        form = TorneoForm()
+        form.fields['deporte'].queryset = Deporte.objects.filter(pk=liga['deporte'].pk)
+        with self.assertNumQueries(1):
+            html = str(form['deporte'])
+        self.assertEqual(html.count('<option'), 2)
+
+
+#====== Autocompletado ======
+
+class AutocompletarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.liga = crear_liga(equipos=3, jugadores=2)
+        cls.usuario = cls.liga['usuario']
+        for nombre in ('ana', 'Ana María', 'Álvaro Jugón', 'Mariano'):
+            Jugador.objects.create(nombre=nombre, dorsal=9)
+
+    def nombres(self, tabla, texto):
+        resultados, _ = autocompletar.buscar(tabla, self.usuario, texto)
+        return [etiqueta.split(' (')[0] for _, etiqueta in resultados]
+
+    def test_primero_los_que_empiezan_sin_mayusculas(self):
+        self.assertEqual(self.nombres('jugadores', 'ANA'), ['ana', 'Ana María'])
+        # Despues los que lo llevan en medio
+        self.assertEqual(self.nombres('jugadores', 'mar'), ['Mariano', 'Ana María'])
+        self.assertEqual(self.nombres('jugadores', 'Ál'), ['Álvaro Jugón'])
+
+    def test_el_prefijo_usa_el_indice(self):
+        sql = str(Jugador.objects.filter(autocompletar._empiezan(Jugador, 'nombre', 'ana')).query)
+        self.assertNotIn('LIKE', sql)
+        if connection.vendor == 'sqlite':
+            plan = Jugador.objects.filter(autocompletar._empiezan(Jugador, 'nombre', 'ana')).explain()
+            self.assertIn('jugador_nombre_minusculas', plan)
+
+    def test_partidos_por_el_nombre_de_sus_equipos(self):
+        self.assertEqual(len(self.nombres('partidos', 'liga equipo 3')), 2)
+
+    def test_una_letra_no_busca_en_medio(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.nombres('jugadores', 'o'), [])
+
+    def test_en_medio_acotado(self):
+        # Con el corte en la fila 2 solo se mira entre ana, Ana María y Jugador 1-1 (por orden de Lower(nombre))
+        with patch.object(autocompletar, 'ESCANEO_CONTIENEN', 2):
+            self.assertEqual(self.nombres('jugadores', 'ía'), ['Ana María'])
+            self.assertEqual(self.nombres('jugadores', 'ano'), [])
+        self.assertEqual(self.nombres('jugadores', 'ano'), ['Mariano'])
+
+
+#====== Clasificación ======
+
+class ClasificacionTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('organizador', is_staff=True)
+        self.deporte = Deporte.objects.create(nombre='Fútbol', sistema_puntuacion=Deporte.SistemaPuntuacion.GOLES)
+        self.torneo = Torneo.objects.create(nombre='Liga', temporada='2025/2026', deporte=self.deporte)
+        self.local, self.visitante, self.tercero = [
+            Equipo.objects.create(usuario=self.usuario, nombre=nombre, entrenador='Entrenador', ciudad='Sevilla',
+                                  deporte=self.deporte)
+            for nombre in ('Local', 'Visitante', 'Tercero')]
+        for equipo in (self.local, self.visitante, self.tercero):
+            Inscripcion.objects.create(torneo=self.torneo, equipo=equipo)
+
+    def fila(self, equipo):
+        # PJ, G, E, P, F, C, puntos
+        return tuple(Inscripcion.objects.filter(torneo=self.torneo, equipo=equipo).values_list(*CAMPOS_CLASIFICACION).get())
+
+    def partido(self, local, visitante, estado=Partido.EstadoPartido.JUGADO):
+        return Partido.objects.create(usuario=self.usuario, torneo=self.torneo, fecha_hora=timezone.now(), lugar='Sevilla',
+                                      jornada='Jornada 1', equipo_local=self.local, equipo_visitante=self.visitante, estado=estado,
+                                      marcador_local=local, marcador_visitante=visitante)
+
+    def assertCoincideConRecalcular(self):
+        self.assertEqual(recalcular_clasificacion([self.torneo], guardar=False), [])
+
+    def test_partido_jugado_suma(self):
+        self.partido(2, 1)
+        self.assertEqual(self.fila(self.local), (1, 1, 0, 0, 2, 1, 3))
+        self.assertEqual(self.fila(self.visitante), (1, 0, 0, 1, 1, 2, 0))
+        self.assertEqual(self.fila(self.tercero), (0, 0, 0, 0, 0, 0, 0))
+        self.assertCoincideConRecalcular()
+
+    def test_cambio_de_marcador(self):
+        partido = self.partido(2, 1)
+        partido.marcador_visitante = 2
+        partido.save()
+        self.assertEqual(self.fila(self.local), (1, 0, 1, 0, 2, 2, 1))
+        self.assertEqual(self.fila(self.visitante), (1, 0, 1, 0, 2, 2, 1))
+        partido.marcador_visitante = 4
+        partido.save()
+        self.assertEqual(self.fila(self.local), (1, 0, 0, 1, 2, 4, 0))
+        self.assertEqual(self.fila(self.visitante), (1, 1, 0, 0, 4, 2, 3))
+        self.assertCoincideConRecalcular()
+
+    def test_deja_de_estar_jugado(self):
+        partido = self.partido(3, 0)
+        self.partido(1, 1)
+        partido.estado = Partido.EstadoPartido.PENDIENTE
+        partido.save()
+        # Solo queda el empate
+        self.assertEqual(self.fila(self.local), (1, 0, 1, 0, 1, 1, 1))
+        self.assertEqual(self.fila(self.visitante), (1, 0, 1, 0, 1, 1, 1))
+        partido.estado = Partido.EstadoPartido.JUGADO
+        partido.save()
+        self.assertEqual(self.fila(self.local), (2, 1, 1, 0, 4, 1, 4))
+        self.assertCoincideConRecalcular()
+
+    def test_pendiente_no_cuenta(self):
+        partido = self.partido(0, 0, estado=Partido.EstadoPartido.PENDIENTE)
+        partido.marcador_local = 5
+        partido.save()
+        self.assertEqual(self.fila(self.local), (0, 0, 0, 0, 0, 0, 0))
+
+    def test_borrar_partido(self):
+        partido = self.partido(0, 2)
+        self.partido(1, 0)
+        partido.delete()
+        self.assertEqual(self.fila(self.local), (1, 1, 0, 0, 1, 0, 3))
+        self.assertEqual(self.fila(self.visitante), (1, 0, 0, 1, 0, 1, 0))
+        self.assertCoincideConRecalcular()
+
+    def test_cambio_de_equipo(self):
+        partido = self.partido(2, 0)
+        partido.equipo_visitante = self.tercero
+        partido.save()
+        self.assertEqual(self.fila(self.visitante), (0, 0, 0, 0, 0, 0, 0))
+        self.assertEqual(self.fila(self.tercero), (1, 0, 0, 1, 0, 2, 0))
+        self.assertEqual(self.fila(self.local), (1, 1, 0, 0, 2, 0, 3))
+        self.assertCoincideConRecalcular()
+
+    def test_recalcular_corrige_desvios(self):
+        self.partido(2, 1)
+        Inscripcion.objects.filter(equipo=self.local).update(puntos_acumulados=10, ganados=0)
+        diferencias = recalcular_clasificacion([self.torneo])
+        self.assertEqual(len(diferencias), 1)
+        self.assertEqual(self.fila(self.local), (1, 1, 0, 0, 2, 1, 3))
+
+
+#====== Marcador ======
+
+class MarcadorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.liga = crear_liga(equipos=3, jugadores=1)
+        cls.organizador = User.objects.create_user('organizador-partido')
+        cls.partido = cls.liga['partidos'][0]#jugado 0-1
+        Partido.objects.filter(pk=cls.partido.pk).update(usuario=cls.organizador)
+
+    def marcador(self):
+        return tuple(Partido.objects.filter(pk=self.partido.pk).values_list('marcador_local', 'marcador_visitante').get())
+
+    def test_suma_con_un_update_condicional(self):
+        with CaptureQueriesContext(connection) as capturadas:
+            actual = ajustar_marcador(self.partido.pk, 'local_sumar')
+        update = next(q['sql'] for q in capturadas.captured_queries if q['sql'].startswith('UPDATE "SportApp_partido"'))
+        self.assertIn('"marcador_local" = ("SportApp_partido"."marcador_local" + 1)', update)
+        self.assertEqual((actual['marcador_local'], actual['marcador_visitante']), (1, 1))
+        # Dos anotadores con la misma foto vieja del partido no se pisan: cada pulsacion suma sobre la fila
+        ajustar_marcador(self.partido.pk, 'local_sumar')
+        self.assertEqual(self.marcador(), (2, 1))
+
+    def test_no_baja_de_cero(self):
+        with CaptureQueriesContext(connection) as capturadas:
+            actual = ajustar_marcador(self.partido.pk, 'local_restar')
+        self.assertEqual((actual['marcador_local'], actual['marcador_visitante']), (0, 1))
+        update = next(q['sql'] for q in capturadas.captured_queries if q['sql'].startswith('UPDATE "SportApp_partido"'))
+        self.assertIn('"marcador_local" >= 1', update)
+        # Sin cambio en el marcador tampoco cambia la clasificacion
+        self.assertEqual(recalcular_clasificacion([self.liga['torneo']], guardar=False), [])
+        ajustar_marcador(self.partido.pk, 'visitante_restar')
+        ajustar_marcador(self.partido.pk, 'visitante_restar')
+        self.assertEqual(self.marcador(), (0, 0))
+
+    def test_actualiza_la_clasificacion(self):
+        ajustar_marcador(self.partido.pk, 'local_sumar')
+        ajustar_marcador(self.partido.pk, 'local_sumar')
+        local = Inscripcion.objects.get(torneo=self.liga['torneo'], equipo=self.partido.equipo_local)
+        self.assertEqual((local.ganados, local.tantos_favor, local.puntos_acumulados), (1, 2, 3))
+        self.assertEqual(recalcular_clasificacion([self.liga['torneo']], guardar=False), [])
+
+    def test_accion_desconocida_y_partido_inexistente(self):
+        self.assertEqual(ajustar_marcador(self.partido.pk, 'local_multiplicar')['marcador_local'], 0)
+        self.assertIsNone(ajustar_marcador(0, 'local_sumar'))
+
+    def url(self, accion='local_sumar', partido_id=None):
+        return reverse('actualizar_marcador', args=[partido_id or self.partido.pk, accion])
+
+    def test_vista_solo_por_post(self):
+        self.client.force_login(self.liga['usuario'])
+        self.assertEqual(self.client.get(self.url()).status_code, 405)
+        self.assertEqual(self.marcador(), (0, 1))
+
+    def test_vista_pide_sesion(self):
+        response = self.client.post(self.url())
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
+        self.assertEqual(self.marcador(), (0, 1))
+
+    def test_vista_solo_organizador_o_staff(self):
+        self.client.force_login(User.objects.create_user('otro'))
+        self.assertEqual(self.client.post(self.url()).status_code, 403)
+        self.assertEqual(self.marcador(), (0, 1))
+
+        self.client.force_login(self.organizador)
+        response = self.client.post(self.url(), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['marcador_local'], 1)
+
+        self.client.force_login(self.liga['usuario'])#staff
+        response = self.client.post(self.url('visitante_sumar'))
+        self.assertRedirects(response, reverse('detalle_evento', args=[self.partido.pk]))
+        self.assertEqual(self.marcador(), (1, 2))
+        self.assertEqual(self.client.post(self.url(partido_id=999999)).status_code, 404)
+
+    def test_api_solo_organizador_o_staff(self):
+        url = reverse('partido-detail', args=[self.partido.pk])
+        self.assertEqual(self.client.patch(url, {'marcador_local': 5}, content_type='application/json').status_code, 403)
+        self.client.force_login(User.objects.create_user('otro'))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.patch(url, {'marcador_local': 5}, content_type='application/json').status_code, 403)
+        self.assertEqual(self.client.delete(url).status_code, 403)
+        self.assertEqual(self.marcador(), (0, 1))
+
+        self.client.force_login(self.organizador)
+        self.assertEqual(self.client.patch(url, {'marcador_local': 5}, content_type='application/json').status_code, 200)
+        self.client.force_login(self.liga['usuario'])#staff
+        self.assertEqual(self.client.patch(url, {'marcador_visitante': 4}, content_type='application/json').status_code, 200)
+        self.assertEqual(self.marcador(), (5, 4))
+
+    def test_detalle_solo_muestra_botones_a_quien_anota(self):
+        url = reverse('detalle_evento', args=[self.partido.pk])
+        self.client.force_login(User.objects.create_user('otro'))
+        self.assertNotContains(self.client.get(url), self.url())
+        self.client.force_login(self.organizador)
+        self.assertContains(self.client.get(url), self.url())
+
+
+#====== Estadísticas acumuladas ======
+
+class EstadisticasAcumuladasTests(TestCase):
+    # Cada cambio en las lineas se aplica con deltas; tras cada uno los acumulados tienen que ser
+    # los mismos que salen de sumar todas las lineas desde cero (recalcular_estadisticas)
+    @classmethod
+    def setUpTestData(cls):
+        cls.liga = crear_liga(equipos=3, jugadores=2)
+        cls.partido = cls.liga['partidos'][0]#jugado, con una linea por jugador
+        cls.local, cls.visitante = cls.partido.equipo_local, cls.partido.equipo_visitante
+        cls.copa = Torneo.objects.create(nombre='Copa', temporada='2024/2025', deporte=cls.liga['deporte'])
+        cls.partido_copa = Partido.objects.create(
+            usuario=cls.liga['usuario'], torneo=cls.copa, fecha_hora=timezone.now() - timedelta(days=400),
+            lugar='Sevilla', jornada='Final', equipo_local=cls.visitante, equipo_visitante=cls.local,
+            estado=Partido.EstadoPartido.JUGADO, marcador_local=1, marcador_visitante=0)
+
+    def foto(self):
+        filas = EstadisticaAcumulada.objects.values_list('jugador_id', 'ambito', 'clave', 'torneo_id', *CAMPOS_ACUMULADOS, 'forma')
+        # Las filas que se quedan a cero por deltas no existen al recalcular
+        return {(jugador, ambito, clave): (torneo, *valores, forma) for jugador, ambito, clave, torneo, *valores, forma in filas
+                if any(valores) or forma}
+
+    def assertCoincideConRecalcular(self):
+        incremental = self.foto()
+        recalcular_estadisticas()
+        self.assertEqual(incremental, self.foto())
+
+    def carrera(self, jugador):
+        return tuple(EstadisticaAcumulada.objects.filter(jugador=jugador, ambito=Ambito.CARRERA)
+                     .values_list(*CAMPOS_ACUMULADOS).get())
+
+    def linea(self, jugador, partido=None, **valores):
+        return EstadisticaPartido.objects.create(partido=partido or self.partido_copa, jugador=jugador,
+                                                 **{'puntos': 2, 'minutos_jugados': 60, 'juega': True, **valores})
+
+    def test_alta(self):
+        jugador = self.local.jugadores.first()
+        antes = self.carrera(jugador)
+        self.linea(jugador, puntos=3, minutos_jugados=45)
+        self.assertEqual(self.carrera(jugador), (antes[0] + 1, antes[1] + 3, antes[2] + 45))
+        temporada = EstadisticaAcumulada.objects.get(jugador=jugador, ambito=Ambito.TEMPORADA, clave='2024/2025')
+        self.assertEqual((temporada.partidos_jugados, temporada.puntos), (1, 3))
+        total = EstadisticaAcumulada.objects.get(jugador=None, ambito=Ambito.TORNEO, clave=str(self.copa.pk))
+        self.assertEqual((total.partidos_jugados, total.puntos, total.torneo_id), (1, 3, self.copa.pk))
+        self.assertCoincideConRecalcular()
+
+    def test_edicion(self):
+        linea = EstadisticaPartido.objects.filter(partido=self.partido).first()
+        antes = self.carrera(linea.jugador)
+        linea.puntos += 4
+        linea.minutos_jugados = 30
+        linea.save()
+        self.assertEqual(self.carrera(linea.jugador), (antes[0], antes[1] + 4, antes[2] - 60))
+        self.assertCoincideConRecalcular()
+        linea.juega = False#convocado sin jugar: deja de contar como partido jugado
+        linea.save()
+        self.assertEqual(self.carrera(linea.jugador)[0], antes[0] - 1)
+        self.assertCoincideConRecalcular()
+
+    def test_baja(self):
+        linea = EstadisticaPartido.objects.filter(partido=self.partido).first()
+        jugador = linea.jugador
+        antes = self.carrera(jugador)
+        linea.delete()
+        self.assertEqual(self.carrera(jugador), (antes[0] - 1, antes[1] - linea.puntos, antes[2] - 90))
+        self.assertCoincideConRecalcular()
+
+    def test_cambio_de_jugador(self):
+        linea = EstadisticaPartido.objects.filter(partido=self.partido, jugador__equipo=self.local).first()
+        otro = self.local.jugadores.exclude(pk=linea.jugador_id).first()
+        EstadisticaPartido.objects.filter(partido=self.partido, jugador=otro).delete()
+        antes_viejo, antes_nuevo = self.carrera(linea.jugador), self.carrera(otro)
+        viejo = linea.jugador
+        linea.jugador = otro
+        linea.save()
+        self.assertEqual(self.carrera(viejo)[0], antes_viejo[0] - 1)
+        self.assertEqual(self.carrera(otro)[0], antes_nuevo[0] + 1)
+        self.assertCoincideConRecalcular()
+
+    def test_cambio_de_partido_a_otro_torneo(self):
+        linea = EstadisticaPartido.objects.filter(partido=self.partido).first()
+        linea.partido = self.partido_copa
+        linea.save()
+        self.assertTrue(EstadisticaAcumulada.objects.filter(jugador=linea.jugador, ambito=Ambito.TORNEO,
+                                                            clave=str(self.copa.pk), partidos_jugados=1).exists())
+        self.assertCoincideConRecalcular()
+
+
+#====== Perfil de jugador ======
+
+class PerfilJugadorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('organizador', is_staff=True)
+        deporte = Deporte.objects.create(nombre='Fútbol', sistema_puntuacion=Deporte.SistemaPuntuacion.GOLES)
+        cls.casa, cls.fuera = [Equipo.objects.create(usuario=cls.usuario, nombre=nombre, entrenador='Entrenador',
+                                                     ciudad='Sevilla', deporte=deporte) for nombre in ('Casa', 'Fuera')]
+        cls.jugador = Jugador.objects.create(nombre='Goleador', dorsal=9, equipo=cls.casa)
+        torneos = [Torneo.objects.create(nombre=f'Liga {temporada}', temporada=temporada, deporte=deporte)
+                   for temporada in ('2024/2025', '2025/2026')]
+        inicio = timezone.now() - timedelta(days=100)
+        cls.lineas = []
+        for numero in range(7):#los 3 primeros en la temporada anterior; uno de cada dos fuera de casa
+            en_casa = numero % 2 == 0
+            partido = Partido.objects.create(
+                usuario=cls.usuario, torneo=torneos[numero >= 3], fecha_hora=inicio + timedelta(days=numero * 7),
+                lugar='Sevilla', jornada=f'Jornada {numero + 1}', estado=Partido.EstadoPartido.JUGADO,
+                equipo_local=cls.casa if en_casa else cls.fuera, equipo_visitante=cls.fuera if en_casa else cls.casa)
+            cls.lineas.append(EstadisticaPartido.objects.create(partido=partido, jugador=cls.jugador, puntos=numero,
+                                                                minutos_jugados=90, juega=True))
+
+    def partidos_forma(self):
+        return [partido['partido'] for partido in perfil_jugador(self.jugador)['forma']]
+
+    def assertCarreraDesdeCero(self):
+        # La fila de carrera es la suma de todas sus lineas
+        perfil = perfil_jugador(self.jugador)
+        lineas = EstadisticaPartido.objects.filter(jugador=self.jugador)
+        suma = lineas.aggregate(puntos=Sum('puntos'), minutos=Sum('minutos_jugados'))
+        carrera = perfil['carrera']
+        self.assertEqual((carrera.partidos_jugados, carrera.puntos, carrera.minutos_jugados),
+                         (lineas.filter(juega=True).count(), suma['puntos'], suma['minutos']))
+
+    def test_perfil(self):
+        perfil = perfil_jugador(self.jugador)
+        self.assertEqual([fila.clave for fila in perfil['temporadas']], ['2025/2026', '2024/2025'])
+        self.assertEqual([(fila.partidos_jugados, fila.puntos) for fila in perfil['temporadas']], [(4, 18), (3, 3)])
+        self.assertEqual([fila.torneo.temporada for fila in perfil['torneos']], ['2025/2026', '2024/2025'])
+        # La forma: los 5 ultimos, del mas reciente al mas antiguo, con el rival visto desde el jugador
+        self.assertEqual(self.partidos_forma(), [linea.partido_id for linea in reversed(self.lineas[2:])])
+        ultimo = perfil['forma'][0]
+        self.assertEqual((ultimo['rival'], ultimo['en_casa'], ultimo['puntos']), ('Fuera', True, 6))
+        self.assertEqual((perfil['forma'][1]['rival'], perfil['forma'][1]['en_casa']), ('Fuera', False))
+        self.assertCarreraDesdeCero()
+
+    def test_forma_tras_editar_y_borrar(self):
+        antigua = self.lineas[0]#fuera de la forma: cambia el total pero no la forma
+        antigua.puntos = 10
+        antigua.save()
+        self.assertEqual(self.partidos_forma(), [linea.partido_id for linea in reversed(self.lineas[2:])])
+        self.assertCarreraDesdeCero()
+
+        self.lineas[6].delete()#la mas reciente: entra en la forma la sexta empezando por el final
+        self.assertEqual(self.partidos_forma(), [linea.partido_id for linea in reversed(self.lineas[1:6])])
+        self.lineas[5].juega = False#sin jugar no cuenta en la forma
+        self.lineas[5].save()
+        self.assertEqual(self.partidos_forma(), [linea.partido_id for linea in reversed(self.lineas[:5])])
+        self.assertCarreraDesdeCero()
+
+    def test_perfil_en_la_api_y_la_ficha(self):
+        self.client.force_login(self.usuario)
+        datos = self.client.get(reverse('jugador-perfil', args=[self.jugador.pk])).json()
+        self.assertEqual((datos['carrera']['partidos_jugados'], datos['carrera']['puntos']), (7, 21))
+        self.assertEqual([partido['partido'] for partido in datos['forma']], self.partidos_forma())
+        self.assertEqual(len(datos['temporadas']), 2)
+        response = self.client.get(reverse('jugador_detalle', args=[self.jugador.pk]))
+        self.assertContains(response, '2024/2025')
+
+
+#====== Cargas en lote ======
+
+class ActaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.liga = crear_liga(equipos=3, jugadores=3)
+        cls.partido = cls.liga['partidos'][0]#ya tiene una linea por jugador de los dos equipos
+        cls.jugadores = list(Jugador.objects.filter(equipo__in=(cls.partido.equipo_local, cls.partido.equipo_visitante)).order_by('pk'))
+        cls.ajeno = Jugador.objects.exclude(pk__in=[j.pk for j in cls.jugadores]).first()
+
+    def foto_acumulados(self):
+        filas = EstadisticaAcumulada.objects.values_list('jugador_id', 'ambito', 'clave', *CAMPOS_ACUMULADOS, 'forma')
+        return {(jugador, ambito, clave): (*valores, forma) for jugador, ambito, clave, *valores, forma in filas
+                if any(valores) or forma}
+
+    def test_upsert_sobre_lineas_existentes(self):
+        EstadisticaPartido.objects.filter(partido=self.partido, jugador=self.jugadores[-1]).delete()
+        existentes = dict(EstadisticaPartido.objects.filter(partido=self.partido).values_list('jugador_id', 'pk'))
+        lineas = [{'jugador': jugador.pk, 'juega': True, 'puntos': 5, 'minutos_jugados': 70, 'observaciones': 'acta'}
+                  for jugador in self.jugadores]
+        self.assertEqual(guardar_acta(self.partido, lineas), len(self.jugadores))
+
+        guardadas = EstadisticaPartido.objects.filter(partido=self.partido)
+        self.assertEqual(guardadas.count(), len(self.jugadores))#las que chocan se actualizan, no se duplican
+        self.assertEqual(set(guardadas.values_list('puntos', 'minutos_jugados', 'observaciones')), {(5, 70, 'acta')})
+        for jugador_id, pk in existentes.items():
+            self.assertEqual(guardadas.get(jugador_id=jugador_id).pk, pk)
+
+    def test_acumulados_sin_señales(self):
+        # bulk_create no dispara post_save: los acumulados y la forma los ajusta guardar_acta en el mismo lote
+        lineas = [{'jugador': jugador.pk, 'juega': i % 2 == 0, 'puntos': i, 'minutos_jugados': 10 * i}
+                  for i, jugador in enumerate(self.jugadores)]
+        guardar_acta(self.partido, lineas)
+        incremental = self.foto_acumulados()
+        recalcular_estadisticas()
+        self.assertEqual(incremental, self.foto_acumulados())
+
+    def test_jugadores_no_validos_no_escriben_nada(self):
+        antes = list(EstadisticaPartido.objects.filter(partido=self.partido).values_list('pk', 'puntos'))
+        lineas = [{'jugador': self.jugadores[0].pk, 'puntos': 9}, {'jugador': self.jugadores[0].pk, 'puntos': 9},
+                  {'jugador': self.ajeno.pk, 'puntos': 9}]
+        with self.assertRaises(ValidationError) as error:
+            guardar_acta(self.partido, lineas)
+        self.assertEqual(set(error.exception.message_dict), {str(self.jugadores[0].pk), str(self.ajeno.pk)})
+        self.assertEqual(list(EstadisticaPartido.objects.filter(partido=self.partido).values_list('pk', 'puntos')), antes)
+
+    def test_api(self):
+        url = reverse('partido-acta', args=[self.partido.pk])
+        lineas = [{'jugador': self.jugadores[0].pk, 'juega': True, 'puntos': 3, 'minutos_jugados': 90}]
+        self.client.force_login(User.objects.create_user('otro'))
+        self.assertEqual(self.client.post(url, lineas, content_type='application/json').status_code, 403)
+        self.client.force_login(self.liga['usuario'])
+        response = self.client.post(url, lineas, content_type='application/json')
+        self.assertEqual(response.json(), {'guardadas': 1})
+        self.assertEqual(EstadisticaPartido.objects.get(partido=self.partido, jugador=self.jugadores[0]).puntos, 3)
+
+
+class InsertarFilasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.liga = crear_liga(equipos=2, jugadores=1)
+        cls.local, cls.visitante = cls.liga['equipos']
+
+    def insertar(self, estado=Partido.EstadoPartido.JUGADO):
+        fila = (self.liga['usuario'].pk, self.liga['torneo'].pk, timezone.now(), 'Sede Nueva', 'Jornada 9', estado,
+                Partido.FasePartido.REGULAR, self.local.pk, self.visitante.pk, 3, 0)
+        return insertar_filas(Partido, CAMPOS_INSERTADOS, [fila, fila])
+
+    def test_marcas_de_tiempo(self):
+        self.assertEqual(self.insertar(), 2)
+        for creado, actualizado in Partido.objects.filter(lugar='Sede Nueva').values_list('creado', 'actualizado'):
+            self.assertIsNotNone(creado)
+            self.assertEqual(creado, actualizado)
+
+    def test_sin_señales_ni_datos_derivados(self):
+        # Lo que las señales harian con un save() se queda sin hacer: quien inserta en lote lo tiene que pedir
+        self.insertar()
+        self.assertEqual(recalcular_clasificacion([self.liga['torneo']], guardar=False)[0][1]['partidos_jugados'], 2)
+        self.assertEqual(Inscripcion.objects.get(torneo=self.liga['torneo'], equipo=self.local).partidos_jugados, 0)
+        self.assertFalse(busqueda.buscar('sede nueva')[0])
+        self.assertEqual(busqueda.indexar_nuevos(Partido.objects.all()), 2)
+        self.assertEqual(len(busqueda.buscar('sede nueva')[0]), 2)
+
+    def test_generar_liga_indexa_y_no_toca_la_clasificacion(self):
+        filas = Inscripcion.objects.values_list(*CAMPOS_CLASIFICACION)
+        antes = list(filas)
+        torneo = self.liga['torneo']
+        Partido.objects.filter(torneo=torneo).delete()
+        creados = generar_liga(torneo, self.liga['usuario'], timezone.now(), ida_y_vuelta=True)
+        self.assertEqual(creados, 2)
+        self.assertEqual(list(filas), [tuple(0 for _ in fila) for fila in antes])#los jugados se han borrado y los nuevos son pendientes
+        self.assertEqual(DocumentoBusqueda.objects.filter(tipo=DocumentoBusqueda.Tipo.PARTIDO).count(), 2)
+
+
+class ImportacionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.liga = crear_liga(equipos=3, jugadores=1, nombre='Imp')
+        cls.usuario = cls.liga['usuario']
+        cls.deporte = cls.liga['deporte'].nombre
+
+    def csv(self, *lineas):
+        return io.BytesIO('\n'.join(lineas).encode())
+
+    def importar(self, tipo, *lineas, **opciones):
+        return importar(tipo, self.csv(*lineas), self.usuario, nombre=f'{tipo}.csv', **opciones)
+
+    def equipos(self, n, desde=1):
+        return [f'Nuevo {i};{self.deporte};Huelva;Míster' for i in range(desde, desde + n)]
+
+    def test_equipos_con_inscripcion(self):
+        creados, errores = self.importar('equipos', 'nombre;deporte;ciudad;entrenador;torneo;temporada',
+                                         f'Nuevo 1;{self.deporte};Huelva;Míster;Imp;2025/2026',
+                                         f'Nuevo 2;{self.deporte};Cádiz;Míster;;')
+        self.assertEqual((creados, errores), ({'equipos': 2, 'inscripciones': 1}, []))
+        self.assertTrue(Inscripcion.objects.filter(torneo=self.liga['torneo'], equipo__nombre='Nuevo 1').exists())
+        self.assertEqual(DocumentoBusqueda.objects.filter(titulo__startswith='Nuevo').count(), 2)
+
+    def test_errores_por_fila(self):
+        creados, errores = self.importar('equipos', 'nombre;deporte;ciudad;entrenador;usuario',
+                                         f'Nuevo 1;{self.deporte};Huelva;Míster;',
+                                         'Nuevo 2;Críquet;Huelva;Míster;',
+                                         f'Nuevo 3;{self.deporte};;Míster;',
+                                         f'Nuevo 1;{self.deporte};Huelva;Míster;',
+                                         f'Imp Equipo 1;{self.deporte};Huelva;Míster;',
+                                         f'Nuevo 4;{self.deporte};Huelva;Míster;nadie')
+        self.assertEqual(creados, {})
+        self.assertEqual([linea for linea, _ in errores], [3, 4, 5, 6, 7])
+        self.assertIn("Críquet", errores[0][1])
+        self.assertIn("'ciudad'", errores[1][1])
+        self.assertIn("'nadie'", errores[4][1])
+        self.assertFalse(Equipo.objects.filter(nombre__startswith='Nuevo').exists())
+
+    def test_errores_de_jugadores_y_partidos(self):
+        _, errores = self.importar('jugadores', 'nombre,equipo,dorsal', 'Ana,Imp Equipo 1,7', 'Bea,Imp Equipo 1,120',
+                                   'Carla,Nadie,3', 'Dora,Imp Equipo 1,siete')
+        self.assertEqual([linea for linea, _ in errores], [3, 4, 5])
+        _, errores = self.importar('partidos', 'torneo,temporada,fecha_hora,jornada,equipo_local,equipo_visitante,estado',
+                                   'Imp,2025/2026,2026-01-10 18:00,J1,Imp Equipo 1,Imp Equipo 2,',
+                                   'Imp,2025/2026,2026-01-10 18:00,J1,Imp Equipo 1,Imp Equipo 1,',
+                                   'Imp,2025/2026,mañana,J1,Imp Equipo 1,Imp Equipo 2,',
+                                   'Imp,2025/2026,2026-01-10 18:00,J1,Imp Equipo 1,Imp Equipo 2,APLAZADO',
+                                   'Otra,2025/2026,2026-01-10 18:00,J1,Imp Equipo 1,Imp Equipo 2,')
+        self.assertEqual([linea for linea, _ in errores], [3, 4, 5, 6])
+        self.assertFalse(Jugador.objects.filter(nombre='Ana').exists())
+        self.assertFalse(Partido.objects.filter(jornada='J1').exists())
+
+    def test_columnas_y_fichero_vacio(self):
+        with self.assertRaisesMessage(ErrorImportacion, 'ciudad, entrenador'):
+            self.importar('equipos', 'nombre;deporte', f'Nuevo 1;{self.deporte}')
+        with self.assertRaisesMessage(ErrorImportacion, 'no tiene filas'):
+            self.importar('equipos', 'nombre;deporte;ciudad;entrenador')
+
+    @patch('SportApp.importacion.LOTE', 2)
+    def test_por_lotes(self):
+        with patch('SportApp.importacion.insertar_filas', wraps=insertar_filas) as insertar:
+            creados, errores = self.importar('equipos', 'nombre;deporte;ciudad;entrenador', *self.equipos(5))
+        self.assertEqual((creados, errores), ({'equipos': 5}, []))
+        self.assertEqual([len(llamada.args[2]) for llamada in insertar.call_args_list], [2, 2, 1])
+        self.assertEqual(DocumentoBusqueda.objects.filter(titulo__startswith='Nuevo').count(), 5)
+
+    @patch('SportApp.importacion.LOTE', 2)
+    def test_error_en_un_lote_posterior_deshace_los_anteriores(self):
+        # Los dos primeros lotes se insertan; el error de la linea 7 y el repetido de otro lote deshacen todo
+        creados, errores = self.importar('equipos', 'nombre;deporte;ciudad;entrenador',
+                                         *self.equipos(4), f'Nuevo 5;Críquet;Huelva;Míster', *self.equipos(1, desde=5),
+                                         *self.equipos(1, desde=2))
+        self.assertEqual(creados, {})
+        self.assertEqual([linea for linea, _ in errores], [6, 8])
+        self.assertFalse(Equipo.objects.filter(nombre__startswith='Nuevo').exists())
+
+    def test_comprobar_no_escribe(self):
+        creados, errores = self.importar('equipos', 'nombre;deporte;ciudad;entrenador', *self.equipos(3), comprobar=True)
+        self.assertEqual((creados, errores), ({'equipos': 3}, []))
+        self.assertFalse(Equipo.objects.filter(nombre__startswith='Nuevo').exists())
+        self.assertFalse(DocumentoBusqueda.objects.filter(titulo__startswith='Nuevo').exists())
+
+    @patch('SportApp.importacion.LOTE', 1)
+    def test_partidos_jugados_recalculan_al_final(self):
+        creados, errores = self.importar('partidos', 'torneo,temporada,fecha_hora,jornada,equipo_local,equipo_visitante,'
+                                                     'estado,marcador_local,marcador_visitante',
+                                         'Imp,2025/2026,2026-01-10 18:00,J9,Imp Equipo 1,Imp Equipo 2,JUGADO,3,0',
+                                         'Imp,2025/2026,2026-01-17 18:00,J10,Imp Equipo 2,Imp Equipo 3,Jugado,1,1',
+                                         'Imp,2025/2026,2026-01-24 18:00,J11,Imp Equipo 3,Imp Equipo 1,,,')
+        self.assertEqual((creados, errores), ({'partidos': 3}, []))
+        incremental = list(Inscripcion.objects.order_by('pk').values_list(*CAMPOS_CLASIFICACION))
+        recalcular_clasificacion([self.liga['torneo']])
+        self.assertEqual(list(Inscripcion.objects.order_by('pk').values_list(*CAMPOS_CLASIFICACION)), incremental)
+        self.assertEqual(Partido.objects.get(jornada='J9').lugar, 'Sevilla')#en casa del local
+        self.assertEqual(list(Tarea.objects.values_list('nombre', 'argumentos')),
+                         [('recalcular_elo', {'deportes': [self.liga['deporte'].pk]})])
+        self.assertEqual(DocumentoBusqueda.objects.filter(tipo=DocumentoBusqueda.Tipo.PARTIDO).count(), 6)
+
+
+#====== Cara a cara ======
+
+class EnfrentamientosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.liga = crear_liga(equipos=4, jugadores=1)
+        cls.e1, cls.e2, cls.e3, cls.e4 = cls.liga['equipos']
+
+    def esperado(self):
+        # Lo mismo contado a mano desde los partidos jugados, del mas reciente al mas antiguo
+        filas = {}
+        for partido in Partido.objects.filter(estado=Partido.EstadoPartido.JUGADO).order_by('-fecha_hora', '-id'):
+            a, b = sorted((partido.equipo_local_id, partido.equipo_visitante_id))
+            tantos = {partido.equipo_local_id: partido.marcador_local, partido.equipo_visitante_id: partido.marcador_visitante}
+            fila = filas.setdefault((a, b), [0, 0, 0, 0, 0, 0, []])
+            fila[0] += 1
+            fila[1 if tantos[a] > tantos[b] else 2 if tantos[b] > tantos[a] else 3] += 1
+            fila[4] += tantos[a]
+            fila[5] += tantos[b]
+            if len(fila[6]) < ULTIMOS_PARTIDOS:
+                fila[6].append(partido.pk)
+        return filas
+
+    def assertCoincide(self):
+        filas = {(f.equipo_a_id, f.equipo_b_id): [*(getattr(f, c) for c in CAMPOS_TOTALES), [u['partido'] for u in f.ultimos]]
+                 for f in Enfrentamiento.objects.all()}
+        self.assertEqual(filas, self.esperado())
+
+    def jugar(self, local, visitante, marcador, dias):
+        return Partido.objects.create(
+            usuario=self.liga['usuario'], torneo=self.liga['torneo'], fecha_hora=timezone.now() + timedelta(days=dias),
+            lugar='Sevilla', jornada=f'Extra {dias}', equipo_local=local, equipo_visitante=visitante,
+            estado=Partido.EstadoPartido.JUGADO, marcador_local=marcador[0], marcador_visitante=marcador[1])
+
+    def test_crear_cambiar_y_borrar(self):
+        self.assertCoincide()
+        partido = self.jugar(self.e2, self.e1, (2, 0), 1)#en campo del de id mayor
+        self.assertCoincide()
+        partido.marcador_visitante = 2
+        partido.save()
+        self.assertCoincide()
+        partido.estado = Partido.EstadoPartido.PENDIENTE
+        partido.save()
+        self.assertCoincide()
+        partido.estado = Partido.EstadoPartido.JUGADO
+        partido.equipo_visitante = self.e4#sale de una pareja y entra en otra
+        partido.save()
+        self.assertCoincide()
+        partido.delete()
+        self.assertCoincide()
+
+    def test_pareja_sin_partidos_pierde_su_fila(self):
+        partido = self.jugar(self.e3, self.e4, (1, 0), 1)
+        self.assertIsNotNone(enfrentamiento_de(self.e4.pk, self.e3.pk))
+        partido.delete()
+        self.assertIsNone(enfrentamiento_de(self.e3.pk, self.e4.pk))
+
+    def test_ultimos_partidos(self):
+        partidos = [self.jugar(self.e1, self.e2, (i, 1), i) for i in range(1, ULTIMOS_PARTIDOS + 3)]
+        fila = enfrentamiento_de(self.e1.pk, self.e2.pk)
+        self.assertEqual([u['partido'] for u in fila.ultimos], [p.pk for p in reversed(partidos)][:ULTIMOS_PARTIDOS])
+        self.assertCoincide()
+        self.assertEqual(fila.para(self.e2.pk)['ganados'], fila.victorias_b)
+        self.assertEqual(fila.para(self.e2.pk)['tantos_favor'], fila.tantos_b)
+
+    def test_recalcular_y_cargas_sin_señales(self):
+        fila = (self.liga['usuario'].pk, self.liga['torneo'].pk, timezone.now(), 'Sevilla', 'SQL', Partido.EstadoPartido.JUGADO,
+                Partido.FasePartido.REGULAR, self.e4.pk, self.e3.pk, 4, 4)
+        insertar_filas(Partido, CAMPOS_INSERTADOS, [fila])
+        self.assertIsNone(enfrentamiento_de(self.e3.pk, self.e4.pk))
+        recalcular_parejas([(self.e4.pk, self.e3.pk)])
+        self.assertCoincide()
+        Enfrentamiento.objects.all().delete()
+        self.assertEqual(recalcular_enfrentamientos(), len(self.esperado()))
+        self.assertCoincide()
+
+    def test_vista_y_api(self):
+        self.jugar(self.e1, self.e2, (3, 1), 1)
+        fila = enfrentamiento_de(self.e1.pk, self.e2.pk)
+        response = self.client.get(reverse('enfrentamiento', args=[self.e2.pk, self.e1.pk]))
+        self.assertEqual(response.context['cara_a_cara'], fila.para(self.e2.pk))
+        self.assertEqual(len(response.context['ultimos']), fila.partidos)
+        datos = self.client.get('/api/enfrentamientos/', {'pares': f'{self.e2.pk}-{self.e1.pk}'}).json()['results']
+        self.assertEqual([(d['partidos'], d['tantos_a'], d['tantos_b']) for d in datos],
+                         [(fila.partidos, fila.tantos_a, fila.tantos_b)])
+        self.assertEqual(self.client.get(reverse('enfrentamiento', args=[self.e1.pk, self.e1.pk])).status_code, 404)
+
+
+#====== Elo ======
+
+class EloTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.liga = crear_liga(equipos=6, jugadores=1)#los jugados se crean por orden de fecha
+
+    def foto(self):
+        return (list(Equipo.objects.order_by('pk').values_list('elo', 'elo_partidos')),
+                list(Partido.objects.order_by('pk').values_list('elo_cambio', flat=True)))
+
+    def assertFotosIguales(self, una, otra):
+        (elos, cambios), (elos_otra, cambios_otra) = una, otra
+        self.assertEqual([partidos for _, partidos in elos], [partidos for _, partidos in elos_otra])
+        for (elo, _), (elo_otra, _) in zip(elos, elos_otra):
+            self.assertAlmostEqual(elo, elo_otra, places=9)
+        self.assertEqual([c is None for c in cambios], [c is None for c in cambios_otra])
+        for cambio, cambio_otra in zip(cambios, cambios_otra):
+            if cambio is not None:
+                self.assertAlmostEqual(cambio, cambio_otra, places=9)
+
+    def assertCoincideConRecalcular(self):
+        incremental = self.foto()
+        recalcular_elo()
+        self.assertFotosIguales(incremental, self.foto())
+
+    def jugar(self, local, visitante, marcador, dias=1, **campos):
+        return Partido.objects.create(
+            usuario=self.liga['usuario'], torneo=self.liga['torneo'], fecha_hora=timezone.now() + timedelta(days=dias),
+            lugar='Sevilla', jornada='Extra', equipo_local=local, equipo_visitante=visitante,
+            estado=Partido.EstadoPartido.JUGADO, marcador_local=marcador[0], marcador_visitante=marcador[1], **campos)
+
+    def test_incremental_igual_que_repetir_la_historia(self):
+        self.assertTrue(Partido.objects.filter(elo_cambio__isnull=False).exists())
+        self.assertCoincideConRecalcular()
+        self.assertAlmostEqual(sum(Equipo.objects.values_list('elo', flat=True)), 6 * ELO_INICIAL, places=6)
+
+    def test_corregir_y_anular_el_ultimo_partido(self):
+        local, visitante = self.liga['equipos'][:2]
+        partido = self.jugar(local, visitante, (5, 0))
+        self.assertCoincideConRecalcular()
+        partido.marcador_local = 0
+        partido.save()#se deshace el cambio anterior y se aplica el nuevo con el Elo de antes de ese partido
+        self.assertCoincideConRecalcular()
+        partido.estado = Partido.EstadoPartido.SUSPENDIDO
+        partido.save()
+        self.assertIsNone(Partido.objects.get(pk=partido.pk).elo_cambio)
+        self.assertCoincideConRecalcular()
+        partido.delete()
+        self.assertCoincideConRecalcular()
+
+    def test_corregir_un_partido_antiguo_hasta_recalcular(self):
+        # El partido corregido se reaplica con el Elo actual: solo recalcular_elo lo deja como en la historia
+        partido = Partido.objects.filter(estado=Partido.EstadoPartido.JUGADO).order_by('fecha_hora').first()
+        partido.marcador_local += 4
+        partido.save()
+        incremental = self.foto()
+        recalcular_elo([self.liga['deporte'].pk])
+        historia = self.foto()
+        self.assertEqual([p for _, p in incremental[0]], [p for _, p in historia[0]])
+        self.assertNotEqual([round(elo, 6) for elo, _ in incremental[0]], [round(elo, 6) for elo, _ in historia[0]])
+        self.assertCoincideConRecalcular()
+
+    def test_guardar_un_equipo_viejo_no_pisa_el_elo(self):
+        local, visitante = self.liga['equipos'][:2]
+        viejo = Equipo.objects.get(pk=local.pk)
+        self.jugar(local, visitante, (3, 0))
+        elo, partidos = Equipo.objects.filter(pk=local.pk).values_list('elo', 'elo_partidos').get()
+        viejo.ciudad = 'Cádiz'
+        viejo.save()
+        self.assertEqual(Equipo.objects.filter(pk=local.pk).values_list('elo', 'elo_partidos', 'ciudad').get(),
+                         (elo, partidos, 'Cádiz'))
+        self.assertNotEqual(viejo.elo, elo)#en memoria sigue el viejo
+        self.assertCoincideConRecalcular()
+
+    def test_equipo_nuevo_empieza_con_el_elo_inicial(self):
+        equipo = Equipo.objects.create(usuario=self.liga['usuario'], nombre='Recién llegado', entrenador='E',
+                                       ciudad='Jaén', deporte=self.liga['deporte'])
+        self.assertEqual(Equipo.objects.filter(pk=equipo.pk).values_list('elo', 'elo_partidos').get(), (ELO_INICIAL, 0))
+
+
+#====== Buscador ======
+
+class BusquedaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('buscador', is_staff=True)
+        cls.deporte = Deporte.objects.create(nombre='Balonmano', sistema_puntuacion=Deporte.SistemaPuntuacion.GOLES,
+                                             jugadores_por_equipo=1)
+        cls.torneo = Torneo.objects.create(nombre='Copa Sur', temporada='2025/2026', deporte=cls.deporte)
+        cls.atletico = Equipo.objects.create(usuario=cls.usuario, nombre='Atlético Málaga', entrenador='Íñigo Peña',
+                                             ciudad='Málaga', deporte=cls.deporte)
+        cls.rival = Equipo.objects.create(usuario=cls.usuario, nombre='Club Cádiz', entrenador='Ana',
+                                          ciudad='Cádiz', deporte=cls.deporte)
+        cls.jugador = Jugador.objects.create(nombre='Lucía Muñoz', dorsal=9, equipo=cls.atletico)
+        cls.partido = Partido.objects.create(usuario=cls.usuario, torneo=cls.torneo, fecha_hora=timezone.now(),
+                                             lugar='Málaga', jornada='Jornada 1', equipo_local=cls.atletico,
+                                             equipo_visitante=cls.rival)
+
+    def titulos(self, texto, tipos=None, **opciones):
+        return [documento.titulo for documento in busqueda.buscar(texto, tipos, **opciones)[0]]
+
+    def test_prefijos_sin_tildes_ni_mayusculas(self):
+        self.assertEqual(self.titulos('atl mal'), ['Atlético Málaga'])
+        self.assertEqual(self.titulos('LUCIA munoz'), ['Lucía Muñoz'])
+        self.assertEqual(self.titulos('inigo'), ['Atlético Málaga'])#por el entrenador
+        self.assertEqual(self.titulos('copa 2025'), ['Copa Sur (2025/2026)'])
+        self.assertEqual(self.titulos('atl cadiz'), [])#todas las palabras
+
+    def test_partidos_detras_y_por_tipo(self):
+        self.assertEqual(self.titulos('malaga'), ['Atlético Málaga', 'Atlético Málaga vs Club Cádiz'])
+        self.assertEqual(self.titulos('malaga', [DocumentoBusqueda.Tipo.PARTIDO]), ['Atlético Málaga vs Club Cádiz'])
+
+    def test_texto_con_sintaxis_de_fts(self):
+        for texto in ('"atl', 'atl*', 'atl OR cadiz', 'NEAR(atl)', 'atl -mal', '^', '   '):
+            busqueda.buscar(texto)
+        self.assertEqual(self.titulos('"atl*"'), ['Atlético Málaga'])
+
+    def test_renombrar_rehace_los_que_lo_citan(self):
+        self.atletico.nombre = 'Real Málaga'
+        self.atletico.save()
+        self.assertEqual(self.titulos('atl'), [])
+        self.assertEqual(self.titulos('real', [DocumentoBusqueda.Tipo.EQUIPO]), ['Real Málaga'])
+        self.assertEqual(DocumentoBusqueda.objects.get(tipo=DocumentoBusqueda.Tipo.JUGADOR, objeto_id=self.jugador.pk).detalle,
+                         'Real Málaga · #9')
+        self.assertEqual(self.titulos('malaga', [DocumentoBusqueda.Tipo.PARTIDO]), ['Real Málaga vs Club Cádiz'])
+        self.deporte.nombre = 'Fútbol sala'
+        self.deporte.save()
+        self.assertTrue(DocumentoBusqueda.objects.get(tipo=DocumentoBusqueda.Tipo.EQUIPO, objeto_id=self.rival.pk)
+                        .detalle.endswith('Fútbol sala'))
+
+    def test_borrar(self):
+        self.atletico.delete()#sus partidos se borran en cascada y sus jugadores se quedan sin equipo
+        self.assertEqual(self.titulos('malaga'), [])
+        self.assertEqual(DocumentoBusqueda.objects.get(tipo=DocumentoBusqueda.Tipo.JUGADOR, objeto_id=self.jugador.pk).detalle,
+                         'Sin equipo · #9')
+
+    def test_paginas(self):
+        for i in range(5):
+            Equipo.objects.create(usuario=self.usuario, nombre=f'Atlético {i}', entrenador='E', ciudad='Ronda', deporte=self.deporte)
+        primera, hay_mas = busqueda.buscar('ronda', por_pagina=3)
+        segunda, hay_mas_despues = busqueda.buscar('ronda', pagina=2, por_pagina=3)
+        self.assertEqual((len(primera), hay_mas, len(segunda), hay_mas_despues), (3, True, 2, False))
+        self.assertFalse({d.pk for d in primera} & {d.pk for d in segunda})
+
+    def test_reindexar(self):
+        DocumentoBusqueda.objects.all().delete()
+        self.assertEqual(self.titulos('atl'), [])
+        resumen = busqueda.reindexar()
+        self.assertEqual(resumen, {DocumentoBusqueda.Tipo.EQUIPO: 2, DocumentoBusqueda.Tipo.JUGADOR: 1,
+                                   DocumentoBusqueda.Tipo.TORNEO: 1, DocumentoBusqueda.Tipo.PARTIDO: 1})
+        self.assertEqual(self.titulos('atl mal'), ['Atlético Málaga'])
+
+    @skipUnless(connection.vendor == 'sqlite', "el indice FTS5 es de SQLite")
+    def test_indice_fts_al_dia(self):
+        # Los triggers mantienen la tabla FTS de contenido externo: 'integrity-check' falla si se ha desviado
+        self.atletico.nombre = 'Real Málaga'
+        self.atletico.save()
+        self.jugador.delete()
+        fts = connection.ops.quote_name(busqueda.TABLA_FTS)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {fts}({fts}, rank) VALUES ('integrity-check', 1)")
+            cursor.execute(f"SELECT count(*) FROM {fts}")
+            self.assertEqual(cursor.fetchone()[0], DocumentoBusqueda.objects.count())
+
+    def test_vista_y_api(self):
+        response = self.client.get(reverse('buscar'), {'q': 'atl', 'tipo': ['equipo', 'nada']})
+        self.assertEqual([d.titulo for d in response.context['resultados']], ['Atlético Málaga'])
+        self.assertEqual(response.context['tipos'], ['equipo'])
+        self.assertEqual(self.client.get('/api/buscar/').status_code, 400)
+        for i in range(busqueda.POR_PAGINA):
+            Jugador.objects.create(nombre=f'Malagueño {i}', equipo=self.rival)
+        datos = self.client.get('/api/buscar/', {'q': 'malag'}).json()
+        self.assertEqual(len(datos['resultados']), busqueda.POR_PAGINA)
+        self.assertIn('pagina=2', datos['siguiente'])
+        datos = self.client.get(datos['siguiente']).json()
+        self.assertEqual((len(datos['resultados']), datos['siguiente']), (2, None))
+        self.assertEqual(datos['resultados'][-1]['titulo'], 'Atlético Málaga vs Club Cádiz')#los partidos, los ultimos
+
+
+#====== Replicas de lectura ======
+
+@patch('SportApp.replicas.REPLICAS', ['replica_1'])
+@override_settings(OLYMPO_REPLICA_PEGAJOSA=7)
+class ReplicasTests(SimpleTestCase):
+    # Sin base de datos: solo a donde manda el router cada lectura y escritura. En un TestCase todo iria a la
+    # principal, porque las pruebas corren dentro de una transaccion
+    def setUp(self):
+        self.router = RouterReplicas()
+        self.factory = RequestFactory()
+        self.lecturas = []
+
+    def vista(self, escribir=False):
+        def vista(request):
+            self.lecturas.append(self.router.db_for_read(Equipo))
+            if escribir:
+                self.assertEqual(self.router.db_for_write(Equipo), 'default')
+                self.lecturas.append(self.router.db_for_read(Equipo))
+            with solo_primaria():
+                self.lecturas.append(self.router.db_for_read(Equipo))
+            return HttpResponse()
+        return vista
+
+    def test_fuera_de_una_peticion_todo_a_la_principal(self):
+        self.assertEqual((self.router.db_for_read(Equipo), self.router.db_for_write(Equipo)), ('default', 'default'))
+
+    def test_lectura(self):
+        response = ReplicasMiddleware(self.vista())(self.factory.get('/'))
+        self.assertEqual(self.lecturas, ['replica_1', 'default'])
+        self.assertNotIn(COOKIE, response.cookies)
+
+    def test_leer_despues_de_escribir(self):
+        response = ReplicasMiddleware(self.vista(escribir=True))(self.factory.get('/'))
+        self.assertEqual(self.lecturas, ['replica_1', 'default', 'default'])
+        self.assertEqual(response.cookies[COOKIE]['max-age'], 7)
+        self.assertTrue(response.cookies[COOKIE]['httponly'])
+
+    def test_post_lee_de_la_principal_y_deja_la_cookie(self):
+        response = ReplicasMiddleware(self.vista())(self.factory.post('/'))
+        self.assertEqual(self.lecturas, ['default', 'default'])
+        self.assertIn(COOKIE, response.cookies)
+
+    def test_pegajosa(self):
+        request = self.factory.get('/')
+        request.COOKIES[COOKIE] = '1'
+        response = ReplicasMiddleware(self.vista())(request)
+        self.assertEqual(self.lecturas, ['default', 'default'])
+        self.assertNotIn(COOKIE, response.cookies)#no se renueva si no vuelve a escribir
+
+    def test_cada_peticion_empieza_de_cero(self):
+        ReplicasMiddleware(self.vista(escribir=True))(self.factory.get('/'))
+        ReplicasMiddleware(self.vista())(self.factory.get('/'))
+        self.assertEqual(self.lecturas[-2:], ['replica_1', 'default'])
+        self.assertEqual(self.router.db_for_read(Equipo), 'default')
+
+    async def test_asincrono(self):
+        async def vista(request):
+            antes = self.router.db_for_read(Equipo)
+            await sync_to_async(self.router.db_for_write)(Equipo)#en otro hilo, con una copia del contexto
+            return HttpResponse(f'{antes},{self.router.db_for_read(Equipo)}')
+        response = await ReplicasMiddleware(vista)(self.factory.get('/'))
+        self.assertEqual(response.content, b'replica_1,default')
+        self.assertIn(COOKIE, response.cookies)
+
+    @patch('SportApp.replicas.ALIAS', {'default', 'replica_1'})
+    def test_migraciones_y_relaciones(self):
+        self.assertTrue(self.router.allow_migrate('default', 'SportApp'))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'SportApp'))
+        equipo, deporte = Equipo(), Deporte()
+        equipo._state.db, deporte._state.db = 'replica_1', 'default'
+        self.assertTrue(self.router.allow_relation(equipo, deporte))
+        deporte._state.db = 'otra'
+        self.assertFalse(self.router.allow_relation(equipo, deporte))
+
+    def test_sin_replicas_no_hace_nada(self):
+        with patch('SportApp.replicas.REPLICAS', []):
+            with self.assertRaises(MiddlewareNotUsed):
+                ReplicasMiddleware(self.vista())
+            self.assertEqual(self.router.db_for_read(Equipo), 'default')
+
+
+#====== Imagenes ======
+
+class DerivadosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.liga = crear_liga(equipos=2, jugadores=1)
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def png(self, color='red'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (200, 100), color).save(buffer, 'PNG')
+        return SimpleUploadedFile('escudo.png', buffer.getvalue(), content_type='image/png')
+
+    def tareas(self):
+        return list(Tarea.objects.filter(nombre='derivados').order_by('pk').values_list('argumentos', 'estado'))
+
+    def test_una_tarea_pendiente_por_imagen(self):
+        equipo, otro = self.liga['equipos']
+        equipo.escudo = self.png()
+        equipo.save()
+        equipo.ciudad = 'Cádiz'#sin derivados todavia: la imagen sigue pareciendo nueva
+        equipo.save()
+        equipo.escudo = self.png('blue')
+        equipo.save()
+        argumentos = {'modelo': 'SportApp.Equipo', 'pk': equipo.pk, 'campo': 'escudo'}
+        self.assertEqual(self.tareas(), [(argumentos, Tarea.EstadoTarea.PENDIENTE)])
+
+        Tarea.objects.update(estado=Tarea.EstadoTarea.EN_CURSO)#puede haber leido la imagen anterior
+        equipo.save()
+        otro.escudo = self.png()
+        otro.save()
+        self.assertEqual([estado for _, estado in self.tareas()],
+                         [Tarea.EstadoTarea.EN_CURSO, Tarea.EstadoTarea.PENDIENTE, Tarea.EstadoTarea.PENDIENTE])
+        self.assertEqual(self.tareas()[2][0]['pk'], otro.pk)
+
+    def test_la_tarea_genera_los_de_la_imagen_actual(self):
+        jugador = Jugador.objects.first()
+        jugador.foto = self.png()
+        jugador.save()
+        jugador.foto = self.png('blue')
+        jugador.save()
+        tarea = Tarea.objects.get(nombre='derivados')
+        ejecutar_ahora(tarea.pk)
+        jugador.refresh_from_db()
+        self.assertEqual(jugador.foto_derivados['origen'], jugador.foto.name)
+        self.assertTrue(jugador.foto_derivados['tamanos'])
+        jugador.save()#con sus derivados al dia ya no se encola nada
+        self.assertEqual(Tarea.objects.filter(nombre='derivados').count(), 1)
+
+
+#====== Ligas ======
+
+class LigaTests(TestCase):
+    def comprobar(self, n, ida_y_vuelta=False):
+        equipos = list(range(n))
+        rondas = rondas_liga(equipos, ida_y_vuelta)
+        vueltas = 2 if ida_y_vuelta else 1
+        por_vuelta = n - 1 if n % 2 == 0 else n
+        self.assertEqual(len(rondas), por_vuelta * vueltas)
+        for ronda in rondas:
+            en_ronda = [equipo for partido in ronda for equipo in partido]
+            self.assertEqual(len(en_ronda), len(set(en_ronda)))#nadie juega dos veces en la misma jornada
+            self.assertEqual(len(ronda), n // 2)
+        for vuelta in range(vueltas):
+            partidos = [partido for ronda in rondas[vuelta * por_vuelta:(vuelta + 1) * por_vuelta] for partido in ronda]
+            self.assertEqual(len(partidos), n * (n - 1) // 2)
+            self.assertEqual({frozenset(p) for p in partidos}, {frozenset(p) for p in combinations(equipos, 2)})
+            if n % 2:
+                # Con impares cada equipo descansa exactamente una jornada por vuelta
+                descansos = [set(equipos) - {e for p in ronda for e in p}
+                             for ronda in rondas[vuelta * por_vuelta:(vuelta + 1) * por_vuelta]]
+                self.assertTrue(all(len(d) == 1 for d in descansos))
+                self.assertEqual(set().union(*descansos), set(equipos))
+        if ida_y_vuelta:
+            ida = {p for ronda in rondas[:por_vuelta] for p in ronda}
+            vuelta = {p for ronda in rondas[por_vuelta:] for p in ronda}
+            self.assertEqual(vuelta, {(b, a) for a, b in ida})#mismos cruces con el campo cambiado
+
+    def test_metodo_del_circulo(self):
+        for n in (2, 3, 4, 5, 8, 11, 20, 33):
+            for ida_y_vuelta in (False, True):
+                with self.subTest(equipos=n, ida_y_vuelta=ida_y_vuelta):
+                    self.comprobar(n, ida_y_vuelta)
+
+    def test_campo_repartido(self):
+        # En una vuelta cada equipo juega en casa la mitad de sus partidos, redondeando hacia arriba o hacia abajo
+        for n in (10, 11, 20):
+            rondas = rondas_liga(range(n))
+            partidos = n - 1
+            for equipo in range(n):
+                en_casa = sum(1 for ronda in rondas for local, _ in ronda if local == equipo)
+                self.assertIn(en_casa, {partidos // 2, (partidos + 1) // 2})
+
+    def test_liga_de_cientos_de_equipos(self):
+        # Medida de rendimiento: unos cientos de equipos y decenas de miles de partidos sin instancias ni save()
+        usuario = User.objects.create_user('organizador', is_staff=True)
+        deporte = Deporte.objects.create(nombre='Fútbol', sistema_puntuacion=Deporte.SistemaPuntuacion.GOLES)
+        torneo = Torneo.objects.create(nombre='Liga grande', temporada='2025/2026', deporte=deporte)
+        n = 200
+        insertar_filas(Equipo, ('usuario', 'nombre', 'entrenador', 'ciudad', 'deporte', 'escudo', 'escudo_derivados',
+                                'elo', 'elo_partidos'),
+                       [(usuario.pk, f'Equipo {i:03}', 'E', f'Ciudad {i}', deporte.pk, '', {}, ELO_INICIAL, 0) for i in range(n)])
+        hoy = timezone.localdate()
+        insertar_filas(Inscripcion, ('torneo', 'equipo', 'fecha_inscripcion', 'ha_pagado', 'puntos_acumulados',
+                                     'partidos_jugados', 'ganados', 'empatados', 'perdidos', 'tantos_favor', 'tantos_contra'),
+                       [(torneo.pk, pk, hoy, False, 0, 0, 0, 0, 0, 0, 0) for pk in Equipo.objects.values_list('pk', flat=True)])
+
+        inicio = time.perf_counter()
+        with CaptureQueriesContext(connection) as consultas:
+            creados = generar_liga(torneo, usuario, timezone.now())
+        segundos = time.perf_counter() - inicio
+        self.assertEqual(creados, n * (n - 1) // 2)
+        self.assertLess(segundos, 10)
+        self.assertLess(len(consultas), creados / 100)#por lotes (insercion y documentos del buscador), no una por partido
+
+        jornadas = Partido.objects.filter(torneo=torneo).values('jornada').distinct().count()
+        self.assertEqual(jornadas, n - 1)
+        self.assertFalse(Partido.objects.filter(torneo=torneo).values('jornada', 'equipo_local')
+                         .annotate(n=models.Count('id')).filter(n__gt=1).exists())
+        self.assertFalse(Partido.objects.filter(torneo=torneo).values('jornada', 'equipo_visitante')
+                         .annotate(n=models.Count('id')).filter(n__gt=1).exists())
+
+    def test_sedes_sin_coincidencias(self):
+        liga = crear_liga(equipos=7, jugadores=1)
+        Partido.objects.all().delete()
+        generar_liga(liga['torneo'], liga['usuario'], timezone.now(), sedes=['Norte', 'Sur'], horarios=[
+            time_(10), time_(12)])
+        partidos = Partido.objects.filter(torneo=liga['torneo'])
+        self.assertEqual(partidos.count(), 21)
+        self.assertEqual(partidos.values('lugar', 'fecha_hora').distinct().count(), 21)
+        self.assertEqual(set(partidos.values_list('lugar', flat=True)), {'Norte', 'Sur'})
+
+
+#====== Cola de tareas ======
+
+def _tarea_que_falla(**argumentos):
+    raise RuntimeError('no sale')
+
+
+@patch.dict(tareas.TAREAS, {'fallar': (_tarea_que_falla, 3)})
+class TareasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+        cls.usuario = User.objects.create_user('normal')
+
+    def estado(self, tarea):
+        tarea.refresh_from_db()
+        return tarea.estado
+
+    def test_encolar(self):
+        tarea = tareas.encolar('recalcular_estadisticas', self.usuario)
+        self.assertEqual((tarea.estado, tarea.max_intentos, tarea.intentos), (Tarea.EstadoTarea.PENDIENTE, 2, 0))
+        with self.assertRaises(ValueError):
+            tareas.encolar('no_existe')
+
+    @override_settings(OLYMPO_TAREAS_EN_LINEA=True)
+    def test_en_linea_al_confirmar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tarea = tareas.encolar('recalcular_enfrentamientos')
+            self.assertEqual(self.estado(tarea), Tarea.EstadoTarea.PENDIENTE)
+        self.assertEqual(self.estado(tarea), Tarea.EstadoTarea.HECHA)
+        self.assertEqual(tarea.resultado, {'filas': 0})
+
+    def test_dos_trabajadores_no_reclaman_la_misma(self):
+        primera, segunda = tareas.encolar('recalcular_estadisticas'), tareas.encolar('recalcular_estadisticas')
+        # B leyo las dos pendientes, pero A reclama la primera antes que el
+        self.assertEqual(tareas._reclamar([primera.pk], 'A', timezone.now()).pk, primera.pk)
+        reclamada = tareas._reclamar([primera.pk, segunda.pk], 'B', timezone.now())
+        self.assertEqual((reclamada.pk, reclamada.trabajador, reclamada.intentos), (segunda.pk, 'B', 1))
+        self.assertIsNone(tareas.reclamar('C'))
+        self.assertIsNone(tareas._reclamar([primera.pk], 'C', timezone.now()))
+        self.assertEqual(Tarea.objects.get(pk=primera.pk).trabajador, 'A')
+
+    def test_reclamar_por_orden_y_solo_las_que_tocan(self):
+        futura = tareas.encolar('recalcular_estadisticas')
+        Tarea.objects.filter(pk=futura.pk).update(ejecutar_desde=timezone.now() + timedelta(minutes=5))
+        vieja = tareas.encolar('recalcular_estadisticas')
+        Tarea.objects.filter(pk=vieja.pk).update(ejecutar_desde=timezone.now() - timedelta(minutes=5))
+        nueva = tareas.encolar('recalcular_estadisticas')
+        self.assertEqual([tareas.reclamar('A').pk, tareas.reclamar('A').pk, tareas.reclamar('A')], [vieja.pk, nueva.pk, None])
+
+    def test_reintentos_cada_vez_mas_espaciados_y_fallida(self):
+        tarea = tareas.encolar('fallar')
+        esperas = []
+        for intento in range(3):
+            Tarea.objects.filter(pk=tarea.pk).update(ejecutar_desde=timezone.now())
+            antes = timezone.now()
+            with self.assertLogs('SportApp.tareas', 'ERROR'):
+                estado = tareas.ejecutar(tareas.reclamar('A'))
+            tarea.refresh_from_db()
+            if estado == Tarea.EstadoTarea.PENDIENTE:
+                esperas.append(round((tarea.ejecutar_desde - antes).total_seconds()))
+                self.assertIsNone(tareas.reclamar('A'))#hasta que pase la espera
+        self.assertEqual(esperas, [tareas.ESPERA_REINTENTO, 2 * tareas.ESPERA_REINTENTO])
+        self.assertEqual((tarea.estado, tarea.intentos), (Tarea.EstadoTarea.FALLIDA, 3))
+        self.assertIn('RuntimeError: no sale', tarea.error)
+        self.assertIsNotNone(tarea.terminada)
+
+    def test_rescatar_colgadas(self):
+        hace_mucho = timezone.now() - tareas.TIEMPO_MAXIMO - timedelta(minutes=1)
+        reintentable, agotada, reciente = (tareas.encolar('recalcular_estadisticas') for _ in range(3))
+        Tarea.objects.filter(pk=reintentable.pk).update(estado=Tarea.EstadoTarea.EN_CURSO, iniciada=hace_mucho, intentos=1)
+        Tarea.objects.filter(pk=agotada.pk).update(estado=Tarea.EstadoTarea.EN_CURSO, iniciada=hace_mucho, intentos=2)
+        Tarea.objects.filter(pk=reciente.pk).update(estado=Tarea.EstadoTarea.EN_CURSO, iniciada=timezone.now(), intentos=1)
+        self.assertEqual(tareas.rescatar_colgadas(), 2)
+        self.assertEqual([self.estado(t) for t in (reintentable, agotada, reciente)],
+                         [Tarea.EstadoTarea.PENDIENTE, Tarea.EstadoTarea.FALLIDA, Tarea.EstadoTarea.EN_CURSO])
+
+    def test_limpiar_solo_las_hechas_viejas(self):
+        vieja, reciente, fallida = (tareas.encolar('recalcular_estadisticas') for _ in range(3))
+        antiguo = timezone.now() - timedelta(days=tareas.DIAS_CONSERVAR + 1)
+        Tarea.objects.filter(pk__in=(vieja.pk, reciente.pk)).update(estado=Tarea.EstadoTarea.HECHA, terminada=antiguo)
+        Tarea.objects.filter(pk=reciente.pk).update(terminada=timezone.now())
+        Tarea.objects.filter(pk=fallida.pk).update(estado=Tarea.EstadoTarea.FALLIDA, terminada=antiguo)
+        self.assertEqual(tareas.limpiar(), 1)
+        self.assertEqual(set(Tarea.objects.values_list('pk', flat=True)), {reciente.pk, fallida.pk})
+
+    def test_trabajar_una_vez(self):
+        for _ in range(3):
+            tareas.encolar('recalcular_enfrentamientos')
+        self.assertEqual(tareas.trabajar('A', una_vez=True), 3)
+        self.assertEqual(set(Tarea.objects.values_list('estado', flat=True)), {Tarea.EstadoTarea.HECHA})
+        self.assertEqual(tareas.trabajar('A', una_vez=True), 0)
+
+    def test_orden_trabajador(self):
+        for senal in (signal.SIGINT, signal.SIGTERM):#la orden pone los suyos
+            self.addCleanup(signal.signal, senal, signal.getsignal(senal))
+        tareas.encolar('recalcular_enfrentamientos')
+        salida = io.StringIO()
+        call_command('trabajador', '--una-vez', stdout=salida)
+        self.assertIn('1 tareas ejecutadas', salida.getvalue())
+        self.assertEqual(Tarea.objects.get().estado, Tarea.EstadoTarea.HECHA)
+
+    def test_api_recalcular_solo_staff(self):
+        url = reverse('tarea-recalcular')
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.post(url, {'tipo': 'elo'}, content_type='application/json').status_code, 403)
+        self.assertFalse(Tarea.objects.exists())
+        self.client.force_login(self.staff)
+        response = self.client.post(url, {'tipo': 'clasificacion', 'torneos': [3]}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Tarea.objects.values_list('nombre', 'argumentos', 'usuario').get(),
+                         ('recalcular_clasificacion', {'torneos': [3]}, self.staff.pk))
+        self.assertEqual(self.client.post(url, {'tipo': 'nada'}, content_type='application/json').status_code, 400)
+
+    def test_api_reintentar_solo_fallidas_y_staff(self):
+        tarea = tareas.encolar('recalcular_estadisticas', self.usuario)
+        url = reverse('tarea-reintentar', args=[tarea.pk])
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.post(url).status_code, 403)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.post(url).status_code, 400)#todavia pendiente
+        Tarea.objects.filter(pk=tarea.pk).update(estado=Tarea.EstadoTarea.FALLIDA, intentos=2, terminada=timezone.now())
+        self.assertEqual(self.client.post(url).status_code, 202)
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos, tarea.terminada), (Tarea.EstadoTarea.PENDIENTE, 0, None))
+
+    def test_api_cada_uno_ve_las_suyas(self):
+        suya, ajena = tareas.encolar('recalcular_estadisticas', self.usuario), tareas.encolar('recalcular_estadisticas', self.staff)
+        self.assertEqual(self.client.get('/api/tareas/').status_code, 403)
+        self.client.force_login(self.usuario)
+        self.assertEqual([t['id'] for t in self.client.get('/api/tareas/').json()['results']], [suya.pk])
+        self.client.force_login(self.staff)
+        self.assertEqual({t['id'] for t in self.client.get('/api/tareas/').json()['results']}, {suya.pk, ajena.pk})
+
+
+#====== Instrumentacion ======
+
+class InstrumentacionTests(TestCase):
+    def setUp(self):
+        metricas.reiniciar()
+        self.addCleanup(metricas.reiniciar)
+
+    def test_formato_prometheus(self):
+        etiquetas = {'vista': 'raro "x"\\y\nz'}
+        for valor in (0.003, 0.2, 20):
+            metricas.observar('olympo_peticion_segundos', etiquetas, valor)
+        metricas.observar('olympo_peticiones_lentas_total', {'vista': 'a'}, 1)
+        metricas.observar('olympo_peticiones_lentas_total', {'vista': 'a'}, 1)
+        lineas = metricas.exportar().splitlines()
+        self.assertIn('# TYPE olympo_peticion_segundos histogram', lineas)
+        self.assertIn('# TYPE olympo_peticiones_lentas_total counter', lineas)
+        vista = 'vista="raro \\"x\\"\\\\y\\nz"'
+        self.assertIn(f'olympo_peticion_segundos_bucket{{{vista},le="0.005"}} 1', lineas)
+        self.assertIn(f'olympo_peticion_segundos_bucket{{{vista},le="0.25"}} 2', lineas)#acumulados
+        self.assertIn(f'olympo_peticion_segundos_bucket{{{vista},le="10.0"}} 2', lineas)
+        self.assertIn(f'olympo_peticion_segundos_bucket{{{vista},le="+Inf"}} 3', lineas)
+        self.assertIn(f'olympo_peticion_segundos_count{{{vista}}} 3', lineas)
+        suma = next(l for l in lineas if l.startswith('olympo_peticion_segundos_sum'))
+        self.assertAlmostEqual(float(suma.rsplit(' ', 1)[1]), 20.203)
+        self.assertIn('olympo_peticiones_lentas_total{vista="a"} 2', lineas)
+        self.assertEqual(len([l for l in lineas if l.startswith('olympo_peticion_segundos_bucket')]),
+                         len(metricas.BUCKETS_SEGUNDOS) + 1)
+
+    @override_settings(OLYMPO_METRICAS_TOKEN='secreto')
+    def test_acceso_a_metrics(self):
+        url = reverse('metricas')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer otro').status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.client.force_login(User.objects.create_user('normal'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.assertContains(self.client.get(url), '# HELP olympo_consultas ')
+
+    @override_settings(OLYMPO_METRICAS_TOKEN='')
+    def test_sin_token_solo_staff(self):
+        self.assertEqual(self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    @override_settings(OLYMPO_INSTRUMENTACION=False)
+    def test_desactivada_sale_de_la_cadena(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            InstrumentacionMiddleware(lambda request: HttpResponse())
+
+    @override_settings(OLYMPO_INSTRUMENTACION=True, OLYMPO_INSTRUMENTACION_MUESTREO=1.0, OLYMPO_PETICION_LENTA_MS=100000)
+    def test_mide_cada_vista(self):
+        crear_liga(equipos=3, jugadores=1)
+        self.client.get(reverse('torneo_lista'))
+        self.client.get(reverse('torneo_lista'))
+        texto = metricas.exportar()
+        self.assertIn('olympo_peticion_segundos_count{metodo="GET",vista="torneo_lista"} 2', texto)
+        self.assertIn('olympo_plantillas_segundos_count{vista="torneo_lista"} 2', texto)
+        consultas = [l for l in texto.splitlines() if l.startswith('olympo_consultas_sum{vista="torneo_lista"}')]
+        self.assertEqual(len(consultas), 1)
+        self.assertGreater(float(consultas[0].rsplit(' ', 1)[1]), 0)
+        self.assertNotIn('olympo_peticiones_lentas_total{', texto)
+
+    @override_settings(OLYMPO_INSTRUMENTACION=True, OLYMPO_INSTRUMENTACION_MUESTREO=0.0, OLYMPO_PETICION_LENTA_MS=0)
+    def test_lentas_aunque_no_esten_en_la_muestra(self):
+        with self.assertLogs('SportApp.middleware', 'WARNING') as log:
+            self.client.get(reverse('torneo_lista'))
+        self.assertIn('Petición lenta GET', log.output[0])
+        texto = metricas.exportar()
+        self.assertIn('olympo_peticiones_lentas_total{vista="torneo_lista"} 1', texto)
+        self.assertNotIn('olympo_peticion_segundos_count', texto)
+
+
+#====== Directo ======
+
+class DirectoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.liga = crear_liga(equipos=3, jugadores=1)
+        cls.partido = cls.liga['partidos'][0]
+
+    def setUp(self):
+        self.broker = BrokerMemoria()
+        self.bucle = asyncio.new_event_loop()
+        self.addCleanup(self.bucle.close)
+
+    def suscribir(self, partido_id):
+        async def suscribir():
+            return self.broker.suscribir(partido_id)#necesita el bucle en marcha
+        return self.bucle.run_until_complete(suscribir())
+
+    def recibir(self, suscripcion):
+        return self.bucle.run_until_complete(suscripcion.recibir(timeout=0.05))
+
+    def datos(self, **cambios):
+        return dict({'id': 1, 'estado': 'JUGANDO', 'marcador_local': 1, 'marcador_visitante': 0, 'lugar': 'x'}, **cambios)
+
+    def test_publica_solo_al_confirmar(self):
+        suscripcion = self.suscribir(1)
+        with patch('SportApp.directo.get_broker', return_value=self.broker):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                publicar_al_confirmar(self.datos())
+                self.assertIsNone(self.recibir(suscripcion))#todavia sin confirmar
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.recibir(suscripcion),
+                         {'id': 1, 'estado': 'JUGANDO', 'marcador_local': 1, 'marcador_visitante': 0})
+
+    def test_se_descarta_con_rollback(self):
+        suscripcion = self.suscribir(1)
+        with patch('SportApp.directo.get_broker', return_value=self.broker):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with transaction.atomic():
+                    publicar_al_confirmar(self.datos())
+                    transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        self.assertIsNone(self.recibir(suscripcion))
+
+    def test_suscriptor_lento_no_bloquea(self):
+        lenta, otra = self.suscribir(1), self.suscribir(2)
+        inicio = time.perf_counter()
+        for marcador in range(1000):
+            self.assertEqual(self.broker.publicar(1, self.datos(marcador_local=marcador)), 1)
+        self.assertLess(time.perf_counter() - inicio, 1)
+        #solo guarda la ultima foto y no toca las conexiones de otros partidos
+        self.assertEqual(self.recibir(lenta)['marcador_local'], 999)
+        self.assertIsNone(self.recibir(lenta))
+        self.assertIsNone(self.recibir(otra))
+        self.assertEqual(self.broker.conexiones(), 2)
+        lenta.cerrar()
+        self.assertEqual(self.broker.conexiones(1), 0)
+        self.assertEqual(self.broker.publicar(1, self.datos()), 0)
+
+    def test_guardar_partido_publica(self):
+        suscripcion = self.suscribir(self.partido.pk)
+        with patch('SportApp.directo.get_broker', return_value=self.broker):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.partido.marcador_local = 7
+                self.partido.save()
+        self.assertEqual(self.recibir(suscripcion)['marcador_local'], 7)
+
+    async def test_vista_sse(self):
+        await self.async_client.aforce_login(self.liga['usuario'])
+        response = await self.async_client.get(reverse('directo_evento', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+        with patch('SportApp.views.get_broker', return_value=self.broker):
+            response = await self.async_client.get(reverse('directo_evento', args=[self.partido.pk]))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            self.assertEqual(response['Cache-Control'], 'no-cache')
+            contenido = response.streaming_content
+            primero = await anext(contenido)
+            self.assertIn(f'"id": {self.partido.pk}'.encode(), primero)
+            self.assertEqual(self.broker.conexiones(self.partido.pk), 1)
+            self.broker.publicar(self.partido.pk, {'id': self.partido.pk, 'marcador_local': 3})
+            self.assertIn(b'"marcador_local": 3', await anext(contenido))
+            await contenido.aclose()
+
+    async def test_vista_sse_anonimo(self):
+        response = await self.async_client.get(reverse('directo_evento', args=[self.partido.pk]))
+        self.assertEqual(response.status_code, 403)
+
+
+#====== Datos sintéticos ======
+
+class DatosSinteticosTests(TestCase):
+    TAMANOS = {'deportes': 2, 'equipos': 4, 'jugadores': 2, 'torneos': 2}
+
+    def foto(self):
+        return {
+            'equipos': list(Equipo.objects.order_by('id').values_list('ciudad', 'elo_partidos')),
+            'partidos': list(Partido.objects.order_by('id').values_list('estado', 'marcador_local', 'marcador_visitante')),
+            'lineas': list(EstadisticaPartido.objects.order_by('id').values_list('puntos', 'minutos_jugados')),
+            'puntos': list(Inscripcion.objects.order_by('id').values_list('ha_pagado', 'puntos_acumulados')),
+        }
+
+    def sembrar_y_deshacer(self, semilla):
+        with transaction.atomic():
+            creados = sembrar(semilla=semilla, **self.TAMANOS)
+            foto = self.foto()
+            transaction.set_rollback(True)
+        return creados, foto
+
+    def test_misma_semilla_mismos_datos(self):
+        creados, foto = self.sembrar_y_deshacer(7)
+        self.assertEqual(creados, self.sembrar_y_deshacer(7)[0])
+        self.assertEqual(foto, self.sembrar_y_deshacer(7)[1])
+        self.assertEqual({k: v for k, v in creados.items() if k != 'lineas'},
+                         {'deportes': 2, 'equipos': 8, 'jugadores': 16, 'torneos': 4, 'inscripciones': 16,
+                          'partidos': 48})#4 equipos a doble vuelta: 6 jornadas de 2 partidos por torneo
+        self.assertEqual(len(foto['lineas']), creados['lineas'])
+        self.assertGreater(creados['lineas'], 0)
+        self.assertNotEqual(foto['partidos'], self.sembrar_y_deshacer(8)[1]['partidos'])
+
+    def test_semilla_repetida(self):
+        sembrar(semilla=3, **self.TAMANOS)
+        with self.assertRaisesMessage(ValueError, "semilla 3"):
+            sembrar(semilla=3, **self.TAMANOS)
+        sembrar(semilla=4, **self.TAMANOS)#otra semilla convive con la primera
+        self.assertEqual(Deporte.objects.count(), 4)
+
+    def test_urls_a_medir(self):
+        sembrar(**self.TAMANOS)
+        usuario = User.objects.get(username='sintetico')
+        usuario.is_staff = True
+        usuario.save(update_fields=['is_staff'])
+        tareas.encolar('recalcular_elo', usuario)#como hace el comando
+        rutas, saltadas = urls_a_medir()
+        self.assertEqual(dict(saltadas), EXCLUIDAS)#solo las que se excluyen a proposito
+        nombres = [nombre for nombre, _ in rutas]
+        self.assertEqual(set(nombres) | set(EXCLUIDAS), {patron.name for patron in _rutas(urls.urlpatterns)})
+        self.client.force_login(usuario)
+        for nombre, url in rutas:
+            self.assertLess(self.client.get(url).status_code, 400, nombre)
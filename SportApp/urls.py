@@ -7,11 +7,15 @@ router = routers.DefaultRouter()
 router.register(r'equipos', views.EquipoViewSet)
 router.register(r'jugadores', views.JugadorViewSet)
 router.register(r'partidos', views.PartidoViewSet)
+router.register(r'enfrentamientos', views.EnfrentamientoViewSet)
+router.register(r'tareas', views.TareaViewSet)
+router.register(r'buscar', views.BusquedaViewSet, basename='buscar')
 urlpatterns = [
 
     path('', views.inicio, name='inicio'),
     path('eventos/', views.ver_eventos, name='ver_eventos'),
     path('eventos/<int:evento_pk>/', views.detalle_evento, name='detalle_evento'),
+    path('eventos/<int:evento_pk>/directo/', views.directo_evento, name='directo_evento'),
     path('partido/<int:partido_id>/marcador/<str:accion>/', views.actualizar_marcador, name='actualizar_marcador'),
     path('añadir_evento/', views.EventoCreateView.as_view(), name='añadir_evento'),
     
@@ -26,6 +30,7 @@ urlpatterns = [
     # URLs para Equipos (CBV)
     path('equipos/', views.EquipoListView.as_view(), name='equipo_lista'),
     path('equipos/<int:equipo_id>/', views.ver_equipo, name='ver_equipo'),
+    path('equipos/<int:equipo_id>/contra/<int:rival_id>/', views.enfrentamiento, name='enfrentamiento'),
     path('equipos/crear/', views.EquipoCreateView.as_view(), name='equipo_crear'),
     path('equipos/<int:pk>/editar/', views.EquipoUpdateView.as_view(), name='equipo_editar'),
     path('equipos/<int:pk>/eliminar/', views.EquipoDeleteView.as_view(), name='equipo_eliminar'),
@@ -41,6 +46,12 @@ urlpatterns = [
     path('torneos/crear/', views.TorneoCreateView.as_view(), name='torneo_crear'),
     path('torneos/<int:pk>/editar/', views.TorneoUpdateView.as_view(), name='torneo_editar'),
     path('torneos/<int:pk>/eliminar/', views.TorneoDeleteView.as_view(), name='torneo_eliminar'),
+    path('torneos/<int:pk>/calendario/generar/', views.TorneoGenerarCalendarioView.as_view(), name='torneo_generar_calendario'),
+    path('exportar/<str:tipo>.<str:formato>', views.ExportarView.as_view(), name='exportar'),
+    path('importar/', views.ImportarView.as_view(), name='importar'),
+    path('autocompletar/<str:tabla>/', views.autocompletar, name='autocompletar'),
+    path('buscar/', views.buscar_global, name='buscar'),
+    path('metrics', views.metricas, name='metricas'),
     
     # URLs para Inscripciones (CBV)
     path('inscripciones/crear/', views.InscripcionCreateView.as_view(), name='inscripcion_crear'),
@@ -55,6 +66,7 @@ urlpatterns = [
 
     path('partidos/<int:partido_pk>/estadisticas/', views.EstadisticaPartidoPorPartidoListView.as_view(), name='estadisticas_partido'),
     path('partidos/<int:partido_pk>/estadisticas/crear/', views.EstadisticaPartidoCreateView.as_view(), name='estadistica_crear_partido'),
+    path('partidos/<int:partido_pk>/estadisticas/acta/', views.ActaPartidoView.as_view(), name='acta_partido'),
 
 
     path('api/', include(router.urls)),
@@ -1,16 +1,48 @@
+import json
+from datetime import datetime, timezone as dt_timezone
+
 from django.shortcuts import render,get_object_or_404,redirect
-from django.http import Http404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 
-from SportApp.permissions import IsOwnerOrReadOnly
+from SportApp.permissions import IsOrganizerOrStaff, IsOwnerOrReadOnly
 from .models import *
-from django.views.generic import ListView, DetailView, UpdateView, CreateView, DeleteView,TemplateView
+from django.views.generic import ListView, DetailView, UpdateView, CreateView, DeleteView,TemplateView,FormView,View
+from django.contrib import messages
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_POST
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import cached_property
 from .forms import *
+from .marcador import ajustar_marcador, puede_anotar
+from .directo import get_broker, mensaje_partido
+from .estadisticas import perfil_jugador, ranking, totales
+from .enfrentamientos import enfrentamiento_de, pareja
+from .actas import CAMPOS_ACTA, guardar_acta
+from . import busqueda, jornadas
+from .exportacion import EXPORTACIONES, FORMATOS, contenido
+from .importacion import COLUMNAS, ErrorImportacion, importar
+from .autocompletar import BUSQUEDAS, buscar
+from .middleware import calidad_codificacion, presupuesto_consultas
+from .metricas import exportar as exportar_metricas
+from .cache_http import CacheApiMixin, marca_de, politica_cache
+from .calendario import (SEGUNDOS_CACHE_CALENDARIO, SeccionCalendario, ventana_desde_parametros,
+                         version_global, versiones_deportes)
 from django.urls import reverse_lazy, reverse
 from django.contrib.auth.mixins import UserPassesTestMixin, LoginRequiredMixin
 from django.contrib.auth.decorators import login_required, user_passes_test, permission_required
 #=================================================================================================
-from rest_framework import viewsets,permissions
-from .serializers import EquipoSerializer, JugadorSerializer, PartidoSerializer
+from rest_framework import viewsets,permissions,serializers
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from .serializers import (DocumentoBusquedaSerializer, EnfrentamientoSerializer, EquipoSerializer, JugadorSerializer, PartidoSerializer, LineaActaSerializer, PerfilJugadorSerializer,
+                          RecalcularSerializer, TareaSerializer)
+from .pagination import CursorPaginacionRecientes
+from .tareas import encolar
 
 class StaffRequiredMixin(UserPassesTestMixin):# mixin para restringir acceso a usuarios staff
     def test_func(self):
@@ -18,89 +50,163 @@ class StaffRequiredMixin(UserPassesTestMixin):# mixin para restringir acceso a u
 
 # Create your views here.
 
+@politica_cache(segundos=300, segundos_servidor=300)
 def inicio(request):
     return render(request, 'SportApp/inicio.html')
 
+def _calendario(request):
+    # Lo calculamos una vez por peticion: lo usan el ETag, el Last-Modified y la propia vista
+    if not hasattr(request, '_calendario'):
+        deporte_id_raw = request.GET.get('deporte')
+        deporte_id = None
+
+        # Si es un número, lo usamos, si es texto raro, lo ignoramos (deporte_id se queda en None)
+        if deporte_id_raw and str(deporte_id_raw).isdigit():
+            deporte_id = int(deporte_id_raw)
+
+        desde, hasta = ventana_desde_parametros(request.GET.get('desde'), request.GET.get('hasta'))
+        request._calendario = {
+            'deporte_id': deporte_id,
+            'desde': desde,
+            'hasta': hasta,
+            'cursor': request.GET.get('cursor', '') if deporte_id is not None else '',#el cursor solo tiene sentido dentro de un deporte
+        }
+    return request._calendario
+
+
+def _marca_calendario(request):
+    # La pagina cambia con los partidos (version global) y con la ventana pedida; quien la mira lo pone politica_cache
+    c = _calendario(request)
+    return f"{version_global()}|{c['deporte_id']}|{c['desde']}|{c['hasta']}|{c['cursor']}"
+
+
+def _modificacion_calendario(request):
+    return datetime.fromtimestamp(version_global(), tz=dt_timezone.utc)
+
+
+@politica_cache(_marca_calendario, segundos=60, segundos_servidor=SEGUNDOS_CACHE_CALENDARIO,
+                ultima_modificacion=_modificacion_calendario)
 def ver_eventos(request):
-    
-    deporte_id_raw = request.GET.get('deporte')
-    deporte_id = None
-    
-    # Si es un número, lo usamos, si es texto raro, lo ignoramos (deporte_id se queda en None)
-    if deporte_id_raw and str(deporte_id_raw).isdigit():
-        deporte_id = int(deporte_id_raw)
-    
-    
-    deportes = Deporte.objects.order_by('nombre')
-    
-    #
-    # Preparamos la superconsulta para evitar el n+1
-    partidos_qs = Partido.objects.select_related(
-        'torneo', 'torneo__deporte', 'equipo_local', 'equipo_visitante'
-    )
-    
-    #  Aplicar filtro si es valido el deporte_id
-    if deporte_id is not None:
-        partidos_qs = partidos_qs.filter(torneo__deporte_id=deporte_id)# buscamos en la relacion atraves del torneo
+    c = _calendario(request)
+    deporte_id = c['deporte_id']
 
-    # Aqui agrupamos los partidos por deporte
-    secciones = []
-    
+    deportes = list(Deporte.objects.order_by('nombre'))
     if deporte_id is not None:
-        # Un solo deporte
-        deporte = deportes.filter(id=deporte_id).first()
-        if deporte:
-            # Ejecutamos la queri aqui al hacer list()
-            secciones.append((deporte, list(partidos_qs.order_by('fecha_hora'))))
+        deportes_seccion = [d for d in deportes if d.id == deporte_id]
     else:
-        # Todos los deportes
-        # Ejecutamos una sola queri grande ordenada por deporte
-        partidos = list(partidos_qs.order_by('torneo__deporte__nombre', 'fecha_hora'))
-        
-        # agrupamos los partidos por deporte usando un diccionario temporal
-        partidos_por_deporte_id = {}
-        for partido in partidos:
-            # setdefault crea la lista si no existe y luego hace apend
-            partidos_por_deporte_id.setdefault(partido.torneo.deporte_id, []).append(partido)
-
-        # Reconstruimos la lista de secciones iterando sobre los deportes disponibles
-        for deporte in deportes:
-            partidos_del_deporte = partidos_por_deporte_id.get(deporte.id, [])
-            #mostramos la sección si tiene partidos par aque no este vacio
-            if partidos_del_deporte: 
-                secciones.append((deporte, partidos_del_deporte))
+        deportes_seccion = deportes
+
+    # Cada seccion es una pagina de un deporte dentro de la ventana; su consulta solo se lanza
+    # si el fragmento no esta en cache (ver SportApp.calendario)
+    versiones = versiones_deportes([d.id for d in deportes_seccion])
+    secciones = [
+        SeccionCalendario(deporte, c['desde'], c['hasta'], c['cursor'], versiones[deporte.id])
+        for deporte in deportes_seccion
+    ]
 
     context = {
         'deportes': deportes,
         'deporte_seleccionado': deporte_id,
         'secciones': secciones,
+        'desde': c['desde'],
+        'hasta': c['hasta'],
+        'segundos_cache': SEGUNDOS_CACHE_CALENDARIO,
     }
 
     return render(request, 'SportApp/ver_eventos.html', context)
 
 
+@presupuesto_consultas(6)#una es el cara a cara
 @login_required
 def detalle_evento(request, evento_pk):
     evento=get_object_or_404(Partido.objects.select_related('torneo','equipo_local','equipo_visitante'), pk=evento_pk)
-    return render(request, 'SportApp/detalle_evento.html', {'evento': evento})
-
-
+    enfrentamiento = enfrentamiento_de(evento.equipo_local_id, evento.equipo_visitante_id)
+    return render(request, 'SportApp/detalle_evento.html', {
+        'evento': evento,
+        'cara_a_cara': enfrentamiento.para(evento.equipo_local_id) if enfrentamiento else None,
+        'puede_anotar': puede_anotar(request.user, evento.usuario_id),
+    })
+
+
+@presupuesto_consultas(4)
+def enfrentamiento(request, equipo_id, rival_id):
+    # Historial de dos equipos leido de su fila de Enfrentamiento (SportApp.enfrentamientos), sin recorrer Partido
+    equipos = Equipo.objects.con_deporte().in_bulk([equipo_id, rival_id])
+    if equipo_id == rival_id or len(equipos) != 2:
+        raise Http404("No existe ese enfrentamiento")
+    fila = enfrentamiento_de(equipo_id, rival_id)
+    equipo, rival = equipos[equipo_id], equipos[rival_id]
+    ultimos = [
+        dict(partido, fecha=datetime.fromisoformat(partido['fecha']),
+             local=equipo if partido['local'] == equipo_id else rival,
+             visitante=rival if partido['local'] == equipo_id else equipo)
+        for partido in (fila.ultimos if fila else [])
+    ]
+    return render(request, 'SportApp/enfrentamiento.html', {
+        'equipo': equipo,
+        'rival': rival,
+        'cara_a_cara': fila.para(equipo_id) if fila else None,
+        'ultimos': ultimos,
+    })
+
+
+@require_POST
+@login_required
 def actualizar_marcador(request, partido_id, accion):
-    partido = get_object_or_404(Partido, pk=partido_id)
-    
-    if accion == 'local_sumar':
-        partido.marcador_local += 1
-    elif accion == 'local_restar' and partido.marcador_local > 0:
-        partido.marcador_local -= 1
-    elif accion == 'visitante_sumar':
-        partido.marcador_visitante += 1
-    elif accion == 'visitante_restar' and partido.marcador_visitante > 0:
-        partido.marcador_visitante -= 1
-        
-    partido.save()
-    
+    # Un solo UPDATE atomico por pulsacion (ver SportApp.marcador), sin leer-modificar-guardar.
+    # Solo anotan el organizador del partido y el staff
+    organizador = Partido.objects.filter(pk=partido_id).values_list('usuario_id', flat=True).first()
+    if organizador is None:
+        raise Http404("No existe el partido")
+    if not puede_anotar(request.user, organizador):
+        raise PermissionDenied("Solo el organizador del partido puede cambiar el marcador.")
+    partido = ajustar_marcador(partido_id, accion)
+    if partido is None:
+        raise Http404("No existe el partido")
+
+    # Desde el JS del detalle devolvemos el marcador nuevo y nos ahorramos la redireccion
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({
+            'id': partido_id,
+            'estado': partido['estado'],
+            'marcador_local': partido['marcador_local'],
+            'marcador_visitante': partido['marcador_visitante'],
+        })
+
     # Redirigimos de vuelta al detalle del evento
-    return redirect('detalle_evento', evento_pk=partido.id)
+    return redirect('detalle_evento', evento_pk=partido_id)
+
+async def directo_evento(request, evento_pk):
+    # Canal SSE del partido: el navegador se queda conectado y recibe cada cambio de marcador o estado
+    # sin volver a pedir el detalle. Las fotos llegan del broker (SportApp.directo), no de la BD.
+    usuario = await request.auser()
+    if not usuario.is_authenticated:
+        return HttpResponse(status=403)
+    if not isinstance(request, ASGIRequest):
+        # Con WSGI cada conexion abierta bloquearia un hilo; 204 hace que EventSource no reintente
+        return HttpResponse(status=204)
+
+    datos = await Partido.objects.filter(pk=evento_pk).values('id', 'estado', 'marcador_local', 'marcador_visitante').afirst()
+    if datos is None:
+        raise Http404("No existe el partido")
+
+    async def eventos():
+        suscripcion = get_broker().suscribir(evento_pk)
+        try:
+            yield f"data: {json.dumps(mensaje_partido(datos))}\n\n"
+            while True:
+                mensaje = await suscripcion.recibir(timeout=15)
+                if mensaje is None:
+                    yield ": ping\n\n"  # mantiene viva la conexion a traves de proxies
+                else:
+                    yield f"data: {json.dumps(mensaje)}\n\n"
+        finally:
+            suscripcion.cerrar()
+
+    respuesta = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
 
 class EventoCreateView(StaffRequiredMixin, CreateView):
     model = Partido
@@ -114,17 +220,29 @@ class JugadorListView(LoginRequiredMixin, ListView):
     model = Jugador
     template_name = 'SportApp/jugador_lista.html'
     context_object_name = 'jugadores'
+    presupuesto_consultas = 3
     
     def get_queryset(self):
         if self.request.user.is_staff:
-            return Jugador.objects.select_related('equipo').order_by('equipo', 'dorsal')
+            return Jugador.objects.con_equipo().order_by('equipo', 'dorsal')
 
-        return Jugador.objects.filter(equipo__usuario=self.request.user).select_related('equipo').order_by('equipo', 'dorsal')
+        return Jugador.objects.filter(equipo__usuario=self.request.user).con_equipo().order_by('equipo', 'dorsal')
 
+@method_decorator(politica_cache(lambda request, pk: marca_de(Jugador.objects.filter(pk=pk), 'equipo', 'equipo__deporte',
+                                                                'estadisticas_acumuladas'),
+                                 segundos=60, segundos_servidor=300), name='dispatch')
 class JugadorDetailView(DetailView):
+    # Ficha del jugador: los totales y la forma salen ya hechos de SportApp.estadisticas, juegue los partidos que juegue
     model = Jugador
     template_name = 'SportApp/jugador_detalle.html'
     context_object_name = 'jugador'
+    presupuesto_consultas = 5#una es la marca del ETag
+    queryset = Jugador.objects.con_equipo()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['perfil'] = perfil_jugador(self.object)
+        return context
 
 class JugadorCreateView(LoginRequiredMixin, CreateView):
     model = Jugador
@@ -159,22 +277,24 @@ class JugadorDeleteView(LoginRequiredMixin, DeleteView):
 
     
 #----------------------CBVs Para equipos -----------------------------------
+@presupuesto_consultas(5)
 @login_required
 def ver_equipo(request, equipo_id):
-    equipo = get_object_or_404(Equipo, id=equipo_id)
+    equipo = get_object_or_404(Equipo.objects.con_plantilla(), id=equipo_id)
 
     inscripciones=Inscripcion.objects.filter(equipo=equipo).select_related('torneo').order_by('torneo__nombre')
     return render(request, 'SportApp/ver_equipo.html', {'equipo': equipo,'inscripciones':inscripciones})
 
 class EquipoListView(LoginRequiredMixin,ListView):
     model = Equipo
+    presupuesto_consultas = 4
     def get_queryset(self):
         if self.request.user.is_staff:
-            return Equipo.objects.annotate(num_jugadores=models.Count('jugadores')).order_by('nombre')
+            return Equipo.objects.para_listado().order_by('nombre')
 
         queryset = Equipo.objects.filter(usuario=self.request.user)#nos quedamos con los equipos del usuario 
 
-        queryset = queryset.annotate(num_jugadores=models.Count('jugadores'))#anotamos el numero de jugadores de cada equipo
+        queryset = queryset.para_listado()#con el deporte y el numero de jugadores de cada equipo
         
         return queryset.order_by('nombre')
     
@@ -248,18 +368,28 @@ class PartidoDeleteView(StaffRequiredMixin, DeleteView):
 
 #----------------------CBVs Para TOrneo-----------------------------------
 
+@presupuesto_consultas(5)
+@politica_cache(lambda request, pk: marca_de(Torneo.objects.filter(pk=pk), 'deporte', 'inscripcion', 'inscripcion__equipo'),
+                segundos=60, segundos_servidor=300)
 def TorneoDetail(request, pk):
-    torneo = get_object_or_404(Torneo, pk=pk)
+    torneo = get_object_or_404(Torneo.objects.para_listado(), pk=pk)
     
     #repito con select_related para optimizar la consulta. Ordeamos con el"-" para que primero salgon los top
-    clasificacion=Inscripcion.objects.filter(torneo=torneo).select_related('equipo').order_by('-puntos_acumulados','equipo__nombre')
+    #las filas ya vienen calculadas (SportApp.clasificacion), aqui no se agrega ningun partido
+    clasificacion=(Inscripcion.objects.filter(torneo=torneo).select_related('equipo')
+        .annotate(diferencia=models.F('tantos_favor')-models.F('tantos_contra'))
+        .order_by('-puntos_acumulados','-diferencia','-tantos_favor','equipo__nombre'))
     context={
         'torneo': torneo,
         'clasificacion': clasificacion,
     }
     return render(request, 'SportApp/torneo_detalle.html', context)
+@method_decorator(politica_cache(lambda request: marca_de(Torneo.objects.all(), 'deporte'),
+                                 segundos=60, segundos_servidor=300), name='dispatch')
 class TorneoListView(ListView):
     model = Torneo
+    queryset = Torneo.objects.para_listado()
+    presupuesto_consultas = 4
     template_name = 'SportApp/torneo_lista.html'
     context_object_name = 'torneos'
     ordering = ['deporte', 'nombre']
@@ -281,6 +411,141 @@ class TorneoDeleteView(StaffRequiredMixin, DeleteView):
     template_name = 'SportApp/torneo_eliminar.html'
     success_url = reverse_lazy('torneo_lista')
 
+class TorneoGenerarCalendarioView(LoginRequiredMixin, StaffRequiredMixin, FormView):
+    # Crea todos los partidos del torneo de una vez (SportApp.jornadas) en vez de uno a uno
+    form_class = GenerarCalendarioForm
+    template_name = 'SportApp/generar_calendario.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        self.torneo = get_object_or_404(Torneo.objects.select_related('deporte'), pk=kwargs.get('pk'))
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['torneo'] = self.torneo
+        context['inscritos'] = Inscripcion.objects.filter(torneo=self.torneo).count()
+        return context
+
+    def form_valid(self, form):
+        datos = form.cleaned_data
+        comunes = dict(dias_entre_jornadas=datos['dias_entre_jornadas'], horarios=datos['horarios'], sedes=datos['sedes'])
+        try:
+            if datos['tipo'] == 'liga':
+                creados = jornadas.generar_liga(self.torneo, self.request.user, datos['inicio'],
+                                                ida_y_vuelta=datos['ida_y_vuelta'], reemplazar=datos['reemplazar'], **comunes)
+            elif datos['tipo'] == 'eliminatoria':
+                creados = jornadas.generar_eliminatoria(self.torneo, self.request.user, datos['inicio'],
+                                                        clasificados=datos['clasificados'], reemplazar=datos['reemplazar'], **comunes)
+            else:
+                creados = jornadas.generar_siguiente_ronda(self.torneo, self.request.user, datos['inicio'], **comunes)
+        except ValidationError as e:
+            for mensaje in e.messages:
+                messages.error(self.request, mensaje)
+            return self.form_invalid(form)
+        messages.success(self.request, f"Calendario generado: {creados} partidos.")
+        return redirect('torneo_detalle', pk=self.torneo.pk)
+
+
+class ExportarView(LoginRequiredMixin, StaffRequiredMixin, View):
+    # Descarga de partidos, clasificaciones o lineas de estadisticas (SportApp.exportacion) filtrable por
+    # ?torneo=, ?deporte= y ?temporada=. Se escribe segun se lee, asi que no importa cuantas temporadas se pidan
+    def get(self, request, tipo, formato):
+        exportacion = EXPORTACIONES.get(tipo)
+        if exportacion is None or formato not in FORMATOS:
+            raise Http404("No existe esa exportación")
+
+        filtros = {'temporada': request.GET.get('temporada') or None}
+        for campo in ('torneo', 'deporte'):
+            valor = request.GET.get(campo)
+            if valor:
+                if not valor.isdigit():
+                    return HttpResponseBadRequest(f"'{campo}' tiene que ser un id")
+                filtros[campo] = int(valor)
+
+        comprimir = calidad_codificacion(request, 'gzip') > 0
+        respuesta = StreamingHttpResponse(contenido(exportacion, formato, comprimir, **filtros),
+                                          content_type=FORMATOS[formato])
+        if comprimir:
+            respuesta['Content-Encoding'] = 'gzip'
+        respuesta['Vary'] = 'Accept-Encoding'
+        respuesta['Content-Disposition'] = f'attachment; filename="{tipo}-{timezone.localdate():%Y%m%d}.{formato}"'
+        respuesta['X-Accel-Buffering'] = 'no'
+        return respuesta
+
+
+@presupuesto_consultas(6)#sesion, usuario, el partido de ?partido=, empiezan, el corte y contienen
+@login_required
+def autocompletar(request, tabla):
+    # Opciones de los selects grandes segun se escribe (SportApp.autocompletar): ?q= y los filtros del formulario
+    if tabla not in BUSQUEDAS:
+        raise Http404("No existe esa búsqueda")
+    resultados, mas = buscar(tabla, request.user, request.GET.get('q', ''), request.GET)
+    return JsonResponse({
+        'resultados': [{'id': pk, 'texto': texto} for pk, texto in resultados],
+        'mas': mas,
+    })
+
+
+def _parametros_busqueda(parametros):
+    tipos = [tipo for tipo in parametros.getlist('tipo') if tipo in DocumentoBusqueda.Tipo.values]
+    pagina = int(parametros['pagina']) if parametros.get('pagina', '').isdigit() else 1
+    return parametros.get('q', '').strip(), tipos, pagina
+
+
+@presupuesto_consultas(3)
+def buscar_global(request):
+    # Buscador de la barra de navegacion (SportApp.busqueda): ?q=, ?tipo= (uno o varios) y ?pagina=
+    texto, tipos, pagina = _parametros_busqueda(request.GET)
+    resultados, hay_mas = busqueda.buscar(texto, tipos, pagina) if texto else ([], False)
+    return render(request, 'SportApp/buscar.html', {
+        'q': texto,
+        'tipos': tipos,
+        'opciones_tipo': DocumentoBusqueda.Tipo.choices,
+        'resultados': resultados,
+        'pagina': pagina,
+        'hay_mas': hay_mas,
+    })
+
+
+def metricas(request):
+    # Lo que va midiendo InstrumentacionMiddleware, para Prometheus: staff o el token de OLYMPO_METRICAS_TOKEN
+    token = getattr(settings, 'OLYMPO_METRICAS_TOKEN', '')
+    cabecera = request.headers.get('Authorization', '')
+    if not request.user.is_staff and not (token and constant_time_compare(cabecera, f'Bearer {token}')):
+        raise PermissionDenied
+    return HttpResponse(exportar_metricas(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ImportarView(LoginRequiredMixin, StaffRequiredMixin, FormView):
+    # Alta masiva desde CSV/XLSX (SportApp.importacion): o entra el fichero entero o no entra nada
+    form_class = ImportarForm
+    template_name = 'SportApp/importar.html'
+    max_errores = 200#los que se pintan; el total se indica aparte
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['columnas'] = COLUMNAS
+        return context
+
+    def form_valid(self, form):
+        datos = form.cleaned_data
+        try:
+            creados, errores = importar(datos['tipo'], datos['fichero'], self.request.user,
+                                        nombre=datos['fichero'].name, comprobar=datos['comprobar'])
+        except ErrorImportacion as e:
+            form.add_error('fichero', str(e))
+            return self.form_invalid(form)
+
+        if errores:
+            return self.render_to_response(self.get_context_data(
+                form=form, errores=errores[:self.max_errores], total_errores=len(errores)))
+        resumen = ", ".join(f"{n} {modelo}" for modelo, n in creados.items())
+        if datos['comprobar']:
+            messages.info(self.request, f"El fichero es correcto. Se crearían: {resumen}.")
+        else:
+            messages.success(self.request, f"Importados: {resumen}.")
+        return redirect('importar')
+
 
 #----------------------CBVs Para Inscripcion-----------------------------------
 class InscripcionCreateView(LoginRequiredMixin, CreateView):
@@ -319,41 +584,30 @@ class InscripcionDeleteView(LoginRequiredMixin, DeleteView):
 
 #========================= Estadisticas Globales ==========================
 class EstadisticaPartidoListView(LoginRequiredMixin, TemplateView):
+    presupuesto_consultas = 7
     template_name = 'SportApp/estadisticas.html'
     
     def get_context_data(self, **kwargs):
         
         context=super().get_context_data(**kwargs)
-        #añadimos el nombre del torneo al contexto para mostrarlo en la plantilla
-        context['torneo']=self.request.GET.get('torneo')
-        
-        datos_globales=EstadisticaPartido.objects.aggregate(# creamos un diccionario con lo s siguientes totales calculados
-                total_puntos=models.Sum('puntos'),
-                total_minutos=models.Sum('minutos_jugados'),    
-                partidos_jugados=models.Count('id',filter=models.Q(juega=True)),#filtramos aquellos ids que cumplan la condicion de juega
-            )
-        context['globales'] = datos_globales
-
-
-        top_puntos=Jugador.objects.annotate(
-            total_puntos=models.Sum('estadisticapartido__puntos')
-            ).filter(total_puntos__gt=0).order_by('-total_puntos')[:5]# el uso del gt signfica greater than
-        
-        context['top_puntos']=top_puntos
-
-        top_minutos=Jugador.objects.annotate(
-            total_minutos=models.Sum('estadisticapartido__minutos_jugados')
-            ).filter(total_minutos__gt=0).order_by('-total_minutos')[:5]
-        
-        context['top_minutos']=top_minutos
-        
-        
-        
-        top_participaciones=Jugador.objects.annotate(
-            partidos_jugados=models.Count('estadisticapartido', filter=models.Q(estadisticapartido__juega=True))
-            ).filter(partidos_jugados__gt=0).order_by('-partidos_jugados')[:5]
-        
-        context['top_participaciones']=top_participaciones
+        #todo sale de las filas ya sumadas (SportApp.estadisticas), aqui no se agrega ninguna linea de partido
+        ambito, clave = EstadisticaAcumulada.Ambito.CARRERA, ''
+
+        torneo_id=self.request.GET.get('torneo')
+        torneo=None
+        if torneo_id and torneo_id.isdigit():
+            torneo=Torneo.objects.filter(pk=torneo_id).first()
+        if torneo is not None:
+            ambito, clave = EstadisticaAcumulada.Ambito.TORNEO, str(torneo.pk)
+        #añadimos el torneo al contexto para mostrar su nombre en la plantilla
+        context['torneo']=torneo
+        context['torneos']=Torneo.objects.order_by('-temporada','nombre')
+
+        context['globales'] = totales(ambito, clave)
+
+        context['top_puntos']=ranking('puntos', ambito, clave)
+        context['top_minutos']=ranking('minutos_jugados', ambito, clave)
+        context['top_participaciones']=ranking('partidos_jugados', ambito, clave)
         
         return context
 
@@ -368,6 +622,7 @@ class EstadisticaPartidoListView(LoginRequiredMixin, TemplateView):
 
 
 class EstadisticaPartidoPorPartidoListView(LoginRequiredMixin, ListView):
+    presupuesto_consultas = 4
     model = EstadisticaPartido
     template_name = 'SportApp/estadisticas_partido.html'
     context_object_name = 'estadisticas'
@@ -389,6 +644,50 @@ class EstadisticaPartidoPorPartidoListView(LoginRequiredMixin, ListView):
         return context
 
 
+class ActaPartidoView(LoginRequiredMixin, StaffRequiredMixin, FormView):
+    # Acta completa: una fila por jugador de los dos equipos y un solo envio para todas
+    form_class = ActaFormSet
+    template_name = 'SportApp/acta_partido.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        self.partido = get_object_or_404(
+            Partido.objects.select_related('torneo', 'equipo_local', 'equipo_visitante'), pk=kwargs.get('partido_pk'))
+        return super().dispatch(request, *args, **kwargs)
+
+    @cached_property
+    def jugadores(self):
+        return list(Jugador.objects.filter(equipo__in=[self.partido.equipo_local_id, self.partido.equipo_visitante_id])
+            .select_related('equipo').order_by('equipo__nombre', 'dorsal', 'nombre'))
+
+    @cached_property
+    def lineas(self):
+        return {
+            fila['jugador_id']: fila
+            for fila in EstadisticaPartido.objects.filter(partido=self.partido).values('jugador_id', *CAMPOS_ACTA)
+        }
+
+    def get_initial(self):
+        return [dict(self.lineas.get(jugador.pk, {}), jugador=jugador.pk) for jugador in self.jugadores]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['partido'] = self.partido
+        context['filas'] = list(zip(self.jugadores, context['form'].forms))
+        return context
+
+    def form_valid(self, form):
+        #solo guardamos las filas rellenas o las que ya tenian linea (para poder corregirlas)
+        lineas = [f.cleaned_data for f in form if f.tiene_datos() or f.cleaned_data['jugador'] in self.lineas]
+        try:
+            guardadas = guardar_acta(self.partido, lineas)
+        except ValidationError as e:
+            for mensaje in e.messages:
+                messages.error(self.request, mensaje)
+            return self.form_invalid(form)
+        messages.success(self.request, f"Acta guardada: {guardadas} líneas.")
+        return redirect('estadisticas_partido', partido_pk=self.partido.pk)
+
+
 class EstadisticaPartidoCreateView(LoginRequiredMixin, StaffRequiredMixin, CreateView):
     model = EstadisticaPartido
     form_class = EstadisticaPartidoForm
@@ -456,20 +755,134 @@ class EstadisticaPartidoDeleteView(LoginRequiredMixin, StaffRequiredMixin, Delet
 
 
 
-class EquipoViewSet(viewsets.ModelViewSet):
+class ConsultaSegunFormaMixin:
+    # Elegimos el select_related segun las relaciones que pide el cliente con ?expand=,
+    # asi un listado hace siempre las mismas consultas sea cual sea el tamaño de pagina
+    relaciones_fijas = ()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        relaciones = set(self.relaciones_fijas) | self.get_serializer_class().expandir_pedido(self.request)
+        if relaciones:
+            queryset = queryset.select_related(*relaciones)
+        return queryset
+
+
+class EquipoViewSet(CacheApiMixin, ConsultaSegunFormaMixin, viewsets.ModelViewSet):
     queryset = Equipo.objects.all()
     serializer_class = EquipoSerializer
     permission_classes=[IsOwnerOrReadOnly]
 
-class JugadorViewSet(viewsets.ModelViewSet):
+class JugadorViewSet(CacheApiMixin, ConsultaSegunFormaMixin, viewsets.ModelViewSet):
     queryset = Jugador.objects.all()
     serializer_class = JugadorSerializer
     permission_classes=[IsOwnerOrReadOnly]
+    relaciones_fijas = ('equipo',)#IsOwnerOrReadOnly mira equipo.usuario_id
 
+    @action(detail=True)
+    def perfil(self, request, pk=None):
+        # GET /api/jugadores/<pk>/perfil/: carrera, temporadas, torneos y forma (SportApp.estadisticas.perfil_jugador)
+        jugador = self.get_object()
+        perfil = perfil_jugador(jugador)
+        filas = [fila for fila in (perfil['carrera'], *perfil['temporadas'], *perfil['torneos']) if fila is not None]
+        return self._responder([jugador, *filas], lambda: Response(PerfilJugadorSerializer(perfil).data), relaciones=())
 
-class PartidoViewSet(viewsets.ModelViewSet):
+
+class PartidoViewSet(CacheApiMixin, ConsultaSegunFormaMixin, viewsets.ModelViewSet):
     queryset = Partido.objects.all()
     serializer_class = PartidoSerializer
-    permission_classes=[IsOwnerOrReadOnly]
-    permission_classes=[permissions.IsAuthenticated]
+    permission_classes=[IsOrganizerOrStaff]
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def acta(self, request, pk=None):
+        # POST /api/partidos/<pk>/acta/ con la lista de lineas del partido, todas en un solo upsert
+        partido = self.get_object()
+        serializer = LineaActaSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        try:
+            guardadas = guardar_acta(partido, serializer.validated_data)
+        except ValidationError as e:
+            raise serializers.ValidationError(e.message_dict)
+        return Response({'guardadas': guardadas})
+
+
+class EnfrentamientoViewSet(CacheApiMixin, ConsultaSegunFormaMixin, viewsets.ReadOnlyModelViewSet):
+    # Cara a cara de parejas de equipos: ?pares=3-7,4-9 (los de un calendario de una vez) o ?equipo=<id>
+    queryset = Enfrentamiento.objects.all()
+    serializer_class = EnfrentamientoSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        pares = self.request.query_params.get('pares')
+        if pares:
+            filtro = Q()
+            for par in pares.split(','):
+                ids = par.split('-')
+                if len(ids) != 2 or not all(i.strip().isdigit() for i in ids):
+                    raise serializers.ValidationError({'pares': f"'{par}' no es una pareja de ids (3-7)."})
+                a, b = pareja(int(ids[0]), int(ids[1]))
+                filtro |= Q(equipo_a_id=a, equipo_b_id=b)
+            queryset = queryset.filter(filtro)
+        equipo = self.request.query_params.get('equipo')
+        if equipo and equipo.isdigit():
+            queryset = queryset.filter(Q(equipo_a_id=equipo) | Q(equipo_b_id=equipo))
+        return queryset
+
+
+class BusquedaViewSet(viewsets.ViewSet):
+    # GET /api/buscar/?q=&tipo=&pagina=: lo mismo que el buscador de la web, por paginas de busqueda.POR_PAGINA
+    def list(self, request):
+        texto, tipos, pagina = _parametros_busqueda(request.query_params)
+        if not texto:
+            raise serializers.ValidationError({'q': "Indica qué buscar."})
+        resultados, hay_mas = busqueda.buscar(texto, tipos, pagina)
+        siguiente = None
+        if hay_mas:
+            parametros = request.query_params.copy()
+            parametros['pagina'] = pagina + 1
+            siguiente = request.build_absolute_uri(f"{request.path}?{parametros.urlencode()}")
+        return Response({
+            'pagina': pagina,
+            'siguiente': siguiente,
+            'resultados': DocumentoBusquedaSerializer(resultados, many=True).data,
+        })
+
+
+class TareaViewSet(viewsets.ReadOnlyModelViewSet):
+    # Estado de las tareas en segundo plano (SportApp.tareas): cada usuario ve las suyas y el staff todas
+    serializer_class = TareaSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CursorPaginacionRecientes
+    queryset = Tarea.objects.all()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(usuario=self.request.user)
+        estado = self.request.query_params.get('estado')
+        if estado:
+            queryset = queryset.filter(estado=estado.upper())
+        return queryset
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def recalcular(self, request):
+        # POST /api/tareas/recalcular/ {"tipo": "clasificacion"|"estadisticas"|"enfrentamientos"|"elo"}: responde ya y se hace en la cola
+        serializer = RecalcularSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        datos = serializer.validated_data
+        if datos['tipo'] == 'clasificacion':
+            tarea = encolar('recalcular_clasificacion', request.user, torneos=datos.get('torneos'))
+        else:
+            tarea = encolar(f"recalcular_{datos['tipo']}", request.user)
+        return Response(TareaSerializer(tarea).data, status=202)
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def reintentar(self, request, pk=None):
+        # Vuelve a poner en la cola una tarea fallida, con sus intentos a cero
+        tarea = self.get_object()
+        if tarea.estado != Tarea.EstadoTarea.FALLIDA:
+            raise serializers.ValidationError({'estado': "Solo se pueden reintentar las tareas fallidas."})
+        Tarea.objects.filter(pk=tarea.pk).update(estado=Tarea.EstadoTarea.PENDIENTE, intentos=0,
+                                                 ejecutar_desde=timezone.now(), terminada=None)
+        tarea.refresh_from_db()
+        return Response(TareaSerializer(tarea).data, status=202)